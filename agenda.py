@@ -0,0 +1,117 @@
+"""
+Agenda do terapeuta: sessões com o nome do paciente e horários livres, por dia, semana ou mês.
+
+Cada período é lido com uma única consulta (database.agenda_medico) e guardado em memória;
+o período seguinte é pré-carregado numa thread em segundo plano, para que a navegação
+"Próximo >" já encontre os dados prontos. Qualquer escrita em sessões, disponibilidade ou
+pacientes (deste processo ou de outro) descarta os períodos guardados.
+"""
+import calendar
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import database
+
+MODOS = ('dia', 'semana', 'mes')
+MAX_PERIODOS_GUARDADOS = 32
+
+# --- Períodos ---
+
+def periodo(modo, referencia):
+    """Retorna (primeiro dia, último dia) do dia, da semana (segunda a domingo) ou do mês da data de referência."""
+    if modo == 'dia':
+        return referencia, referencia
+    if modo == 'semana':
+        inicio = referencia - timedelta(days=referencia.weekday())
+        return inicio, inicio + timedelta(days=6)
+    if modo == 'mes':
+        _, total_dias = calendar.monthrange(referencia.year, referencia.month)
+        return date(referencia.year, referencia.month, 1), date(referencia.year, referencia.month, total_dias)
+    raise ValueError(f"Modo de agenda inválido: '{modo}'.")
+
+def deslocar(modo, referencia, direcao):
+    """Avança (direcao=1) ou volta (direcao=-1) um período a partir da data de referência."""
+    if modo == 'dia':
+        return referencia + timedelta(days=direcao)
+    if modo == 'semana':
+        return referencia + timedelta(weeks=direcao)
+    indice_mes = referencia.year * 12 + referencia.month - 1 + direcao
+    return date(indice_mes // 12, indice_mes % 12 + 1, 1)
+
+# --- Montagem da Agenda ---
+
+def _horarios_livres(disponiveis, ocupados):
+    """Subtrai os intervalos ocupados (sessões) dos disponíveis. Intervalos em minutos, [inicio, fim)."""
+    livres = []
+    ocupados = sorted(ocupados)
+    for inicio, fim in sorted(disponiveis):
+        cursor = inicio
+        for ocupado_inicio, ocupado_fim in ocupados:
+            if ocupado_fim <= cursor or ocupado_inicio >= fim:
+                continue
+            if ocupado_inicio > cursor:
+                livres.append((cursor, ocupado_inicio))
+            cursor = max(cursor, ocupado_fim)
+        if cursor < fim:
+            livres.append((cursor, fim))
+    return livres
+
+def montar_agenda(linhas):
+    """
+    Organiza as linhas de database.agenda_medico por dia: {dia: [item, ...]}, cada item com
+    'tipo' ('sessao' ou 'livre'), 'minuto_inicio', 'minuto_fim' e, nas sessões, o paciente.
+    """
+    por_dia = {}
+    for linha in linhas:
+        por_dia.setdefault(linha['dia'], []).append(linha)
+    agenda = {}
+    for dia, itens_do_dia in por_dia.items():
+        sessoes = [l for l in itens_do_dia if l['tipo'] == 'sessao']
+        disponiveis = [(l['minuto_inicio'], l['minuto_fim']) for l in itens_do_dia
+                       if l['tipo'] == 'disponivel' and l['minuto_inicio'] is not None and l['minuto_fim'] is not None]
+        ocupados = [(s['minuto_inicio'], s['minuto_fim']) for s in sessoes
+                    if s['minuto_inicio'] is not None and s['minuto_fim'] is not None]
+        livres = [{'tipo': 'livre', 'minuto_inicio': i, 'minuto_fim': f} for i, f in _horarios_livres(disponiveis, ocupados)]
+        agenda[dia] = sorted(sessoes + livres, key=lambda item: (item['minuto_inicio'] is None, item['minuto_inicio'] or 0))
+    return agenda
+
+# --- Períodos Guardados e Pré-carregamento ---
+
+_trava = threading.Lock()
+_guardados = {}   # (arquivo, medico_id, inicio, fim) -> (geração, agenda)
+_geracao = [0]    # Incrementada a cada escrita que afeta agendas
+
+def _ao_escrever(tabela, operacao, registro_id):
+    if tabela in ('sessoes', 'disponibilidade_medico', 'pacientes', 'medicos'):
+        with _trava:
+            _geracao[0] += 1
+            _guardados.clear()
+
+database.registrar_ouvinte(_ao_escrever)
+
+def carregar_agenda(medico_id, inicio, fim):
+    """Retorna a agenda montada do médico entre as datas, usando o período guardado se ainda for válido."""
+    geracao = (_geracao[0], database.geracao_externa())
+    chave = (database.DB_FILE, medico_id, inicio, fim)
+    with _trava:
+        guardado = _guardados.get(chave)
+    if guardado and guardado[0] == geracao:
+        return guardado[1]
+    agenda = montar_agenda(database.agenda_medico(medico_id, inicio, fim))
+    with _trava:
+        if len(_guardados) >= MAX_PERIODOS_GUARDADOS:
+            _guardados.pop(next(iter(_guardados)))
+        _guardados[chave] = (geracao, agenda)
+    return agenda
+
+def pre_carregar(medico_id, inicio, fim):
+    """Carrega o período numa thread em segundo plano; erros são ignorados (o período será lido de novo ao abrir)."""
+    def carregar():
+        try:
+            carregar_agenda(medico_id, inicio, fim)
+        except sqlite3.Error:
+            pass
+    thread = threading.Thread(target=carregar, name='pre_carregar_agenda', daemon=True)
+    thread.start()
+    return thread
@@ -1,13 +1,27 @@
 import tkinter as tk
-from tkinter import messagebox, ttk
-from datetime import date, datetime
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from datetime import date, datetime, timedelta
+import os
 import sqlite3
 import database  # Importa nosso módulo de banco de dados
+import agenda
+import auditoria
+import cache_disponibilidade
+import indice_pacientes
+import lembretes
+import lista_espera
+import notificacoes
+import relatorios
 import calendar # Módulo para trabalhar com calendários mensais
 from tkcalendar import Calendar # Importa o calendário
+from formatacao import (formatar_data_para_db, formatar_data_para_exibicao,
+                        preparar_linhas_pacientes, preparar_linhas_sessoes, preparar_datas_calendario,
+                        preparar_grade_disponibilidade, preparar_linhas_agenda,
+                        preparar_grafico_evolucao, descrever_ponto_evolucao, preparar_linhas_auditoria,
+                        preparar_linhas_lista_espera, DIAS_SEMANA_ABREVIADOS, preparar_linhas_anexos)
 
-# Variável global para armazenar os dados do usuário logado
-USUARIO_LOGADO = None
+# Vigia das alterações gravadas por outras estações (criada pela janela principal)
+VIGIA_ALTERACOES = None
 
 # --- Constantes e Dicionários Auxiliares ---
 DIAS_SEMANA_MAP = {
@@ -19,38 +33,46 @@ DIAS_SEMANA_INV_MAP = {v: k for k, v in DIAS_SEMANA_MAP.items()}
 
 # --- Funções Auxiliares ---
 
-def formatar_data_para_db(data_str):
-    """Converte data de DD/MM/YYYY para YYYY-MM-DD para salvar no DB."""
-    if not data_str:
-        return None
-    try:
-        # Converte para o formato do banco de dados, que permite ordenação correta
-        return datetime.strptime(data_str, '%d/%m/%Y').strftime('%Y-%m-%d')
-    except ValueError:
-        return None # Retorna None se o formato da data for inválido
-
-def formatar_data_para_exibicao(data_str):
-    """Converte data de YYYY-MM-DD para DD/MM/YYYY para exibir na UI."""
-    if not data_str:
-        return ""
-    try:
-        # Converte de volta para o formato amigável para o usuário
-        return datetime.strptime(data_str, '%Y-%m-%d').strftime('%d/%m/%Y')
-    except ValueError:
-        return data_str # Se já estiver em outro formato, retorna o original
+def iniciar_vigia_alteracoes(root):
+    """Cria a vigia de alterações e a verifica periodicamente pelo laço de eventos do Tk."""
+    global VIGIA_ALTERACOES
+    VIGIA_ALTERACOES = notificacoes.VigiaAlteracoes()
+    def verificar():
+        try:
+            VIGIA_ALTERACOES.verificar()
+        except sqlite3.Error as e:
+            print(f"Aviso: falha ao verificar alterações de outras estações: {e}")
+        root.after(notificacoes.INTERVALO_VERIFICACAO_MS, verificar)
+    root.after(notificacoes.INTERVALO_VERIFICACAO_MS, verificar)
+    root.bind("<Destroy>", lambda e: VIGIA_ALTERACOES.fechar() if e.widget == root else None, add='+')
+
+def mostrar_acesso_negado(root):
+    """Mostra AcessoNegado lançado por qualquer botão das janelas como aviso, em vez de um erro no terminal."""
+    relatar_padrao = root.report_callback_exception
+    def relatar(tipo, valor, rastreamento):
+        if isinstance(valor, database.AcessoNegado):
+            messagebox.showwarning("Acesso Negado", str(valor))
+        else:
+            relatar_padrao(tipo, valor, rastreamento)
+    root.report_callback_exception = relatar
 
-def calcular_idade(data_nasc_db):
-    """Calcula a idade a partir da data de nascimento no formato YYYY-MM-DD."""
-    if not data_nasc_db:
-        return ""
-    try:
-        nascimento = datetime.strptime(data_nasc_db, '%Y-%m-%d').date()
-        hoje = date.today()
-        # Calcula a idade de forma precisa
-        idade = hoje.year - nascimento.year - ((hoje.month, hoje.day) < (nascimento.month, nascimento.day))
-        return idade
-    except (ValueError, TypeError):
-        return "" # Retorna vazio se a data for inválida
+def pedir_data(janela, titulo, mensagem):
+    """Pede uma data em DD/MM/AAAA. Retorna a data em YYYY-MM-DD, ou None se o usuário cancelar ou digitar uma data inválida."""
+    texto = simpledialog.askstring(titulo, f"{mensagem} (DD/MM/AAAA):", parent=janela)
+    if not texto:
+        return None
+    data_db = formatar_data_para_db(texto.strip())
+    if not data_db:
+        messagebox.showerror("Erro de Formato", "Use o formato DD/MM/AAAA.", parent=janela)
+    return data_db
+
+def inscrever_alteracoes(janela, tabelas, funcao):
+    """Inscreve funcao(alteracoes) na vigia enquanto a janela estiver aberta (ver notificacoes.VigiaAlteracoes)."""
+    if VIGIA_ALTERACOES is None:
+        return
+    vigia = VIGIA_ALTERACOES
+    vigia.inscrever(tabelas, funcao)
+    janela.bind("<Destroy>", lambda e: vigia.cancelar(funcao) if e.widget == janela else None, add='+')
 
 def salvar_paciente(janela_cadastro, entry_nome, entry_data, entry_resp):
     """Coleta os dados dos campos de entrada e salva no banco de dados."""
@@ -96,6 +118,39 @@ def salvar_alteracoes_paciente(janela_edicao, entry_nome, entry_data, entry_resp
     except sqlite3.Error as e:
         messagebox.showerror("Erro de Banco de Dados", f"Ocorreu um erro ao atualizar: {e}", parent=janela_edicao)
 
+def ler_agenda_sessao(janela_form, widgets):
+    """
+    Lê o médico e os horários do formulário de sessão. Retorna (medico_id, hora_inicio, hora_fim),
+    com None nos campos não preenchidos, ou None se houver erro de validação (já exibido).
+    """
+    indice = widgets['medico'].current()
+    medico_id = widgets['medicos_ids'][indice] if indice > 0 else None
+    hora_inicio = widgets['hora_inicio'].get().strip() or None
+    hora_fim = widgets['hora_fim'].get().strip() or None
+
+    if bool(hora_inicio) != bool(hora_fim):
+        messagebox.showerror("Erro de Validação", "Informe o horário de início e o de fim, ou deixe ambos em branco.", parent=janela_form)
+        return None
+    if hora_inicio:
+        try:
+            inicio, fim = datetime.strptime(hora_inicio, '%H:%M'), datetime.strptime(hora_fim, '%H:%M')
+        except ValueError:
+            messagebox.showerror("Erro de Validação", "O formato do horário deve ser HH:MM.", parent=janela_form)
+            return None
+        if inicio >= fim:
+            messagebox.showwarning("Lógica Inválida", "O horário de início deve ser anterior ao de fim.", parent=janela_form)
+            return None
+        # Normaliza para HH:MM com dois dígitos (ex.: 8:00 -> 08:00), formato usado pelo banco
+        hora_inicio, hora_fim = inicio.strftime('%H:%M'), fim.strftime('%H:%M')
+    return medico_id, hora_inicio, hora_fim
+
+def mostrar_conflito_agendamento(janela_form, conflito):
+    """Exibe um ConflitoAgendamento com as sessões que ocupam o horário."""
+    detalhes = [str(conflito)]
+    for sessao in conflito.sessoes_conflitantes:
+        detalhes.append(f"  • {sessao['hora_inicio']}–{sessao['hora_fim']}: {sessao['paciente_nome'] or 'Paciente não encontrado'}")
+    messagebox.showerror("Conflito de Agenda", "\n".join(detalhes), parent=janela_form)
+
 def salvar_nova_sessao(janela_form, paciente_id, widgets):
     """Salva uma nova sessão no banco de dados."""
     try:
@@ -114,9 +169,16 @@ def salvar_nova_sessao(janela_form, paciente_id, widgets):
             messagebox.showerror("Erro de Validação", "Formato de data inválido. Use DD/MM/AAAA.", parent=janela_form)
             return
 
-        database.adicionar_sessao(paciente_id, widgets['medico_id'], data_sessao_db, widgets['horario'], widgets['hora_fim'], resumo, evolucao, obs_evolucao, plano)
+        agenda = ler_agenda_sessao(janela_form, widgets)
+        if agenda is None:
+            return
+        medico_id, hora_inicio, hora_fim = agenda
+
+        database.adicionar_sessao(paciente_id, medico_id, data_sessao_db, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano)
         messagebox.showinfo("Sucesso", "Nova sessão registrada com sucesso!", parent=janela_form)
         janela_form.destroy()
+    except database.ConflitoAgendamento as e:
+        mostrar_conflito_agendamento(janela_form, e)
     except sqlite3.Error as e:
         messagebox.showerror("Erro de Banco de Dados", f"Ocorreu um erro ao salvar a sessão: {e}", parent=janela_form)
 
@@ -138,9 +200,16 @@ def salvar_alteracoes_sessao(janela_form, sessao_id, widgets):
             messagebox.showerror("Erro de Validação", "Formato de data inválido. Use DD/MM/AAAA.", parent=janela_form)
             return
 
-        database.atualizar_sessao(sessao_id, widgets['medico_id'], data_sessao_db, widgets['horario'], widgets['hora_fim'], resumo, evolucao, obs_evolucao, plano)
+        agenda = ler_agenda_sessao(janela_form, widgets)
+        if agenda is None:
+            return
+        medico_id, hora_inicio, hora_fim = agenda
+
+        database.atualizar_sessao(sessao_id, medico_id, data_sessao_db, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano)
         messagebox.showinfo("Sucesso", "Sessão atualizada com sucesso!", parent=janela_form)
         janela_form.destroy()
+    except database.ConflitoAgendamento as e:
+        mostrar_conflito_agendamento(janela_form, e)
     except sqlite3.Error as e:
         messagebox.showerror("Erro de Banco de Dados", f"Ocorreu um erro ao salvar a sessão: {e}", parent=janela_form)
 
@@ -280,25 +349,35 @@ def abrir_janela_disponibilidade(janela_pai, medico_id, medico_nome):
     entry_fim = ttk.Entry(add_frame, width=10)
     entry_fim.grid(row=0, column=3, padx=5, pady=5)
 
+    eventos_marcados = {} # data -> id do evento no calendário
+
     def marcar_dias_disponiveis():
-        """Pinta os dias com disponibilidade no calendário."""
-        cal.calevent_remove('all')
+        """
+        Pinta os dias com disponibilidade no calendário (o mês exibido e a semana vizinha de cada lado),
+        a partir dos meses guardados em memória. Só os dias que mudaram são desmarcados ou marcados.
+        """
         ano, mes = cal.get_displayed_month()
-        datas_disponiveis = database.listar_datas_disponiveis_por_mes(medico_id, ano, mes)
-        for data_str in datas_disponiveis:
-            try:
-                data_obj = datetime.strptime(data_str, '%Y-%m-%d').date()
-                cal.calevent_create(data_obj, 'Disponível', tags='disponivel')
-            except ValueError:
-                continue
+        dia_inicio, dia_fim = database.intervalo_mes(ano, mes)
+        try:
+            datas = set(preparar_datas_calendario(cache_disponibilidade.dias_disponiveis(medico_id, dia_inicio - 7, dia_fim + 7)))
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar a disponibilidade: {e}", parent=janela_disp)
+            return
+        for data_obj in [d for d in eventos_marcados if d not in datas]:
+            cal.calevent_remove(eventos_marcados.pop(data_obj))
+        for data_obj in datas:
+            if data_obj not in eventos_marcados:
+                eventos_marcados[data_obj] = cal.calevent_create(data_obj, 'Disponível', tags='disponivel')
+        # Os meses ao redor do exibido ficam prontos antes de o usuário avançar ou voltar
+        cache_disponibilidade.pre_carregar(medico_id, ano, mes)
 
     def atualizar_horarios_do_dia(event=None): # Adicionado event=None para ser usado como callback
-        """Carrega e exibe os horários para o dia selecionado no calendário."""
+        """Exibe os horários do dia selecionado no calendário, a partir dos meses guardados em memória."""
         for i in tree_horarios.get_children(): tree_horarios.delete(i)
         data_selecionada = cal.get_date()
         lbl_data_selecionada.config(text=f"Horários para {data_selecionada}")
         data_db = formatar_data_para_db(data_selecionada)
-        horarios = database.listar_disponibilidade_por_data(medico_id, data_db)
+        horarios = cache_disponibilidade.horarios_do_dia(medico_id, data_db)
         for horario in horarios:
             tree_horarios.insert("", "end", values=(horario['id'], horario['hora_inicio'], horario['hora_fim']))
 
@@ -316,42 +395,579 @@ def abrir_janela_disponibilidade(janela_pai, medico_id, medico_nome):
             messagebox.showwarning("Lógica Inválida", "O horário de início deve ser anterior ao de fim.", parent=janela_disp); return
 
         try:
-            database.adicionar_disponibilidade(medico_id, data_db, inicio, fim)
+            database.adicionar_disponibilidade(medico_id, data_db, inicio, fim) # Relê só este dia no cache
             entry_inicio.delete(0, 'end'); entry_fim.delete(0, 'end')
             atualizar_horarios_do_dia()
             marcar_dias_disponiveis() # Garante que o dia seja marcado
         except sqlite3.Error as e:
             messagebox.showerror("Erro de BD", f"Não foi possível adicionar o horário: {e}", parent=janela_disp)
+            return
+        abrir_janela_propostas_espera(janela_disp, [(medico_id, data_db)])
+
+    def horarios_selecionados():
+        """Ids dos horários selecionados (Ctrl/Shift + clique seleciona vários)."""
+        ids = [tree_horarios.item(item)['values'][0] for item in tree_horarios.selection()]
+        if not ids:
+            messagebox.showwarning("Nenhuma Seleção", "Selecione um ou mais horários.", parent=janela_disp)
+        return ids
+
+    def aplicar_em_lote(acao, descricao):
+        """Executa a ação em lote (uma transação) e atualiza a janela uma única vez."""
+        try:
+            acao()
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Não foi possível {descricao}: {e}", parent=janela_disp)
+            return
+        atualizar_horarios_do_dia()
+        marcar_dias_disponiveis() # Atualiza o calendário caso algum dia fique sem horários (ou passe a ter)
 
     def excluir_horario_selecionado():
-        selected_item = tree_horarios.focus()
-        if not selected_item:
-            messagebox.showwarning("Nenhuma Seleção", "Selecione um horário para excluir.", parent=janela_disp); return
-        if messagebox.askyesno("Confirmar", "Tem certeza que deseja excluir este horário?", parent=janela_disp):
-            try:
-                disponibilidade_id = tree_horarios.item(selected_item)['values'][0]
-                database.excluir_disponibilidade(disponibilidade_id)
-                atualizar_horarios_do_dia()
-                marcar_dias_disponiveis() # Atualiza o calendário caso o dia fique sem horários
-            except sqlite3.Error as e:
-                messagebox.showerror("Erro", f"Não foi possível excluir o horário: {e}", parent=janela_disp)
+        ids = horarios_selecionados()
+        if ids and messagebox.askyesno("Confirmar", f"Tem certeza que deseja excluir {len(ids)} horário(s)?", parent=janela_disp):
+            aplicar_em_lote(lambda: database.excluir_disponibilidades(ids), "excluir os horários")
+
+    def copiar_ou_mover_selecionados(mover):
+        ids = horarios_selecionados()
+        if not ids:
+            return
+        data_destino = pedir_data(janela_disp, "Mover Horários" if mover else "Copiar Horários",
+                                  f"{'Mover' if mover else 'Copiar'} {len(ids)} horário(s) para a data")
+        if not data_destino:
+            return
+        if mover:
+            aplicar_em_lote(lambda: database.mover_disponibilidades(ids, data_destino), "mover os horários")
+        else:
+            aplicar_em_lote(lambda: database.copiar_disponibilidades(ids, data_destino), "copiar os horários")
+
+    def limpar_mes_exibido():
+        ano, mes = cal.get_displayed_month()
+        inicio, fim = (database.data_do_dia(dia) for dia in database.intervalo_mes(ano, mes))
+        if messagebox.askyesno("Confirmar", f"Excluir todos os horários de {medico_nome} em {mes:02d}/{ano}?", parent=janela_disp):
+            aplicar_em_lote(lambda: database.excluir_disponibilidade_periodo(medico_id, inicio, fim), "limpar o mês")
 
     # --- Botões e Eventos ---
     ttk.Button(add_frame, text="Adicionar", command=adicionar_horario).grid(row=0, column=4, padx=5)
 
     bottom_buttons_frame = ttk.Frame(right_frame)
     bottom_buttons_frame.pack(fill='x', side='bottom', pady=(10,0))
-    ttk.Button(bottom_buttons_frame, text="Excluir Horário Selecionado", command=excluir_horario_selecionado).pack(side='left')
+    ttk.Button(bottom_buttons_frame, text="Excluir Selecionados", command=excluir_horario_selecionado).pack(side='left')
+    ttk.Button(bottom_buttons_frame, text="Copiar para Data...", command=lambda: copiar_ou_mover_selecionados(False)).pack(side='left', padx=(5, 0))
+    ttk.Button(bottom_buttons_frame, text="Mover para Data...", command=lambda: copiar_ou_mover_selecionados(True)).pack(side='left', padx=(5, 0))
+    ttk.Button(bottom_buttons_frame, text="Limpar Mês", command=limpar_mes_exibido).pack(side='left', padx=(5, 0))
     ttk.Button(bottom_buttons_frame, text="Fechar", command=janela_disp.destroy).pack(side='right')
 
     # Bind de eventos do calendário
     cal.bind("<<CalendarSelected>>", atualizar_horarios_do_dia)
     cal.bind("<<CalendarMonthChanged>>", lambda e: marcar_dias_disponiveis())
 
+    # Horários alterados em outras estações: o cache já se descarta; a janela só redesenha
+    def aplicar_alteracoes_disponibilidade(alteracoes):
+        marcar_dias_disponiveis()
+        atualizar_horarios_do_dia()
+    inscrever_alteracoes(janela_disp, ('disponibilidade_medico',), aplicar_alteracoes_disponibilidade)
+
     # Carregamento inicial
     marcar_dias_disponiveis()
     atualizar_horarios_do_dia()
 
+def abrir_janela_visao_geral_agenda(janela_pai):
+    """Abre uma grade com a agenda de todos os médicos (agendado / disponível por dia), por semana ou por mês."""
+    janela_visao = tk.Toplevel(janela_pai)
+    janela_visao.title("Visão Geral da Agenda dos Médicos")
+    janela_visao.geometry("1100x550")
+    janela_visao.transient(janela_pai)
+    janela_visao.grab_set()
+
+    estado = {'referencia': date.today()}
+    modo = tk.StringVar(value='semana')
+
+    # --- Navegação ---
+    topo_frame = ttk.Frame(janela_visao, padding=10)
+    topo_frame.pack(fill='x')
+    ttk.Button(topo_frame, text="< Anterior", command=lambda: navegar(-1)).pack(side='left')
+    lbl_periodo = ttk.Label(topo_frame, font=("Helvetica", 12, "bold"))
+    lbl_periodo.pack(side='left', padx=15)
+    ttk.Button(topo_frame, text="Próximo >", command=lambda: navegar(1)).pack(side='left')
+    ttk.Radiobutton(topo_frame, text="Mês", variable=modo, value='mes', command=lambda: recarregar_grade()).pack(side='right')
+    ttk.Radiobutton(topo_frame, text="Semana", variable=modo, value='semana', command=lambda: recarregar_grade()).pack(side='right', padx=5)
+    ttk.Label(janela_visao, text="Cada célula mostra: horas agendadas / horas disponíveis", padding=(10, 0)).pack(anchor='w')
+
+    # --- Grade (Treeview) ---
+    tree_frame = ttk.Frame(janela_visao, padding=10)
+    tree_frame.pack(expand=True, fill='both')
+    tree = ttk.Treeview(tree_frame, show='headings')
+    tree.grid(row=0, column=0, sticky='nsew')
+    scroll_y = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+    scroll_x = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL, command=tree.xview)
+    tree.configure(yscroll=scroll_y.set, xscroll=scroll_x.set)
+    scroll_y.grid(row=0, column=1, sticky='ns')
+    scroll_x.grid(row=1, column=0, sticky='ew')
+    tree_frame.grid_rowconfigure(0, weight=1)
+    tree_frame.grid_columnconfigure(0, weight=1)
+
+    def dias_do_periodo():
+        referencia = estado['referencia']
+        if modo.get() == 'semana':
+            inicio = referencia - timedelta(days=referencia.weekday())
+            return [inicio + timedelta(days=i) for i in range(7)]
+        _, total_dias = calendar.monthrange(referencia.year, referencia.month)
+        return [date(referencia.year, referencia.month, dia) for dia in range(1, total_dias + 1)]
+
+    def navegar(direcao):
+        referencia = estado['referencia']
+        if modo.get() == 'semana':
+            estado['referencia'] = referencia + timedelta(weeks=direcao)
+        else:
+            indice_mes = referencia.year * 12 + referencia.month - 1 + direcao
+            estado['referencia'] = date(indice_mes // 12, indice_mes % 12 + 1, 1)
+        recarregar_grade()
+
+    def recarregar_grade():
+        """Busca o resumo do período numa única consulta e redesenha a grade."""
+        dias = dias_do_periodo()
+        try:
+            resumo = database.resumo_disponibilidade_periodo(dias[0].isoformat(), dias[-1].isoformat())
+            medicos = database.listar_medicos()
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar a agenda: {e}", parent=janela_visao)
+            return
+
+        colunas = ['Médico'] + [dia.isoformat() for dia in dias] + ['Total']
+        tree.delete(*tree.get_children())
+        tree.configure(columns=colunas)
+        tree.heading('Médico', text='Médico/Terapeuta'); tree.column('Médico', width=200, stretch=tk.NO)
+        largura_dia = 110 if modo.get() == 'semana' else 85
+        for dia in dias:
+            tree.heading(dia.isoformat(), text=f"{DIAS_SEMANA_LISTA[dia.weekday()][:3]} {dia.strftime('%d/%m')}")
+            tree.column(dia.isoformat(), width=largura_dia, anchor='center', stretch=tk.NO)
+        tree.heading('Total', text='Total'); tree.column('Total', width=110, anchor='center', stretch=tk.NO)
+
+        for medico_id, valores in preparar_grade_disponibilidade(medicos, resumo, dias):
+            tree.insert("", "end", iid=medico_id, values=valores)
+        lbl_periodo.config(text=f"{dias[0].strftime('%d/%m/%Y')} a {dias[-1].strftime('%d/%m/%Y')}")
+
+    ttk.Button(janela_visao, text="Fechar", command=janela_visao.destroy).pack(side='right', padx=10, pady=(0, 10))
+
+    recarregar_grade()
+
+def abrir_janela_agenda_terapeuta(janela_pai, medico_id, medico_nome):
+    """Mostra o dia, a semana ou o mês de um terapeuta: sessões com o paciente e horários livres."""
+    janela_agenda = tk.Toplevel(janela_pai)
+    janela_agenda.title(f"Agenda de {medico_nome}")
+    janela_agenda.geometry("750x520")
+    janela_agenda.transient(janela_pai)
+
+    estado = {'referencia': date.today()}
+    modo = tk.StringVar(value='dia')
+
+    # --- Navegação ---
+    topo_frame = ttk.Frame(janela_agenda, padding=10)
+    topo_frame.pack(fill='x')
+    ttk.Button(topo_frame, text="< Anterior", command=lambda: navegar(-1)).pack(side='left')
+    ttk.Button(topo_frame, text="Hoje", command=lambda: ir_para_hoje()).pack(side='left', padx=5)
+    ttk.Button(topo_frame, text="Próximo >", command=lambda: navegar(1)).pack(side='left')
+    lbl_periodo = ttk.Label(topo_frame, font=("Helvetica", 12, "bold"))
+    lbl_periodo.pack(side='left', padx=15)
+    for texto, valor in (("Mês", 'mes'), ("Semana", 'semana'), ("Dia", 'dia')):
+        ttk.Radiobutton(topo_frame, text=texto, variable=modo, value=valor, command=lambda: recarregar_agenda()).pack(side='right', padx=2)
+
+    rodape_frame = ttk.Frame(janela_agenda, padding=10)
+    rodape_frame.pack(fill='x', side='bottom')
+    lbl_resumo = ttk.Label(rodape_frame)
+    lbl_resumo.pack(side='left')
+    ttk.Button(rodape_frame, text="Fechar", command=janela_agenda.destroy).pack(side='right')
+
+    # --- Lista de Horários ---
+    tree_frame = ttk.Frame(janela_agenda, padding=(10, 0))
+    tree_frame.pack(expand=True, fill='both')
+    cols = ('Data', 'Horário', 'Paciente', 'Nível de Evolução')
+    tree = ttk.Treeview(tree_frame, columns=cols, show='headings')
+    tree.heading('Data', text='Data'); tree.column('Data', width=90, anchor='center')
+    tree.heading('Horário', text='Horário'); tree.column('Horário', width=110, anchor='center')
+    tree.heading('Paciente', text='Paciente / Situação'); tree.column('Paciente', width=320)
+    tree.heading('Nível de Evolução', text='Nível de Evolução'); tree.column('Nível de Evolução', width=140, anchor='center')
+    tree.tag_configure('livre', foreground='darkgreen')
+    tree.pack(side='left', expand=True, fill='both')
+    scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+    tree.configure(yscroll=scrollbar.set)
+    scrollbar.pack(side='right', fill='y')
+
+    def recarregar_agenda():
+        inicio, fim = agenda.periodo(modo.get(), estado['referencia'])
+        try:
+            agenda_periodo = agenda.carregar_agenda(medico_id, inicio, fim)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar a agenda: {e}", parent=janela_agenda)
+            return
+        dias = [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        tree.delete(*tree.get_children())
+        linhas = preparar_linhas_agenda(agenda_periodo, dias)
+        for iid, valores, tags in linhas:
+            tree.insert("", "end", iid=iid, values=valores, tags=tags)
+        sessoes = sum(1 for _, _, tags in linhas if 'sessao' in tags)
+        if inicio == fim:
+            lbl_periodo.config(text=inicio.strftime('%d/%m/%Y'))
+        else:
+            lbl_periodo.config(text=f"{inicio.strftime('%d/%m/%Y')} a {fim.strftime('%d/%m/%Y')}")
+        lbl_resumo.config(text=f"{sessoes} sessão(ões) no período." if linhas else "Nenhum horário neste período.")
+        # Deixa o próximo período pronto enquanto o usuário lê este
+        proxima_referencia = agenda.deslocar(modo.get(), estado['referencia'], 1)
+        agenda.pre_carregar(medico_id, *agenda.periodo(modo.get(), proxima_referencia))
+
+    def navegar(direcao):
+        estado['referencia'] = agenda.deslocar(modo.get(), estado['referencia'], direcao)
+        recarregar_agenda()
+
+    def ir_para_hoje():
+        estado['referencia'] = date.today()
+        recarregar_agenda()
+
+    def ao_clicar_duas_vezes(event):
+        item = tree.focus()
+        if item.startswith('sessao_'):
+            abrir_janela_detalhes_sessao(janela_agenda, int(item.split('_')[1]))
+
+    tree.bind("<Double-1>", ao_clicar_duas_vezes)
+    recarregar_agenda()
+
+def abrir_janela_auditoria(janela_pai):
+    """Consulta o log de auditoria por usuário, paciente e período (somente leitura)."""
+    janela_auditoria = tk.Toplevel(janela_pai)
+    janela_auditoria.title("Auditoria de Acessos")
+    janela_auditoria.geometry("900x500")
+    janela_auditoria.transient(janela_pai)
+
+    # --- Filtros ---
+    try:
+        usuarios = {"Todos": None, **{u['nome_usuario']: u['id'] for u in database.listar_usuarios()}}
+        pacientes = {"Todos": None, **{f"{p['nome_completo']} (#{p['id']})": p['id'] for p in database.listar_pacientes()}}
+    except sqlite3.Error as e:
+        messagebox.showerror("Erro", f"Erro ao carregar os filtros: {e}", parent=janela_auditoria)
+        janela_auditoria.destroy()
+        return
+    filtros_frame = ttk.Frame(janela_auditoria, padding=10)
+    filtros_frame.pack(fill='x')
+    ttk.Label(filtros_frame, text="Usuário:").grid(row=0, column=0, sticky='w')
+    combo_usuario = ttk.Combobox(filtros_frame, values=list(usuarios), state='readonly', width=20)
+    combo_usuario.set("Todos"); combo_usuario.grid(row=0, column=1, sticky='w', padx=(5, 15))
+    ttk.Label(filtros_frame, text="Paciente:").grid(row=0, column=2, sticky='w')
+    combo_paciente = ttk.Combobox(filtros_frame, values=list(pacientes), state='readonly', width=35)
+    combo_paciente.set("Todos"); combo_paciente.grid(row=0, column=3, sticky='w', padx=(5, 15))
+    ttk.Label(filtros_frame, text="Período (DD/MM/AAAA):").grid(row=1, column=0, sticky='w', pady=(5, 0))
+    periodo_frame = ttk.Frame(filtros_frame)
+    periodo_frame.grid(row=1, column=1, columnspan=3, sticky='w', pady=(5, 0))
+    hoje = date.today()
+    entry_inicio = ttk.Entry(periodo_frame, width=12); entry_inicio.pack(side='left')
+    entry_inicio.insert(0, (hoje - timedelta(days=30)).strftime('%d/%m/%Y'))
+    ttk.Label(periodo_frame, text=" a ").pack(side='left')
+    entry_fim = ttk.Entry(periodo_frame, width=12); entry_fim.pack(side='left')
+    entry_fim.insert(0, hoje.strftime('%d/%m/%Y'))
+    ttk.Button(filtros_frame, text="Buscar", command=lambda: buscar()).grid(row=0, column=4, rowspan=2, padx=10)
+
+    # --- Eventos ---
+    tree_frame = ttk.Frame(janela_auditoria, padding=10)
+    tree_frame.pack(expand=True, fill='both')
+    cols = ('Data/Hora', 'Usuário', 'Ação', 'Registro', 'Paciente')
+    tree = ttk.Treeview(tree_frame, columns=cols, show='headings')
+    for col, largura in zip(cols, (150, 120, 90, 140, 300)):
+        tree.heading(col, text=col); tree.column(col, width=largura)
+    tree.pack(side='left', expand=True, fill='both')
+    scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+    tree.configure(yscroll=scrollbar.set)
+    scrollbar.pack(side='right', fill='y')
+    lbl_total = ttk.Label(janela_auditoria, text="")
+    lbl_total.pack(side='left', padx=10, pady=(0, 10))
+
+    def buscar():
+        datas = []
+        for entry in (entry_inicio, entry_fim):
+            texto = entry.get().strip()
+            data_db = formatar_data_para_db(texto)
+            if texto and not data_db:
+                messagebox.showerror("Erro de Formato", "Use o formato DD/MM/AAAA para o período.", parent=janela_auditoria)
+                return
+            datas.append(date.fromisoformat(data_db) if data_db else None)
+        try:
+            eventos = auditoria.consultar_eventos(usuarios[combo_usuario.get()], pacientes[combo_paciente.get()], *datas)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao consultar a auditoria: {e}", parent=janela_auditoria)
+            return
+        tree.delete(*tree.get_children())
+        for linha in preparar_linhas_auditoria(eventos):
+            tree.insert("", "end", values=linha)
+        limite = " (limite atingido; refine os filtros)" if len(eventos) >= auditoria.LIMITE_CONSULTA else ""
+        lbl_total.config(text=f"{len(eventos)} eventos{limite}")
+
+    ttk.Button(janela_auditoria, text="Fechar", command=janela_auditoria.destroy).pack(side='right', padx=10, pady=(0, 10))
+    buscar()
+
+QUALQUER_MEDICO = "(qualquer médico da especialidade)"
+
+def abrir_janela_propostas_espera(janela_pai, vagas, callback_atualizar=None):
+    """
+    Oferece os pacientes da lista de espera para os horários livres de cada (medico_id, data) em vagas,
+    depois de uma sessão desmarcada ou de um novo horário de disponibilidade. Não abre nada se não houver proposta.
+    """
+    def calcular_propostas():
+        propostas = []
+        for medico_id, data in vagas:
+            propostas.extend(lista_espera.propor_vagas(medico_id, data))
+        return propostas
+    try:
+        propostas = calcular_propostas()
+    except sqlite3.Error as e:
+        messagebox.showerror("Erro", f"Erro ao consultar a lista de espera: {e}", parent=janela_pai)
+        return
+    if not propostas:
+        return
+
+    janela_propostas = tk.Toplevel(janela_pai)
+    janela_propostas.title("Vaga Livre - Lista de Espera")
+    janela_propostas.geometry("650x320")
+    janela_propostas.transient(janela_pai)
+    ttk.Label(janela_propostas, text="Pacientes da lista de espera que cabem no horário liberado:",
+              padding=(10, 10, 10, 0)).pack(anchor='w')
+
+    tree_frame = ttk.Frame(janela_propostas, padding=10)
+    tree_frame.pack(expand=True, fill='both')
+    cols = ('Data', 'Horário', 'Paciente', 'Prioridade')
+    tree = ttk.Treeview(tree_frame, columns=cols, show='headings', selectmode='browse')
+    for col, largura in zip(cols, (90, 110, 300, 80)):
+        tree.heading(col, text=col); tree.column(col, width=largura)
+    tree.pack(side='left', expand=True, fill='both')
+
+    def exibir():
+        tree.delete(*tree.get_children())
+        for indice, proposta in enumerate(propostas):
+            tree.insert("", "end", iid=str(indice), values=(
+                formatar_data_para_exibicao(proposta['data']), f"{proposta['hora_inicio']} - {proposta['hora_fim']}",
+                proposta['paciente_nome'], proposta['prioridade']))
+
+    def agendar_selecionada():
+        item = tree.focus()
+        if not item:
+            messagebox.showwarning("Nenhuma Seleção", "Selecione um paciente para agendar.", parent=janela_propostas)
+            return
+        proposta = propostas[int(item)]
+        try:
+            lista_espera.agendar(proposta)
+        except database.ConflitoAgendamento as e:
+            messagebox.showwarning("Conflito de Agenda", str(e), parent=janela_propostas)
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Erro", f"Não foi possível agendar: {e}", parent=janela_propostas)
+        else:
+            messagebox.showinfo("Sessão Agendada", f"{proposta['paciente_nome']} agendado(a) para "
+                                f"{formatar_data_para_exibicao(proposta['data'])} às {proposta['hora_inicio']}.", parent=janela_propostas)
+            if callback_atualizar:
+                callback_atualizar()
+        # O horário agendado deixa de estar livre: as propostas são recalculadas
+        propostas[:] = calcular_propostas()
+        if not propostas:
+            janela_propostas.destroy()
+            return
+        exibir()
+
+    botoes_frame = ttk.Frame(janela_propostas, padding=(10, 0, 10, 10))
+    botoes_frame.pack(fill='x')
+    ttk.Button(botoes_frame, text="Agendar Selecionado", command=agendar_selecionada).pack(side='left')
+    ttk.Button(botoes_frame, text="Fechar", command=janela_propostas.destroy).pack(side='right')
+    exibir()
+
+def abrir_janela_lista_espera(janela_pai):
+    """Mostra a lista de espera e permite incluir pacientes (por médico ou especialidade, dias e janela de horário) e retirá-los."""
+    janela_espera = tk.Toplevel(janela_pai)
+    janela_espera.title("Lista de Espera")
+    janela_espera.geometry("950x560")
+    janela_espera.transient(janela_pai)
+
+    try:
+        pacientes = {f"{p['nome_completo']} (#{p['id']})": p['id'] for p in database.listar_pacientes()}
+        medicos = {QUALQUER_MEDICO: None, **{m['nome_completo']: m['id'] for m in database.listar_medicos()}}
+    except sqlite3.Error as e:
+        messagebox.showerror("Erro", f"Erro ao carregar pacientes e médicos: {e}", parent=janela_espera)
+        janela_espera.destroy()
+        return
+
+    # --- Entradas ---
+    tree_frame = ttk.Frame(janela_espera, padding=10)
+    tree_frame.pack(expand=True, fill='both')
+    cols = ('ID', 'Paciente', 'Médico', 'Dias', 'Janela', 'Duração', 'Prioridade', 'Desde')
+    tree = ttk.Treeview(tree_frame, columns=cols, show='headings')
+    for col, largura in zip(cols, (0, 220, 180, 150, 100, 70, 70, 80)):
+        tree.heading(col, text=col); tree.column(col, width=largura)
+    tree.column('ID', stretch=tk.NO) # Oculto
+    tree.pack(side='left', expand=True, fill='both')
+    scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+    tree.configure(yscroll=scrollbar.set)
+    scrollbar.pack(side='right', fill='y')
+
+    # --- Nova Entrada ---
+    form = ttk.LabelFrame(janela_espera, text="Incluir na Lista de Espera", padding=10)
+    form.pack(fill='x', padx=10)
+    ttk.Label(form, text="Paciente:").grid(row=0, column=0, sticky='w')
+    combo_paciente = ttk.Combobox(form, values=list(pacientes), state='readonly', width=35)
+    combo_paciente.grid(row=0, column=1, columnspan=3, sticky='w', padx=5, pady=2)
+    ttk.Label(form, text="Médico:").grid(row=1, column=0, sticky='w')
+    combo_medico = ttk.Combobox(form, values=list(medicos), state='readonly', width=35)
+    combo_medico.set(QUALQUER_MEDICO)
+    combo_medico.grid(row=1, column=1, columnspan=3, sticky='w', padx=5, pady=2)
+    ttk.Label(form, text="Especialidade:").grid(row=1, column=4, sticky='w')
+    entry_especialidade = ttk.Entry(form, width=20)
+    entry_especialidade.grid(row=1, column=5, columnspan=2, sticky='w', padx=5)
+    ttk.Label(form, text="Dias:").grid(row=2, column=0, sticky='w')
+    dias_frame = ttk.Frame(form)
+    dias_frame.grid(row=2, column=1, columnspan=6, sticky='w', padx=5, pady=2)
+    dias_vars = []
+    for indice, nome in enumerate(DIAS_SEMANA_ABREVIADOS):
+        var = tk.BooleanVar(value=indice < 5)
+        ttk.Checkbutton(dias_frame, text=nome, variable=var).pack(side='left')
+        dias_vars.append(var)
+    campos = {}
+    for coluna, (chave, rotulo, padrao) in enumerate((('inicio', "Das (HH:MM):", "08:00"), ('fim', "Até (HH:MM):", "18:00"),
+                                                       ('duracao', "Duração (min):", str(database.DURACAO_PADRAO_ESPERA)),
+                                                       ('prioridade', "Prioridade:", "0"))):
+        ttk.Label(form, text=rotulo).grid(row=3, column=coluna * 2, sticky='w')
+        campos[chave] = ttk.Entry(form, width=8)
+        campos[chave].insert(0, padrao)
+        campos[chave].grid(row=3, column=coluna * 2 + 1, sticky='w', padx=5, pady=2)
+    ttk.Label(form, text="Observação:").grid(row=4, column=0, sticky='w')
+    entry_observacao = ttk.Entry(form, width=60)
+    entry_observacao.grid(row=4, column=1, columnspan=6, sticky='w', padx=5, pady=2)
+
+    def recarregar():
+        try:
+            entradas = database.listar_lista_espera()
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar a lista de espera: {e}", parent=janela_espera)
+            return
+        tree.delete(*tree.get_children())
+        for linha in preparar_linhas_lista_espera(entradas):
+            tree.insert("", "end", values=linha)
+
+    def incluir():
+        paciente_id = pacientes.get(combo_paciente.get())
+        medico_id = medicos.get(combo_medico.get())
+        especialidade = entry_especialidade.get().strip() or None
+        inicio, fim = campos['inicio'].get().strip(), campos['fim'].get().strip()
+        if paciente_id is None:
+            messagebox.showwarning("Campo Obrigatório", "Selecione o paciente.", parent=janela_espera); return
+        if medico_id is None and not especialidade:
+            messagebox.showwarning("Campo Obrigatório", "Escolha um médico ou informe a especialidade.", parent=janela_espera); return
+        dias = [indice for indice, var in enumerate(dias_vars) if var.get()]
+        if not dias:
+            messagebox.showwarning("Campo Obrigatório", "Marque ao menos um dia da semana.", parent=janela_espera); return
+        try:
+            hora_inicio, hora_fim = datetime.strptime(inicio, '%H:%M'), datetime.strptime(fim, '%H:%M')
+            duracao, prioridade = int(campos['duracao'].get()), int(campos['prioridade'].get())
+        except ValueError:
+            messagebox.showerror("Formato Inválido", "Use HH:MM nos horários e números inteiros na duração e na prioridade.", parent=janela_espera); return
+        if duracao <= 0 or (hora_fim - hora_inicio).total_seconds() < duracao * 60:
+            messagebox.showwarning("Lógica Inválida", "A janela de horário precisa comportar a duração da sessão.", parent=janela_espera); return
+        try:
+            # Normalizados: '8:00' passa no strptime, mas só '08:00' vira minutos no banco
+            database.adicionar_lista_espera(paciente_id, medico_id, especialidade, hora_inicio.strftime('%H:%M'),
+                                            hora_fim.strftime('%H:%M'), lista_espera.mascara_dias(dias),
+                                            duracao, prioridade, entry_observacao.get().strip() or None)
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Erro", f"Não foi possível incluir na lista de espera: {e}", parent=janela_espera)
+            return
+        entry_observacao.delete(0, 'end')
+        recarregar()
+
+    def retirar_selecionados():
+        itens = tree.selection()
+        if not itens:
+            messagebox.showwarning("Nenhuma Seleção", "Selecione uma ou mais entradas.", parent=janela_espera)
+            return
+        if not messagebox.askyesno("Confirmar", f"Retirar {len(itens)} paciente(s) da lista de espera?", parent=janela_espera):
+            return
+        try:
+            for item in itens:
+                database.excluir_da_lista_espera(tree.item(item)['values'][0])
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Não foi possível retirar da lista de espera: {e}", parent=janela_espera)
+        recarregar()
+
+    ttk.Button(form, text="Incluir", command=incluir).grid(row=4, column=7, padx=10)
+    botoes_frame = ttk.Frame(janela_espera, padding=10)
+    botoes_frame.pack(fill='x')
+    ttk.Button(botoes_frame, text="Retirar Selecionados", command=retirar_selecionados).pack(side='left')
+    ttk.Button(botoes_frame, text="Fechar", command=janela_espera.destroy).pack(side='right')
+    recarregar()
+
+def abrir_janela_busca_clinicas(janela_pai):
+    """Busca pacientes e a agenda de um médico em todas as clínicas da rede (somente leitura)."""
+    janela_busca = tk.Toplevel(janela_pai)
+    janela_busca.title("Buscar em Todas as Clínicas")
+    janela_busca.geometry("850x500")
+    janela_busca.transient(janela_pai)
+
+    # --- Critérios de Busca ---
+    busca_frame = ttk.Frame(janela_busca, padding=10)
+    busca_frame.pack(fill='x')
+    modo = tk.StringVar(value='pacientes')
+    ttk.Radiobutton(busca_frame, text="Pacientes (nome)", variable=modo, value='pacientes').grid(row=0, column=0, sticky='w')
+    ttk.Radiobutton(busca_frame, text="Agenda do médico (nome completo)", variable=modo, value='agenda').grid(row=0, column=1, sticky='w')
+    entry_termo = ttk.Entry(busca_frame, width=40)
+    entry_termo.grid(row=1, column=0, columnspan=2, sticky='ew', pady=5)
+    entry_termo.focus_set()
+    ttk.Label(busca_frame, text="Período da agenda (DD/MM/AAAA):").grid(row=2, column=0, sticky='w')
+    periodo_frame = ttk.Frame(busca_frame)
+    periodo_frame.grid(row=2, column=1, sticky='w')
+    hoje = date.today()
+    entry_inicio = ttk.Entry(periodo_frame, width=12); entry_inicio.pack(side='left')
+    entry_inicio.insert(0, hoje.strftime('%d/%m/%Y'))
+    ttk.Label(periodo_frame, text=" a ").pack(side='left')
+    entry_fim = ttk.Entry(periodo_frame, width=12); entry_fim.pack(side='left')
+    entry_fim.insert(0, (hoje + timedelta(days=30)).strftime('%d/%m/%Y'))
+    ttk.Button(busca_frame, text="Buscar", command=lambda: buscar()).grid(row=1, column=2, padx=10)
+
+    # --- Resultados ---
+    tree_frame = ttk.Frame(janela_busca, padding=10)
+    tree_frame.pack(expand=True, fill='both')
+    tree = ttk.Treeview(tree_frame, show='headings')
+    tree.pack(side='left', expand=True, fill='both')
+    scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+    tree.configure(yscroll=scrollbar.set)
+    scrollbar.pack(side='right', fill='y')
+
+    def configurar_colunas(colunas):
+        tree.delete(*tree.get_children())
+        tree.configure(columns=[nome for nome, _, _ in colunas])
+        for nome, titulo, largura in colunas:
+            tree.heading(nome, text=titulo)
+            tree.column(nome, width=largura)
+
+    def buscar():
+        termo = entry_termo.get().strip()
+        if not termo:
+            messagebox.showwarning("Atenção", "Digite um nome para buscar.", parent=janela_busca)
+            return
+        try:
+            if modo.get() == 'pacientes':
+                resultados = database.buscar_pacientes_todas_clinicas(termo)
+                configurar_colunas([('clinica', 'Clínica', 120), ('nome', 'Nome Completo', 300),
+                                    ('nascimento', 'Nascimento', 100), ('responsavel', 'Responsável', 250)])
+                for p in resultados:
+                    tree.insert("", "end", values=(p['clinica'], p['nome_completo'],
+                                                   formatar_data_para_exibicao(p['data_nascimento']), p['nome_responsavel']))
+            else:
+                data_inicio, data_fim = formatar_data_para_db(entry_inicio.get()), formatar_data_para_db(entry_fim.get())
+                if not data_inicio or not data_fim:
+                    messagebox.showerror("Erro de Formato", "Use o formato DD/MM/AAAA para o período.", parent=janela_busca)
+                    return
+                resultados = database.listar_agenda_medico_todas_clinicas(termo, data_inicio, data_fim)
+                configurar_colunas([('clinica', 'Clínica', 120), ('data', 'Data', 100), ('inicio', 'Início', 70),
+                                    ('fim', 'Fim', 70), ('paciente', 'Paciente', 300)])
+                for s in resultados:
+                    tree.insert("", "end", values=(s['clinica'], formatar_data_para_exibicao(s['data_sessao']),
+                                                   s['hora_inicio_sessao'] or '', s['hora_fim_sessao'] or '', s['paciente_nome'] or ''))
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao consultar as clínicas: {e}", parent=janela_busca)
+
+    entry_termo.bind("<Return>", lambda event: buscar())
+    ttk.Button(janela_busca, text="Fechar", command=janela_busca.destroy).pack(side='right', padx=10, pady=(0, 10))
+
 # --- Funções para Abrir Janelas de Pacientes ---
 
 
@@ -538,24 +1154,87 @@ def abrir_janela_sessoes(janela_pai, paciente_id, paciente_nome, callback_atuali
 
     tree.grid(row=0, column=0, sticky='nsew')
     scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
-    tree.configure(yscroll=scrollbar.set)
+    tree.configure(yscroll=lambda primeiro, ultimo: ao_rolar(primeiro, ultimo))
     scrollbar.grid(row=0, column=1, sticky='ns')
     tree_frame.grid_rowconfigure(0, weight=1)
     tree_frame.grid_columnconfigure(0, weight=1)
+    tree.tag_configure('arquivada', foreground='gray40')
+
+    # As sessões antigas ficam no arquivo morto e só são lidas quando o usuário rola até o fim da lista
+    ITEM_ARQUIVO = 'carregar_arquivo'
+    estado = {'incluir_arquivo': False}
+    # Cada linha usa o id da sessão como item e guarda a chave de ordenação, para que alterações de
+    # outras estações sejam aplicadas só às linhas afetadas (ver aplicar_alteracoes)
+    chaves = {}
+
+    def chave_ordenacao(sessao):
+        return (sessao['dia_sessao'] or 0, sessao['minuto_inicio_sessao'] or 0)
 
     def recarregar_sessoes():
         for i in tree.get_children():
             tree.delete(i)
+        chaves.clear()
         try:
-            for sessao in database.listar_sessoes_por_paciente(paciente_id):
-                # sessao = {'id': ..., 'data_sessao': ..., 'nivel_evolucao': ..., 'resumo_sessao': ...}
-                # Limita o resumo para exibição na tabela e remove quebras de linha
-                data_exibicao = formatar_data_para_exibicao(sessao['data_sessao'])
-                resumo_original = sessao['resumo_sessao'] or ""
-                resumo_curto = (resumo_original[:75] + '...') if len(resumo_original) > 75 else resumo_original
-                tree.insert("", "end", values=(sessao['id'], data_exibicao, sessao['hora_inicio_sessao'] or '', sessao['medico_nome'] or 'Não definido', sessao['nivel_evolucao'], resumo_curto.replace('\n', ' ')))
+            sessoes = database.listar_sessoes_por_paciente(paciente_id, incluir_arquivo=estado['incluir_arquivo'])
+            for sessao, valores in zip(sessoes, preparar_linhas_sessoes(sessoes)):
+                iid = str(sessao['id'])
+                tree.insert("", "end", iid=iid, values=valores, tags=('arquivada',) if sessao['arquivada'] else ())
+                chaves[iid] = chave_ordenacao(sessao)
         except sqlite3.Error as e:
             messagebox.showerror("Erro", f"Erro ao carregar sessões: {e}", parent=janela_sessoes)
+            return
+        if not estado['incluir_arquivo'] and os.path.exists(database.caminho_arquivo_morto()):
+            tree.insert("", "end", iid=ITEM_ARQUIVO, tags=('arquivada',),
+                        values=('', '', '', 'Sessões arquivadas...', '', 'Role até aqui ou dê um duplo clique para carregar'))
+
+    def aplicar_alteracoes(alteracoes):
+        """Atualiza, insere ou remove só as sessões deste paciente alteradas por outras estações."""
+        if alteracoes is None:
+            recarregar_sessoes()
+            return
+        ids = {a['registro_id'] for a in alteracoes if a['paciente_id'] == paciente_id}
+        if not ids:
+            return
+        if estado['incluir_arquivo'] and any(a['operacao'] == 'excluido' for a in alteracoes):
+            recarregar_sessoes() # A sessão pode ter sido movida para o arquivo morto, que está sendo exibido
+            return
+        sessoes = database.listar_sessoes_por_ids(ids)
+        for sessao_id in ids - {sessao['id'] for sessao in sessoes}:
+            if tree.exists(str(sessao_id)):
+                tree.delete(str(sessao_id))
+                chaves.pop(str(sessao_id), None)
+        for sessao, valores in zip(sessoes, preparar_linhas_sessoes(sessoes)):
+            iid, chave = str(sessao['id']), chave_ordenacao(sessao)
+            if tree.exists(iid) and chaves.get(iid) == chave:
+                tree.item(iid, values=valores) # Mesma posição: mantém a seleção do usuário
+                continue
+            if tree.exists(iid):
+                tree.delete(iid)
+            # A lista está em ordem decrescente: a linha entra antes da primeira com chave menor
+            posicao = next((i for i, item in enumerate(tree.get_children()) if chaves.get(item, (-1, -1)) < chave), 'end')
+            tree.insert("", posicao, iid=iid, values=valores)
+            chaves[iid] = chave
+
+    def carregar_arquivo():
+        estado['incluir_arquivo'] = True
+        quantidade_recentes = len(tree.get_children()) - 1
+        recarregar_sessoes()
+        filhos = tree.get_children()
+        if quantidade_recentes < len(filhos):
+            tree.see(filhos[quantidade_recentes]) # Mantém a vista no ponto em que o usuário estava
+
+    def ao_rolar(primeiro, ultimo):
+        scrollbar.set(primeiro, ultimo)
+        # Só carrega automaticamente se a lista foi de fato rolada (e não apenas coube inteira na tela)
+        if float(ultimo) >= 1.0 and float(primeiro) > 0.0 and tree.exists(ITEM_ARQUIVO):
+            janela_sessoes.after_idle(carregar_arquivo)
+
+    def sessao_somente_leitura(item):
+        """Sessões arquivadas (e a linha de carregamento) não podem ser editadas nem excluídas."""
+        if item == ITEM_ARQUIVO or 'arquivada' in tree.item(item, 'tags'):
+            messagebox.showinfo("Sessão Arquivada", "Sessões arquivadas estão disponíveis apenas para consulta.", parent=janela_sessoes)
+            return True
+        return False
 
     def callback_combinado():
         """Função que atualiza tanto a lista de sessões quanto o calendário principal."""
@@ -566,7 +1245,9 @@ def abrir_janela_sessoes(janela_pai, paciente_id, paciente_nome, callback_atuali
     def ao_clicar_duas_vezes(event):
         """Abre os detalhes da sessão ao dar um duplo clique."""
         item_selecionado = tree.focus()
-        if item_selecionado:
+        if item_selecionado == ITEM_ARQUIVO:
+            carregar_arquivo()
+        elif item_selecionado:
             sessao_id = tree.item(item_selecionado)['values'][0]
             abrir_janela_detalhes_sessao(janela_sessoes, sessao_id)
 
@@ -588,36 +1269,168 @@ def abrir_janela_sessoes(janela_pai, paciente_id, paciente_nome, callback_atuali
         if not selected_item:
             messagebox.showwarning("Nenhuma Seleção", "Por favor, selecione uma sessão para editar.", parent=janela_sessoes)
             return
+        if sessao_somente_leitura(selected_item):
+            return
         sessao_id = tree.item(selected_item)['values'][0]
         abrir_janela_edicao_sessao(janela_sessoes, sessao_id, callback_combinado)
 
+    def sessoes_selecionadas():
+        """Ids das sessões selecionadas (Ctrl/Shift + clique seleciona várias), ou [] se alguma for somente leitura."""
+        itens = tree.selection()
+        if not itens:
+            messagebox.showwarning("Nenhuma Seleção", "Por favor, selecione uma ou mais sessões.", parent=janela_sessoes)
+            return []
+        somente_leitura = [item for item in itens if item == ITEM_ARQUIVO or 'arquivada' in tree.item(item, 'tags')]
+        if somente_leitura:
+            sessao_somente_leitura(somente_leitura[0])
+            return []
+        return [int(item) for item in itens]
+
+    def aplicar_em_lote(acao, descricao):
+        """Executa a ação em lote (uma transação: todas as sessões ou nenhuma) e atualiza a lista e o calendário uma vez. Retorna True se gravou."""
+        try:
+            acao()
+        except database.ConflitoAgendamento as e:
+            messagebox.showwarning("Conflito de Agenda", f"{e}\nNenhuma sessão foi alterada.", parent=janela_sessoes)
+            return False
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao {descricao}: {e}", parent=janela_sessoes)
+            return False
+        callback_combinado()
+        return True
+
     def excluir_sessao_selecionada():
-        selected_item = tree.focus()
-        if not selected_item:
-            messagebox.showwarning("Nenhuma Seleção", "Por favor, selecione uma sessão para excluir.", parent=janela_sessoes)
+        ids = sessoes_selecionadas()
+        if not ids or not messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir {len(ids)} sessão(ões)?", parent=janela_sessoes):
             return
-        
-        sessao_id = tree.item(selected_item)['values'][0]
-        confirmar = messagebox.askyesno("Confirmar Exclusão", "Tem certeza que deseja excluir esta sessão?", parent=janela_sessoes)
-        if confirmar:
-            try:
-                database.excluir_sessao(sessao_id)
-                messagebox.showinfo("Sucesso", "Sessão excluída com sucesso.", parent=janela_sessoes)
-                callback_combinado() # Atualiza lista e calendário
-            except sqlite3.Error as e:
-                messagebox.showerror("Erro", f"Erro ao excluir sessão: {e}", parent=janela_sessoes)
+        try:
+            vagas = sorted({(s['medico_id'], s['data_sessao']) for s in database.listar_sessoes_por_ids(ids) if s['medico_id']})
+        except sqlite3.Error:
+            vagas = [] # Sem as vagas, a exclusão segue; só não há propostas da lista de espera
+        if aplicar_em_lote(lambda: database.excluir_sessoes(ids), "excluir as sessões"):
+            abrir_janela_propostas_espera(janela_sessoes, vagas, callback_combinado)
+
+    def copiar_ou_mover_selecionadas(mover):
+        ids = sessoes_selecionadas()
+        if not ids:
+            return
+        data_destino = pedir_data(janela_sessoes, "Remarcar Sessões" if mover else "Copiar Sessões",
+                                  f"{'Remarcar' if mover else 'Agendar cópia de'} {len(ids)} sessão(ões) para a data")
+        if not data_destino:
+            return
+        if mover:
+            aplicar_em_lote(lambda: database.mover_sessoes(ids, data_destino), "remarcar as sessões")
+        else:
+            aplicar_em_lote(lambda: database.copiar_sessoes(ids, data_destino), "copiar as sessões")
+
+    def gerar_relatorio_paciente():
+        """Gera o relatório (prontuário + histórico de sessões) em PDF ou HTML para entregar à família."""
+        caminho = filedialog.asksaveasfilename(
+            parent=janela_sessoes, title="Salvar Relatório", defaultextension='.pdf',
+            initialfile=relatorios.nome_arquivo_relatorio(paciente_id, paciente_nome, 'pdf'),
+            filetypes=[("PDF", "*.pdf"), ("Página HTML", "*.html")])
+        if not caminho:
+            return
+        try:
+            total = relatorios.gerar_relatorio(paciente_id, caminho)
+            messagebox.showinfo("Relatório Gerado", f"Relatório com {total} sessão(ões) salvo em:\n{caminho}", parent=janela_sessoes)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            messagebox.showerror("Erro", f"Erro ao gerar o relatório: {e}", parent=janela_sessoes)
 
     ttk.Button(botoes_frame, text="Editar Sessão", command=editar_sessao_selecionada).pack(side='left', padx=5)
-    ttk.Button(botoes_frame, text="Excluir Sessão", command=excluir_sessao_selecionada).pack(side='left', padx=5)
+    ttk.Button(botoes_frame, text="Excluir Selecionadas", command=excluir_sessao_selecionada).pack(side='left', padx=5)
+    ttk.Button(botoes_frame, text="Copiar para Data...", command=lambda: copiar_ou_mover_selecionadas(False)).pack(side='left', padx=5)
+    ttk.Button(botoes_frame, text="Remarcar para Data...", command=lambda: copiar_ou_mover_selecionadas(True)).pack(side='left', padx=5)
+    ttk.Button(botoes_frame, text="Gerar Relatório", command=gerar_relatorio_paciente).pack(side='right', padx=5)
+    ttk.Button(botoes_frame, text="Ver Evolução", command=lambda: abrir_janela_evolucao_paciente(janela_sessoes, paciente_id, paciente_nome)).pack(side='right', padx=5)
 
-    # Carrega os dados iniciais
+    # Carrega os dados iniciais e acompanha as sessões gravadas por outras estações
     recarregar_sessoes()
+    inscrever_alteracoes(janela_sessoes, ('sessoes',), aplicar_alteracoes)
+
+CORES_TENDENCIA = {'subiu': 'forestgreen', 'desceu': 'firebrick', 'manteve': 'steelblue'}
+
+def abrir_janela_evolucao_paciente(janela_pai, paciente_id, paciente_nome):
+    """Mostra a linha do tempo do nível de evolução do paciente, agregada por semana ou mês."""
+    janela_evolucao = tk.Toplevel(janela_pai)
+    janela_evolucao.title(f"Evolução de {paciente_nome}")
+    janela_evolucao.geometry("850x450")
+    janela_evolucao.transient(janela_pai)
+
+    agrupamento = tk.StringVar(value='mes')
+    topo_frame = ttk.Frame(janela_evolucao, padding=10)
+    topo_frame.pack(fill='x')
+    ttk.Label(topo_frame, text="Agrupar por:").pack(side='left')
+    for texto, valor in (("Semana", 'semana'), ("Mês", 'mes')):
+        ttk.Radiobutton(topo_frame, text=texto, variable=agrupamento, value=valor, command=lambda: desenhar()).pack(side='left', padx=5)
+    lbl_detalhe = ttk.Label(janela_evolucao, padding=(10, 0, 10, 10))
+    lbl_detalhe.pack(side='bottom', fill='x')
+
+    canvas = tk.Canvas(janela_evolucao, background='white', highlightthickness=0)
+    canvas.pack(expand=True, fill='both', padx=10)
+    estado = {'pontos': [], 'xs': [], 'pendente': None}
+
+    def desenhar():
+        estado['pendente'] = None
+        largura, altura = canvas.winfo_width(), canvas.winfo_height()
+        if largura < 100 or altura < 100:
+            return # Janela ainda não foi exibida; o evento <Configure> desenha em seguida
+        try:
+            # Um ponto a cada 4 pixels: pacientes com milhares de sessões continuam leves de desenhar
+            evolucao = database.evolucao_paciente(paciente_id, agrupamento.get(), largura // 4)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar a evolução: {e}", parent=janela_evolucao)
+            return
+        pontos = evolucao['pontos']
+        grafico = preparar_grafico_evolucao(pontos, largura, altura)
+        canvas.delete('all')
+        for y, nivel in grafico['eixo_y']:
+            canvas.create_line(40, y, largura - 40, y, fill='gray85')
+            canvas.create_text(36, y, text=database.NIVEIS_EVOLUCAO[nivel - 1], anchor='e', font=("Helvetica", 8))
+        for x, texto in grafico['eixo_x']:
+            canvas.create_text(x, altura - 25, text=texto, anchor='n', font=("Helvetica", 8))
+        for x, y_min, y_max in grafico['faixas']:
+            if y_min != y_max:
+                canvas.create_line(x, y_min, x, y_max, fill='gray75', width=3)
+        if len(grafico['linha']) >= 4:
+            canvas.create_line(*grafico['linha'], fill='steelblue', width=2)
+        for x, y, tendencia in grafico['marcas']:
+            canvas.create_oval(x - 3, y - 3, x + 3, y + 3, fill=CORES_TENDENCIA[tendencia], outline='')
+        estado['pontos'], estado['xs'] = pontos, [x for x, _, _ in grafico['marcas']]
+        if not pontos:
+            canvas.create_text(largura / 2, altura / 2, text="Nenhuma sessão com nível de evolução registrado.")
+            lbl_detalhe.config(text="")
+        else:
+            sessoes = sum(p['sessoes'] for p in pontos)
+            lbl_detalhe.config(text=f"{sessoes} sessão(ões) em {len(pontos)} ponto(s). Passe o mouse sobre o gráfico para ver os detalhes.")
+
+    def ao_redimensionar(event):
+        # Agrupa os eventos de redimensionamento e redesenha uma única vez
+        if estado['pendente']:
+            canvas.after_cancel(estado['pendente'])
+        estado['pendente'] = canvas.after(100, desenhar)
+
+    def ao_mover_mouse(event):
+        if not estado['xs']:
+            return
+        indice = min(range(len(estado['xs'])), key=lambda i: abs(estado['xs'][i] - event.x))
+        lbl_detalhe.config(text=descrever_ponto_evolucao(estado['pontos'][indice], database.NIVEIS_EVOLUCAO))
+
+    def ao_fechar(event):
+        if event.widget == janela_evolucao and estado['pendente']:
+            canvas.after_cancel(estado['pendente'])
+
+    canvas.bind("<Configure>", ao_redimensionar)
+    canvas.bind("<Motion>", ao_mover_mouse)
+    janela_evolucao.bind("<Destroy>", ao_fechar)
+    janela_evolucao.update_idletasks()
+    desenhar()
 
 def abrir_janela_form_sessao(janela_pai, callback_atualizar, paciente_id=None, sessao_id=None):
     """Abre um formulário para adicionar uma nova sessão."""
     janela_form = tk.Toplevel(janela_pai)
     janela_form.title("Registrar Nova Sessão" if not sessao_id else "Editar Sessão")
-    janela_form.geometry("600x500")
+    janela_form.geometry("600x540")
     janela_form.resizable(False, False)
     janela_form.transient(janela_pai)
     janela_form.grab_set()
@@ -631,13 +1444,36 @@ def abrir_janela_form_sessao(janela_pai, callback_atualizar, paciente_id=None, s
     entry_data = ttk.Entry(frame_data, width=20)
     entry_data.pack(side='left', padx=5)
     entry_data.focus_set()
+
+    # Médico e horário: a agenda é validada no banco contra conflitos e disponibilidade
+    frame_agenda = ttk.Frame(frame)
+    frame_agenda.pack(fill='x', pady=(8, 0))
+    ttk.Label(frame_agenda, text="Médico/Terapeuta:").pack(side='left')
+    medicos = database.listar_medicos()
+    combo_medico = ttk.Combobox(frame_agenda, values=["(Não definido)"] + [m['nome_completo'] for m in medicos], state='readonly', width=28)
+    combo_medico.pack(side='left', padx=5)
+    combo_medico.current(0)
+    ttk.Label(frame_agenda, text="Início (HH:MM):").pack(side='left', padx=(10, 0))
+    entry_hora_inicio = ttk.Entry(frame_agenda, width=6)
+    entry_hora_inicio.pack(side='left', padx=5)
+    ttk.Label(frame_agenda, text="Fim:").pack(side='left')
+    entry_hora_fim = ttk.Entry(frame_agenda, width=6)
+    entry_hora_fim.pack(side='left', padx=5)
     
     widgets = criar_abas_sessao(frame)
     widgets['data'] = entry_data # Adiciona a entrada de data ao dicionário
+    widgets['medico'] = combo_medico
+    widgets['medicos_ids'] = [None] + [m['id'] for m in medicos]
+    widgets['hora_inicio'] = entry_hora_inicio
+    widgets['hora_fim'] = entry_hora_fim
 
     if sessao_id: # Modo de edição
         sessao_data = database.buscar_sessao_por_id(sessao_id)
         entry_data.insert(0, formatar_data_para_exibicao(sessao_data['data_sessao']))
+        if sessao_data['medico_id'] in widgets['medicos_ids']:
+            combo_medico.current(widgets['medicos_ids'].index(sessao_data['medico_id']))
+        entry_hora_inicio.insert(0, sessao_data['hora_inicio_sessao'] or "")
+        entry_hora_fim.insert(0, sessao_data['hora_fim_sessao'] or "")
         widgets['resumo'].insert('1.0', sessao_data['resumo_sessao'] or "")
         widgets['evolucao'].set(sessao_data['nivel_evolucao'] or "")
         widgets['obs_evolucao'].insert('1.0', sessao_data['observacoes_evolucao'] or "")
@@ -676,6 +1512,10 @@ def abrir_janela_prontuario(janela_pai, paciente_id, paciente_nome):
     # --- Carrega os dados do prontuário ---
     try:
         prontuario_data = database.buscar_ou_criar_prontuario(paciente_id)
+    except database.AcessoNegado as e: # Paciente ainda sem prontuário e usuário sem permissão para criá-lo
+        messagebox.showwarning("Acesso Negado", str(e), parent=janela_prontuario)
+        janela_prontuario.destroy()
+        return
     except sqlite3.Error as e:
         messagebox.showerror("Erro de Banco de Dados", f"Não foi possível carregar o prontuário: {e}", parent=janela_prontuario)
         janela_prontuario.destroy()
@@ -714,6 +1554,73 @@ def abrir_janela_prontuario(janela_pai, paciente_id, paciente_nome):
     txt_anamnese = tk.Text(aba_anamnese, wrap='word'); txt_anamnese.pack(fill='both', expand=True, pady=5)
     txt_anamnese.insert('1.0', prontuario_data.get('anamnese') or "")
 
+    # --- Aba 3: Anexos (só os metadados são lidos ao abrir; o conteúdo, ao salvar uma cópia) ---
+    aba_anexos = ttk.Frame(notebook, padding=10)
+    notebook.add(aba_anexos, text=' Anexos ')
+    cols = ('ID', 'Arquivo', 'Tipo', 'Tamanho', 'Anexado em')
+    tree_anexos = ttk.Treeview(aba_anexos, columns=cols, show='headings')
+    for col, largura in zip(cols, (0, 300, 140, 90, 120)):
+        tree_anexos.heading(col, text=col); tree_anexos.column(col, width=largura)
+    tree_anexos.column('ID', stretch=tk.NO) # Oculto
+    tree_anexos.pack(fill='both', expand=True)
+    botoes_anexos = ttk.Frame(aba_anexos)
+    botoes_anexos.pack(fill='x', pady=(10, 0))
+
+    def recarregar_anexos():
+        tree_anexos.delete(*tree_anexos.get_children())
+        try:
+            anexos = database.listar_anexos(prontuario_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao carregar os anexos: {e}", parent=janela_prontuario)
+            return
+        for linha in preparar_linhas_anexos(anexos):
+            tree_anexos.insert("", "end", values=linha)
+
+    def anexar_arquivo():
+        caminho = filedialog.askopenfilename(parent=janela_prontuario, title="Anexar Arquivo")
+        if not caminho:
+            return
+        try:
+            database.adicionar_anexo(prontuario_id, caminho)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            messagebox.showerror("Erro", f"Não foi possível anexar o arquivo: {e}", parent=janela_prontuario)
+            return
+        recarregar_anexos()
+
+    def anexo_selecionado():
+        item = tree_anexos.focus()
+        if not item:
+            messagebox.showwarning("Nenhuma Seleção", "Selecione um anexo.", parent=janela_prontuario)
+            return None
+        return tree_anexos.item(item)['values']
+
+    def salvar_copia_anexo():
+        valores = anexo_selecionado()
+        if not valores:
+            return
+        caminho = filedialog.asksaveasfilename(parent=janela_prontuario, title="Salvar Cópia do Anexo", initialfile=valores[1])
+        if not caminho:
+            return
+        try:
+            database.salvar_anexo_em(valores[0], caminho)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            messagebox.showerror("Erro", f"Não foi possível salvar o anexo: {e}", parent=janela_prontuario)
+
+    def excluir_anexo_selecionado():
+        valores = anexo_selecionado()
+        if not valores or not messagebox.askyesno("Confirmar", f"Excluir o anexo '{valores[1]}'?", parent=janela_prontuario):
+            return
+        try:
+            database.excluir_anexo(valores[0])
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Não foi possível excluir o anexo: {e}", parent=janela_prontuario)
+        recarregar_anexos()
+
+    ttk.Button(botoes_anexos, text="Anexar Arquivo...", command=anexar_arquivo).pack(side='left')
+    ttk.Button(botoes_anexos, text="Salvar Cópia...", command=salvar_copia_anexo).pack(side='left', padx=5)
+    ttk.Button(botoes_anexos, text="Excluir Anexo", command=excluir_anexo_selecionado).pack(side='left')
+    recarregar_anexos()
+
     # --- Botão Salvar ---
     def salvar_prontuario():
         try:
@@ -777,13 +1684,13 @@ def abrir_janela_lista_medicos(janela_principal):
         abrir_janela_disponibilidade(janela_lista, medico_id, medico_nome)
 
     def excluir_selecionado():
-        selected_item = tree.focus()
-        if not selected_item: return
-        medico_id = tree.item(selected_item)['values'][0]
-        nome_medico = tree.item(selected_item)['values'][1]
-        if messagebox.askyesno("Confirmar", f"Tem certeza que deseja excluir '{nome_medico}'?", parent=janela_lista):
+        itens = tree.selection() # Ctrl/Shift + clique seleciona vários
+        if not itens: return
+        medico_ids = [tree.item(item)['values'][0] for item in itens]
+        descricao = f"'{tree.item(itens[0])['values'][1]}'" if len(itens) == 1 else f"{len(itens)} médicos"
+        if messagebox.askyesno("Confirmar", f"Tem certeza que deseja excluir {descricao}?", parent=janela_lista):
             try:
-                database.excluir_medico(medico_id)
+                database.excluir_medicos(medico_ids)
                 recarregar_lista()
             except sqlite3.Error as e:
                 messagebox.showerror("Erro", f"Erro ao excluir: {e}", parent=janela_lista)
@@ -820,6 +1727,9 @@ def abrir_janela_lista(janela_principal, callback_atualizar_calendario):
 
     def executar_busca():
         """Chama a função de recarregar lista com o termo da busca."""
+        if estado_busca['agendada']:
+            janela_lista.after_cancel(estado_busca['agendada'])
+            estado_busca['agendada'] = None
         recarregar_lista(entry_busca.get())
 
     # Adiciona o evento <Return> (Enter) para o campo de busca
@@ -827,6 +1737,43 @@ def abrir_janela_lista(janela_principal, callback_atualizar_calendario):
 
     ttk.Button(busca_frame, text="Buscar", command=executar_busca).pack(side='left', padx=5)
 
+    # --- Busca enquanto digita ---
+    # Cada tecla reagenda a busca; ela só roda quando o usuário para de digitar por um instante.
+    ATRASO_BUSCA_MS = 150
+    busca_incremental = tk.BooleanVar(value=True)
+    ttk.Checkbutton(busca_frame, text="Buscar enquanto digita", variable=busca_incremental).pack(side='left', padx=5)
+    estado_busca = {'agendada': None}
+
+    def buscar_enquanto_digita():
+        estado_busca['agendada'] = None
+        termo = entry_busca.get()
+        if not termo.strip():
+            recarregar_lista()
+            return
+        for i in tree.get_children():
+            tree.delete(i)
+        try:
+            pacientes = indice_pacientes.buscar_pacientes_incremental(termo)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Ocorreu um erro ao buscar pacientes: {e}", parent=janela_lista)
+            return
+        for valores_para_inserir in preparar_linhas_pacientes(pacientes):
+            tree.insert("", "end", values=valores_para_inserir)
+
+    def ao_digitar(event):
+        if not busca_incremental.get() or event.keysym in ('Return', 'KP_Enter', 'Tab'):
+            return
+        if estado_busca['agendada']:
+            janela_lista.after_cancel(estado_busca['agendada'])
+        estado_busca['agendada'] = janela_lista.after(ATRASO_BUSCA_MS, buscar_enquanto_digita)
+
+    def cancelar_busca_agendada(event):
+        if event.widget == janela_lista and estado_busca['agendada']:
+            janela_lista.after_cancel(estado_busca['agendada'])
+
+    entry_busca.bind("<KeyRelease>", ao_digitar)
+    janela_lista.bind("<Destroy>", cancelar_busca_agendada, add='+')
+
     # --- Tabela (Treeview) ---
     tree_frame = ttk.Frame(frame)
     tree_frame.pack(expand=True, fill='both')
@@ -868,11 +1815,8 @@ def abrir_janela_lista(janela_principal, callback_atualizar_calendario):
             else: # Caso contrário, lista todos os pacientes.
                 pacientes = database.listar_pacientes()
 
-            for paciente in pacientes:
-                idade = calcular_idade(paciente['data_nascimento'])
-                data_nasc_exibicao = formatar_data_para_exibicao(paciente['data_nascimento'])
-                # Monta a tupla na ordem correta das colunas da Treeview
-                valores_para_inserir = (paciente['id'], paciente['nome_completo'], idade, data_nasc_exibicao, paciente['nome_responsavel'])
+            # Monta as tuplas na ordem correta das colunas da Treeview
+            for valores_para_inserir in preparar_linhas_pacientes(pacientes):
                 tree.insert("", "end", values=valores_para_inserir)
 
         except sqlite3.Error as e:
@@ -955,11 +1899,51 @@ def abrir_janela_lista(janela_principal, callback_atualizar_calendario):
 
 # --- Funções de Gerenciamento de Usuários (Admin) ---
 
+SEM_VINCULO = "(nenhum)"
+
+def criar_combo_medico_vinculado(frame):
+    """Cria o combobox de médicos/terapeutas para vincular a um usuário. Retorna (combobox, {nome: id})."""
+    medicos_ids = {SEM_VINCULO: None}
+    try:
+        for medico in database.listar_medicos():
+            medicos_ids[medico['nome_completo']] = medico['id']
+    except sqlite3.Error as e:
+        messagebox.showerror("Erro", f"Erro ao carregar médicos: {e}", parent=frame)
+    combo = ttk.Combobox(frame, values=list(medicos_ids), state='readonly')
+    combo.set(SEM_VINCULO)
+    return combo, medicos_ids
+
+def abrir_janela_vincular_medico(janela_pai, usuario_id, usuario_nome, medico_atual, callback_atualizar):
+    """Abre um diálogo para vincular (ou desvincular) um usuário a um médico/terapeuta."""
+    janela_vinculo = tk.Toplevel(janela_pai)
+    janela_vinculo.title(f"Vincular Médico - {usuario_nome}")
+    janela_vinculo.geometry("380x150")
+    janela_vinculo.transient(janela_pai)
+    janela_vinculo.grab_set()
+
+    frame = ttk.Frame(janela_vinculo, padding=20)
+    frame.pack(fill='both', expand=True)
+    ttk.Label(frame, text="Médico/Terapeuta:").pack(anchor='w')
+    combo_medico, medicos_ids = criar_combo_medico_vinculado(frame)
+    combo_medico.pack(fill='x', pady=(0, 10))
+    if medico_atual in medicos_ids:
+        combo_medico.set(medico_atual)
+
+    def salvar_vinculo():
+        try:
+            database.vincular_usuario_medico(usuario_id, medicos_ids.get(combo_medico.get()))
+            janela_vinculo.destroy()
+            callback_atualizar()
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao vincular médico: {e}", parent=janela_vinculo)
+
+    ttk.Button(frame, text="Salvar", command=salvar_vinculo).pack(anchor='e')
+
 def abrir_janela_cadastro_usuario(janela_pai, callback_atualizar):
     """Abre uma janela para cadastrar um novo usuário."""
     janela_cad_user = tk.Toplevel(janela_pai)
     janela_cad_user.title("Cadastrar Novo Usuário")
-    janela_cad_user.geometry("400x250")
+    janela_cad_user.geometry("400x320")
     janela_cad_user.transient(janela_pai)
     janela_cad_user.grab_set()
 
@@ -984,8 +1968,13 @@ def abrir_janela_cadastro_usuario(janela_pai, callback_atualizar):
     combo_nivel.grid(row=7, column=0, sticky='ew')
     combo_nivel.set('terapeuta')
 
+    ttk.Label(frame, text="Médico/Terapeuta Vinculado (opcional):").grid(row=8, column=0, sticky='w', pady=(10, 2))
+    combo_medico, medicos_ids = criar_combo_medico_vinculado(frame)
+    combo_medico.grid(row=9, column=0, sticky='ew')
+
     def salvar_novo_usuario():
         user, p1, p2, nivel = entry_user.get().strip(), entry_pass.get(), entry_pass_confirm.get(), combo_nivel.get()
+        medico_id = medicos_ids.get(combo_medico.get())
         if not (user and p1 and p2 and nivel):
             messagebox.showerror("Erro", "Todos os campos são obrigatórios.", parent=janela_cad_user); return
         if p1 != p2:
@@ -994,7 +1983,7 @@ def abrir_janela_cadastro_usuario(janela_pai, callback_atualizar):
             messagebox.showwarning("Senha Fraca", "A senha deve ter no mínimo 6 caracteres.", parent=janela_cad_user); return
         
         try:
-            database.adicionar_usuario(user, p1, nivel)
+            database.adicionar_usuario(user, p1, nivel, medico_id)
             messagebox.showinfo("Sucesso", f"Usuário '{user}' criado com sucesso.", parent=janela_cad_user)
             janela_cad_user.destroy()
             callback_atualizar()
@@ -1003,13 +1992,13 @@ def abrir_janela_cadastro_usuario(janela_pai, callback_atualizar):
         except sqlite3.Error as e:
             messagebox.showerror("Erro de Banco de Dados", f"Erro ao criar usuário: {e}", parent=janela_cad_user)
 
-    ttk.Button(frame, text="Salvar", command=salvar_novo_usuario).grid(row=8, column=0, sticky='e', pady=15)
+    ttk.Button(frame, text="Salvar", command=salvar_novo_usuario).grid(row=10, column=0, sticky='e', pady=15)
 
 def abrir_janela_gerenciar_usuarios(janela_principal):
     """Abre a janela de gerenciamento de usuários para o admin."""
     janela_users = tk.Toplevel(janela_principal)
     janela_users.title("Gerenciamento de Usuários")
-    janela_users.geometry("600x400")
+    janela_users.geometry("750x400")
     janela_users.transient(janela_principal)
     janela_users.grab_set()
 
@@ -1018,12 +2007,13 @@ def abrir_janela_gerenciar_usuarios(janela_principal):
 
     tree_frame = ttk.Frame(frame)
     tree_frame.pack(expand=True, fill='both', pady=(0, 10))
-    cols = ('ID', 'Nome de Usuário', 'Nível de Acesso')
+    cols = ('ID', 'Nome de Usuário', 'Nível de Acesso', 'Médico Vinculado')
     tree = ttk.Treeview(tree_frame, columns=cols, show='headings')
 
     tree.heading('ID', text='ID'); tree.column('ID', width=50, anchor='center')
     tree.heading('Nome de Usuário', text='Nome de Usuário'); tree.column('Nome de Usuário', width=250)
     tree.heading('Nível de Acesso', text='Nível de Acesso'); tree.column('Nível de Acesso', width=150, anchor='center')
+    tree.heading('Médico Vinculado', text='Médico Vinculado'); tree.column('Médico Vinculado', width=220)
     tree.grid(row=0, column=0, sticky='nsew')
     scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
     tree.configure(yscroll=scrollbar.set)
@@ -1034,7 +2024,7 @@ def abrir_janela_gerenciar_usuarios(janela_principal):
         for i in tree.get_children(): tree.delete(i)
         try:
             for user in database.listar_usuarios():
-                tree.insert("", "end", values=(user['id'], user['nome_usuario'], user['nivel_acesso']))
+                tree.insert("", "end", values=(user['id'], user['nome_usuario'], user['nivel_acesso'], user['medico_nome'] or ''))
         except sqlite3.Error as e:
             messagebox.showerror("Erro", f"Erro ao carregar usuários: {e}", parent=janela_users)
 
@@ -1045,7 +2035,8 @@ def abrir_janela_gerenciar_usuarios(janela_principal):
         user_id = tree.item(selected_item)['values'][0]
         user_nome = tree.item(selected_item)['values'][1]
 
-        if user_id == USUARIO_LOGADO['id']:
+        sessao = database.sessao_atual()
+        if sessao and user_id == sessao.usuario_id:
             messagebox.showerror("Ação Inválida", "Você não pode excluir o seu próprio usuário.", parent=janela_users)
             return
 
@@ -1056,37 +2047,53 @@ def abrir_janela_gerenciar_usuarios(janela_principal):
             except sqlite3.Error as e:
                 messagebox.showerror("Erro", f"Erro ao excluir usuário: {e}", parent=janela_users)
 
+    def vincular_selecionado():
+        selected_item = tree.focus()
+        if not selected_item: return
+        user_id, user_nome, _, medico_nome = tree.item(selected_item)['values']
+        abrir_janela_vincular_medico(janela_users, user_id, user_nome, medico_nome, recarregar_lista)
+
     botoes_frame = ttk.Frame(frame)
     botoes_frame.pack(fill='x', side='bottom')
     ttk.Button(botoes_frame, text="Adicionar Novo", command=lambda: abrir_janela_cadastro_usuario(janela_users, recarregar_lista)).pack(side='left', padx=5)
+    ttk.Button(botoes_frame, text="Vincular Médico...", command=vincular_selecionado).pack(side='left', padx=5)
     ttk.Button(botoes_frame, text="Excluir Selecionado", command=excluir_selecionado).pack(side='left', padx=5)
 
     recarregar_lista()
     
 
-def abrir_janela_principal():
-    """Cria e exibe a janela principal da aplicação após o login."""
+def construir_janela_principal(master=None):
+    """
+    Cria a janela principal da aplicação, sem entrar no mainloop. Retorna a raiz Tk (ou None em caso de erro).
+    Com master, a janela é um Toplevel dele e não inicia a vigia de alterações (é o caso do harness_janelas.py).
+    """
     try:
         # Inicializa o banco de dados, criando e/ou atualizando as tabelas necessárias.
         database.inicializar_banco_de_dados()
     except Exception as e:
         # Se a inicialização do DB falhar, é um erro crítico.
         # Mostra uma mensagem de erro clara e encerra o programa.
-        root_error = tk.Tk()
-        root_error.withdraw()  # Oculta a janela raiz vazia
+        if master is None:
+            root_error = tk.Tk()
+            root_error.withdraw()  # Oculta a janela raiz vazia
         messagebox.showerror("Erro Crítico de Inicialização", f"Ocorreu um erro ao preparar o banco de dados:\n\n{e}\n\nO programa será encerrado.")
-        return # Impede que o resto do programa execute
-
-    root = tk.Tk()
-    root.title("Sistema de Clínica - Início")
+        return None # Impede que o resto do programa execute
+
+    if master is None:
+        root = tk.Tk()
+        mostrar_acesso_negado(root)
+    else:
+        root = tk.Toplevel(master)
+    root.title(f"Sistema de Clínica - {database.CLINICA_ATUAL}" if database.CLINICA_ATUAL else "Sistema de Clínica - Início")
     root.geometry("800x500") # Aumentei o tamanho para caber o calendário
 
     # --- Layout com Frames ---
     top_frame = tk.Frame(root, pady=10)
     top_frame.pack(fill='x', padx=10, anchor='n')
     tk.Label(top_frame, text="Sistema de Acompanhamento Terapêutico", font=("Helvetica", 16, "bold")).pack(side='left', expand=True)
-    if USUARIO_LOGADO:
-        user_info = f"Usuário: {USUARIO_LOGADO['nome_usuario']} ({USUARIO_LOGADO['nivel_acesso']})"
+    sessao = database.sessao_atual()
+    if sessao:
+        user_info = f"Usuário: {sessao.nome_usuario} ({sessao.nivel_acesso})"
         tk.Label(top_frame, text=user_info, font=("Helvetica", 9)).pack(side='right')
 
     main_content_frame = tk.Frame(root)
@@ -1105,26 +2112,62 @@ def abrir_janela_principal():
     btn_cadastrar = tk.Button(left_frame, text="Cadastrar Paciente", font=("Helvetica", 11), command=lambda: abrir_janela_cadastro(root))
     btn_cadastrar.pack(pady=5, fill='x')
 
-    # Botões visíveis apenas para o administrador
-    if USUARIO_LOGADO and USUARIO_LOGADO['nivel_acesso'] == 'admin':
+    # Agenda do próprio terapeuta, quando o usuário está vinculado a um médico/terapeuta
+    medico_vinculado = sessao and sessao.medico_id and database.buscar_medico_por_id(sessao.medico_id)
+    if medico_vinculado:
+        btn_minha_agenda = tk.Button(left_frame, text="Minha Agenda", font=("Helvetica", 11),
+                                     command=lambda: abrir_janela_agenda_terapeuta(root, medico_vinculado['id'], medico_vinculado['nome_completo']))
+        btn_minha_agenda.pack(pady=5, fill='x')
+
+    # Busca entre clínicas, disponível quando a rede tem mais de um banco configurado
+    if len(database.CLINICAS) > 1:
+        btn_busca_clinicas = tk.Button(left_frame, text="Buscar em Todas as Clínicas", font=("Helvetica", 11), command=lambda: abrir_janela_busca_clinicas(root))
+        btn_busca_clinicas.pack(pady=5, fill='x')
+
+    # Botões visíveis apenas para quem tem a permissão (o administrador); o banco também a exige em cada escrita
+    if database.tem_permissao('medicos.gerenciar'):
         btn_medicos = tk.Button(left_frame, text="Gerenciar Médicos", font=("Helvetica", 11), command=lambda: abrir_janela_lista_medicos(root))
         btn_medicos.pack(pady=5, fill='x')
+    if database.tem_permissao('usuarios.gerenciar'):
         btn_gerenciar_usuarios = tk.Button(left_frame, text="Gerenciar Usuários", font=("Helvetica", 11), command=lambda: abrir_janela_gerenciar_usuarios(root))
         btn_gerenciar_usuarios.pack(pady=5, fill='x')
+    if database.tem_permissao('medicos.gerenciar'):
+        btn_visao_agenda = tk.Button(left_frame, text="Visão Geral da Agenda", font=("Helvetica", 11), command=lambda: abrir_janela_visao_geral_agenda(root))
+        btn_visao_agenda.pack(pady=5, fill='x')
+    if database.tem_permissao('sessoes.editar'):
+        btn_lista_espera = tk.Button(left_frame, text="Lista de Espera", font=("Helvetica", 11), command=lambda: abrir_janela_lista_espera(root))
+        btn_lista_espera.pack(pady=5, fill='x')
+    if database.tem_permissao('auditoria.consultar'):
+        btn_auditoria = tk.Button(left_frame, text="Auditoria de Acessos", font=("Helvetica", 11), command=lambda: abrir_janela_auditoria(root))
+        btn_auditoria.pack(pady=5, fill='x')
 
     def atualizar_eventos_calendario(calendario):
-        """Busca as datas com sessões e as marca no calendário."""
+        """Busca as datas com sessões do mês exibido e as marca no calendário."""
         # Limpa todos os eventos antigos para não duplicar
         calendario.calevent_remove('all')
-        
-        datas_sessoes = database.listar_datas_sessoes()
-        for data_str in datas_sessoes:
-            try:
-                data_obj = datetime.strptime(data_str, '%Y-%m-%d').date()
-                # Cria um evento naquela data com uma tag específica
+
+        # O calendário também mostra alguns dias dos meses vizinhos, por isso a folga de uma semana
+        ano, mes = calendario.get_displayed_month()
+        dia_inicio, dia_fim = database.intervalo_mes(ano, mes)
+        datas_sessoes = database.listar_datas_sessoes(dia_inicio - 7, dia_fim + 7)
+        for data_obj in preparar_datas_calendario(datas_sessoes):
+            # Cria um evento naquela data com uma tag específica
+            calendario.calevent_create(data_obj, 'Sessão Agendada', tags='sessao_marcada')
+
+    def aplicar_alteracoes_calendario(calendario, alteracoes):
+        """Remarca só os dias exibidos cujas sessões foram alteradas por outras estações."""
+        if alteracoes is None:
+            atualizar_eventos_calendario(calendario)
+            return
+        ano, mes = calendario.get_displayed_month()
+        dia_inicio, dia_fim = database.intervalo_mes(ano, mes)
+        dias = {dia for a in alteracoes for dia in (a['dia'], a['dia_anterior'])
+                if dia is not None and dia_inicio - 7 <= dia <= dia_fim + 7}
+        for dia in dias:
+            data_obj = database.data_do_dia(dia)
+            calendario.calevent_remove(date=data_obj, tag='sessao_marcada')
+            if database.listar_datas_sessoes(dia, dia):
                 calendario.calevent_create(data_obj, 'Sessão Agendada', tags='sessao_marcada')
-            except (ValueError, TypeError):
-                continue # Ignora datas em formato inválido
 
     # --- Calendário (no frame da direita) ---
     # Configura o estilo da tag que vamos usar para marcar os dias
@@ -1138,6 +2181,7 @@ def abrir_janela_principal():
     cal.pack(fill="both", expand=True)
     # Configura a cor da nossa tag de evento
     cal.tag_config('sessao_marcada', background='lightblue', foreground='black')
+    cal.bind("<<CalendarMonthChanged>>", lambda e: atualizar_eventos_calendario(cal))
 
     # Botão de Listar Pacientes (precisa do callback do calendário)
     btn_listar = tk.Button(left_frame, text="Listar Pacientes", font=("Helvetica", 11), command=lambda: abrir_janela_lista(root, lambda: atualizar_eventos_calendario(cal)))
@@ -1146,7 +2190,18 @@ def abrir_janela_principal():
     # Carrega os eventos no calendário pela primeira vez
     atualizar_eventos_calendario(cal)
 
-    root.mainloop()
+    # Sessões agendadas em outras estações aparecem sem precisar reabrir o programa
+    if master is None:
+        iniciar_vigia_alteracoes(root)
+    inscrever_alteracoes(root, ('sessoes',), lambda alteracoes: aplicar_alteracoes_calendario(cal, alteracoes))
+
+    return root
+
+def abrir_janela_principal():
+    """Cria e exibe a janela principal da aplicação após o login."""
+    root = construir_janela_principal()
+    if root:
+        root.mainloop()
 
 def abrir_janela_login():
     """Abre a janela de login inicial do sistema."""
@@ -1182,14 +2237,18 @@ def abrir_janela_login():
             messagebox.showerror("Erro", "Usuário e senha são obrigatórios.", parent=login_window)
             return
 
-        usuario_valido = database.verificar_usuario(usuario, senha)
-        if usuario_valido:
-            global USUARIO_LOGADO
-            USUARIO_LOGADO = usuario_valido
-            login_window.destroy()
-            abrir_janela_principal()
-        else:
-            messagebox.showerror("Falha no Login", "Nome de usuário ou senha incorretos.", parent=login_window)
+        try:
+            database.iniciar_sessao(usuario, senha)
+        except database.AcessoNegado as e:
+            messagebox.showerror("Falha no Login", str(e), parent=login_window)
+            return
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Erro ao verificar o usuário: {e}", parent=login_window)
+            return
+        login_window.destroy()
+        if database.tem_permissao('sessoes.editar'):
+            lembretes.iniciar() # Lembretes das próximas sessões, enviados em segundo plano
+        abrir_janela_principal()
 
     entry_pass.bind("<Return>", lambda event: tentar_login())
     ttk.Button(frame, text="Login", command=tentar_login).pack(fill='x')
@@ -1198,12 +2257,20 @@ def abrir_janela_login():
 def main():
     """Função principal que inicializa o DB e chama a tela de login."""
     try:
+        # Se houver um clinicas.json, esta estação passa a usar o banco da sua clínica
+        database.carregar_configuracao_clinicas()
         database.inicializar_banco_de_dados()
+        database.AUTORIZACAO_ATIVA = True # Toda escrita passa a exigir a sessão do usuário que entrou
     except Exception as e:
         root_error = tk.Tk(); root_error.withdraw()
         messagebox.showerror("Erro Crítico", f"Erro ao inicializar o banco de dados:\n\n{e}")
         return
-    abrir_janela_login()
+    auditoria.iniciar()
+    try:
+        abrir_janela_login()
+    finally:
+        lembretes.encerrar()
+        auditoria.encerrar() # Grava os eventos que ainda estão na fila
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Rotina de arquivamento das sessões antigas.
+
+Move as sessões anteriores à data de corte para o arquivo morto ('<banco>_arquivo.db'),
+com os textos longos comprimidos, e informa o tamanho dos arquivos e a latência das
+consultas mais usadas antes e depois. Uso:
+
+    python arquivamento.py                          # sessões com mais de 12 meses, no clinica.db
+    python arquivamento.py --meses 6 --db clinica_sintetica.db
+    python arquivamento.py --data-corte 2024-01-01 --simular --saida arquivamento.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+from datetime import date
+
+import database
+from cronometro import amostra_de_referencia, banco_de_trabalho, cronometrar
+
+def _tamanho_mb(caminho):
+    return round(os.path.getsize(caminho) / 2**20, 2) if os.path.exists(caminho) else 0.0
+
+def medir(repeticoes=20):
+    """Mede o tamanho dos arquivos e a latência das consultas do dia a dia no banco atual."""
+    with sqlite3.connect(database.DB_FILE) as conn:
+        sessoes = conn.execute("SELECT COUNT(*) FROM sessoes").fetchone()[0]
+    amostra = amostra_de_referencia()
+    hoje = date.today()
+    dia_inicio, dia_fim = database.intervalo_mes(hoje.year, hoje.month)
+    consultas = {'listar_datas_sessoes.mes': lambda: database.listar_datas_sessoes(dia_inicio - 7, dia_fim + 7)}
+    if amostra: # Sem sessões (todas arquivadas, ou banco novo), só a consulta do calendário faz sentido
+        paciente_id, sessao_id, medico_id, data_sessao = amostra
+        consultas.update({
+            'listar_sessoes_por_paciente': lambda: database.listar_sessoes_por_paciente(paciente_id),
+            'buscar_sessao_por_id': lambda: database.buscar_sessao_por_id(sessao_id),
+            'listar_sessoes_por_medico_e_data': lambda: database.listar_sessoes_por_medico_e_data(medico_id, data_sessao),
+        })
+    return {
+        'sessoes_no_banco': sessoes,
+        'banco_mb': _tamanho_mb(database.DB_FILE),
+        'arquivo_morto_mb': _tamanho_mb(database.caminho_arquivo_morto()),
+        'latencias_ms': {nome: cronometrar(funcao, repeticoes)['mediana_ms'] for nome, funcao in consultas.items()},
+    }
+
+def executar(data_corte=None, repeticoes=20):
+    """Arquiva as sessões antigas do banco atual e devolve o relatório com as medidas de antes e depois."""
+    antes = medir(repeticoes)
+    resultado = database.arquivar_sessoes_antigas(data_corte)
+    depois = medir(repeticoes)
+    return {**resultado, 'antes': antes, 'depois': depois}
+
+def imprimir(relatorio):
+    antes, depois = relatorio['antes'], relatorio['depois']
+    print(f"Sessões anteriores a {relatorio['data_corte']} arquivadas: {relatorio['sessoes_arquivadas']}")
+    print(f"{'':<36} {'antes':>12} {'depois':>12}")
+    print(f"{'sessões no banco':<36} {antes['sessoes_no_banco']:>12} {depois['sessoes_no_banco']:>12}")
+    print(f"{'banco (MB)':<36} {antes['banco_mb']:>12.2f} {depois['banco_mb']:>12.2f}")
+    print(f"{'arquivo morto (MB)':<36} {antes['arquivo_morto_mb']:>12.2f} {depois['arquivo_morto_mb']:>12.2f}")
+    for nome in dict.fromkeys([*antes['latencias_ms'], *depois['latencias_ms']]):
+        valores = [medidas['latencias_ms'].get(nome) for medidas in (antes, depois)]
+        print(f"{nome + ' (ms)':<36} " + ' '.join(f"{ms:>12.3f}" if ms is not None else f"{'—':>12}" for ms in valores))
+
+def main():
+    parser = argparse.ArgumentParser(description="Move as sessões antigas para o arquivo morto comprimido.")
+    parser.add_argument('--db', default=database.DB_FILE, help="Banco da clínica (padrão: %(default)s).")
+    parser.add_argument('--meses', type=int, default=database.MESES_DADOS_QUENTES,
+                        help="Mantém no banco principal as sessões dos últimos N meses (padrão: %(default)s).")
+    parser.add_argument('--data-corte', help="Data de corte explícita (YYYY-MM-DD); tem precedência sobre --meses.")
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--simular', action='store_true', help="Executa sobre uma cópia do banco, sem alterar o original.")
+    parser.add_argument('--saida', help="Arquivo JSON onde o relatório será gravado.")
+    args = parser.parse_args()
+
+    database.MESES_DADOS_QUENTES = args.meses
+    with banco_de_trabalho(args.db, args.simular, prefixo='arquivamento_clinica_'):
+        database.inicializar_banco_de_dados()
+        relatorio = executar(args.data_corte, args.repeticoes)
+
+    imprimir(relatorio)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Log de auditoria: quem viu ou alterou cada paciente, prontuário e sessão.
+
+database.py anuncia cada leitura e escrita auditada (ver database.registrar_auditor). O gravador
+apenas coloca o evento numa fila em memória, sem tocar em disco na thread de quem chamou; uma
+thread própria retira os eventos em lotes e grava cada lote numa única transação. Os eventos
+ficam num banco separado, '<nome>_auditoria.db' ao lado do banco da clínica, para que o
+crescimento da auditoria não aumente o clinica.db. Gatilhos impedem alterar ou apagar eventos.
+
+encerrar() (também chamada ao sair do Python) grava tudo o que ainda está na fila antes de
+voltar. Se o processo for morto, perdem-se no máximo os eventos de INTERVALO_GRAVACAO_S.
+Se o banco de auditoria falhar, até MAXIMO_PENDENTES eventos aguardam a próxima tentativa; os
+excedentes, e os de um lote com erro inesperado, são descartados com aviso (ver 'descartados').
+A consulta anexa o banco da clínica (somente leitura) para trazer o nome dos pacientes.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import quote
+
+import database
+
+LOTE_MAXIMO = 500
+MAXIMO_PENDENTES = 20 * LOTE_MAXIMO # Eventos guardados para nova tentativa enquanto o banco de auditoria falha
+INTERVALO_GRAVACAO_S = 0.5
+LIMITE_CONSULTA = 1000
+
+_ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS eventos (
+        id INTEGER PRIMARY KEY,
+        momento REAL NOT NULL, -- Segundos desde a época (time.time())
+        usuario_id INTEGER,
+        nome_usuario TEXT,
+        acao TEXT NOT NULL, -- 'visualizado', 'inserido', 'atualizado' ou 'excluido'
+        tabela TEXT NOT NULL,
+        registro_id INTEGER,
+        paciente_id INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_eventos_momento ON eventos (momento)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_usuario ON eventos (usuario_id, momento)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_paciente ON eventos (paciente_id, momento)",
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_eventos_sem_alteracao BEFORE UPDATE ON eventos
+    BEGIN SELECT RAISE(ABORT, 'Eventos de auditoria não podem ser alterados.'); END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_eventos_sem_exclusao BEFORE DELETE ON eventos
+    BEGIN SELECT RAISE(ABORT, 'Eventos de auditoria não podem ser excluídos.'); END
+    """,
+)
+
+_INSERIR = """
+    INSERT INTO eventos (momento, usuario_id, nome_usuario, acao, tabela, registro_id, paciente_id)
+    VALUES (:momento, :usuario_id, :nome_usuario, :acao, :tabela, :registro_id, :paciente_id)"""
+
+_FIM = object() # Marca, na fila, o pedido de encerramento
+
+def caminho_auditoria(arquivo=None):
+    """Retorna o caminho do banco de auditoria do banco da clínica indicado (por padrão, o atual)."""
+    return os.path.splitext(arquivo or database.DB_FILE)[0] + '_auditoria.db'
+
+def _uri(caminho, modo=''):
+    return f"file:{quote(os.path.abspath(caminho))}" + (f"?mode={modo}" if modo else '')
+
+def _abrir(caminho):
+    conn = sqlite3.connect(_uri(caminho), uri=True, check_same_thread=False)
+    for instrucao in _ESQUEMA:
+        conn.execute(instrucao)
+    conn.commit()
+    return conn
+
+class GravadorAuditoria:
+    """Recebe os eventos de database.py numa fila e os grava em lotes a partir de uma thread própria."""
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._conexoes = {}  # banco da clínica -> conexão com o seu banco de auditoria (usada só pela thread)
+        self._pendentes = [] # Eventos de um lote que falhou, tentados de novo no próximo (até MAXIMO_PENDENTES)
+        self.estatisticas = {'recebidos': 0, 'gravados': 0, 'lotes': 0, 'falhas': 0, 'descartados': 0}
+        self._thread = threading.Thread(target=self._executar, name='auditoria', daemon=True)
+        self._thread.start()
+        database.registrar_auditor(self.registrar)
+
+    def registrar(self, evento):
+        self.estatisticas['recebidos'] += 1
+        self._fila.put(evento)
+
+    def _proximo_lote(self):
+        """Espera o primeiro evento e junta os que chegarem em até INTERVALO_GRAVACAO_S (ou até LOTE_MAXIMO)."""
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + INTERVALO_GRAVACAO_S
+        while lote[-1] is not _FIM and len(lote) < LOTE_MAXIMO:
+            restante = prazo - time.monotonic()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._proximo_lote()
+            fim = lote[-1] is _FIM
+            eventos = self._pendentes + [e for e in lote if e is not _FIM]
+            gravados = self.estatisticas['gravados']
+            try:
+                self._gravar(eventos)
+            except Exception as e: # Um erro inesperado não pode matar a thread: descarregar() esperaria para sempre
+                perdidos = len(eventos) - (self.estatisticas['gravados'] - gravados)
+                self._pendentes = [] # Não adianta tentar de novo um evento que provoca erro inesperado
+                self.estatisticas['falhas'] += 1
+                self.estatisticas['descartados'] += perdidos
+                print(f"Aviso: erro inesperado na gravação da auditoria, {perdidos} eventos descartados: {e!r}")
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
+            if fim:
+                break
+        for conn in self._conexoes.values():
+            conn.close()
+        self._conexoes = {}
+
+    def _gravar(self, eventos):
+        if not eventos:
+            return
+        por_arquivo = {}
+        for evento in eventos:
+            por_arquivo.setdefault(evento['arquivo'], []).append(evento)
+        self._pendentes = []
+        for arquivo, grupo in por_arquivo.items():
+            try:
+                conn = self._conexoes.get(arquivo)
+                if conn is None:
+                    conn = self._conexoes[arquivo] = _abrir(caminho_auditoria(arquivo))
+                with conn:
+                    conn.executemany(_INSERIR, grupo)
+                self.estatisticas['gravados'] += len(grupo)
+                self.estatisticas['lotes'] += 1
+            except sqlite3.Error as e:
+                self.estatisticas['falhas'] += 1
+                print(f"Aviso: falha ao gravar {len(grupo)} eventos de auditoria (nova tentativa no próximo lote): {e}")
+                self._pendentes.extend(grupo)
+        excesso = len(self._pendentes) - MAXIMO_PENDENTES
+        if excesso > 0: # Os mais antigos saem primeiro, para a memória não crescer sem limite
+            del self._pendentes[:excesso]
+            self.estatisticas['descartados'] += excesso
+            print(f"Aviso: {excesso} eventos de auditoria descartados (mais de {MAXIMO_PENDENTES} aguardando gravação).")
+
+    def descarregar(self):
+        """Espera até que todos os eventos já recebidos tenham sido gravados (ou tenham falhado)."""
+        self._fila.join()
+
+    def encerrar(self):
+        """Para de receber eventos, grava os que estão na fila e encerra a thread."""
+        database.remover_auditor(self.registrar)
+        if self._thread.is_alive():
+            self._fila.put(_FIM)
+            self._thread.join()
+        if self._pendentes:
+            print(f"Aviso: {len(self._pendentes)} eventos de auditoria não puderam ser gravados.")
+
+_gravador = None
+
+def iniciar():
+    """Passa a auditar as leituras e escritas deste processo. Retorna o gravador."""
+    global _gravador
+    if _gravador is None:
+        _gravador = GravadorAuditoria()
+        atexit.register(encerrar)
+    return _gravador
+
+def encerrar():
+    """Grava os eventos pendentes e para a auditoria."""
+    global _gravador
+    if _gravador is not None:
+        _gravador.encerrar()
+        _gravador = None
+
+def descarregar():
+    if _gravador is not None:
+        _gravador.descarregar()
+
+def consultar_eventos(usuario_id=None, paciente_id=None, inicio=None, fim=None, limite=LIMITE_CONSULTA):
+    """
+    Retorna os eventos do banco atual, do mais recente para o mais antigo, filtrados por usuário,
+    paciente e/ou período (inicio e fim como datetime.date, inclusive), com o nome do paciente.
+    Os eventos ainda na fila são gravados antes, para que a consulta inclua as ações mais recentes.
+    """
+    database.exigir_permissao('auditoria.consultar')
+    descarregar()
+    caminho = caminho_auditoria()
+    if not os.path.exists(caminho):
+        return []
+    condicoes, parametros = [], []
+    if usuario_id is not None:
+        condicoes.append("e.usuario_id = ?"); parametros.append(usuario_id)
+    if paciente_id is not None:
+        condicoes.append("e.paciente_id = ?"); parametros.append(paciente_id)
+    if inicio is not None:
+        condicoes.append("e.momento >= ?"); parametros.append(time.mktime(inicio.timetuple()))
+    if fim is not None: # Até a meia-noite seguinte: dias com mudança de horário de verão não têm 86400s
+        condicoes.append("e.momento < ?"); parametros.append(time.mktime((fim + timedelta(days=1)).timetuple()))
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    conn = sqlite3.connect(_uri(caminho, 'ro'), uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("ATTACH DATABASE ? AS clinica", (_uri(database.DB_FILE, 'ro'),))
+        cursor = conn.execute(f"""
+            SELECT e.id, e.momento, e.usuario_id, e.nome_usuario, e.acao, e.tabela, e.registro_id, e.paciente_id,
+                   p.nome_completo AS paciente_nome
+            FROM eventos e LEFT JOIN clinica.pacientes p ON p.id = e.paciente_id
+            {where}
+            ORDER BY e.momento DESC, e.id DESC
+            LIMIT ?""", (*parametros, limite))
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
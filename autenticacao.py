@@ -0,0 +1,100 @@
+"""
+Sessões de acesso: tokens assinados, permissões por nível de acesso e bloqueio após falhas de login.
+
+Ao entrar, o usuário recebe uma SessaoAcesso com as permissões do seu nível já calculadas e um
+token assinado com HMAC por uma chave que só existe na memória deste processo. database.py guarda
+a sessão atual e, em cada escrita, só confere se a permissão está no conjunto da sessão e se ela
+ainda vale, sem consultar o banco. As comparações de senha e de assinatura são feitas em tempo
+constante (hmac.compare_digest). Num banco com criptografia, a sessão também leva a chave dos
+textos clínicos aberta no login (cifradores), que deixa de valer quando a sessão é encerrada.
+Este módulo não acessa o banco.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+
+VALIDADE_SESSAO_SEGUNDOS = 12 * 3600
+MAX_TENTATIVAS_LOGIN = 5
+BLOQUEIO_SEGUNDOS = 15 * 60
+
+# Permissões exigidas pelas escritas de database.py (e pela consulta da auditoria)
+PERMISSOES = ('pacientes.editar', 'sessoes.editar', 'prontuarios.editar',
+              'medicos.gerenciar', 'usuarios.gerenciar', 'banco.manutencao', 'auditoria.consultar')
+
+PERMISSOES_POR_NIVEL = {
+    'admin': frozenset(PERMISSOES),
+    'terapeuta': frozenset({'pacientes.editar', 'sessoes.editar', 'prontuarios.editar'}),
+}
+
+_CHAVE = secrets.token_bytes(32) # Tokens de outro processo (ou de uma execução anterior) não valem aqui
+_sessoes = {} # token -> SessaoAcesso emitida e ainda não encerrada
+
+class AcessoNegado(ValueError):
+    """Erro lançado quando não há sessão, a sessão expirou ou o usuário não tem a permissão exigida."""
+
+    def __init__(self, mensagem, permissao=None):
+        self.permissao = permissao
+        super().__init__(mensagem)
+
+class SessaoAcesso:
+    """Usuário autenticado, com as permissões do seu nível e o token que identifica a sessão."""
+    __slots__ = ('usuario_id', 'nome_usuario', 'nivel_acesso', 'medico_id', 'permissoes', 'expira_em', 'token', 'ativa',
+                 'cifradores')
+
+    def __init__(self, usuario_id, nome_usuario, nivel_acesso, medico_id, expira_em, token):
+        self.usuario_id = usuario_id
+        self.nome_usuario = nome_usuario
+        self.nivel_acesso = nivel_acesso
+        self.medico_id = medico_id
+        self.permissoes = PERMISSOES_POR_NIVEL.get(nivel_acesso, frozenset())
+        self.expira_em = expira_em
+        self.token = token
+        self.ativa = True
+        self.cifradores = {} # arquivo do banco -> criptografia.Cifrador com a chave aberta no login
+
+    def permite(self, permissao):
+        return self.ativa and permissao in self.permissoes and time.time() < self.expira_em
+
+def _assinar(conteudo):
+    return hmac.new(_CHAVE, conteudo.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def emitir_sessao(usuario):
+    """Cria a sessão de um usuário já autenticado (dicionário com id, nome_usuario, nivel_acesso e medico_id)."""
+    expira_em = int(time.time()) + VALIDADE_SESSAO_SEGUNDOS
+    conteudo = f"{usuario['id']}.{usuario['nivel_acesso']}.{expira_em}.{secrets.token_hex(8)}"
+    token = f"{conteudo}.{_assinar(conteudo)}"
+    sessao = SessaoAcesso(usuario['id'], usuario['nome_usuario'], usuario['nivel_acesso'], usuario.get('medico_id'), expira_em, token)
+    _sessoes[token] = sessao
+    return sessao
+
+def validar_token(token):
+    """Retorna a sessão do token se a assinatura confere e a sessão não expirou nem foi encerrada; senão lança AcessoNegado."""
+    conteudo, _, assinatura = (token or '').rpartition('.')
+    if not hmac.compare_digest(assinatura, _assinar(conteudo)):
+        raise AcessoNegado("Sessão inválida.")
+    sessao = _sessoes.get(token)
+    if sessao is None or not sessao.ativa or time.time() >= sessao.expira_em:
+        raise AcessoNegado("A sessão expirou. Entre novamente.")
+    return sessao
+
+def encerrar_sessoes(usuario_id=None, token=None):
+    """Encerra a sessão do token, ou todas as sessões do usuário (por exemplo, quando ele é excluído)."""
+    for chave, sessao in list(_sessoes.items()):
+        if chave == token or (usuario_id is not None and sessao.usuario_id == usuario_id):
+            sessao.ativa = False
+            for cifrador in sessao.cifradores.values():
+                cifrador.descartar()
+            sessao.cifradores = {}
+            del _sessoes[chave]
+
+def conferir_senha(hash_informado, hash_guardado):
+    """Compara os hashes em tempo constante. Sem usuário (hash_guardado None), compara com um hash fictício."""
+    return hmac.compare_digest(hash_informado, hash_guardado or '0' * len(hash_informado)) and hash_guardado is not None
+
+def registrar_falha(tentativas, agora=None):
+    """Retorna (tentativas, bloqueado_ate) após mais uma senha errada; bloqueia ao atingir MAX_TENTATIVAS_LOGIN."""
+    tentativas += 1
+    if tentativas >= MAX_TENTATIVAS_LOGIN:
+        return 0, (agora or time.time()) + BLOQUEIO_SEGUNDOS
+    return tentativas, None
@@ -0,0 +1,1556 @@
+"""
+Suíte de benchmarks sem interface gráfica.
+
+Mede cada função pública de database.py e a preparação de dados das janelas de lista
+e de calendário, sobre um banco gerado por gerar_dados.py. Os resultados são gravados
+em JSON para comparação entre commits. Uso:
+
+    python benchmark.py --escala clinica --saida resultados.json
+    python benchmark.py --db clinica_sintetica.db --saida depois.json --comparar antes.json
+    python benchmark.py --fragmentacao 10x500000 --saida fragmentacao.json
+    python benchmark.py --escala clinica --relatorios 1000
+    python benchmark.py --db clinica_sintetica.db --filtro nenhum --replicacao 50000
+    python benchmark.py --db clinica_sintetica.db --filtro nenhum --lembretes 5000
+"""
+import argparse
+import calendar
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import database
+import formatacao
+import agenda
+import auditoria
+import cache_disponibilidade
+import gerar_dados
+import indice_pacientes
+import lembretes
+import lista_espera
+import notificacoes
+import relatorios
+import replicacao
+from cronometro import cronometrar
+
+# --- Registro de Casos ---
+# Cada caso recebe o contexto (ids de exemplo do banco) e devolve a função a ser cronometrada.
+# Funções que escrevem no banco rodam sobre uma cópia temporária do arquivo.
+CASOS = {}
+
+# Funções sem caso de benchmark: configuração que não consulta o banco e manutenção
+# medida por script próprio (arquivamento.py, integridade.py, criptografar.py), que alteraria os dados dos demais casos.
+SEM_CASO = {'configurar_clinicas', 'selecionar_clinica', 'carregar_configuracao_clinicas',
+            'caminho_arquivo_morto', 'caminho_anexos', 'arquivar_sessoes_antigas', 'reparar_integridade', 'estatisticas_cache', 'limpar_cache',
+            'ativar_criptografia',
+            'registrar_ouvinte', 'remover_ouvinte', 'geracao_externa', 'iterar_sessoes_paciente',
+            'fechar_conexoes', 'estatisticas_consultas', 'sessao_atual', 'encerrar_sessao',
+            'registrar_auditor', 'remover_auditor',
+            'zerar_estatisticas_consultas', 'registrar_observador_consultas', 'remover_observador_consultas'}
+
+def caso(nome):
+    def registrar(fabrica):
+        CASOS[nome] = fabrica
+        return fabrica
+    return registrar
+
+def _montar_contexto():
+    """Escolhe ids e datas representativos do banco atual para alimentar os casos."""
+    with sqlite3.connect(database.DB_FILE) as conn:
+        cursor = conn.cursor()
+        paciente_id = cursor.execute(
+            "SELECT paciente_id FROM sessoes GROUP BY paciente_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+        medico_id, data_disp = cursor.execute(
+            "SELECT medico_id, data_disponivel FROM disponibilidade_medico ORDER BY id LIMIT 1").fetchone()
+        sessao_id = cursor.execute("SELECT MAX(id) FROM sessoes").fetchone()[0]
+        prontuario_id = cursor.execute("SELECT id FROM prontuarios ORDER BY id LIMIT 1").fetchone()[0]
+        usuario_id = cursor.execute("SELECT id FROM usuarios WHERE nome_usuario != 'admin' ORDER BY id LIMIT 1").fetchone()[0]
+        nome_busca = cursor.execute("SELECT nome_completo FROM pacientes ORDER BY id LIMIT 1").fetchone()[0].split()[0]
+        medico_nome = cursor.execute("SELECT nome_completo FROM medicos WHERE id = ?", (medico_id,)).fetchone()[0]
+    ano, mes = int(data_disp[:4]), int(data_disp[5:7])
+    return {
+        'paciente_id': paciente_id, 'medico_id': medico_id, 'data': data_disp, 'ano': ano, 'mes': mes,
+        'sessao_id': sessao_id, 'prontuario_id': prontuario_id, 'usuario_id': usuario_id, 'nome_busca': nome_busca,
+        'medico_nome': medico_nome, 'hoje': date.today().isoformat(),
+    }
+
+# --- Casos: Pacientes ---
+
+@caso('adicionar_paciente')
+def _(ctx):
+    return lambda: database.adicionar_paciente("Paciente Benchmark", "2015-03-10", "Responsável Benchmark")
+
+@caso('adicionar_pacientes')
+def _(ctx):
+    pacientes = [(f"Paciente Benchmark {i}", "2015-03-10", "Responsável Benchmark") for i in range(100)]
+    return lambda: database.adicionar_pacientes(pacientes)
+
+@caso('listar_pacientes')
+def _(ctx):
+    return database.listar_pacientes
+
+@caso('iterar_pacientes')
+def _(ctx):
+    return lambda: sum(1 for _ in database.iterar_pacientes())
+
+@caso('buscar_paciente_por_id')
+def _(ctx):
+    return lambda: database.buscar_paciente_por_id(ctx['paciente_id'])
+
+@caso('atualizar_paciente')
+def _(ctx):
+    paciente = database.buscar_paciente_por_id(ctx['paciente_id'])
+    return lambda: database.atualizar_paciente(paciente['id'], paciente['nome_completo'], paciente['data_nascimento'], paciente['nome_responsavel'])
+
+@caso('excluir_paciente')
+def _(ctx):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.executemany("INSERT INTO pacientes (nome_completo, data_nascimento, nome_responsavel) VALUES (?, ?, ?)",
+                         [("Paciente Descartável", "2016-01-01", "Responsável")] * 500)
+        ids = [row[0] for row in conn.execute("SELECT id FROM pacientes WHERE nome_completo = 'Paciente Descartável'")]
+    # Cada repetição apaga um paciente diferente; depois que a lista acaba, apaga ids inexistentes.
+    return lambda: database.excluir_paciente(ids.pop() if ids else -1)
+
+@caso('buscar_pacientes_por_nome')
+def _(ctx):
+    return lambda: database.buscar_pacientes_por_nome(ctx['nome_busca'])
+
+# --- Casos: Médicos ---
+
+@caso('adicionar_medico')
+def _(ctx):
+    return lambda: database.adicionar_medico("Médico Benchmark", "Fonoaudiologia", "(11) 90000-0000")
+
+@caso('listar_medicos')
+def _(ctx):
+    return database.listar_medicos
+
+@caso('buscar_medico_por_id')
+def _(ctx):
+    return lambda: database.buscar_medico_por_id(ctx['medico_id'])
+
+@caso('atualizar_medico')
+def _(ctx):
+    medico = database.buscar_medico_por_id(ctx['medico_id'])
+    return lambda: database.atualizar_medico(medico['id'], medico['nome_completo'], medico['especialidade'], medico['contato'])
+
+@caso('excluir_medico')
+def _(ctx):
+    return lambda: database.excluir_medico(-1)
+
+@caso('excluir_medicos')
+def _(ctx):
+    return lambda: database.excluir_medicos(range(-20, 0))
+
+# --- Casos: Disponibilidade ---
+
+@caso('adicionar_disponibilidade')
+def _(ctx):
+    return lambda: database.adicionar_disponibilidade(ctx['medico_id'], '2099-01-05', '07:00', '07:30')
+
+@caso('listar_disponibilidade_por_data')
+def _(ctx):
+    return lambda: database.listar_disponibilidade_por_data(ctx['medico_id'], ctx['data'])
+
+@caso('listar_datas_disponiveis_por_mes')
+def _(ctx):
+    return lambda: database.listar_datas_disponiveis_por_mes(ctx['medico_id'], ctx['ano'], ctx['mes'])
+
+@caso('listar_disponibilidade_intervalo')
+def _(ctx):
+    inicio, _ = database.intervalo_mes(ctx['ano'], ctx['mes'])
+    return lambda: database.listar_disponibilidade_intervalo(ctx['medico_id'], inicio - 62, inicio + 92) # Cinco meses
+
+@caso('buscar_disponibilidade_por_id')
+def _(ctx):
+    return lambda: database.buscar_disponibilidade_por_id(1)
+
+@caso('resumo_disponibilidade_periodo')
+def _(ctx):
+    inicio, fim = database.intervalo_mes(ctx['ano'], ctx['mes'])
+    return lambda: database.resumo_disponibilidade_periodo(database.data_do_dia(inicio), database.data_do_dia(fim))
+
+@caso('excluir_disponibilidade')
+def _(ctx):
+    return lambda: database.excluir_disponibilidade(-1)
+
+def _horarios_do_mes(ctx):
+    inicio, fim = database.intervalo_mes(ctx['ano'], ctx['mes'])
+    return [h['id'] for h in database.listar_disponibilidade_intervalo(ctx['medico_id'], inicio, fim)]
+
+@caso('copiar_disponibilidades')
+def _(ctx):
+    ids = _horarios_do_mes(ctx)
+    return lambda: database.copiar_disponibilidades(ids, '2099-02-01')
+
+@caso('mover_disponibilidades')
+def _(ctx):
+    ids = database.copiar_disponibilidades(_horarios_do_mes(ctx), '2099-02-02')
+    return lambda: database.mover_disponibilidades(ids, '2099-02-03')
+
+@caso('excluir_disponibilidades')
+def _(ctx):
+    return lambda: database.excluir_disponibilidades(range(-20, 0))
+
+@caso('excluir_disponibilidade_periodo')
+def _(ctx):
+    return lambda: database.excluir_disponibilidade_periodo(ctx['medico_id'], '2099-03-01', '2099-03-31')
+
+# Limpar um mês de horários: um DELETE por horário (cada um com a sua transação) contra uma única instrução.
+# Os dois casos recriam o mês antes, com a mesma cópia em lote.
+
+@caso('comparativo.limpar_mes_um_a_um')
+def _(ctx):
+    ids = _horarios_do_mes(ctx)
+    def executar():
+        for novo_id in database.copiar_disponibilidades(ids, '2099-04-01'):
+            database.excluir_disponibilidade(novo_id)
+    return executar
+
+@caso('comparativo.limpar_mes_em_lote')
+def _(ctx):
+    ids = _horarios_do_mes(ctx)
+    def executar():
+        database.copiar_disponibilidades(ids, '2099-04-01')
+        database.excluir_disponibilidade_periodo(ctx['medico_id'], '2099-04-01', '2099-04-30')
+    return executar
+
+# --- Casos: Prontuário ---
+
+@caso('buscar_ou_criar_prontuario')
+def _(ctx):
+    return lambda: database.buscar_ou_criar_prontuario(ctx['paciente_id'])
+
+@caso('buscar_prontuario_por_paciente')
+def _(ctx):
+    return lambda: database.buscar_prontuario_por_paciente(ctx['paciente_id'])
+
+@caso('atualizar_prontuario')
+def _(ctx):
+    return lambda: database.atualizar_prontuario(ctx['prontuario_id'], "Queixa", "Histórico", "Anamnese", "Informações")
+
+# --- Casos: Anexos do Prontuário ---
+# Abrir o prontuário (registro + lista de anexos, como a janela faz) de um paciente sem anexos e de um
+# com ANEXOS_PRONTUARIO anexos (conteúdos de 256 KB, um a cada cinco repetido, para exercitar a deduplicação).
+
+ANEXOS_PRONTUARIO = 500
+_PRONTUARIO_COM_ANEXOS = {}
+
+def _arquivo_anexo(indice, tamanho=256 * 1024):
+    caminho = os.path.join(os.path.dirname(database.DB_FILE), f'anexo_{indice}.pdf')
+    if not os.path.exists(caminho):
+        with open(caminho, 'wb') as f:
+            f.write(random.Random(indice).randbytes(tamanho))
+    return caminho
+
+def _paciente_com_anexos(ctx):
+    if database.DB_FILE not in _PRONTUARIO_COM_ANEXOS:
+        with sqlite3.connect(database.DB_FILE) as conn:
+            paciente_id = conn.execute("SELECT id FROM pacientes WHERE id != ? ORDER BY id LIMIT 1", (ctx['paciente_id'],)).fetchone()[0]
+        prontuario_id = database.buscar_ou_criar_prontuario(paciente_id)['id']
+        for i in range(ANEXOS_PRONTUARIO):
+            database.adicionar_anexo(prontuario_id, _arquivo_anexo(i if i % 5 else 0))
+        _PRONTUARIO_COM_ANEXOS[database.DB_FILE] = (paciente_id, prontuario_id)
+    return _PRONTUARIO_COM_ANEXOS[database.DB_FILE]
+
+def _abrir_prontuario(paciente_id):
+    prontuario = database.buscar_ou_criar_prontuario(paciente_id)
+    return formatacao.preparar_linhas_anexos(database.listar_anexos(prontuario['id']))
+
+@caso('comparativo.abrir_prontuario_sem_anexos')
+def _(ctx):
+    return lambda: _abrir_prontuario(ctx['paciente_id'])
+
+@caso('comparativo.abrir_prontuario_500_anexos')
+def _(ctx):
+    paciente_id, _ = _paciente_com_anexos(ctx)
+    return lambda: _abrir_prontuario(paciente_id)
+
+@caso('adicionar_anexo')
+def _(ctx):
+    prontuario_id = database.buscar_ou_criar_prontuario(ctx['paciente_id'])['id']
+    contador = iter(range(10**9))
+    return lambda: database.adicionar_anexo(prontuario_id, _arquivo_anexo(1000 + next(contador))) # Conteúdo novo a cada repetição
+
+@caso('adicionar_anexo.repetido')
+def _(ctx):
+    prontuario_id = database.buscar_ou_criar_prontuario(ctx['paciente_id'])['id']
+    caminho = _arquivo_anexo(0)
+    return lambda: database.adicionar_anexo(prontuario_id, caminho) # Só os metadados: o conteúdo já está guardado
+
+@caso('listar_anexos')
+def _(ctx):
+    _, prontuario_id = _paciente_com_anexos(ctx)
+    return lambda: database.listar_anexos(prontuario_id)
+
+@caso('buscar_anexo_por_id')
+def _(ctx):
+    _, prontuario_id = _paciente_com_anexos(ctx)
+    anexo_id = database.listar_anexos(prontuario_id)[0]['id']
+    return lambda: database.buscar_anexo_por_id(anexo_id)
+
+@caso('ler_anexo')
+def _(ctx):
+    _, prontuario_id = _paciente_com_anexos(ctx)
+    anexo_id = database.listar_anexos(prontuario_id)[0]['id']
+    return lambda: sum(len(bloco) for bloco in database.ler_anexo(anexo_id))
+
+@caso('salvar_anexo_em')
+def _(ctx):
+    _, prontuario_id = _paciente_com_anexos(ctx)
+    anexo_id = database.listar_anexos(prontuario_id)[0]['id']
+    destino = os.path.join(os.path.dirname(database.DB_FILE), 'anexo_salvo.pdf')
+    return lambda: database.salvar_anexo_em(anexo_id, destino)
+
+@caso('excluir_anexo')
+def _(ctx):
+    return lambda: database.excluir_anexo(-1)
+
+@caso('janela_prontuario.preparar_anexos')
+def _(ctx):
+    _, prontuario_id = _paciente_com_anexos(ctx)
+    anexos = database.listar_anexos(prontuario_id)
+    return lambda: formatacao.preparar_linhas_anexos(anexos)
+
+# --- Casos: Criptografia dos Textos Clínicos ---
+# Os casos cifrados rodam sobre uma segunda cópia do banco, com a criptografia ativada e a chave
+# aberta por um novo login nela; a primeira cópia, usada pelos demais casos, fica em claro.
+# Os comparativos medem as janelas de lista e o prontuário com e sem a criptografia.
+
+_BANCO_CIFRADO = {}
+
+def _banco_cifrado():
+    if database.DB_FILE not in _BANCO_CIFRADO:
+        original = database.DB_FILE
+        copia = os.path.join(os.path.dirname(original), 'clinica_cifrada.db')
+        with closing(sqlite3.connect(original)) as origem, closing(sqlite3.connect(copia)) as destino:
+            origem.backup(destino)
+        database.DB_FILE = copia
+        try:
+            database.ativar_criptografia('admin123')
+        finally:
+            database.DB_FILE = original
+        _BANCO_CIFRADO[original] = copia
+    return _BANCO_CIFRADO[database.DB_FILE]
+
+def _no_banco_cifrado(funcao):
+    copia = _banco_cifrado()
+    original, database.DB_FILE = database.DB_FILE, copia
+    try:
+        database.iniciar_sessao('admin', 'admin123') # Abre a chave do banco cifrado, como no login do app
+    finally:
+        database.DB_FILE = original
+    def executar():
+        original, database.DB_FILE = database.DB_FILE, copia
+        try:
+            return funcao()
+        finally:
+            database.DB_FILE = original
+    return executar
+
+def _abrir_lista_sessoes(paciente_id):
+    return formatacao.preparar_linhas_sessoes(database.listar_sessoes_por_paciente(paciente_id))
+
+def _abrir_lista_pacientes():
+    return formatacao.preparar_linhas_pacientes(database.listar_pacientes())
+
+@caso('comparativo.lista_sessoes_em_claro')
+def _(ctx):
+    return lambda: _abrir_lista_sessoes(ctx['paciente_id'])
+
+@caso('comparativo.lista_sessoes_cifrada')
+def _(ctx):
+    return _no_banco_cifrado(lambda: _abrir_lista_sessoes(ctx['paciente_id']))
+
+@caso('comparativo.lista_pacientes_em_claro')
+def _(ctx):
+    return _abrir_lista_pacientes
+
+@caso('comparativo.lista_pacientes_cifrada')
+def _(ctx):
+    return _no_banco_cifrado(_abrir_lista_pacientes)
+
+@caso('comparativo.abrir_prontuario_em_claro')
+def _(ctx):
+    return lambda: database.buscar_ou_criar_prontuario(ctx['paciente_id'])
+
+@caso('comparativo.abrir_prontuario_cifrado')
+def _(ctx):
+    return _no_banco_cifrado(lambda: database.buscar_ou_criar_prontuario(ctx['paciente_id']))
+
+@caso('comparativo.gravar_sessao_em_claro')
+def _(ctx):
+    return lambda: database.atualizar_sessao(ctx['sessao_id'], None, ctx['hoje'], None, None, "Resumo", "Iniciante", "Obs", "Plano")
+
+@caso('comparativo.gravar_sessao_cifrada')
+def _(ctx):
+    return _no_banco_cifrado(lambda: database.atualizar_sessao(ctx['sessao_id'], None, ctx['hoje'], None, None,
+                                                               "Resumo", "Iniciante", "Obs", "Plano"))
+
+@caso('criptografia_ativa')
+def _(ctx):
+    return _no_banco_cifrado(database.criptografia_ativa)
+
+@caso('cifrar_dados_existentes')
+def _(ctx):
+    return _no_banco_cifrado(database.cifrar_dados_existentes) # Já cifrado: mede a busca por textos em claro
+
+# --- Casos: Usuários ---
+
+@caso('hash_senha')
+def _(ctx):
+    return lambda: database.hash_senha('senha123')
+
+@caso('adicionar_usuario')
+def _(ctx):
+    contador = iter(range(10**9))
+    return lambda: database.adicionar_usuario(f"bench_{next(contador)}_{time.time_ns()}", 'senha123', 'terapeuta')
+
+@caso('adicionar_usuarios')
+def _(ctx):
+    contador = iter(range(10**9))
+    return lambda: database.adicionar_usuarios([{'nome_usuario': f"bench_{next(contador)}_{time.time_ns()}", 'senha': 'senha123',
+                                                 'nivel_acesso': 'terapeuta'} for _ in range(10)])
+
+@caso('listar_usuarios')
+def _(ctx):
+    return database.listar_usuarios
+
+@caso('atualizar_senha_usuario')
+def _(ctx):
+    return lambda: database.atualizar_senha_usuario(ctx['usuario_id'], 'senha123')
+
+@caso('excluir_usuario')
+def _(ctx):
+    return lambda: database.excluir_usuario(-1)
+
+@caso('vincular_usuario_medico')
+def _(ctx):
+    return lambda: database.vincular_usuario_medico(ctx['usuario_id'], ctx['medico_id'])
+
+@caso('verificar_usuario')
+def _(ctx):
+    return lambda: database.verificar_usuario('admin', 'admin123')
+
+# --- Casos: Sessão de Acesso ---
+# Os casos rodam com AUTORIZACAO_ATIVA e a sessão do admin, como o app; cada escrita paga a verificação.
+
+@caso('iniciar_sessao')
+def _(ctx):
+    return lambda: database.iniciar_sessao('admin', 'admin123')
+
+@caso('usar_sessao')
+def _(ctx):
+    return lambda: database.usar_sessao(database.sessao_atual().token)
+
+@caso('tem_permissao')
+def _(ctx):
+    return lambda: database.tem_permissao('sessoes.editar')
+
+@caso('exigir_permissao')
+def _(ctx):
+    return lambda: database.exigir_permissao('sessoes.editar')
+
+# --- Casos: Sessões ---
+
+@caso('adicionar_sessao')
+def _(ctx):
+    return lambda: database.adicionar_sessao(ctx['paciente_id'], None, ctx['hoje'], None, None, "Resumo", "Iniciante", "Obs", "Plano")
+
+@caso('adicionar_sessao.com_verificacao')
+def _(ctx):
+    # Cada repetição reserva um dia diferente com disponibilidade, passando pelos gatilhos de conflito.
+    dias = [(date(2099, 1, 1) + timedelta(days=i)).isoformat() for i in range(2000)]
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.executemany("INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, ?, '08:00', '12:00')",
+                         [(ctx['medico_id'], dia) for dia in dias])
+    return lambda: database.adicionar_sessao(ctx['paciente_id'], ctx['medico_id'], dias.pop(), '09:00', '09:50',
+                                             "Resumo", "Iniciante", "Obs", "Plano")
+
+@caso('listar_sessoes_por_paciente')
+def _(ctx):
+    return lambda: database.listar_sessoes_por_paciente(ctx['paciente_id'])
+
+@caso('buscar_sessao_por_id')
+def _(ctx):
+    return lambda: database.buscar_sessao_por_id(ctx['sessao_id'])
+
+@caso('atualizar_sessao')
+def _(ctx):
+    s = database.buscar_sessao_por_id(ctx['sessao_id'])
+    return lambda: database.atualizar_sessao(ctx['sessao_id'], s['medico_id'], s['data_sessao'], s['hora_inicio_sessao'], s['hora_fim_sessao'],
+                                             s['resumo_sessao'], s['nivel_evolucao'], s['observacoes_evolucao'], s['plano_terapeutico'])
+
+@caso('excluir_sessao')
+def _(ctx):
+    return lambda: database.excluir_sessao(-1)
+
+@caso('excluir_sessoes')
+def _(ctx):
+    return lambda: database.excluir_sessoes(list(range(-20, 0)))
+
+@caso('copiar_sessoes')
+def _(ctx):
+    # Cópia para um dia livre do médico, desfeita em seguida para que a próxima repetição não entre em conflito
+    s = database.buscar_sessao_por_id(ctx['sessao_id'])
+    if s['medico_id']:
+        database.adicionar_disponibilidade(s['medico_id'], '2099-05-04', '00:00', '23:59')
+    return lambda: database.excluir_sessoes(database.copiar_sessoes([ctx['sessao_id']], '2099-05-04'))
+
+@caso('mover_sessoes')
+def _(ctx):
+    s = database.buscar_sessao_por_id(ctx['sessao_id'])
+    return lambda: database.mover_sessoes([ctx['sessao_id']], s['data_sessao']) # Mesma data: os gatilhos de agenda não rodam
+
+@caso('deslocar_agenda_medico')
+def _(ctx):
+    inicio, fim = agenda.periodo('semana', date.fromisoformat(ctx['data']))
+    return lambda: database.deslocar_agenda_medico(ctx['medico_id'], inicio, fim, 0) # Zero dias: a agenda não muda
+
+@caso('listar_datas_sessoes')
+def _(ctx):
+    return database.listar_datas_sessoes
+
+@caso('listar_datas_sessoes.mes')
+def _(ctx):
+    return lambda: database.listar_datas_sessoes(*database.intervalo_mes(ctx['ano'], ctx['mes']))
+
+@caso('listar_sessoes_por_medico_e_data')
+def _(ctx):
+    return lambda: database.listar_sessoes_por_medico_e_data(ctx['medico_id'], ctx['data'])
+
+@caso('inicializar_banco_de_dados')
+def _(ctx):
+    return database.inicializar_banco_de_dados
+
+@caso('dia_numero')
+def _(ctx):
+    return lambda: database.dia_numero(ctx['data'])
+
+@caso('data_do_dia')
+def _(ctx):
+    return lambda: database.data_do_dia(738890)
+
+@caso('intervalo_entre')
+def _(ctx):
+    return lambda: database.intervalo_entre(ctx['data'], ctx['hoje'])
+
+@caso('intervalo_mes')
+def _(ctx):
+    return lambda: database.intervalo_mes(ctx['ano'], ctx['mes'])
+
+@caso('intervalo_semana')
+def _(ctx):
+    return lambda: database.intervalo_semana(ctx['data'])
+
+# --- Casos: Agenda do Terapeuta ---
+# A janela 'Minha Agenda' deve abrir em menos de 100 ms; a semana é o modo mais usado.
+
+@caso('agenda_medico')
+def _(ctx):
+    inicio, fim = agenda.periodo('semana', date.fromisoformat(ctx['data']))
+    return lambda: database.agenda_medico(ctx['medico_id'], inicio, fim)
+
+@caso('agenda_medico.mes')
+def _(ctx):
+    inicio, fim = agenda.periodo('mes', date.fromisoformat(ctx['data']))
+    return lambda: database.agenda_medico(ctx['medico_id'], inicio, fim)
+
+@caso('listar_carteira_medico')
+def _(ctx):
+    return lambda: database.listar_carteira_medico(ctx['medico_id'])
+
+@caso('agenda.carregar_agenda.guardada')
+def _(ctx):
+    inicio, fim = agenda.periodo('semana', date.fromisoformat(ctx['data']))
+    return lambda: agenda.carregar_agenda(ctx['medico_id'], inicio, fim)
+
+@caso('agenda.preparar_linhas.semana')
+def _(ctx):
+    inicio, fim = agenda.periodo('semana', date.fromisoformat(ctx['data']))
+    agenda_semana = agenda.carregar_agenda(ctx['medico_id'], inicio, fim)
+    dias = [inicio + timedelta(days=i) for i in range(7)]
+    return lambda: formatacao.preparar_linhas_agenda(agenda_semana, dias)
+
+# --- Casos: Linha do Tempo de Evolução ---
+# O gráfico pede um ponto a cada 4 pixels; 200 pontos equivalem a uma janela de 800 pixels.
+
+@caso('evolucao_paciente')
+def _(ctx):
+    return lambda: database.evolucao_paciente(ctx['paciente_id'], 'mes', 200)
+
+@caso('evolucao_paciente.sem_cache')
+def _(ctx):
+    def executar():
+        database.CACHE_ATIVO = False
+        try:
+            database.evolucao_paciente(ctx['paciente_id'], 'semana', 200)
+        finally:
+            database.CACHE_ATIVO = True
+    return executar
+
+@caso('evolucao.preparar_grafico')
+def _(ctx):
+    pontos = database.evolucao_paciente(ctx['paciente_id'], 'semana', 200)['pontos']
+    return lambda: formatacao.preparar_grafico_evolucao(pontos, 800, 380)
+
+# --- Casos: Registro de Consultas ---
+
+@caso('validar_consultas')
+def _(ctx):
+    return database.validar_consultas
+
+@caso('explicar_consulta')
+def _(ctx):
+    return lambda: database.explicar_consulta('agenda.medico')
+
+# --- Casos: Verificação de Integridade ---
+# O reparo é medido pelo integridade.py, já que alteraria os dados dos demais casos.
+
+@caso('verificar_integridade')
+def _(ctx):
+    return database.verificar_integridade
+
+# --- Casos: Alterações de Outras Estações ---
+# As janelas abertas verificam o banco a cada segundo: sem alterações, a verificação só lê o
+# PRAGMA data_version. A recarga completa é o que cada janela faria sem o registro de alterações.
+
+@caso('ultima_alteracao')
+def _(ctx):
+    return database.ultima_alteracao
+
+@caso('alteracoes_desde')
+def _(ctx):
+    seq = max(0, database.ultima_alteracao() - 20)
+    return lambda: database.alteracoes_desde(seq)
+
+@caso('listar_sessoes_por_ids')
+def _(ctx):
+    return lambda: database.listar_sessoes_por_ids([ctx['sessao_id']])
+
+@caso('notificacoes.verificar.sem_alteracoes')
+def _(ctx):
+    vigia = notificacoes.VigiaAlteracoes()
+    return vigia.verificar
+
+@caso('notificacoes.verificar.uma_alteracao')
+def _(ctx):
+    vigia = notificacoes.VigiaAlteracoes()
+    vigia.inscrever(('sessoes',), lambda alteracoes: None)
+    s = database.buscar_sessao_por_id(ctx['sessao_id'])
+    def executar():
+        # Grava por outra conexão, como faria outra estação
+        with sqlite3.connect(database.DB_FILE) as conn:
+            conn.execute("UPDATE sessoes SET resumo_sessao = ? WHERE id = ?", (s['resumo_sessao'], ctx['sessao_id']))
+        vigia.verificar()
+    return executar
+
+@caso('comparativo.sondagem_recarga_completa')
+def _(ctx):
+    def executar():
+        database.listar_datas_sessoes(*database.intervalo_mes(ctx['ano'], ctx['mes']))
+        database.listar_sessoes_por_paciente(ctx['paciente_id'])
+    return executar
+
+# --- Casos: Consultas Federadas entre Clínicas ---
+# Sem clínicas configuradas, a consulta federada anexa apenas o banco atual.
+
+@caso('buscar_pacientes_todas_clinicas')
+def _(ctx):
+    return lambda: database.buscar_pacientes_todas_clinicas(ctx['nome_busca'])
+
+@caso('listar_agenda_medico_todas_clinicas')
+def _(ctx):
+    inicio, fim = database.intervalo_mes(ctx['ano'], ctx['mes'])
+    data_inicio, data_fim = database.data_do_dia(inicio).isoformat(), database.data_do_dia(fim).isoformat()
+    return lambda: database.listar_agenda_medico_todas_clinicas(ctx['medico_nome'], data_inicio, data_fim)
+
+# --- Casos: Busca Enquanto Digita ---
+# Cada caso mede uma tecla. Os casos '100k' usam um índice em memória com 100 mil pacientes
+# sintéticos, a escala em que cada tecla deve responder em menos de 5 ms.
+
+@caso('buscar_pacientes_incremental')
+def _(ctx):
+    return lambda: indice_pacientes.buscar_pacientes_incremental(ctx['nome_busca'][:3])
+
+_INDICE_100K = []
+
+def _indice_100k():
+    if not _INDICE_100K:
+        rng = random.Random(7)
+        indice = indice_pacientes.IndicePacientes()
+        indice.carregar({'id': i, 'nome_completo': nome, 'data_nascimento': nascimento, 'dia_nascimento': None,
+                         'nome_responsavel': responsavel}
+                        for i, (nome, nascimento, responsavel) in enumerate(gerar_dados._gerar_pacientes(rng, 100_000), 1))
+        _INDICE_100K.append(indice)
+    return _INDICE_100K[0]
+
+for _nome_caso, _termo in [('uma_letra', 'm'), ('prenome', 'mari'), ('prenome_acentuado', 'JÚLI'),
+                           ('dois_termos', 'ana sou'), ('sobrenome', 'olivei'), ('sem_resultado', 'xqzw')]:
+    @caso(f'indice_pacientes.100k.{_nome_caso}')
+    def _(ctx, termo=_termo):
+        indice = _indice_100k()
+        return lambda: indice.buscar(termo)
+
+@caso('indice_pacientes.100k.atualizar_paciente')
+def _(ctx):
+    indice = _indice_100k()
+    paciente = dict(indice.pacientes[50_000])
+    def atualizar():
+        paciente['nome_completo'] = paciente['nome_completo'][::-1] # Alterna o nome para forçar a troca das chaves
+        indice.adicionar(dict(paciente))
+    return atualizar
+
+# --- Casos: Comparativo Com e Sem Cache ---
+# Reproduz as leituras feitas ao abrir a lista de sessões de um paciente e o formulário de sessão
+# dez vezes seguidas, como acontece ao longo de um atendimento.
+
+def _abrir_janelas_repetidas(ctx):
+    for _ in range(10):
+        database.buscar_paciente_por_id(ctx['paciente_id'])
+        database.listar_sessoes_por_paciente(ctx['paciente_id'])
+        database.listar_medicos()
+        database.buscar_medico_por_id(ctx['medico_id'])
+
+@caso('comparativo.janelas_repetidas_com_cache')
+def _(ctx):
+    return lambda: _abrir_janelas_repetidas(ctx)
+
+@caso('comparativo.janelas_repetidas_sem_cache')
+def _(ctx):
+    def executar():
+        database.CACHE_ATIVO = False
+        try:
+            _abrir_janelas_repetidas(ctx)
+        finally:
+            database.CACHE_ATIVO = True
+    return executar
+
+# --- Casos: Comparativo Escrita com e sem Autorização ---
+# A mesma escrita com a verificação da sessão desligada e ligada, para medir o custo da autorização.
+
+@caso('comparativo.escrita_sem_autorizacao')
+def _(ctx):
+    def executar():
+        database.AUTORIZACAO_ATIVA = False
+        try:
+            database.vincular_usuario_medico(ctx['usuario_id'], ctx['medico_id'])
+        finally:
+            database.AUTORIZACAO_ATIVA = True
+    return executar
+
+@caso('comparativo.escrita_com_autorizacao')
+def _(ctx):
+    return lambda: database.vincular_usuario_medico(ctx['usuario_id'], ctx['medico_id'])
+
+# --- Casos: Auditoria ---
+# O gravador fica desligado do database.py, exceto durante o caso com auditoria, que mede
+# o custo de enfileirar o evento na thread de quem lê (a gravação em lotes ocorre à parte).
+
+def _gravador_benchmark(ctx):
+    """Gravador da auditoria para os casos, com alguns milhares de eventos já gravados para as consultas."""
+    if 'gravador' not in ctx:
+        gravador = ctx['gravador'] = auditoria.iniciar()
+        database.remover_auditor(gravador.registrar)
+        agora = time.time()
+        for i in range(5000):
+            gravador.registrar({'momento': agora - i * 60, 'arquivo': database.DB_FILE, 'usuario_id': 1 + i % 3,
+                                'nome_usuario': f"usuario{1 + i % 3}", 'acao': 'visualizado', 'tabela': 'prontuarios',
+                                'registro_id': i, 'paciente_id': ctx['paciente_id'] if i % 10 == 0 else i})
+        gravador.descarregar()
+    return ctx['gravador']
+
+@caso('comparativo.visualizar_prontuario_sem_auditoria')
+def _(ctx):
+    return lambda: database.buscar_ou_criar_prontuario(ctx['paciente_id'])
+
+@caso('comparativo.visualizar_prontuario_com_auditoria')
+def _(ctx):
+    gravador = _gravador_benchmark(ctx)
+    def executar():
+        database.registrar_auditor(gravador.registrar)
+        try:
+            database.buscar_ou_criar_prontuario(ctx['paciente_id'])
+        finally:
+            database.remover_auditor(gravador.registrar)
+    return executar
+
+@caso('auditoria.consultar_eventos.paciente')
+def _(ctx):
+    _gravador_benchmark(ctx)
+    return lambda: auditoria.consultar_eventos(paciente_id=ctx['paciente_id'])
+
+@caso('auditoria.consultar_eventos.usuario_periodo')
+def _(ctx):
+    _gravador_benchmark(ctx)
+    return lambda: auditoria.consultar_eventos(usuario_id=1, inicio=date.today() - timedelta(days=1), fim=date.today())
+
+@caso('janela_auditoria.preparar_linhas')
+def _(ctx):
+    _gravador_benchmark(ctx)
+    eventos = auditoria.consultar_eventos()
+    return lambda: formatacao.preparar_linhas_auditoria(eventos)
+
+# --- Casos: Lista de Espera ---
+# ESPERA_ENTRADAS entradas distribuídas entre os médicos (60%) e as especialidades do banco, e um dia
+# futuro inteiro de disponibilidade para o médico de referência. A busca de candidatos pelos índices
+# da lista é comparada com a leitura da lista inteira filtrada em Python.
+
+ESPERA_ENTRADAS = 5000
+DIA_VAGA = '2099-06-01'
+_ESPERA_SEMEADA = set()
+
+def _semear_lista_espera(ctx):
+    if database.DB_FILE in _ESPERA_SEMEADA:
+        return
+    rng = random.Random(11)
+    with sqlite3.connect(database.DB_FILE) as conn:
+        pacientes = [row[0] for row in conn.execute("SELECT id FROM pacientes")]
+        medicos = conn.execute("SELECT id, especialidade FROM medicos").fetchall()
+        linhas = []
+        for _ in range(ESPERA_ENTRADAS):
+            medico_id, especialidade = rng.choice(medicos)
+            inicio = rng.randrange(7 * 60, 17 * 60, 30)
+            linhas.append((rng.choice(pacientes), medico_id if especialidade is None or rng.random() < 0.6 else None,
+                           especialidade, rng.randrange(1, database.TODOS_OS_DIAS + 1), gerar_dados._hora(inicio),
+                           gerar_dados._hora(inicio + rng.choice((60, 120, 240))), 50, rng.randrange(3), None, time.time()))
+        conn.executemany(database.CONSULTAS['lista_espera.inserir'], linhas)
+        conn.execute("INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, ?, '07:00', '19:00')",
+                     (ctx['medico_id'], DIA_VAGA))
+    database.limpar_cache()
+    _ESPERA_SEMEADA.add(database.DB_FILE)
+
+@caso('adicionar_lista_espera')
+def _(ctx):
+    return lambda: database.adicionar_lista_espera(ctx['paciente_id'], ctx['medico_id'], None, '08:00', '12:00')
+
+@caso('listar_lista_espera')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    return database.listar_lista_espera
+
+@caso('excluir_da_lista_espera')
+def _(ctx):
+    return lambda: database.excluir_da_lista_espera(-1)
+
+@caso('candidatos_lista_espera')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    return lambda: database.candidatos_lista_espera(ctx['medico_id'], DIA_VAGA, 9 * 60, 10 * 60)
+
+@caso('agendar_da_lista_espera')
+def _(ctx):
+    # Cada repetição agenda uma entrada diferente num horário de 5 minutos ainda livre
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.execute("INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, '2099-06-02', '00:00', '23:55')",
+                     (ctx['medico_id'],))
+    propostas = [(database.adicionar_lista_espera(ctx['paciente_id'], ctx['medico_id'], None, '00:00', '23:55', duracao_minutos=5),
+                  gerar_dados._hora(i * 5), gerar_dados._hora(i * 5 + 5)) for i in range(287)]
+    def agendar():
+        if propostas:
+            espera_id, inicio, fim = propostas.pop()
+            database.agendar_da_lista_espera(espera_id, ctx['medico_id'], '2099-06-02', inicio, fim)
+    return agendar
+
+@caso('lista_espera.propor_vagas')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    return lambda: lista_espera.propor_vagas(ctx['medico_id'], DIA_VAGA)
+
+@caso('comparativo.candidatos_lista_inteira')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    especialidade = database.buscar_medico_por_id(ctx['medico_id'])['especialidade']
+    bit, inicio, fim = 1 << date.fromisoformat(DIA_VAGA).weekday(), 9 * 60, 10 * 60
+    def filtrar():
+        candidatos = []
+        for entrada in database.listar_lista_espera():
+            if entrada['medico_id'] != ctx['medico_id'] and not (entrada['medico_id'] is None and entrada['especialidade'] == especialidade):
+                continue
+            janela_inicio, janela_fim = (int(h[:2]) * 60 + int(h[3:]) for h in (entrada['hora_inicio'], entrada['hora_fim']))
+            if entrada['dias_semana'] & bit and min(janela_fim, fim) - max(janela_inicio, inicio) >= entrada['duracao_minutos']:
+                candidatos.append(entrada)
+        return candidatos[:10]
+    return filtrar
+
+@caso('comparativo.candidatos_por_indice')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    return lambda: database.candidatos_lista_espera(ctx['medico_id'], DIA_VAGA, 9 * 60, 10 * 60)
+
+@caso('janela_lista_espera.preparar_linhas')
+def _(ctx):
+    _semear_lista_espera(ctx)
+    entradas = database.listar_lista_espera()
+    return lambda: formatacao.preparar_linhas_lista_espera(entradas)
+
+# --- Casos: Lembretes de Sessão ---
+# LEMBRETES_SESSOES sessões com horário nos dois dias seguintes a um momento de referência futuro,
+# sem médico (para não depender da disponibilidade). Os lembretes são gerados com antecedência de
+# dois dias, para que todos já estejam vencidos no momento de referência.
+
+LEMBRETES_SESSOES = 10000
+MOMENTO_LEMBRETES = datetime(2099, 7, 1, 7, 0).timestamp()
+_LEMBRETES_SEMEADOS = set()
+
+def _semear_lembretes(ctx, arquivo_db=None, sessoes=LEMBRETES_SESSOES, momento=MOMENTO_LEMBRETES, horas=47):
+    arquivo_db = arquivo_db or database.DB_FILE
+    if arquivo_db in _LEMBRETES_SEMEADOS:
+        return
+    rng = random.Random(13)
+    inicio = datetime.fromtimestamp(momento)
+    with sqlite3.connect(arquivo_db) as conn:
+        pacientes = [row[0] for row in conn.execute("SELECT id FROM pacientes")]
+        linhas = []
+        for _ in range(sessoes):
+            momento = inicio + timedelta(minutes=rng.randrange(60, horas * 60, 10))
+            linhas.append((rng.choice(pacientes), momento.date().isoformat(), momento.strftime('%H:%M'),
+                           (momento + timedelta(minutes=50)).strftime('%H:%M')))
+        conn.executemany("""
+            INSERT INTO sessoes (paciente_id, data_sessao, hora_inicio_sessao, hora_fim_sessao, nivel_evolucao)
+            VALUES (?, ?, ?, ?, 'Intermediário')""", linhas)
+    database.limpar_cache()
+    _LEMBRETES_SEMEADOS.add(arquivo_db)
+
+def _gerar_lembretes_vencidos():
+    return database.gerar_lembretes(MOMENTO_LEMBRETES, antecedencia_horas=48)
+
+@caso('listar_proximas_sessoes')
+def _(ctx):
+    _semear_lembretes(ctx)
+    inicio = datetime.fromtimestamp(MOMENTO_LEMBRETES)
+    return lambda: database.listar_proximas_sessoes(inicio, inicio + timedelta(hours=database.JANELA_LEMBRETES_HORAS))
+
+@caso('gerar_lembretes')
+def _(ctx):
+    # Depois da primeira rodada, o custo de uma rodada em que a fila já está em dia
+    _semear_lembretes(ctx)
+    return _gerar_lembretes_vencidos
+
+@caso('reservar_lembretes')
+def _(ctx):
+    _semear_lembretes(ctx)
+    _gerar_lembretes_vencidos()
+    return lambda: database.reservar_lembretes(lembretes.LOTE_MAXIMO, MOMENTO_LEMBRETES)
+
+@caso('concluir_lembretes')
+def _(ctx):
+    _semear_lembretes(ctx)
+    _gerar_lembretes_vencidos()
+    lotes = [database.reservar_lembretes(lembretes.LOTE_MAXIMO, MOMENTO_LEMBRETES) for _ in range(21)]
+    def concluir():
+        lote = lotes.pop() if lotes else []
+        database.concluir_lembretes(lote[:-10], [(l, "falha simulada") for l in lote[-10:]], MOMENTO_LEMBRETES)
+    return concluir
+
+@caso('resumo_lembretes')
+def _(ctx):
+    _semear_lembretes(ctx)
+    _gerar_lembretes_vencidos()
+    return database.resumo_lembretes
+
+# --- Casos: Calendário de Disponibilidade ---
+# Navegação por doze meses (seis antes do mês de referência) no calendário do médico, marcando os dias e abrindo o primeiro dia
+# com horários de cada mês: uma consulta por mês e por dia, contra os meses guardados em memória.
+
+def _navegar_meses(ctx, dias_do_mes, horarios_do_dia):
+    for deslocamento in range(-6, 6):
+        indice = ctx['ano'] * 12 + ctx['mes'] - 1 + deslocamento
+        datas = dias_do_mes(indice // 12, indice % 12 + 1)
+        if datas:
+            horarios_do_dia(datas[0])
+
+@caso('comparativo.navegar_meses_consultando')
+def _(ctx):
+    return lambda: _navegar_meses(
+        ctx, lambda ano, mes: database.listar_datas_disponiveis_por_mes(ctx['medico_id'], ano, mes),
+        lambda data: database.listar_disponibilidade_por_data(ctx['medico_id'], data))
+
+def _navegar_meses_com_cache(ctx):
+    _navegar_meses(
+        ctx, lambda ano, mes: cache_disponibilidade.dias_disponiveis(ctx['medico_id'], *database.intervalo_mes(ano, mes)),
+        lambda data: cache_disponibilidade.horarios_do_dia(ctx['medico_id'], data))
+
+@caso('comparativo.navegar_meses_cache_vazio')
+def _(ctx):
+    def executar():
+        cache_disponibilidade.limpar() # Sem o pré-carregamento da janela: cada mês novo é lido na hora
+        _navegar_meses_com_cache(ctx)
+    return executar
+
+@caso('comparativo.navegar_meses_guardados')
+def _(ctx):
+    return lambda: _navegar_meses_com_cache(ctx) # Como na janela, com os vizinhos já pré-carregados
+
+@caso('cache_disponibilidade.horarios_do_dia.guardado')
+def _(ctx):
+    cache_disponibilidade.carregar_meses(ctx['medico_id'], ctx['ano'], ctx['mes'])
+    return lambda: cache_disponibilidade.horarios_do_dia(ctx['medico_id'], ctx['data'])
+
+@caso('cache_disponibilidade.recarregar_dia')
+def _(ctx):
+    cache_disponibilidade.carregar_meses(ctx['medico_id'], ctx['ano'], ctx['mes'])
+    return lambda: cache_disponibilidade.recarregar_dia(ctx['medico_id'], database.dia_numero(ctx['data']))
+
+# --- Casos: Comparativo Texto x Colunas Ordenáveis ---
+# Mantêm a forma antiga (LIKE sobre o texto e strptime na decodificação) ao lado da nova,
+# para medir o ganho das colunas inteiras na mesma execução.
+
+@caso('comparativo.mes_like_texto')
+def _(ctx):
+    def consultar():
+        with sqlite3.connect(database.DB_FILE) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT data_disponivel FROM disponibilidade_medico WHERE medico_id = ? AND data_disponivel LIKE ?",
+                (ctx['medico_id'], f"{ctx['ano']}-{ctx['mes']:02d}-%"))]
+    return consultar
+
+@caso('comparativo.mes_intervalo_inteiro')
+def _(ctx):
+    return lambda: database.listar_datas_disponiveis_por_mes(ctx['medico_id'], ctx['ano'], ctx['mes'])
+
+@caso('comparativo.sessoes_mes_texto')
+def _(ctx):
+    def consultar():
+        with sqlite3.connect(database.DB_FILE) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT data_sessao FROM sessoes WHERE data_sessao LIKE ?", (f"{ctx['ano']}-{ctx['mes']:02d}-%",))]
+    return consultar
+
+@caso('comparativo.sessoes_mes_inteiro')
+def _(ctx):
+    return lambda: database.listar_datas_sessoes(*database.intervalo_mes(ctx['ano'], ctx['mes']))
+
+@caso('comparativo.decodificar_strptime')
+def _(ctx):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        textos = [row[0] for row in conn.execute("SELECT data_sessao FROM sessoes LIMIT 20000")]
+    return lambda: [formatacao.formatar_data_para_exibicao(t) for t in textos]
+
+@caso('comparativo.decodificar_ordinal')
+def _(ctx):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        linhas = conn.execute("SELECT dia_sessao, data_sessao FROM sessoes LIMIT 20000").fetchall()
+    return lambda: [formatacao.formatar_dia_para_exibicao(dia, texto) for dia, texto in linhas]
+
+# --- Casos: Preparação de Dados das Janelas ---
+
+@caso('janela_lista.preparar_linhas')
+def _(ctx):
+    pacientes = database.listar_pacientes()
+    return lambda: formatacao.preparar_linhas_pacientes(pacientes)
+
+@caso('janela_sessoes.preparar_linhas')
+def _(ctx):
+    sessoes = database.listar_sessoes_por_paciente(ctx['paciente_id'])
+    return lambda: formatacao.preparar_linhas_sessoes(sessoes)
+
+@caso('calendario_principal.preparar_datas')
+def _(ctx):
+    datas = database.listar_datas_sessoes()
+    return lambda: formatacao.preparar_datas_calendario(datas)
+
+@caso('calendario_disponibilidade.preparar_datas')
+def _(ctx):
+    datas = database.listar_datas_disponiveis_por_mes(ctx['medico_id'], ctx['ano'], ctx['mes'])
+    return lambda: formatacao.preparar_datas_calendario(datas)
+
+@caso('visao_geral_agenda.preparar_grade')
+def _(ctx):
+    dias = [date(ctx['ano'], ctx['mes'], d) for d in range(1, calendar.monthrange(ctx['ano'], ctx['mes'])[1] + 1)]
+    resumo = database.resumo_disponibilidade_periodo(dias[0].isoformat(), dias[-1].isoformat())
+    medicos = database.listar_medicos()
+    return lambda: formatacao.preparar_grade_disponibilidade(medicos, resumo, dias)
+
+# --- Execução ---
+
+def funcoes_publicas():
+    """Lista as funções públicas de database.py, para detectar funções sem caso de benchmark."""
+    return sorted(nome for nome, func in inspect.getmembers(database, inspect.isfunction)
+                  if not nome.startswith('_') and func.__module__ == database.__name__)
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def executar_benchmarks(arquivo_db, repeticoes=20, filtro=None):
+    """Executa todos os casos sobre uma cópia temporária do banco e devolve o relatório em dicionário."""
+    pasta = tempfile.mkdtemp(prefix='bench_clinica_')
+    copia = os.path.join(pasta, 'clinica.db')
+    shutil.copy(arquivo_db, copia)
+
+    db_original = database.DB_FILE
+    database.DB_FILE = copia
+    try:
+        database.inicializar_banco_de_dados() # Aplica as migrações pendentes, como o app faz ao iniciar
+        with sqlite3.connect(copia) as conn:
+            contagens = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                         for t in ('pacientes', 'medicos', 'disponibilidade_medico', 'sessoes', 'prontuarios', 'usuarios')}
+        ctx = _montar_contexto()
+        database.AUTORIZACAO_ATIVA = True
+        database.iniciar_sessao('admin', 'admin123')
+        database.limpar_cache()
+        resultados = {}
+        for nome, fabrica in CASOS.items():
+            if filtro and filtro not in nome:
+                continue
+            resultados[nome] = cronometrar(fabrica(ctx), repeticoes)
+            print(f"{nome:<45} mediana {resultados[nome]['mediana_ms']:>10.3f} ms   p95 {resultados[nome]['p95_ms']:>10.3f} ms")
+    finally:
+        auditoria.encerrar()
+        database.AUTORIZACAO_ATIVA = False
+        database.encerrar_sessao()
+        database.fechar_conexoes()
+        database.DB_FILE = db_original
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    sem_caso = [nome for nome in funcoes_publicas() if nome not in CASOS and nome not in SEM_CASO]
+    if sem_caso:
+        print(f"AVISO: funções públicas sem caso de benchmark: {', '.join(sem_caso)}")
+
+    return {
+        'meta': {
+            'commit': _commit_atual(),
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plataforma': platform.platform(),
+            'contagens': contagens,
+            'sem_caso': sem_caso,
+            'cache': database.estatisticas_cache(),
+        },
+        'resultados': resultados,
+    }
+
+# --- Teste de Concorrência do Agendamento ---
+
+def _tentar_reservar(arquivo_db, barreira, fila, argumentos):
+    """Processo filho: espera todos ficarem prontos e tenta reservar o mesmo horário."""
+    database.DB_FILE = arquivo_db
+    barreira.wait()
+    inicio = time.perf_counter()
+    try:
+        database.adicionar_sessao(*argumentos)
+        resultado = 'reservado'
+    except database.ConflitoAgendamento as e:
+        resultado = e.motivo
+    except sqlite3.Error as e:
+        resultado = f"erro: {e}"
+    fila.put((resultado, (time.perf_counter() - inicio) * 1000))
+
+def testar_concorrencia_agendamento(arquivo_db, processos=8, rodadas=20):
+    """
+    Dispara vários processos reservando o mesmo horário do mesmo médico ao mesmo tempo,
+    sobre uma cópia do banco. Em cada rodada exatamente um deve conseguir; os demais devem
+    receber ConflitoAgendamento. Retorna o relatório com as rodadas que falharam.
+    """
+    pasta = tempfile.mkdtemp(prefix='concorrencia_clinica_')
+    copia = os.path.join(pasta, 'clinica.db')
+    shutil.copy(arquivo_db, copia)
+    db_original = database.DB_FILE
+    database.DB_FILE = copia
+    try:
+        database.inicializar_banco_de_dados()
+        ctx = _montar_contexto()
+        falhas, latencias = [], []
+        for rodada in range(rodadas):
+            dia = (date(2098, 1, 1) + timedelta(days=rodada)).isoformat()
+            database.adicionar_disponibilidade(ctx['medico_id'], dia, '08:00', '12:00')
+            argumentos = (ctx['paciente_id'], ctx['medico_id'], dia, '10:00', '10:50', "Corrida", "Iniciante", "", "")
+            barreira = multiprocessing.Barrier(processos)
+            fila = multiprocessing.Queue()
+            filhos = [multiprocessing.Process(target=_tentar_reservar, args=(copia, barreira, fila, argumentos))
+                      for _ in range(processos)]
+            for filho in filhos:
+                filho.start()
+            resultados = [fila.get(timeout=60) for _ in filhos]
+            for filho in filhos:
+                filho.join()
+            latencias.extend(ms for _, ms in resultados)
+            reservas = sum(1 for r, _ in resultados if r == 'reservado')
+            no_banco = len(database.listar_sessoes_por_medico_e_data(ctx['medico_id'], dia))
+            if reservas != 1 or no_banco != 1 or any(r not in ('reservado', 'conflito_horario') for r, _ in resultados):
+                falhas.append({'rodada': rodada, 'resultados': [r for r, _ in resultados], 'sessoes_no_banco': no_banco})
+    finally:
+        database.fechar_conexoes()
+        database.DB_FILE = db_original
+        shutil.rmtree(pasta, ignore_errors=True)
+    latencias.sort()
+    return {
+        'processos': processos,
+        'rodadas': rodadas,
+        'falhas': falhas,
+        'latencia_mediana_ms': round(statistics.median(latencias), 3),
+        'latencia_max_ms': round(latencias[-1], 3),
+    }
+
+# --- Comparativo Banco Único x Um Arquivo por Clínica ---
+
+def _escrever_sessoes(arquivo_db, indice, quantidade, barreira, fila):
+    """Processo filho: agenda várias sessões seguidas no arquivo indicado e informa o tempo gasto."""
+    database.DB_FILE = arquivo_db
+    with sqlite3.connect(arquivo_db) as conn:
+        medico_id = conn.execute("SELECT id FROM medicos ORDER BY id LIMIT 1 OFFSET ?",
+                                 (indice % conn.execute("SELECT COUNT(*) FROM medicos").fetchone()[0],)).fetchone()[0]
+        paciente_id = conn.execute("SELECT MIN(id) FROM pacientes").fetchone()[0]
+    barreira.wait()
+    inicio = time.perf_counter()
+    erros = 0
+    for i in range(quantidade):
+        # Um dia distante por escrita e por processo, para que só a disputa pelo arquivo pese
+        dia = (date(2099, 1, 1) + timedelta(days=indice * quantidade + i)).isoformat()
+        try:
+            database.adicionar_disponibilidade(medico_id, dia, '08:00', '09:00')
+            database.adicionar_sessao(paciente_id, medico_id, dia, '08:00', '08:50', "Carga", "Iniciante", "", "")
+        except sqlite3.Error:
+            erros += 1
+    fila.put((time.perf_counter() - inicio, erros))
+
+def _vazao_escrita(arquivos, processos, escritas):
+    """Mede a vazão de escrita com vários processos, distribuídos entre os arquivos em rodízio."""
+    barreira = multiprocessing.Barrier(processos)
+    fila = multiprocessing.Queue()
+    filhos = [multiprocessing.Process(target=_escrever_sessoes, args=(arquivos[i % len(arquivos)], i, escritas, barreira, fila))
+              for i in range(processos)]
+    for filho in filhos:
+        filho.start()
+    resultados = [fila.get(timeout=600) for _ in filhos]
+    for filho in filhos:
+        filho.join()
+    duracao = max(segundos for segundos, _ in resultados)
+    return {
+        'processos': processos,
+        'escritas_por_processo': escritas,
+        'segundos': round(duracao, 3),
+        'sessoes_por_segundo': round(processos * escritas / duracao, 1),
+        'erros': sum(erros for _, erros in resultados),
+    }
+
+def comparar_fragmentacao(clinicas=10, sessoes_por_clinica=500_000, repeticoes=5, processos=None, escritas=200):
+    """
+    Gera a mesma rede em dois formatos, um banco único e um arquivo por clínica, e compara
+    a busca de pacientes e a agenda de um médico (consultas federadas), a vazão de escrita
+    concorrente e o tamanho dos arquivos.
+    """
+    processos = processos or clinicas
+    pasta = tempfile.mkdtemp(prefix='fragmentacao_clinica_')
+    totais = {'pacientes': 3_000 * clinicas, 'medicos': 30 * clinicas, 'sessoes': sessoes_por_clinica * clinicas,
+              'usuarios': 15 * clinicas}
+    clinicas_original = dict(database.CLINICAS)
+    db_original, clinica_original = database.DB_FILE, database.CLINICA_ATUAL
+    try:
+        unico = os.path.join(pasta, 'unico.db')
+        gerar_dados.gerar_banco(unico, clinicas=clinicas, **totais)
+        fragmentos = gerar_dados.gerar_rede_fragmentada(os.path.join(pasta, 'rede'), clinicas, **totais)
+        layouts = {'unico': {'unico': unico}, 'fragmentado': fragmentos}
+
+        relatorio = {'clinicas': clinicas, 'sessoes_por_clinica': sessoes_por_clinica, 'layouts': {}}
+        for layout, arquivos in layouts.items():
+            database.configurar_clinicas(arquivos)
+            ctx = _montar_contexto()
+            inicio, fim = database.intervalo_mes(ctx['ano'], ctx['mes'])
+            data_inicio, data_fim = database.data_do_dia(inicio).isoformat(), database.data_do_dia(fim).isoformat()
+            resultado = {
+                'tamanho_total_mb': round(sum(os.path.getsize(a) for a in arquivos.values()) / 2**20, 1),
+                'maior_arquivo_mb': round(max(os.path.getsize(a) for a in arquivos.values()) / 2**20, 1),
+                'busca_pacientes': cronometrar(
+                    lambda: database.buscar_pacientes_todas_clinicas(ctx['nome_busca']), repeticoes),
+                'agenda_medico_mes': cronometrar(
+                    lambda: database.listar_agenda_medico_todas_clinicas(ctx['medico_nome'], data_inicio, data_fim), repeticoes),
+                'escrita_concorrente': _vazao_escrita(list(arquivos.values()), processos, escritas),
+            }
+            relatorio['layouts'][layout] = resultado
+            print(f"{layout:<12} {resultado['tamanho_total_mb']:>8.1f} MB (maior {resultado['maior_arquivo_mb']:.1f} MB)  "
+                  f"busca {resultado['busca_pacientes']['mediana_ms']:.2f} ms  "
+                  f"agenda {resultado['agenda_medico_mes']['mediana_ms']:.2f} ms  "
+                  f"escrita {resultado['escrita_concorrente']['sessoes_por_segundo']:.0f} sessões/s")
+    finally:
+        database.CLINICAS.clear()
+        database.CLINICAS.update(clinicas_original)
+        database.fechar_conexoes()
+        database.DB_FILE, database.CLINICA_ATUAL = db_original, clinica_original
+        shutil.rmtree(pasta, ignore_errors=True)
+    return relatorio
+
+# --- Vazão de Relatórios ---
+
+def medir_relatorios(arquivo_db, pacientes=1000, formatos=('html', 'pdf'), processos=None):
+    """
+    Gera os relatórios dos primeiros pacientes (os de maior histórico primeiro) num único processo
+    e no pool de processos, e informa a vazão de cada modo em relatórios por minuto.
+    """
+    pasta = tempfile.mkdtemp(prefix='relatorios_clinica_')
+    db_original = database.DB_FILE
+    database.DB_FILE = arquivo_db
+    try:
+        with sqlite3.connect(arquivo_db) as conn:
+            paciente_ids = [row[0] for row in conn.execute(
+                "SELECT paciente_id FROM sessoes GROUP BY paciente_id ORDER BY COUNT(*) DESC LIMIT ?", (pacientes,))]
+        relatorio = {'pacientes': len(paciente_ids), 'formatos': list(formatos), 'modos': {}}
+        for modo, quantidade in (('um_processo', 1), ('pool', processos or os.cpu_count())):
+            inicio = time.perf_counter()
+            resultados = relatorios.gerar_relatorios_em_lote(paciente_ids, os.path.join(pasta, modo), formatos, quantidade)
+            duracao = time.perf_counter() - inicio
+            tamanho = sum(os.path.getsize(a) for r in resultados for a in r['arquivos'])
+            relatorio['modos'][modo] = {
+                'processos': quantidade,
+                'segundos': round(duracao, 2),
+                'relatorios_por_minuto': round(len(resultados) / duracao * 60, 1),
+                'sessoes': sum(r['sessoes'] for r in resultados),
+                'tamanho_total_mb': round(tamanho / 2**20, 1),
+            }
+            print(f"{modo:<12} {quantidade:>3} processo(s): {len(resultados)} pacientes em {duracao:.1f}s "
+                  f"= {relatorio['modos'][modo]['relatorios_por_minuto']:.0f} relatórios/min")
+    finally:
+        database.fechar_conexoes()
+        database.DB_FILE = db_original
+        shutil.rmtree(pasta, ignore_errors=True)
+    return relatorio
+
+# --- Envio de Lembretes em Segundo Plano ---
+
+def medir_lembretes(arquivo_db, sessoes=5000):
+    """
+    Agenda sessoes sessões para as próximas horas numa cópia do banco e mede o processador de
+    lembretes enviando todos para um arquivo na sua thread, enquanto a thread principal recarrega a
+    lista de pacientes como a janela faria. Compara a latência dessa recarga com a do banco parado.
+    """
+    pasta = tempfile.mkdtemp(prefix='lembretes_clinica_')
+    copia = os.path.join(pasta, 'clinica.db')
+    shutil.copy(arquivo_db, copia)
+    db_original = database.DB_FILE
+    database.DB_FILE = copia
+    recarregar = lambda: formatacao.preparar_linhas_pacientes(database.listar_pacientes())
+    try:
+        database.inicializar_banco_de_dados()
+        # Sessões entre 1 e 23 horas à frente: todos os lembretes já estão vencidos (antecedência de 24 horas)
+        _semear_lembretes(None, copia, sessoes, time.time(), horas=23)
+        parado = cronometrar(recarregar, 20)
+        remetente = lembretes.RemetenteArquivo(os.path.join(pasta, 'saida.jsonl'))
+        latencias = []
+        inicio = time.perf_counter()
+        processador = lembretes.ProcessadorLembretes(remetente, intervalo=3600)
+        while processador.estatisticas['rodadas'] == 0:
+            t = time.perf_counter()
+            recarregar()
+            latencias.append((time.perf_counter() - t) * 1000)
+        duracao = time.perf_counter() - inicio
+        processador.encerrar()
+        with open(remetente.caminho, encoding='utf-8') as f:
+            gravados = sum(1 for _ in f)
+        latencias.sort()
+        relatorio = {
+            'sessoes': sessoes,
+            'enviados': processador.estatisticas['enviados'],
+            'no_arquivo': gravados,
+            'lotes': processador.estatisticas['lotes'],
+            'segundos': round(duracao, 3),
+            'lembretes_por_segundo': round(processador.estatisticas['enviados'] / duracao, 1),
+            'janela_parado_mediana_ms': parado['mediana_ms'],
+            'janela_durante_envio_mediana_ms': round(statistics.median(latencias), 3) if latencias else None,
+            'janela_durante_envio_max_ms': round(latencias[-1], 3) if latencias else None,
+            'resumo_fila': database.resumo_lembretes(),
+        }
+        print(f"Lembretes: {relatorio['enviados']} enviados em {duracao:.2f}s ({relatorio['lotes']} lotes, "
+              f"{relatorio['lembretes_por_segundo']:.0f}/s); lista de pacientes: mediana {parado['mediana_ms']:.1f} ms parado, "
+              f"{relatorio['janela_durante_envio_mediana_ms']} ms durante o envio (máx. {relatorio['janela_durante_envio_max_ms']} ms)")
+    finally:
+        database.fechar_conexoes()
+        database.DB_FILE = db_original
+        shutil.rmtree(pasta, ignore_errors=True)
+    return relatorio
+
+# --- Replicação entre Cópias do Banco ---
+
+def _linhas_replicadas(arquivo_db):
+    """Conteúdo das linhas replicadas de um banco, por uuid e com as chaves estrangeiras como uuids."""
+    with closing(sqlite3.connect(arquivo_db)) as conn:
+        uuids = {tabela: dict(conn.execute(
+                     "SELECT registro_id, uuid FROM replicacao_versoes WHERE tabela = ? AND excluido = 0", (tabela,)))
+                 for tabela in ('medicos', 'pacientes')}
+        linhas = {}
+        for tabela in replicacao.TABELAS:
+            colunas = replicacao._colunas(conn, tabela)
+            chaves = replicacao.CHAVES_ESTRANGEIRAS.get(tabela, {})
+            for row in conn.execute(f"""
+                    SELECT v.uuid, {', '.join('t.' + c for c in colunas)} FROM {tabela} t
+                    JOIN replicacao_versoes v ON v.tabela = '{tabela}' AND v.registro_id = t.id AND v.excluido = 0"""):
+                dados = dict(zip(colunas, row[1:]))
+                for coluna, referencia in chaves.items():
+                    dados[coluna] = uuids[referencia].get(dados[coluna], dados[coluna])
+                linhas[row[0]] = dados
+    return linhas
+
+def medir_replicacao(arquivo_db, alteracoes=50_000, semente=42):
+    """
+    Sincroniza duas cópias locais do banco: ativa a replicação numa cópia do arquivo (a clínica), cria
+    a cópia do notebook, faz nela cerca de alteracoes alterações (sessões novas, editadas e excluídas,
+    pacientes novos, prontuários editados) enquanto a clínica edita parte das mesmas linhas, troca os
+    deltas nos dois sentidos e confere que as duas cópias terminam com o mesmo conteúdo.
+    """
+    rng = random.Random(semente)
+    pasta = tempfile.mkdtemp(prefix='replicacao_clinica_')
+    clinica = os.path.join(pasta, 'clinica.db')
+    notebook = os.path.join(pasta, 'notebook.db')
+    shutil.copy(arquivo_db, clinica)
+    try:
+        inicio = time.perf_counter()
+        replicacao.ativar(clinica)
+        tempo_ativar = time.perf_counter() - inicio
+        replicacao.criar_copia(notebook, clinica)
+
+        with closing(sqlite3.connect(notebook)) as conn:
+            paciente_ids = [row[0] for row in conn.execute("SELECT id FROM pacientes")]
+            sessao_ids = [row[0] for row in conn.execute("SELECT id FROM sessoes")]
+            prontuario_ids = [row[0] for row in conn.execute("SELECT id FROM prontuarios")]
+        partes = {'sessoes_novas': alteracoes * 4 // 10, 'sessoes_editadas': alteracoes * 3 // 10,
+                  'sessoes_excluidas': alteracoes // 10, 'prontuarios_editados': min(alteracoes // 10, len(prontuario_ids))}
+        partes['pacientes_novos'] = alteracoes - sum(partes.values())
+        editadas = rng.sample(sessao_ids, partes['sessoes_editadas'] + partes['sessoes_excluidas'])
+        excluidas = editadas[partes['sessoes_editadas']:]
+        del editadas[partes['sessoes_editadas']:]
+
+        with closing(sqlite3.connect(notebook)) as conn, conn:
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.executemany("INSERT INTO pacientes (nome_completo, data_nascimento, nome_responsavel) VALUES (?, '2015-03-10', '')",
+                             [(f"Paciente Visita {i}",) for i in range(partes['pacientes_novos'])])
+            conn.executemany("""
+                INSERT INTO sessoes (paciente_id, data_sessao, resumo_sessao, nivel_evolucao, observacoes_evolucao, plano_terapeutico)
+                VALUES (?, ?, ?, 'Intermediário', '', '')""",
+                [(rng.choice(paciente_ids), (date(2024, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+                  f"Visita domiciliar {i}") for i in range(partes['sessoes_novas'])])
+            conn.executemany("UPDATE sessoes SET resumo_sessao = ? WHERE id = ?",
+                             [(f"Revisado no notebook {i}", sessao_id) for i, sessao_id in enumerate(editadas)])
+            conn.executemany("DELETE FROM sessoes WHERE id = ?", [(sessao_id,) for sessao_id in excluidas])
+            conn.executemany("UPDATE prontuarios SET anamnese = ? WHERE id = ?",
+                             [(f"Anamnese do notebook {i}", prontuario_id)
+                              for i, prontuario_id in enumerate(rng.sample(prontuario_ids, partes['prontuarios_editados']))])
+        # Na clínica, edições concorrentes de parte das mesmas sessões (inclusive excluídas no notebook) e prontuários
+        concorrentes = rng.sample(editadas, len(editadas) // 10) + excluidas[:len(excluidas) // 10]
+        with closing(sqlite3.connect(clinica)) as conn, conn:
+            conn.executemany("UPDATE sessoes SET resumo_sessao = ? WHERE id = ?",
+                             [(f"Revisado na clínica {i}", sessao_id) for i, sessao_id in enumerate(concorrentes)])
+            conn.executemany("UPDATE prontuarios SET queixa_principal = ? WHERE id = ?",
+                             [(f"Queixa revista na clínica {i}", prontuario_id)
+                              for i, prontuario_id in enumerate(rng.sample(prontuario_ids, len(prontuario_ids) // 20))])
+
+        relatorio = {'alteracoes_notebook': partes, 'alteracoes_clinica': len(concorrentes) + len(prontuario_ids) // 20,
+                     'ativar_segundos': round(tempo_ativar, 3)}
+        # Os dois deltas são exportados antes de qualquer aplicação, como numa troca entre cópias desconectadas
+        sentidos = (('notebook_para_clinica', notebook, clinica), ('clinica_para_notebook', clinica, notebook))
+        for sentido, origem, _ in sentidos:
+            inicio = time.perf_counter()
+            exportado = replicacao.exportar(os.path.join(pasta, f"{sentido}.json.gz"), arquivo=origem)
+            relatorio[sentido] = {'linhas': exportado['linhas'], 'delta_kb': round(exportado['bytes'] / 1024, 1),
+                                  'exportar_segundos': round(time.perf_counter() - inicio, 3)}
+        for sentido, _, destino in sentidos:
+            inicio = time.perf_counter()
+            relatorio[sentido].update(replicacao.aplicar(os.path.join(pasta, f"{sentido}.json.gz"), arquivo=destino))
+            relatorio[sentido]['aplicar_segundos'] = round(time.perf_counter() - inicio, 3)
+            r = relatorio[sentido]
+            print(f"{sentido:<24} {r['linhas']:>7} linhas, {r['delta_kb']:>8.1f} KB: exportar {r['exportar_segundos']:.2f}s, "
+                  f"aplicar {r['aplicar_segundos']:.2f}s ({r['aplicadas']} aplicadas, {r['mescladas']} mescladas, "
+                  f"{r['ignoradas']} ignoradas, {r['conflitos']} conflitos)")
+        relatorio['convergiu'] = _linhas_replicadas(clinica) == _linhas_replicadas(notebook)
+        print("As duas cópias convergiram." if relatorio['convergiu'] else "FALHA: as cópias divergem após a sincronização.")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return relatorio
+
+def comparar(base, atual, limiar=1.10):
+    """Imprime a razão atual/base das medianas e destaca regressões acima do limiar."""
+    print(f"\nComparação com {base['meta'].get('commit')} (mediana atual / mediana base):")
+    for nome, resultado in atual['resultados'].items():
+        anterior = base['resultados'].get(nome)
+        if not anterior or not anterior['mediana_ms']:
+            print(f"  {nome:<45} (novo)")
+            continue
+        razao = resultado['mediana_ms'] / anterior['mediana_ms']
+        marca = '  <-- REGRESSÃO' if razao > limiar else ''
+        print(f"  {nome:<45} {razao:>6.2f}x{marca}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da camada de dados e da preparação das janelas.")
+    parser.add_argument('--db', help="Banco já gerado. Se omitido, um banco é gerado na escala indicada.")
+    parser.add_argument('--escala', choices=gerar_dados.ESCALAS.keys(), default='consultorio')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--filtro', help="Executa apenas os casos cujo nome contém este texto.")
+    parser.add_argument('--saida', help="Arquivo JSON onde os resultados serão gravados.")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparação.")
+    parser.add_argument('--concorrencia', type=int, metavar='PROCESSOS',
+                        help="Executa também o teste de processos concorrentes reservando o mesmo horário.")
+    parser.add_argument('--fragmentacao', metavar='CLINICASxSESSOES',
+                        help="Compara banco único e um arquivo por clínica, ex.: 10x500000 (sessões por clínica).")
+    parser.add_argument('--relatorios', type=int, metavar='PACIENTES',
+                        help="Mede a geração de relatórios HTML+PDF para N pacientes, num processo e em pool.")
+    parser.add_argument('--lembretes', type=int, metavar='SESSOES',
+                        help="Mede o envio em segundo plano dos lembretes de N sessões e a latência da janela durante o envio.")
+    parser.add_argument('--replicacao', type=int, metavar='ALTERACOES',
+                        help="Sincroniza duas cópias do banco após N alterações numa delas e confere a convergência.")
+    args = parser.parse_args()
+
+    if args.fragmentacao:
+        clinicas, _, sessoes = args.fragmentacao.lower().partition('x')
+        relatorio = {'fragmentacao': comparar_fragmentacao(int(clinicas), int(sessoes), min(args.repeticoes, 5))}
+        if args.saida:
+            with open(args.saida, 'w', encoding='utf-8') as f:
+                json.dump(relatorio, f, indent=2, ensure_ascii=False)
+            print(f"Resultados gravados em {args.saida}")
+        return
+
+    arquivo_db = args.db
+    pasta_temporaria = None
+    if not arquivo_db:
+        pasta_temporaria = tempfile.mkdtemp(prefix='dados_clinica_')
+        arquivo_db = os.path.join(pasta_temporaria, f"{args.escala}.db")
+        gerar_dados.gerar_banco(arquivo_db, **gerar_dados.ESCALAS[args.escala])
+
+    try:
+        relatorio = executar_benchmarks(arquivo_db, args.repeticoes, args.filtro)
+        relatorio['meta']['escala'] = None if args.db else args.escala
+        if args.concorrencia:
+            relatorio['concorrencia'] = testar_concorrencia_agendamento(arquivo_db, args.concorrencia)
+        if args.relatorios:
+            relatorio['relatorios'] = medir_relatorios(arquivo_db, args.relatorios)
+        if args.lembretes:
+            relatorio['lembretes'] = medir_lembretes(arquivo_db, args.lembretes)
+        if args.replicacao:
+            relatorio['replicacao'] = medir_replicacao(arquivo_db, args.replicacao)
+    finally:
+        if pasta_temporaria:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.saida}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(json.load(f), relatorio)
+    if args.concorrencia:
+        concorrencia = relatorio['concorrencia']
+        print(f"\nConcorrência: {concorrencia['processos']} processos x {concorrencia['rodadas']} rodadas, "
+              f"latência mediana {concorrencia['latencia_mediana_ms']} ms")
+        if concorrencia['falhas']:
+            print(f"FALHA: reservas duplicadas ou erros em {len(concorrencia['falhas'])} rodada(s): {concorrencia['falhas']}")
+            sys.exit(1)
+        print("Nenhuma reserva duplicada.")
+    if args.replicacao and not relatorio['replicacao']['convergiu']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
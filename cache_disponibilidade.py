@@ -0,0 +1,156 @@
+"""
+Disponibilidade dos médicos por mês, guardada em memória para a navegação no calendário.
+
+Os meses de um médico são lidos numa única consulta que cobre uma janela de meses ao redor do
+mês exibido (database.listar_disponibilidade_intervalo); os meses vizinhos são pré-carregados
+numa thread em segundo plano, e os horários de um dia são servidos da memória.
+Uma escrita de disponibilidade deste processo relê apenas o dia afetado (ouvinte de escrita):
+na inserção, o dia do novo horário; na exclusão, o dia em que o horário estava guardado.
+Escritas sem registro conhecido (como a exclusão de um médico) e escritas de outros processos
+descartam tudo o que está guardado.
+"""
+import sqlite3
+import threading
+from datetime import date
+
+import database
+
+RAIO_MESES = 2 # Meses lidos de cada lado do mês pedido
+MAX_MEDICOS_GUARDADOS = 16
+
+_trava = threading.Lock()
+_meses = {}    # (arquivo, medico_id) -> {índice do mês: {dia: [horário, ...]}}
+_horarios = {} # (arquivo, id do horário) -> (medico_id, dia), para achar o dia de um horário excluído
+_estado = {'versao': 0, 'geracao_externa': None} # versao muda a cada invalidação
+
+def indice_mes(ano, mes):
+    return ano * 12 + mes - 1
+
+def _limites_meses(primeiro, ultimo):
+    """Intervalo de dias (dia_inicio, dia_fim) que cobre os meses de índice primeiro a ultimo."""
+    inicio = date(primeiro // 12, primeiro % 12 + 1, 1)
+    _, fim = database.intervalo_mes(ultimo // 12, ultimo % 12 + 1)
+    return database.dia_numero(inicio), fim
+
+def _indice_do_dia(dia):
+    data = database.data_do_dia(dia)
+    return indice_mes(data.year, data.month)
+
+def _descartar_tudo():
+    _meses.clear()
+    _horarios.clear()
+    _estado['versao'] += 1
+
+def _conferir_externas():
+    """Descarta os meses guardados se outro processo gravou no banco desde a última leitura."""
+    geracao = database.geracao_externa()
+    with _trava:
+        if _estado['geracao_externa'] != geracao:
+            _descartar_tudo()
+            _estado['geracao_externa'] = geracao
+
+def _garantir_meses(medico_id, primeiro, ultimo):
+    """Garante em memória os meses de índice primeiro a ultimo, lendo os que faltam numa única consulta."""
+    chave = (database.DB_FILE, medico_id)
+    with _trava:
+        guardados = _meses.get(chave, {})
+        faltando = [i for i in range(primeiro, ultimo + 1) if i not in guardados]
+        versao = _estado['versao']
+    if not faltando:
+        return
+    primeiro, ultimo = faltando[0], faltando[-1]
+    linhas = database.listar_disponibilidade_intervalo(medico_id, *_limites_meses(primeiro, ultimo))
+    por_mes = {i: {} for i in range(primeiro, ultimo + 1)}
+    inicios = [_limites_meses(i, i)[0] for i in range(primeiro, ultimo + 2)] # Primeiro dia de cada mês
+    indice = primeiro
+    for linha in linhas: # Já ordenadas por dia
+        while linha['dia'] >= inicios[indice - primeiro + 1]:
+            indice += 1
+        por_mes[indice].setdefault(linha['dia'], []).append(linha)
+    with _trava:
+        if _estado['versao'] != versao:
+            return # Houve uma escrita durante a leitura; os meses serão lidos de novo quando pedidos
+        if chave not in _meses and len(_meses) >= MAX_MEDICOS_GUARDADOS:
+            arquivo, antigo = next(iter(_meses))
+            del _meses[(arquivo, antigo)]
+            for id_horario in [k for k, (m, _) in _horarios.items() if k[0] == arquivo and m == antigo]:
+                del _horarios[id_horario]
+        _meses.setdefault(chave, {}).update(por_mes)
+        for linha in linhas:
+            _horarios[(database.DB_FILE, linha['id'])] = (medico_id, linha['dia'])
+
+def carregar_meses(medico_id, ano, mes, raio=RAIO_MESES):
+    """Garante em memória os meses de (ano, mes) - raio a (ano, mes) + raio."""
+    _conferir_externas()
+    centro = indice_mes(ano, mes)
+    _garantir_meses(medico_id, centro - raio, centro + raio)
+
+def dias_disponiveis(medico_id, dia_inicio, dia_fim):
+    """Retorna as datas (datetime.date) com disponibilidade do médico entre dois dias (números, inclusive)."""
+    _conferir_externas()
+    primeiro, ultimo = _indice_do_dia(dia_inicio), _indice_do_dia(dia_fim)
+    _garantir_meses(medico_id, primeiro - RAIO_MESES, ultimo + RAIO_MESES)
+    with _trava:
+        meses = _meses.get((database.DB_FILE, medico_id), {})
+        dias = [dia for i in range(primeiro, ultimo + 1) for dia in meses.get(i, ()) if dia_inicio <= dia <= dia_fim]
+    return [database.data_do_dia(dia) for dia in sorted(dias)]
+
+def horarios_do_dia(medico_id, data):
+    """Retorna os horários (id, dia, hora_inicio, hora_fim) do médico na data (date ou YYYY-MM-DD)."""
+    dia = database.dia_numero(data)
+    indice = _indice_do_dia(dia)
+    carregar_meses(medico_id, indice // 12, indice % 12 + 1)
+    with _trava:
+        horarios = _meses.get((database.DB_FILE, medico_id), {}).get(indice, {}).get(dia, [])
+        return [dict(h) for h in horarios]
+
+def recarregar_dia(medico_id, dia):
+    """Relê do banco os horários de um dia, se o mês dele estiver guardado."""
+    chave, indice = (database.DB_FILE, medico_id), _indice_do_dia(dia)
+    with _trava:
+        if indice not in _meses.get(chave, {}):
+            return
+        _estado['versao'] += 1 # Uma leitura de meses em andamento não deve sobrescrever este dia
+    linhas = database.listar_disponibilidade_intervalo(medico_id, dia, dia)
+    with _trava:
+        mes = _meses.get(chave, {}).get(indice)
+        if mes is None:
+            return
+        for id_horario in [h['id'] for h in mes.pop(dia, [])]:
+            _horarios.pop((database.DB_FILE, id_horario), None)
+        if linhas:
+            mes[dia] = linhas
+        for linha in linhas:
+            _horarios[(database.DB_FILE, linha['id'])] = (medico_id, dia)
+
+def pre_carregar(medico_id, ano, mes):
+    """Carrega os meses ao redor de (ano, mes) numa thread em segundo plano; erros são ignorados."""
+    def carregar():
+        try:
+            carregar_meses(medico_id, ano, mes)
+        except sqlite3.Error:
+            pass
+    thread = threading.Thread(target=carregar, name='pre_carregar_disponibilidade', daemon=True)
+    thread.start()
+    return thread
+
+def limpar():
+    with _trava:
+        _descartar_tudo()
+
+def _ao_escrever(tabela, operacao, registro_id):
+    if tabela != 'disponibilidade_medico':
+        return
+    if operacao is None:
+        limpar()
+    elif operacao == 'inserido':
+        horario = database.buscar_disponibilidade_por_id(registro_id)
+        if horario:
+            recarregar_dia(horario['medico_id'], horario['dia'])
+    elif operacao == 'excluido':
+        with _trava:
+            guardado = _horarios.get((database.DB_FILE, registro_id))
+        if guardado:
+            recarregar_dia(*guardado)
+
+database.registrar_ouvinte(_ao_escrever)
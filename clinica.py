@@ -0,0 +1,307 @@
+"""
+Linha de comando para as rotinas em lote sobre o banco da clínica.
+
+Cada subcomando chama as funções de database.py. As importações gravam uma transação por lote, e as
+listagens são escritas à medida que as linhas saem do banco, como tabela, CSV ou JSON (um objeto por
+linha), para poder rodar em rotinas agendadas (cron) sobre bancos grandes. Sem --usuario, roda sem
+controle de acesso, como as demais rotinas de manutenção; com --usuario, as escritas exigem as
+permissões desse usuário e são auditadas, e a senha vem de CLINICA_SENHA ou é pedida no terminal.
+As mensagens vão para a saída de erros e o código de saída é 1 em caso de erro. Uso:
+
+    python -m clinica pacientes listar --busca silva --formato csv > pacientes.csv
+    python -m clinica --db clinica_sintetica.db pacientes importar novos.csv --lote 5000
+    python -m clinica --usuario admin usuarios importar equipe.csv
+    python -m clinica medicos carteira --medico 3 --formato json
+    python -m clinica sessoes listar --paciente 42 --arquivo-morto
+    python -m clinica agenda listar --medico 3 --de 2025-03-01 --ate 31/03/2025
+    python -m clinica agenda deslocar --medico 3 --de 2025-03-10 --ate 2025-03-14 --dias 7
+    python -m clinica --clinica centro lembretes enviar      # no cron, a cada 15 minutos
+    python -m clinica lembretes resumo
+
+Os CSVs de importação têm cabeçalho: pacientes com nome_completo, data_nascimento (YYYY-MM-DD ou
+DD/MM/YYYY) e nome_responsavel; usuários com nome_usuario, senha, nivel_acesso e medico_id.
+Este módulo não importa tkinter.
+"""
+import argparse
+import contextlib
+import csv
+import getpass
+import json
+import os
+import sqlite3
+import sys
+from datetime import date
+from itertools import chain, islice
+
+import autenticacao
+import auditoria
+import database
+import formatacao
+import lembretes
+
+FORMATOS = ('tabela', 'csv', 'json')
+LOTE_IMPORTACAO = 1000
+AMOSTRA_LARGURAS = 200 # Linhas lidas antes de escrever a tabela, para medir as colunas
+LARGURA_MAXIMA = 40
+
+# --- Saída ---
+
+def _texto(valor):
+    return '' if valor is None else str(valor).replace('\n', ' ')
+
+def _celula(valor, largura):
+    texto = _texto(valor)
+    return (texto[:largura - 1] + '…' if len(texto) > largura else texto).ljust(largura)
+
+def escrever(linhas, colunas, formato='tabela', saida=None):
+    """
+    Escreve as linhas (dicionários) à medida que chegam, só com as colunas indicadas. Na tabela, as
+    larguras vêm das primeiras AMOSTRA_LARGURAS linhas, e os valores mais largos são cortados.
+    Retorna quantas linhas foram escritas.
+    """
+    saida = saida or sys.stdout
+    linhas, escritas = iter(linhas), 0
+    if formato == 'json':
+        for linha in linhas:
+            saida.write(json.dumps({c: linha.get(c) for c in colunas}, ensure_ascii=False, default=str) + '\n')
+            escritas += 1
+    elif formato == 'csv':
+        escritor = csv.writer(saida, lineterminator='\n')
+        escritor.writerow(colunas)
+        for linha in linhas:
+            escritor.writerow([linha.get(c) for c in colunas])
+            escritas += 1
+    else:
+        amostra = list(islice(linhas, AMOSTRA_LARGURAS))
+        larguras = [min(LARGURA_MAXIMA, max([len(c)] + [len(_texto(linha.get(c))) for linha in amostra])) for c in colunas]
+        saida.write('  '.join(c.ljust(l) for c, l in zip(colunas, larguras)).rstrip() + '\n')
+        saida.write('  '.join('-' * l for l in larguras) + '\n')
+        for linha in chain(amostra, linhas):
+            saida.write('  '.join(_celula(linha.get(c), l) for c, l in zip(colunas, larguras)).rstrip() + '\n')
+            escritas += 1
+    return escritas
+
+def _informar(mensagem):
+    print(mensagem, file=sys.stderr)
+
+# --- Entrada ---
+
+def _data(texto):
+    """Data em YYYY-MM-DD ou DD/MM/YYYY, devolvida como YYYY-MM-DD (None se vazia). Lança ValueError se for inválida."""
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+    try:
+        return date.fromisoformat(texto).isoformat()
+    except ValueError:
+        pass
+    data = formatacao.formatar_data_para_db(texto)
+    if data is None:
+        raise ValueError(f"Data inválida: '{texto}' (use YYYY-MM-DD ou DD/MM/YYYY).")
+    return data
+
+def _argumento_data(texto):
+    try:
+        return _data(texto)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+@contextlib.contextmanager
+def _ler_csv(caminho, obrigatorias):
+    """Abre o CSV (o '-' é a entrada padrão), confere o cabeçalho e fornece o leitor de dicionários."""
+    with contextlib.nullcontext(sys.stdin) if caminho == '-' else open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        leitor = csv.DictReader(arquivo)
+        faltando = [c for c in obrigatorias if c not in (leitor.fieldnames or ())]
+        if faltando:
+            raise ValueError(f"{caminho}: faltam as colunas {', '.join(faltando)} no cabeçalho.")
+        yield leitor
+
+def _lotes(linhas, tamanho):
+    linhas = iter(linhas)
+    while True:
+        lote = list(islice(linhas, tamanho))
+        if not lote:
+            break
+        yield lote
+
+# --- Subcomandos ---
+
+def pacientes_listar(args):
+    escrever(database.iterar_pacientes(args.busca),
+             ('id', 'nome_completo', 'data_nascimento', 'nome_responsavel'), args.formato)
+
+def pacientes_importar(args):
+    importados = lotes = 0
+    with _ler_csv(args.arquivo, ('nome_completo', 'data_nascimento')) as leitor:
+        for lote in _lotes(enumerate(leitor, start=2), args.lote):
+            pacientes = []
+            for numero, linha in lote:
+                nome = (linha['nome_completo'] or '').strip()
+                try:
+                    data_nasc = _data(linha['data_nascimento'])
+                    if not nome or not data_nasc:
+                        raise ValueError("nome_completo e data_nascimento são obrigatórios.")
+                    pacientes.append((nome, data_nasc, (linha.get('nome_responsavel') or '').strip()))
+                except ValueError as e:
+                    raise ValueError(f"{args.arquivo}, linha {numero}: {e} Pacientes já gravados nos lotes anteriores: {importados}.")
+            importados += len(database.adicionar_pacientes(pacientes))
+            lotes += 1
+    print(f"{importados} paciente(s) importado(s) em {lotes} lote(s).")
+
+def medicos_listar(args):
+    escrever(database.listar_medicos(), ('id', 'nome_completo', 'especialidade', 'contato'), args.formato)
+
+def medicos_carteira(args):
+    escrever(database.listar_carteira_medico(args.medico),
+             ('paciente_id', 'paciente_nome', 'nome_responsavel', 'sessoes', 'primeira_sessao', 'ultima_sessao', 'proxima_sessao'),
+             args.formato)
+
+def usuarios_listar(args):
+    escrever(database.listar_usuarios(), ('id', 'nome_usuario', 'nivel_acesso', 'medico_id', 'medico_nome'), args.formato)
+
+def usuarios_importar(args):
+    # Todos numa única transação: a equipe entra inteira ou nenhum usuário é criado
+    usuarios = []
+    with _ler_csv(args.arquivo, ('nome_usuario', 'senha', 'nivel_acesso')) as leitor:
+        for numero, linha in enumerate(leitor, start=2):
+            nome, nivel = (linha['nome_usuario'] or '').strip(), (linha['nivel_acesso'] or '').strip()
+            medico_id = (linha.get('medico_id') or '').strip()
+            if not nome or not linha['senha']:
+                raise ValueError(f"{args.arquivo}, linha {numero}: nome_usuario e senha são obrigatórios.")
+            if nivel not in autenticacao.PERMISSOES_POR_NIVEL:
+                raise ValueError(f"{args.arquivo}, linha {numero}: nível de acesso desconhecido '{nivel}' "
+                                 f"(use {', '.join(autenticacao.PERMISSOES_POR_NIVEL)}).")
+            if medico_id and not medico_id.isdigit():
+                raise ValueError(f"{args.arquivo}, linha {numero}: medico_id inválido '{medico_id}'.")
+            usuarios.append({'nome_usuario': nome, 'senha': linha['senha'], 'nivel_acesso': nivel,
+                             'medico_id': int(medico_id) if medico_id else None})
+    print(f"{database.adicionar_usuarios(usuarios)} usuário(s) importado(s).")
+
+def sessoes_listar(args):
+    escrever(database.iterar_sessoes_paciente(args.paciente, incluir_arquivo=args.arquivo_morto),
+             ('id', 'data_sessao', 'hora_inicio_sessao', 'hora_fim_sessao', 'medico_nome', 'nivel_evolucao',
+              'resumo_sessao', 'observacoes_evolucao', 'plano_terapeutico', 'arquivada'),
+             args.formato)
+
+def agenda_listar(args):
+    linhas = ({**linha, 'data': database.data_do_dia(linha['dia']).isoformat(),
+               'inicio': formatacao.formatar_minuto_do_dia(linha['minuto_inicio']),
+               'fim': formatacao.formatar_minuto_do_dia(linha['minuto_fim'])}
+              for linha in database.agenda_medico(args.medico, args.de, args.ate))
+    escrever(linhas, ('data', 'inicio', 'fim', 'tipo', 'sessao_id', 'paciente_id', 'paciente_nome', 'nivel_evolucao'), args.formato)
+
+def agenda_deslocar(args):
+    resultado = database.deslocar_agenda_medico(args.medico, args.de, args.ate, args.dias,
+                                                com_disponibilidade=not args.sem_disponibilidade)
+    print(f"{resultado['sessoes']} sessão(ões) e {resultado['disponibilidades']} horário(s) de disponibilidade "
+          f"deslocados em {args.dias:+d} dia(s).")
+
+def lembretes_enviar(args):
+    rodada = lembretes.processar(lembretes.RemetenteArquivo(args.saida), args.lote)
+    print(f"{rodada['gerados']} lembrete(s) gerado(s), {rodada['enviados']} enviado(s), "
+          f"{rodada['falhas']} falha(s) em {rodada['lotes']} lote(s).")
+
+def lembretes_resumo(args):
+    escrever(({'estado': estado, 'lembretes': n} for estado, n in sorted(database.resumo_lembretes().items())),
+             ('estado', 'lembretes'), args.formato)
+
+def _criar_parser():
+    parser = argparse.ArgumentParser(prog='python -m clinica', description="Rotinas em lote sobre o banco da clínica.")
+    parser.add_argument('--db', help=f"Banco da clínica (padrão: {database.DB_FILE}).")
+    parser.add_argument('--clinica', help=f"Clínica configurada em {database.ARQUIVO_CONFIG_CLINICAS} cujo banco será usado.")
+    parser.add_argument('--usuario', help="Usuário cujas permissões valem para as escritas (senha em CLINICA_SENHA ou pedida no terminal).")
+    parser.add_argument('--formato', choices=FORMATOS, default='tabela', help="Formato das listagens (padrão: %(default)s).")
+    grupos = parser.add_subparsers(dest='grupo', required=True)
+    # As listagens aceitam --formato também depois do subcomando, como no uso documentado acima; sem
+    # padrão próprio (SUPPRESS), para não apagar o --formato dado antes do grupo
+    formato = argparse.ArgumentParser(add_help=False)
+    formato.add_argument('--formato', choices=FORMATOS, default=argparse.SUPPRESS, help="Formato da listagem.")
+
+    def comandos(nome, ajuda):
+        return grupos.add_parser(nome, help=ajuda).add_subparsers(dest='comando', required=True)
+
+    def comando(subcomandos, nome, funcao, ajuda, listagem=False):
+        sub = subcomandos.add_parser(nome, help=ajuda, parents=[formato] if listagem else [])
+        sub.set_defaults(executar=funcao)
+        return sub
+
+    pacientes = comandos('pacientes', "Cadastro de pacientes.")
+    comando(pacientes, 'listar', pacientes_listar, "Lista os pacientes por nome.", True).add_argument('--busca', help="Parte do nome.")
+    importacao = comando(pacientes, 'importar', pacientes_importar, "Importa pacientes de um CSV ('-' para a entrada padrão).")
+    importacao.add_argument('arquivo')
+    importacao.add_argument('--lote', type=int, default=LOTE_IMPORTACAO, help="Pacientes por transação (padrão: %(default)s).")
+
+    medicos = comandos('medicos', "Médicos e terapeutas.")
+    comando(medicos, 'listar', medicos_listar, "Lista os médicos.", True)
+    comando(medicos, 'carteira', medicos_carteira, "Pacientes atendidos pelo médico.", True).add_argument('--medico', type=int, required=True)
+
+    usuarios = comandos('usuarios', "Usuários do sistema.")
+    comando(usuarios, 'listar', usuarios_listar, "Lista os usuários.", True)
+    comando(usuarios, 'importar', usuarios_importar, "Cria os usuários de um CSV numa única transação.").add_argument('arquivo')
+
+    sessoes = comando(comandos('sessoes', "Sessões dos pacientes."), 'listar', sessoes_listar,
+                      "Histórico de um paciente, da sessão mais antiga à mais recente.", True)
+    sessoes.add_argument('--paciente', type=int, required=True)
+    sessoes.add_argument('--arquivo-morto', action='store_true', help="Inclui as sessões do arquivo morto.")
+
+    agenda = comandos('agenda', "Agenda dos médicos.")
+    for nome, funcao, ajuda in (('listar', agenda_listar, "Sessões e horários disponíveis do médico no período."),
+                                ('deslocar', agenda_deslocar, "Remarca as sessões do médico no período, numa única transação.")):
+        sub = comando(agenda, nome, funcao, ajuda, listagem=nome == 'listar')
+        sub.add_argument('--medico', type=int, required=True)
+        sub.add_argument('--de', type=_argumento_data, required=True, help="Primeiro dia (YYYY-MM-DD ou DD/MM/YYYY).")
+        sub.add_argument('--ate', type=_argumento_data, required=True, help="Último dia, inclusive.")
+    agenda.choices['deslocar'].add_argument('--dias', type=int, required=True, help="Dias de deslocamento (negativo: antecipa).")
+    agenda.choices['deslocar'].add_argument('--sem-disponibilidade', action='store_true',
+                                            help="Não desloca os horários de disponibilidade.")
+
+    avisos = comandos('lembretes', "Lembretes das próximas sessões.")
+    envio = comando(avisos, 'enviar', lembretes_enviar, "Gera e envia os lembretes pendentes e termina.")
+    envio.add_argument('--saida', help="Arquivo JSONL das mensagens (padrão: <banco>_lembretes.jsonl).")
+    envio.add_argument('--lote', type=int, default=lembretes.LOTE_MAXIMO, help="Lembretes por lote (padrão: %(default)s).")
+    comando(avisos, 'resumo', lembretes_resumo, "Quantos lembretes há em cada estado.", True)
+    return parser
+
+def _abrir_banco(args):
+    if args.clinica:
+        if not database.carregar_configuracao_clinicas():
+            raise ValueError(f"{database.ARQUIVO_CONFIG_CLINICAS} não encontrado.")
+        database.selecionar_clinica(args.clinica)
+    if args.db:
+        database.DB_FILE = args.db
+    # As mensagens de migração não podem se misturar às listagens na saída padrão
+    with contextlib.redirect_stdout(sys.stderr):
+        database.inicializar_banco_de_dados()
+    if args.usuario:
+        senha = os.environ.get('CLINICA_SENHA') or getpass.getpass(f"Senha de {args.usuario}: ")
+        database.AUTORIZACAO_ATIVA = True
+        database.iniciar_sessao(args.usuario, senha)
+        auditoria.iniciar()
+
+def main(argv=None):
+    args = _criar_parser().parse_args(argv)
+    try:
+        _abrir_banco(args)
+        args.executar(args)
+        sys.stdout.flush()
+    except ValueError as e: # Erros de domínio: ConflitoAgendamento, AcessoNegado, CSV inválido...
+        _informar(f"Erro: {e}")
+        return 1
+    except FileNotFoundError as e:
+        _informar(f"Erro: arquivo não encontrado: {e.filename}")
+        return 1
+    except sqlite3.Error as e: # Banco inexistente, bloqueado, corrompido...
+        _informar(f"Erro no banco de dados {database.DB_FILE}: {e}")
+        return 1
+    except BrokenPipeError:
+        # A saída foi fechada antes do fim (ex.: '| head'); o Python não deve falhar de novo ao descarregá-la
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        auditoria.encerrar()
+        database.encerrar_sessao()
+        database.fechar_conexoes()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Rotina de ativação da criptografia dos textos clínicos.
+
+Ativa a criptografia no banco (ver database.ativar_criptografia), cifrando os textos já gravados
+de prontuários e sessões, inclusive os do arquivo morto, e informa a latência das janelas de lista
+antes e depois. A senha do usuário indicado é pedida no terminal: é ela que abre a chave no login.
+Os demais usuários recebem a chave quando um administrador define a senha deles. Uso:
+
+    python criptografar.py                            # no clinica.db, com o usuário admin
+    python criptografar.py --db clinica_sintetica.db --usuario gerente
+    python criptografar.py --simular --saida criptografia.json
+"""
+import argparse
+import getpass
+import json
+
+import database
+import formatacao
+from cronometro import amostra_de_referencia, banco_de_trabalho, cronometrar
+
+def medir(repeticoes=20):
+    """Mede a latência das leituras que exibem os textos clínicos no banco atual (chave já aberta)."""
+    consultas = {'janela_pacientes': lambda: formatacao.preparar_linhas_pacientes(database.listar_pacientes())}
+    amostra = amostra_de_referencia()
+    if amostra: # Banco sem sessões (novo, ou todas arquivadas): só a lista de pacientes é medida
+        paciente_id, sessao_id = amostra[:2]
+        consultas.update({
+            'janela_sessoes': lambda: formatacao.preparar_linhas_sessoes(database.listar_sessoes_por_paciente(paciente_id)),
+            'buscar_prontuario_por_paciente': lambda: database.buscar_prontuario_por_paciente(paciente_id),
+            'buscar_sessao_por_id': lambda: database.buscar_sessao_por_id(sessao_id),
+        })
+    return {nome: cronometrar(funcao, repeticoes)['mediana_ms'] for nome, funcao in consultas.items()}
+
+def executar(senha, repeticoes=20):
+    """Ativa a criptografia no banco atual e devolve o relatório com as latências de antes e depois."""
+    antes = medir(repeticoes)
+    cifrados = database.ativar_criptografia(senha)
+    depois = medir(repeticoes)
+    return {'cifrados': cifrados, 'antes_ms': antes, 'depois_ms': depois}
+
+def imprimir(relatorio):
+    print("Textos cifrados: " + ", ".join(f"{tabela} {n}" for tabela, n in relatorio['cifrados'].items()))
+    print(f"{'':<36} {'antes (ms)':>12} {'depois (ms)':>12} {'diferença':>10}")
+    for nome in dict.fromkeys([*relatorio['antes_ms'], *relatorio['depois_ms']]):
+        antes, depois = relatorio['antes_ms'].get(nome), relatorio['depois_ms'].get(nome)
+        colunas = ' '.join(f"{ms:>12.3f}" if ms is not None else f"{'—':>12}" for ms in (antes, depois))
+        diferenca = f"{(depois / antes - 1) * 100:>9.1f}%" if antes and depois is not None else f"{'—':>10}"
+        print(f"{nome:<36} {colunas} {diferenca}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ativa a criptografia dos textos clínicos do banco.")
+    parser.add_argument('--db', default=database.DB_FILE, help="Banco da clínica (padrão: %(default)s).")
+    parser.add_argument('--usuario', default='admin', help="Administrador que recebe a primeira cópia da chave (padrão: %(default)s).")
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--simular', action='store_true', help="Executa sobre uma cópia do banco, sem alterar o original.")
+    parser.add_argument('--saida', help="Arquivo JSON onde o relatório será gravado.")
+    args = parser.parse_args()
+    senha = getpass.getpass(f"Senha de {args.usuario}: ")
+
+    with banco_de_trabalho(args.db, args.simular, prefixo='criptografia_clinica_'):
+        database.inicializar_banco_de_dados()
+        database.iniciar_sessao(args.usuario, senha)
+        try:
+            relatorio = executar(senha, args.repeticoes)
+        finally:
+            database.encerrar_sessao()
+
+    imprimir(relatorio)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
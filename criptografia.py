@@ -0,0 +1,115 @@
+"""
+Criptografia em repouso dos textos clínicos (prontuários e sessões).
+
+Os textos são cifrados com AES-256-GCM (pacote opcional 'cryptography') por uma chave de dados
+única de cada banco. Essa chave nunca é gravada às claras: cada usuário guarda uma cópia dela
+cifrada por uma chave derivada da sua senha (scrypt), aberta no login e mantida só na memória
+da sessão (ver database.iniciar_sessao). Um valor cifrado é um BLOB que começa com PREFIXO; os
+textos gravados antes da ativação continuam legíveis. Cada valor é ligado ao seu lugar ('tabela.coluna',
+o dado associado do GCM): copiado para outra coluna, não decifra. A linha não entra no dado associado
+porque os ids são locais a cada cópia do banco e a replicação leva os valores cifrados como estão. O Cifrador guarda os valores já decifrados
+num cache da própria sessão, descartado quando ela é encerrada.
+Este módulo não acessa o banco.
+"""
+import hashlib
+import os
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError: # A criptografia é opcional; sem o pacote, só os bancos não cifrados podem ser usados
+    AESGCM = None
+    InvalidTag = ValueError
+
+PREFIXO = b'\x00CF' # Nenhum texto em UTF-8 nem dado comprimido com zlib começa com o byte 0; segue a versão do formato
+MARCA = PREFIXO + b'2' # Formato atual, com o lugar do valor como dado associado
+_MARCA_SEM_CONTEXTO = PREFIXO + b'1' # Formato anterior, sem dado associado: ainda é lido
+TAMANHO_CHAVE = 32
+TAMANHO_NONCE = 12
+TAMANHO_SAL = 16
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1 # ~16 MB e algumas dezenas de ms por login
+MAX_DECIFRADOS = 20000 # Valores decifrados guardados por sessão
+TEXTO_INDISPONIVEL = "[conteúdo criptografado]" # Exibido a quem não tem a chave do banco
+
+_DADOS_CHAVE = b'clinica.chave_dados' # Dado associado da chave cifrada, que não pode ser usada como texto
+
+class CriptografiaIndisponivel(ValueError):
+    """Erro lançado quando o pacote 'cryptography' não está instalado."""
+
+def disponivel():
+    return AESGCM is not None
+
+def _exigir_pacote():
+    if AESGCM is None:
+        raise CriptografiaIndisponivel("A criptografia do banco precisa do pacote 'cryptography' (pip install cryptography).")
+
+def cifrado(valor):
+    """Indica se um valor lido do banco está cifrado."""
+    return isinstance(valor, bytes) and valor[:len(PREFIXO)] == PREFIXO
+
+def gerar_chave():
+    """Gera uma nova chave de dados aleatória."""
+    _exigir_pacote()
+    return AESGCM.generate_key(bit_length=TAMANHO_CHAVE * 8)
+
+def _derivar(senha, sal):
+    return hashlib.scrypt(senha.encode('utf-8'), salt=sal, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=TAMANHO_CHAVE)
+
+def embrulhar_chave(chave, senha):
+    """Cifra a chave de dados com uma chave derivada da senha. Retorna sal + nonce + chave cifrada."""
+    _exigir_pacote()
+    sal, nonce = os.urandom(TAMANHO_SAL), os.urandom(TAMANHO_NONCE)
+    return sal + nonce + AESGCM(_derivar(senha, sal)).encrypt(nonce, chave, _DADOS_CHAVE)
+
+def desembrulhar_chave(embrulhada, senha):
+    """Abre a chave de dados cifrada por embrulhar_chave. Retorna None se a senha não for a usada para cifrá-la."""
+    _exigir_pacote()
+    sal, nonce = embrulhada[:TAMANHO_SAL], embrulhada[TAMANHO_SAL:TAMANHO_SAL + TAMANHO_NONCE]
+    try:
+        return AESGCM(_derivar(senha, sal)).decrypt(nonce, embrulhada[TAMANHO_SAL + TAMANHO_NONCE:], _DADOS_CHAVE)
+    except InvalidTag:
+        return None
+
+class Cifrador:
+    """Cifra e decifra os textos de um banco com a sua chave de dados, guardando os valores já decifrados."""
+
+    def __init__(self, chave):
+        _exigir_pacote()
+        self._aes = AESGCM(chave)
+        self._chave = chave
+        self._decifrados = {} # (lugar, valor cifrado) -> texto, na ordem em que foram decifrados
+
+    def cifrar(self, texto, lugar):
+        """Cifra um texto para a coluna indicada ('tabela.coluna'). None e valores já cifrados são retornados como estão."""
+        if texto is None or isinstance(texto, bytes):
+            return texto
+        nonce = os.urandom(TAMANHO_NONCE)
+        return MARCA + nonce + self._aes.encrypt(nonce, texto.encode('utf-8'), lugar.encode('utf-8'))
+
+    def decifrar(self, valor, lugar):
+        """
+        Decifra um valor lido da coluna indicada ('tabela.coluna'); valores não cifrados são retornados
+        como estão. Um valor corrompido, de outra coluna ou de outro banco resulta em TEXTO_INDISPONIVEL.
+        """
+        texto = self._decifrados.get((lugar, valor))
+        if texto is None:
+            if not cifrado(valor):
+                return valor
+            inicio = len(MARCA) + TAMANHO_NONCE
+            dado_associado = None if valor[:len(MARCA)] == _MARCA_SEM_CONTEXTO else lugar.encode('utf-8')
+            try:
+                texto = self._aes.decrypt(valor[len(MARCA):inicio], valor[inicio:], dado_associado).decode('utf-8')
+            except (InvalidTag, ValueError): # ValueError: valor truncado (nonce incompleto) ou texto que não é UTF-8
+                return TEXTO_INDISPONIVEL
+            if len(self._decifrados) >= MAX_DECIFRADOS:
+                del self._decifrados[next(iter(self._decifrados))] # Descarta o mais antigo
+            self._decifrados[(lugar, valor)] = texto
+        return texto
+
+    def embrulhar_chave(self, senha):
+        """Cópia da chave de dados cifrada pela senha de um usuário (ver embrulhar_chave)."""
+        return embrulhar_chave(self._chave, senha)
+
+    def descartar(self):
+        """Esquece os valores decifrados (ao encerrar a sessão)."""
+        self._decifrados.clear()
@@ -0,0 +1,65 @@
+"""
+Cronômetro das medições de latência: benchmark.py, arquivamento.py e criptografar.py medem as
+consultas da mesma forma, sem que as rotinas de manutenção precisem importar o benchmark
+(e, com ele, todos os módulos que ele exercita).
+
+As rotinas de manutenção também compartilham a cópia de trabalho do banco (opção --simular)
+e a escolha do paciente e da sessão usados como referência nas medições.
+"""
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database
+
+def cronometrar(funcao, repeticoes):
+    """Executa funcao() uma vez para aquecer e depois 'repeticoes' vezes. Retorna as estatísticas em milissegundos."""
+    funcao() # Aquecimento (cache de páginas do SQLite, imports preguiçosos)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        'repeticoes': repeticoes,
+        'min_ms': round(tempos[0], 4),
+        'mediana_ms': round(statistics.median(tempos), 4),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 4),
+        'max_ms': round(tempos[-1], 4),
+    }
+
+@contextmanager
+def banco_de_trabalho(arquivo, simular=False, prefixo='clinica_'):
+    """Aponta database.DB_FILE para o banco indicado durante o bloco e fecha as conexões ao sair.
+
+    Com simular=True, trabalha sobre uma cópia temporária do banco e do seu arquivo morto,
+    apagada ao final, sem alterar o original."""
+    pasta = None
+    if simular:
+        pasta = tempfile.mkdtemp(prefix=prefixo)
+        copia = os.path.join(pasta, os.path.basename(arquivo))
+        shutil.copy(arquivo, copia)
+        arquivo_morto = os.path.splitext(arquivo)[0] + '_arquivo.db'
+        if os.path.exists(arquivo_morto):
+            shutil.copy(arquivo_morto, os.path.splitext(copia)[0] + '_arquivo.db')
+        arquivo = copia
+    database.DB_FILE = arquivo
+    try:
+        yield arquivo
+    finally:
+        database.fechar_conexoes()
+        if pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+def amostra_de_referencia():
+    """Retorna (paciente_id, sessao_id, medico_id, data_sessao) do uso comum no banco atual: o paciente
+    com mais sessões e a sessão mais recente. Retorna None se não houver sessões (banco novo ou todas arquivadas)."""
+    with sqlite3.connect(database.DB_FILE) as conn:
+        paciente = conn.execute("SELECT paciente_id FROM sessoes GROUP BY paciente_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        sessao = conn.execute("SELECT id, medico_id, data_sessao FROM sessoes ORDER BY dia_sessao DESC LIMIT 1").fetchone()
+    return (*paciente, *sessao) if paciente and sessao else None
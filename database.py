@@ -1,24 +1,1559 @@
 import sqlite3
 import hashlib # Para criptografar senhas
+import calendar
+import functools
+import inspect
+import json
+import mimetypes
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from math import ceil
+from urllib.parse import quote
 
+import autenticacao
+import criptografia
+
+# Banco da clínica desta estação: todas as escritas vão para este arquivo.
 DB_FILE = 'clinica.db'
 
+# Roteamento entre clínicas: nome da clínica -> arquivo SQLite (um arquivo por clínica).
+# Vazio quando a instalação tem uma única clínica.
+CLINICAS = {}
+CLINICA_ATUAL = None
+ARQUIVO_CONFIG_CLINICAS = 'clinicas.json'
+
+# Sessões mais antigas que isto (em meses) são movidas para o arquivo morto por arquivar_sessoes_antigas()
+MESES_DADOS_QUENTES = 12
+
+# Cache de leituras frequentes (médicos, pacientes): tamanho máximo e validade de cada entrada
+CACHE_ATIVO = True
+CACHE_MAX_ENTRADAS = 512
+CACHE_TTL_SEGUNDOS = 300
+
+# Exige uma sessão de acesso com a permissão adequada em cada escrita (ver exigir_permissao).
+# O app liga ao iniciar; scripts de manutenção e de medição rodam com o acesso do dono do arquivo.
+AUTORIZACAO_ATIVA = False
+
+# Níveis de evolução registrados nas sessões, do inicial ao final (a linha do tempo usa as posições 1 a 4)
+NIVEIS_EVOLUCAO = ('Iniciante', 'Intermediário', 'Avançado', 'Manutenção')
+
+# Lista de espera: dias da semana aceitos como bits (segunda = 1, ..., domingo = 64) e duração padrão da sessão
+TODOS_OS_DIAS = 0b1111111
+DURACAO_PADRAO_ESPERA = 50
+
+# Lembretes de sessão: com quanta antecedência enviar, até onde gerar à frente, quantas tentativas
+# por lembrete (com espera crescente entre elas) e por quanto tempo um lote reservado fica com quem o reservou
+ANTECEDENCIA_LEMBRETE_HORAS = 24
+JANELA_LEMBRETES_HORAS = 48
+MAX_TENTATIVAS_LEMBRETE = 3
+ESPERA_NOVA_TENTATIVA_S = 600
+RESERVA_LEMBRETES_S = 300
+
+# Registro de alterações entre estações (log_alteracoes): quantas linhas manter e quantas
+# entregar de uma vez antes de pedir que a janela recarregue tudo
+LOG_ALTERACOES_MANTER = 5000
+LOG_ALTERACOES_LOTE = 500
+
+# Instruções compiladas guardadas por conexão (mais que o número de consultas registradas em CONSULTAS)
+_INSTRUCOES_EM_CACHE = 256
+
+# Limite padrão de bancos anexados por conexão no SQLite (SQLITE_MAX_ATTACHED)
+_MAX_ANEXADOS = 10
+
+# Diferença entre o dia juliano do SQLite (à meia-noite) e o ordinal de datetime.date
+_DESLOCAMENTO_JULIANO = 1721424.5
+
 # --- Funções de Segurança ---
 
 def hash_senha(senha):
     """Gera um hash SHA-256 para a senha, garantindo que não seja armazenada em texto plano."""
     return hashlib.sha256(senha.encode('utf-8')).hexdigest()
 
+# --- Sessão de Acesso e Autorização ---
+# A sessão atual vale para o processo inteiro (uma estação, um usuário). Cada escrita declara a
+# permissão de que precisa (@_exige); a verificação usa só as permissões guardadas na sessão.
+
+AcessoNegado = autenticacao.AcessoNegado
+_sessao_atual = None
+
+def sessao_atual():
+    """Retorna a SessaoAcesso do usuário que entrou neste processo, ou None."""
+    return _sessao_atual
+
+def usar_sessao(token):
+    """Passa a usar a sessão de um token emitido por iniciar_sessao neste processo. Lança AcessoNegado se não valer mais."""
+    global _sessao_atual
+    _sessao_atual = autenticacao.validar_token(token)
+    return _sessao_atual
+
+def encerrar_sessao():
+    """Encerra a sessão atual (logout)."""
+    global _sessao_atual
+    if _sessao_atual is not None:
+        autenticacao.encerrar_sessoes(token=_sessao_atual.token)
+    _sessao_atual = None
+
+def tem_permissao(permissao):
+    """Indica se a sessão atual tem a permissão (ver autenticacao.PERMISSOES); útil para mostrar ou esconder botões."""
+    return _sessao_atual is not None and _sessao_atual.permite(permissao)
+
+def exigir_permissao(permissao):
+    """Lança AcessoNegado se a autorização estiver ativa e a sessão atual não tiver a permissão."""
+    if AUTORIZACAO_ATIVA and not (_sessao_atual is not None and _sessao_atual.permite(permissao)):
+        if _sessao_atual is None or not _sessao_atual.ativa:
+            raise AcessoNegado("Nenhum usuário conectado. Entre novamente.", permissao)
+        if permissao in _sessao_atual.permissoes:
+            raise AcessoNegado("A sessão expirou. Entre novamente.", permissao)
+        raise AcessoNegado(f"O usuário '{_sessao_atual.nome_usuario}' não tem permissão para esta operação ({permissao}).", permissao)
+
+def _exige(permissao):
+    """Decorador das funções de escrita: confere a permissão antes de tocar no banco."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            exigir_permissao(permissao)
+            return funcao(*args, **kwargs)
+        envolvida.permissao = permissao
+        return envolvida
+    return decorador
+
+# --- Conexão e Roteamento entre Clínicas ---
+
+# Cada thread mantém uma conexão por arquivo, aberta na primeira consulta e reaproveitada
+# depois, para que o sqlite3 não precise recompilar as consultas (ver Registro de Consultas).
+_conexoes_thread = threading.local()
+
+def _abrir_conexao(arquivo):
+    """
+    Abre uma nova conexão com o arquivo, com cache de instruções para todas as consultas registradas.
+    As chaves estrangeiras valem por conexão: sem o PRAGMA, as exclusões em cascata não acontecem.
+    """
+    conn = sqlite3.connect(arquivo, cached_statements=_INSTRUCOES_EM_CACHE)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def _conectar(arquivo=None):
+    """
+    Retorna a conexão desta thread com o banco da clínica atual (ou com o arquivo indicado).
+    Use com 'with': o bloco confirma (ou desfaz) a transação, mas a conexão continua aberta.
+    """
+    arquivo = arquivo or DB_FILE
+    conexoes = getattr(_conexoes_thread, 'conexoes', None)
+    if conexoes is None:
+        conexoes = _conexoes_thread.conexoes = {}
+    conn = conexoes.get(arquivo)
+    if conn is None:
+        conn = conexoes[arquivo] = _abrir_conexao(arquivo)
+    conn.row_factory = None # Cada função escolhe o formato das linhas que lê
+    return conn
+
+def fechar_conexoes():
+    """Fecha as conexões desta thread (por exemplo, antes de apagar ou substituir o arquivo de um banco)."""
+    for conn in getattr(_conexoes_thread, 'conexoes', {}).values():
+        conn.close()
+    _conexoes_thread.conexoes = {}
+
+def configurar_clinicas(clinicas, clinica_atual=None):
+    """
+    Define os arquivos de cada clínica ({nome: arquivo}) e seleciona a clínica desta estação,
+    que passa a ser a dona de todas as escritas.
+    """
+    CLINICAS.clear()
+    CLINICAS.update(clinicas)
+    selecionar_clinica(clinica_atual or next(iter(clinicas)))
+
+def selecionar_clinica(nome):
+    """Direciona as leituras e escritas locais para o arquivo da clínica indicada."""
+    global DB_FILE, CLINICA_ATUAL
+    if nome not in CLINICAS:
+        raise ValueError(f"Clínica '{nome}' não está configurada.")
+    CLINICA_ATUAL = nome
+    DB_FILE = CLINICAS[nome]
+
+def carregar_configuracao_clinicas(caminho=None):
+    """
+    Lê a configuração de clínicas de um JSON no formato
+    {"clinica_atual": "centro", "clinicas": {"centro": "clinica_centro.db", "norte": "clinica_norte.db"}}.
+    Retorna False (mantendo o banco único) se o arquivo não existir.
+    """
+    caminho = caminho or ARQUIVO_CONFIG_CLINICAS
+    if not os.path.exists(caminho):
+        return False
+    with open(caminho, encoding='utf-8') as f:
+        config = json.load(f)
+    # Caminhos relativos são resolvidos a partir da pasta do arquivo de configuração
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    clinicas = {nome: arquivo if os.path.isabs(arquivo) else os.path.join(pasta, arquivo)
+                for nome, arquivo in config['clinicas'].items()}
+    configurar_clinicas(clinicas, config.get('clinica_atual'))
+    return True
+
+def _consulta_federada(sql_por_clinica, parametros=()):
+    """
+    Executa a mesma consulta em todas as clínicas e junta os resultados (UNION ALL).
+    Os arquivos são anexados em modo somente leitura a uma conexão em memória, em grupos
+    de até _MAX_ANEXADOS. O SQL deve usar {banco} antes de cada tabela e recebe a coluna
+    'clinica' com o nome da clínica de cada linha.
+    """
+    clinicas = CLINICAS or {CLINICA_ATUAL or 'principal': DB_FILE}
+    itens = list(clinicas.items())
+    resultados = []
+    for inicio in range(0, len(itens), _MAX_ANEXADOS):
+        grupo = itens[inicio:inicio + _MAX_ANEXADOS]
+        conn = sqlite3.connect('file::memory:', uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            partes, todos_parametros = [], []
+            for i, (nome, arquivo) in enumerate(grupo):
+                conn.execute(f"ATTACH DATABASE ? AS c{i}", (f"file:{quote(os.path.abspath(arquivo))}?mode=ro",))
+                partes.append(f"SELECT ? AS clinica, * FROM ({sql_por_clinica.format(banco=f'c{i}')})")
+                todos_parametros.extend([nome, *parametros])
+            cursor = conn.execute(" UNION ALL ".join(partes), todos_parametros)
+            resultados.extend(dict(row) for row in cursor.fetchall())
+        finally:
+            conn.close()
+    return resultados
+
+def buscar_pacientes_todas_clinicas(termo_busca):
+    """Busca pacientes pelo nome em todas as clínicas. Cada resultado traz a clínica de origem."""
+    resultados = _consulta_federada(
+        """SELECT id, nome_completo, data_nascimento, nome_responsavel FROM {banco}.pacientes
+           WHERE lower(nome_completo) LIKE ?""",
+        ('%' + termo_busca.lower() + '%',)
+    )
+    return sorted(resultados, key=lambda p: (p['nome_completo'], p['clinica']))
+
+def listar_agenda_medico_todas_clinicas(nome_medico, data_inicio, data_fim):
+    """
+    Retorna as sessões de um médico (identificado pelo nome, já que cada clínica tem seus próprios ids)
+    em todas as clínicas, entre duas datas, ordenadas por data e horário.
+    """
+    resultados = _consulta_federada(
+        """SELECT s.id, s.data_sessao, s.dia_sessao, s.hora_inicio_sessao, s.hora_fim_sessao, s.minuto_inicio_sessao,
+                  p.nome_completo AS paciente_nome
+           FROM {banco}.sessoes s
+           JOIN {banco}.medicos m ON m.id = s.medico_id
+           LEFT JOIN {banco}.pacientes p ON p.id = s.paciente_id
+           WHERE m.nome_completo = ? AND s.dia_sessao BETWEEN ? AND ?""",
+        (nome_medico, *intervalo_entre(data_inicio, data_fim))
+    )
+    return sorted(resultados, key=lambda s: (s['dia_sessao'], s['minuto_inicio_sessao'] or 0))
+
+# --- Cache de Leituras ---
+# Leituras de dados pequenos e pouco alterados passam por um cache LRU com validade (TTL).
+# Cada entrada guarda a "geração" das tabelas de que depende: as funções de escrita deste
+# módulo incrementam a geração da tabela alterada (_registrar_escrita), e o PRAGMA data_version
+# de uma conexão de vigia revela escritas feitas por outros processos, que invalidam tudo.
+# Leituras de um único paciente podem depender só da geração do paciente: escritas que informam
+# o paciente afetado incrementam (arquivo, tabela, paciente_id); as demais, (arquivo, tabela, '*').
+
+class _CacheLRU:
+    """Cache LRU limitado, com validade por entrada e estatísticas de acertos e falhas."""
+
+    def __init__(self, max_entradas, ttl_segundos):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.entradas = OrderedDict()
+        self.estatisticas = {'acertos': 0, 'falhas': 0, 'expiradas': 0, 'invalidadas': 0, 'descartadas': 0}
+
+    def obter(self, chave, versao):
+        """Retorna (True, valor) se houver entrada válida para a versão dos dados informada."""
+        entrada = self.entradas.get(chave)
+        if entrada is None:
+            self.estatisticas['falhas'] += 1
+            return False, None
+        valor, versao_entrada, expira_em = entrada
+        if versao_entrada != versao:
+            motivo = 'invalidadas'
+        elif time.monotonic() > expira_em:
+            motivo = 'expiradas'
+        else:
+            self.entradas.move_to_end(chave)
+            self.estatisticas['acertos'] += 1
+            return True, valor
+        del self.entradas[chave]
+        self.estatisticas[motivo] += 1
+        self.estatisticas['falhas'] += 1
+        return False, None
+
+    def guardar(self, chave, versao, valor):
+        self.entradas[chave] = (valor, versao, time.monotonic() + self.ttl_segundos)
+        self.entradas.move_to_end(chave)
+        while len(self.entradas) > self.max_entradas:
+            self.entradas.popitem(last=False)
+            self.estatisticas['descartadas'] += 1
+
+_cache = _CacheLRU(CACHE_MAX_ENTRADAS, CACHE_TTL_SEGUNDOS)
+_trava_cache = threading.Lock()
+_geracoes = {}      # (arquivo, tabela) e (arquivo, tabela, paciente_id ou '*') -> contador de escritas deste módulo
+_vigias = {}        # arquivo -> conexão usada só para ler o PRAGMA data_version
+_versao_vista = {}  # arquivo -> último data_version já refletido nas gerações
+
+def _versao_externa():
+    """
+    Lê o data_version do banco atual pela conexão de vigia. Se mudou desde a última leitura,
+    outra conexão gravou algo: incrementa a geração '*' do arquivo, que invalida todas as entradas.
+    """
+    conn = _vigias.get(DB_FILE)
+    if conn is None:
+        conn = _vigias[DB_FILE] = sqlite3.connect(DB_FILE, check_same_thread=False)
+    versao = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _versao_vista.get(DB_FILE) != versao:
+        if DB_FILE in _versao_vista:
+            _geracoes[(DB_FILE, '*')] = _geracoes.get((DB_FILE, '*'), 0) + 1
+        _versao_vista[DB_FILE] = versao
+    return _geracoes.get((DB_FILE, '*'), 0)
+
+def _registrar_escrita(*tabelas, operacao=None, registro_id=None, paciente_id=None):
+    """
+    Chamada pelas funções de escrita após o commit: incrementa a geração das tabelas alteradas
+    (e a do paciente afetado, quando informado; ver _em_cache) e marca o data_version atual como já visto, para que a própria escrita não invalide o cache inteiro.
+    (Uma escrita externa feita no mesmo instante pode passar despercebida; o TTL limita esse caso.)
+    Em seguida avisa os ouvintes registrados (ver registrar_ouvinte).
+    """
+    with _trava_cache:
+        for tabela in tabelas:
+            _geracoes[(DB_FILE, tabela)] = _geracoes.get((DB_FILE, tabela), 0) + 1
+            chave_paciente = (DB_FILE, tabela, '*' if paciente_id is None else paciente_id)
+            _geracoes[chave_paciente] = _geracoes.get(chave_paciente, 0) + 1
+        if DB_FILE in _vigias:
+            _versao_vista[DB_FILE] = _vigias[DB_FILE].execute("PRAGMA data_version").fetchone()[0]
+    for ouvinte in list(_ouvintes):
+        for tabela in tabelas:
+            try:
+                ouvinte(tabela, operacao, registro_id)
+            except Exception as e:
+                # A escrita já foi gravada; um ouvinte com defeito não deve fazê-la parecer ter falhado
+                print(f"Aviso: ouvinte {getattr(ouvinte, '__name__', ouvinte)} falhou: {e}")
+
+def geracao_externa():
+    """Retorna um contador que muda sempre que outro processo (ou conexão) grava no banco atual."""
+    with _trava_cache:
+        return _versao_externa()
+
+def _copiar(valor):
+    """Cópia rasa dos dicionários guardados, para que quem chama possa alterá-los sem afetar o cache."""
+    if isinstance(valor, list):
+        return [dict(item) if isinstance(item, dict) else item for item in valor]
+    if isinstance(valor, dict):
+        return dict(valor)
+    return valor
+
+def _em_cache(*tabelas, por_paciente=False):
+    """
+    Decorador de leitura: guarda o resultado no cache, válido enquanto as tabelas indicadas não mudarem.
+    Com por_paciente=True, o primeiro parâmetro é o id do paciente (passado por posição ou por nome)
+    e só as escritas desse paciente (ou as que podem afetar qualquer paciente) invalidam a entrada.
+    """
+    def decorador(funcao):
+        if por_paciente:
+            assinatura = inspect.signature(funcao)
+            parametro_paciente = next(iter(assinatura.parameters))
+
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            if not CACHE_ATIVO:
+                return funcao(*args, **kwargs)
+            if por_paciente:
+                # Argumentos ligados aos nomes: f(1, 'mes') e f(paciente_id=1, agrupamento='mes') são a mesma entrada
+                argumentos = assinatura.bind(*args, **kwargs)
+                argumentos.apply_defaults()
+                paciente_id = argumentos.arguments[parametro_paciente]
+                args, kwargs = (), argumentos.arguments
+            with _trava_cache:
+                if por_paciente:
+                    geracoes = [_geracoes.get((DB_FILE, t, c), 0) for t in tabelas for c in ('*', paciente_id)]
+                else:
+                    geracoes = [_geracoes.get((DB_FILE, t), 0) for t in tabelas]
+                versao = (_versao_externa(), *geracoes)
+                chave = (DB_FILE, funcao.__name__, args, tuple(sorted(kwargs.items())))
+                encontrado, valor = _cache.obter(chave, versao)
+            if not encontrado:
+                valor = funcao(*args, **kwargs)
+                with _trava_cache:
+                    _cache.guardar(chave, versao, valor)
+            return _copiar(valor)
+        return envolvida
+    return decorador
+
+def estatisticas_cache():
+    """Retorna os contadores do cache (acertos, falhas, ...), a taxa de acerto e o número de entradas."""
+    with _trava_cache:
+        estatisticas = dict(_cache.estatisticas)
+        consultas = estatisticas['acertos'] + estatisticas['falhas']
+        estatisticas['taxa_acerto'] = round(estatisticas['acertos'] / consultas, 4) if consultas else 0.0
+        estatisticas['entradas'] = len(_cache.entradas)
+        return estatisticas
+
+def _descartar_vigias_no_filho():
+    # Conexões SQLite não podem ser usadas através de um fork: o processo filho abre as suas
+    global _conexoes_thread
+    _vigias.clear()
+    _versao_vista.clear()
+    _conexoes_thread = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_descartar_vigias_no_filho)
+
+def limpar_cache():
+    """Esvazia o cache, zera as estatísticas e fecha as conexões de vigia."""
+    global _cache
+    with _trava_cache:
+        _cache = _CacheLRU(CACHE_MAX_ENTRADAS, CACHE_TTL_SEGUNDOS)
+        for conn in _vigias.values():
+            conn.close()
+        _vigias.clear()
+        _versao_vista.clear()
+
+# --- Ouvintes de Escrita ---
+# Estruturas em memória derivadas do banco (como o índice de busca de pacientes) se registram
+# aqui para serem avisadas após cada escrita feita por este módulo.
+
+_ouvintes = []
+
+def registrar_ouvinte(ouvinte):
+    """
+    Registra uma função ouvinte(tabela, operacao, registro_id), chamada após cada escrita.
+    operacao é 'inserido', 'atualizado' ou 'excluido' quando a escrita afeta um único registro
+    conhecido; nas demais escritas, operacao e registro_id são None.
+    """
+    if ouvinte not in _ouvintes:
+        _ouvintes.append(ouvinte)
+
+def remover_ouvinte(ouvinte):
+    if ouvinte in _ouvintes:
+        _ouvintes.remove(ouvinte)
+
+# --- Auditoria ---
+# As leituras e escritas de pacientes, prontuários e sessões são anunciadas aos auditores
+# registrados (ver auditoria.py), já com o usuário da sessão atual. Sem auditores, nada é montado.
+
+_auditores = []
+
+def registrar_auditor(auditor):
+    """
+    Registra uma função auditor(evento), chamada na thread de quem leu ou gravou. evento é um dicionário
+    com momento, arquivo, usuario_id, nome_usuario, acao ('visualizado', 'inserido', 'atualizado' ou
+    'excluido'), tabela, registro_id e paciente_id. O auditor deve apenas enfileirar o evento.
+    """
+    if auditor not in _auditores:
+        _auditores.append(auditor)
+
+def remover_auditor(auditor):
+    if auditor in _auditores:
+        _auditores.remove(auditor)
+
+def _auditar(acao, tabela, registro_id, paciente_id=None):
+    sessao = _sessao_atual
+    evento = {
+        'momento': time.time(), 'arquivo': DB_FILE,
+        'usuario_id': sessao.usuario_id if sessao else None, 'nome_usuario': sessao.nome_usuario if sessao else None,
+        'acao': acao, 'tabela': tabela, 'registro_id': registro_id, 'paciente_id': paciente_id,
+    }
+    for auditor in list(_auditores):
+        try:
+            auditor(evento)
+        except Exception as e:
+            print(f"Aviso: auditor {getattr(auditor, '__name__', auditor)} falhou: {e}")
+
+# --- Arquivo Morto (Sessões Antigas) ---
+# Cada banco de clínica tem ao lado um arquivo '<nome>_arquivo.db' com as sessões antigas,
+# cujos textos longos ficam comprimidos com zlib. Ele só é aberto quando alguém pede sessões antigas.
+
+_COLUNAS_TEXTO_ARQUIVADAS = ('resumo_sessao', 'observacoes_evolucao', 'plano_terapeutico')
+
+def caminho_arquivo_morto():
+    """Retorna o caminho do arquivo morto do banco atual."""
+    return os.path.splitext(DB_FILE)[0] + '_arquivo.db'
+
+def _comprimir(texto):
+    # Textos cifrados (ver criptografia.MARCA) não se comprimem e são arquivados como estão
+    return texto if texto is None or isinstance(texto, bytes) else zlib.compress(texto.encode('utf-8'), 9)
+
+def _descomprimir(dados):
+    return dados if dados is None or criptografia.cifrado(dados) else zlib.decompress(dados).decode('utf-8')
+
+def _registrar_funcoes_arquivo(conn):
+    conn.create_function('comprimir', 1, _comprimir, deterministic=True)
+    conn.create_function('descomprimir', 1, _descomprimir, deterministic=True)
+
+def _anexar_arquivo_morto(conn, criar=False):
+    """
+    Anexa o arquivo morto à conexão como 'arquivo' e registra as funções comprimir/descomprimir.
+    Sem criar=True, retorna False (sem anexar nada) se o arquivo ainda não existir. Como as
+    conexões são reaproveitadas (ver _conectar), o arquivo continua anexado depois da primeira vez.
+    """
+    if not any(banco[1] == 'arquivo' for banco in conn.execute("PRAGMA database_list")):
+        caminho = caminho_arquivo_morto()
+        if not criar and not os.path.exists(caminho):
+            return False
+        _registrar_funcoes_arquivo(conn)
+        conn.execute("ATTACH DATABASE ? AS arquivo", (caminho,))
+    if criar:
+        _criar_tabelas_arquivo(conn)
+    return True
+
+def _criar_tabelas_arquivo(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS arquivo.sessoes_arquivadas (
+        id INTEGER PRIMARY KEY, -- Mesmo id da tabela sessoes (AUTOINCREMENT nunca reutiliza ids)
+        paciente_id INTEGER NOT NULL,
+        medico_id INTEGER,
+        data_sessao TEXT NOT NULL,
+        dia_sessao INTEGER,
+        hora_inicio_sessao TEXT,
+        hora_fim_sessao TEXT,
+        minuto_inicio_sessao INTEGER,
+        nivel_evolucao TEXT,
+        resumo_sessao BLOB, -- Textos comprimidos com zlib
+        observacoes_evolucao BLOB,
+        plano_terapeutico BLOB,
+        arquivada_em TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_arquivadas_paciente_dia ON sessoes_arquivadas (paciente_id, dia_sessao, minuto_inicio_sessao)")
+
+# --- Conteúdo dos Anexos ---
+# Os arquivos anexados aos prontuários ficam num banco separado, '<nome>_anexos.db', endereçados
+# pelo SHA-256 do conteúdo: o mesmo arquivo enviado duas vezes é guardado uma única vez. O banco
+# da clínica guarda só os metadados (tabela anexos), então abrir um prontuário não lê nenhum
+# arquivo. O conteúdo é gravado e lido em blocos pela E/S incremental de BLOB (Connection.blobopen).
+
+TAMANHO_BLOCO_ANEXO = 256 * 1024
+TAMANHO_MAXIMO_ANEXO = 200 * 1024 * 1024
+
+def caminho_anexos():
+    """Retorna o caminho do banco com o conteúdo dos anexos do banco atual."""
+    return os.path.splitext(DB_FILE)[0] + '_anexos.db'
+
+def _anexar_conteudo_anexos(conn, criar=False):
+    """
+    Anexa o banco de conteúdo dos anexos à conexão como 'conteudo' (ver _anexar_arquivo_morto).
+    Sem criar=True, retorna False (sem anexar nada) se o arquivo ainda não existir.
+    """
+    if not any(banco[1] == 'conteudo' for banco in conn.execute("PRAGMA database_list")):
+        caminho = caminho_anexos()
+        if not criar and not os.path.exists(caminho):
+            return False
+        conn.execute("ATTACH DATABASE ? AS conteudo", (caminho,))
+    if criar:
+        _criar_tabelas_conteudo(conn)
+    return True
+
+def _criar_tabelas_conteudo(conn):
+    # Tabela com rowid: blobopen localiza o BLOB pela linha
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS conteudo.arquivos (
+        id INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL UNIQUE, -- SHA-256 do conteúdo, em hexadecimal
+        tamanho INTEGER NOT NULL,
+        dados BLOB NOT NULL
+    )
+    """)
+
+@_exige('banco.manutencao')
+def arquivar_sessoes_antigas(data_corte=None, compactar=True):
+    """
+    Move as sessões anteriores a data_corte (YYYY-MM-DD; por padrão, MESES_DADOS_QUENTES meses atrás)
+    para o arquivo morto, comprimindo os textos, numa única transação. Com compactar=True, executa
+    VACUUM no banco principal para devolver o espaço liberado. Retorna um resumo da operação.
+    """
+    if data_corte is None:
+        hoje = date.today()
+        indice_mes = hoje.year * 12 + hoje.month - 1 - MESES_DADOS_QUENTES
+        data_corte = date(indice_mes // 12, indice_mes % 12 + 1, 1).isoformat()
+    dia_corte = dia_numero(data_corte)
+    with _conectar() as conn:
+        _anexar_arquivo_morto(conn, criar=True)
+        _executar(conn, 'arquivo.mover_sessoes', (dia_corte,))
+        arquivadas = _executar(conn, 'arquivo.excluir_sessoes_movidas', (dia_corte,)).rowcount
+        _executar(conn, 'alteracoes.podar', (LOG_ALTERACOES_MANTER,)) # Cada sessão movida deixou uma linha no log
+    _registrar_escrita('sessoes')
+    if compactar and arquivadas:
+        _conectar().execute("VACUUM main") # Fora de transação: o bloco acima já confirmou
+    return {'data_corte': data_corte, 'sessoes_arquivadas': arquivadas}
+
+# --- Criptografia dos Textos Clínicos ---
+# Com a criptografia ativada (ativar_criptografia), os textos de prontuários e sessões são gravados
+# cifrados (ver criptografia.py) e decifrados em Python só nas leituras que os exibem: a lista de
+# sessões decifra o resumo, mas não as observações nem o plano, e a lista de pacientes não decifra
+# nada. A chave de cada banco é aberta no login e fica na sessão (SessaoAcesso.cifradores), com o
+# cache dos valores decifrados; uma sessão sem a chave vê criptografia.TEXTO_INDISPONIVEL.
+
+_COLUNAS_CIFRADAS_PRONTUARIO = ('queixa_principal', 'historico_medico_relevante', 'anamnese', 'informacoes_adicionais')
+_COLUNAS_CIFRADAS_SESSAO = _COLUNAS_TEXTO_ARQUIVADAS
+# Lugar de cada coluna cifrada (o dado associado, ver criptografia.Cifrador); o arquivo morto guarda as sessões como estão
+_LUGAR_CIFRADO = {**{c: f'prontuarios.{c}' for c in _COLUNAS_CIFRADAS_PRONTUARIO},
+                  **{c: f'sessoes.{c}' for c in _COLUNAS_CIFRADAS_SESSAO}}
+LOTE_CRIPTOGRAFIA = 500
+_VERIFICADOR_CRIPTOGRAFIA = 'clinica.db' # Texto cifrado com a chave do banco ao ativar
+
+def _cifrador():
+    """Cifrador do banco atual na sessão atual, ou None se a sessão não abriu a chave dele."""
+    sessao = _sessao_atual
+    return sessao.cifradores.get(DB_FILE) if sessao is not None and sessao.ativa else None
+
+def _decifrador():
+    """Função decifrar(valor, coluna) dos valores cifrados do banco atual (TEXTO_INDISPONIVEL se a sessão não tiver a chave)."""
+    cifrador = _cifrador()
+    if cifrador is None:
+        return lambda valor, coluna: criptografia.TEXTO_INDISPONIVEL
+    return lambda valor, coluna: cifrador.decifrar(valor, _LUGAR_CIFRADO[coluna])
+
+def _decifrar(registro, colunas):
+    """Decifra, no próprio dicionário, as colunas indicadas que estiverem cifradas. Retorna o dicionário."""
+    decifrar = None
+    for coluna in colunas:
+        valor = registro[coluna]
+        if type(valor) is bytes: # Textos em claro chegam como str; só os cifrados são BLOBs
+            decifrar = decifrar or _decifrador()
+            registro[coluna] = decifrar(valor, coluna)
+    return registro
+
+def _erro_sem_chave():
+    if not criptografia.disponivel():
+        return AcessoNegado("Os textos clínicos deste banco são criptografados e o pacote 'cryptography' "
+                            "não está instalado nesta estação.")
+    return AcessoNegado("Os textos clínicos deste banco são criptografados e a sua sessão não tem a chave. "
+                        "Peça a um administrador que redefina a sua senha.")
+
+def _cifrar(conn, colunas, *textos):
+    """Textos das colunas indicadas prontos para gravação: cifrados se o banco tiver a criptografia ativada, senão como estão."""
+    cifrador = _cifrador()
+    if cifrador is not None:
+        return tuple(cifrador.cifrar(texto, _LUGAR_CIFRADO[coluna]) for coluna, texto in zip(colunas, textos))
+    if _executar(conn, 'criptografia.buscar').fetchone() is not None:
+        raise _erro_sem_chave() # Gravar em claro deixaria textos sem proteção num banco cifrado
+    return textos
+
+def _chave_do_usuario(conn, senha):
+    """Cópia da chave de dados cifrada pela senha, para gravar em usuarios.chave_dados (None sem criptografia)."""
+    cifrador = _cifrador()
+    if cifrador is not None:
+        return cifrador.embrulhar_chave(senha)
+    if _executar(conn, 'criptografia.buscar').fetchone() is not None:
+        raise _erro_sem_chave() # O usuário perderia o acesso aos textos
+    return None
+
+def _abrir_chave(chave_dados, senha):
+    """Abre, na sessão atual, a chave do banco atual guardada para o usuário (chamada no login)."""
+    if chave_dados is None or not criptografia.disponivel():
+        return
+    chave = criptografia.desembrulhar_chave(chave_dados, senha)
+    if chave is not None:
+        _sessao_atual.cifradores[DB_FILE] = criptografia.Cifrador(chave)
+
+def criptografia_ativa():
+    """Indica se os textos clínicos do banco atual são gravados cifrados."""
+    with _conectar() as conn:
+        return _executar(conn, 'criptografia.buscar').fetchone() is not None
+
+@_exige('banco.manutencao')
+def ativar_criptografia(senha):
+    """
+    Ativa a criptografia dos textos clínicos no banco atual e cifra os já gravados (cifrar_dados_existentes).
+    senha é a do usuário conectado, que recebe a primeira cópia da chave; os demais usuários recebem
+    a sua quando um administrador com a chave define a senha deles (atualizar_senha_usuario).
+    Lança AcessoNegado sem sessão ou se a senha não conferir, ValueError se a criptografia já estiver
+    ativada e criptografia.CriptografiaIndisponivel sem o pacote 'cryptography'.
+    """
+    sessao = _sessao_atual
+    if sessao is None or not sessao.ativa:
+        raise AcessoNegado("Nenhum usuário conectado. Entre novamente.")
+    cifrador = criptografia.Cifrador(criptografia.gerar_chave())
+    with _conectar() as conn:
+        row = _executar(conn, 'usuarios.senha', (sessao.usuario_id,)).fetchone()
+        if row is None or not autenticacao.conferir_senha(hash_senha(senha), row[0]):
+            raise AcessoNegado("Senha incorreta.")
+        try:
+            _executar(conn, 'criptografia.inserir', (cifrador.cifrar(_VERIFICADOR_CRIPTOGRAFIA, 'criptografia.verificador'), time.time()))
+        except sqlite3.IntegrityError:
+            raise ValueError("A criptografia já está ativada neste banco.")
+        _executar(conn, 'usuarios.guardar_chave', (cifrador.embrulhar_chave(senha), sessao.usuario_id))
+    sessao.cifradores[DB_FILE] = cifrador
+    _registrar_escrita('usuarios')
+    return cifrar_dados_existentes()
+
+def _cifrar_tabela(conn, cifrador, colunas, consulta, atualizacao, transformar, tamanho_lote):
+    """Cifra as linhas em claro de uma tabela, em lotes por id, confirmando cada lote. Retorna quantas foram cifradas."""
+    total, ultimo_id = 0, 0
+    lugares = [_LUGAR_CIFRADO[coluna] for coluna in colunas]
+    while True:
+        linhas = _executar(conn, consulta, (ultimo_id, tamanho_lote)).fetchall()
+        if not linhas:
+            return total
+        _executar_lote(conn, atualizacao, [(*(cifrador.cifrar(transformar(v), lugar) for lugar, v in zip(lugares, linha[1:])), linha[0])
+                                           for linha in linhas])
+        conn.commit()
+        total += len(linhas)
+        ultimo_id = linhas[-1][0]
+
+@_exige('banco.manutencao')
+def cifrar_dados_existentes(tamanho_lote=LOTE_CRIPTOGRAFIA):
+    """
+    Cifra os textos clínicos ainda em claro (gravados antes da ativação ou por uma estação sem a
+    criptografia), inclusive os do arquivo morto. Cada lote é confirmado à parte, então uma execução
+    interrompida pode ser retomada. Retorna {'prontuarios': n, 'sessoes': n, 'sessoes_arquivadas': n}.
+    Lança AcessoNegado se a sessão não tiver a chave do banco.
+    """
+    cifrador = _cifrador()
+    if cifrador is None:
+        raise _erro_sem_chave()
+    resumo = {}
+    with _conectar() as conn:
+        arquivo_morto = _anexar_arquivo_morto(conn) # Antes de qualquer escrita: ATTACH não roda dentro de transação
+        resumo['prontuarios'] = _cifrar_tabela(conn, cifrador, _COLUNAS_CIFRADAS_PRONTUARIO, 'criptografia.prontuarios_em_claro',
+                                               'criptografia.cifrar_prontuario', lambda v: v, tamanho_lote)
+        resumo['sessoes'] = _cifrar_tabela(conn, cifrador, _COLUNAS_CIFRADAS_SESSAO, 'criptografia.sessoes_em_claro',
+                                           'criptografia.cifrar_sessao', lambda v: v, tamanho_lote)
+        resumo['sessoes_arquivadas'] = _cifrar_tabela(conn, cifrador, _COLUNAS_CIFRADAS_SESSAO, 'criptografia.arquivadas_em_claro',
+                                                      'criptografia.cifrar_arquivada', _descomprimir,
+                                                      tamanho_lote) if arquivo_morto else 0
+        _executar(conn, 'alteracoes.podar', (LOG_ALTERACOES_MANTER,)) # Cada linha cifrada deixou uma linha no log
+    _registrar_escrita('prontuarios', 'sessoes')
+    return resumo
+
+# --- Colunas Ordenáveis e Intervalos de Datas ---
+# Datas são guardadas como texto YYYY-MM-DD e horários como HH:MM. Para consultas por
+# intervalo, cada tabela tem colunas geradas com o dia como inteiro (o mesmo número de
+# date.toordinal()) e os horários em minutos desde a meia-noite.
+
+def _sql_dia(coluna):
+    """Expressão SQL que converte uma coluna YYYY-MM-DD no número do dia (ordinal), ou NULL se inválida."""
+    return f"CASE WHEN date({coluna}) = {coluna} THEN CAST(julianday({coluna}) - {_DESLOCAMENTO_JULIANO} AS INTEGER) END"
+
+# GLOB de um horário HH:MM de 00:00 a 23:59. GLOB não tem alternativas: as horas 00-19 e 20-23 são dois padrões
+_PADROES_HORA = ("'[01][0-9]:[0-5][0-9]'", "'2[0-3]:[0-5][0-9]'")
+
+def _sql_hora_valida(coluna):
+    """Expressão SQL verdadeira se a coluna for um horário HH:MM válido (NULL se a coluna for NULL)."""
+    return '(' + ' OR '.join(f"{coluna} GLOB {padrao}" for padrao in _PADROES_HORA) + ')'
+
+def _sql_minutos(coluna):
+    """Expressão SQL que converte uma coluna HH:MM em minutos desde a meia-noite, ou NULL se inválida."""
+    return (f"CASE WHEN {_sql_hora_valida(coluna)} "
+            f"THEN CAST(substr({coluna}, 1, 2) AS INTEGER) * 60 + CAST(substr({coluna}, 4, 2) AS INTEGER) END")
+
+def _sql_nivel(coluna):
+    """Expressão SQL com a posição do nível de evolução em NIVEIS_EVOLUCAO (1 a 4), ou NULL se não houver nível."""
+    casos = ' '.join(f"WHEN '{nivel}' THEN {posicao}" for posicao, nivel in enumerate(NIVEIS_EVOLUCAO, 1))
+    return f"CASE {coluna} {casos} END"
+
+# Índice do período (semana de segunda a domingo, ou mês) a partir da coluna 'dia'
+_SQL_PERIODO = {
+    'semana': "(dia - 1) / 7",
+    'mes': (f"(CAST(strftime('%Y', dia + {_DESLOCAMENTO_JULIANO}) AS INTEGER) * 12"
+            f" + CAST(strftime('%m', dia + {_DESLOCAMENTO_JULIANO}) AS INTEGER) - 1)"),
+}
+
+def dia_numero(data):
+    """Converte uma data (date ou texto YYYY-MM-DD) no número do dia usado nas colunas ordenáveis."""
+    if isinstance(data, str):
+        data = date.fromisoformat(data)
+    return data.toordinal()
+
+def data_do_dia(numero):
+    """Converte o número do dia de volta em datetime.date."""
+    return date.fromordinal(numero)
+
+def intervalo_entre(data_inicio, data_fim):
+    """Retorna o intervalo fechado (dia_inicio, dia_fim) entre duas datas, para usar com BETWEEN."""
+    return dia_numero(data_inicio), dia_numero(data_fim)
+
+def intervalo_mes(ano, mes):
+    """Retorna o intervalo (dia_inicio, dia_fim) que cobre um mês inteiro."""
+    _, ultimo_dia = calendar.monthrange(ano, mes)
+    return intervalo_entre(date(ano, mes, 1), date(ano, mes, ultimo_dia))
+
+def intervalo_semana(data):
+    """Retorna o intervalo (dia_inicio, dia_fim) da semana (segunda a domingo) que contém a data."""
+    inicio = dia_numero(data)
+    inicio -= data_do_dia(inicio).weekday()
+    return inicio, inicio + 6
+
+# --- Conflitos de Agendamento ---
+
+class ConflitoAgendamento(ValueError):
+    """
+    Erro estruturado lançado quando uma sessão não pode ser gravada por conflito de agenda.
+    O motivo é 'conflito_horario' (o médico já tem sessão sobreposta), 'fora_disponibilidade'
+    (o horário não está dentro da disponibilidade do médico) ou 'horario_invalido'.
+    """
+    MENSAGENS = {
+        'conflito_horario': "O médico já possui sessão agendada que se sobrepõe a este horário.",
+        'fora_disponibilidade': "O horário está fora da disponibilidade cadastrada para o médico nesta data.",
+        'horario_invalido': "O horário de início deve ser anterior ao horário de fim.",
+    }
+
+    def __init__(self, motivo, medico_id, data, hora_inicio, hora_fim, sessoes_conflitantes=None):
+        self.motivo = motivo
+        self.medico_id = medico_id
+        self.data = data
+        self.hora_inicio = hora_inicio
+        self.hora_fim = hora_fim
+        self.sessoes_conflitantes = sessoes_conflitantes or []
+        super().__init__(self.MENSAGENS.get(motivo, motivo))
+
+def _sql_gatilhos_agendamento():
+    """
+    Gatilhos que impedem sessões sobrepostas do mesmo médico e sessões fora da disponibilidade.
+    A verificação roda dentro da própria transação de escrita, então duas estações gravando ao
+    mesmo tempo não conseguem reservar o mesmo horário; as buscas usam os índices
+    (medico_id, dia, minuto_inicio) e custam O(log n).
+    """
+    dia, inicio, fim = _sql_dia('NEW.data_sessao'), _sql_minutos('NEW.hora_inicio_sessao'), _sql_minutos('NEW.hora_fim_sessao')
+    verificacoes = f"""
+        SELECT RAISE(ABORT, 'horario_invalido') WHERE ({inicio}) IS NULL OR ({fim}) IS NULL OR ({fim}) <= ({inicio});
+        SELECT RAISE(ABORT, 'conflito_horario') WHERE EXISTS (
+            SELECT 1 FROM sessoes s
+            WHERE s.medico_id = NEW.medico_id AND s.dia_sessao = ({dia})
+              AND s.minuto_inicio_sessao < ({fim}) AND s.minuto_fim_sessao > ({inicio})
+              AND s.id IS NOT NEW.id
+        );
+        SELECT RAISE(ABORT, 'fora_disponibilidade') WHERE NOT EXISTS (
+            SELECT 1 FROM disponibilidade_medico d
+            WHERE d.medico_id = NEW.medico_id AND d.dia_disponivel = ({dia})
+              AND d.minuto_inicio <= ({inicio}) AND d.minuto_fim >= ({fim})
+        );
+    """
+    agendada = "NEW.medico_id IS NOT NULL AND NEW.hora_inicio_sessao IS NOT NULL AND NEW.hora_fim_sessao IS NOT NULL"
+    return [
+        f"""CREATE TRIGGER trg_sessoes_agenda_insert BEFORE INSERT ON sessoes
+            WHEN {agendada}
+            BEGIN {verificacoes} END""",
+        # Na atualização, só verifica se o horário mudou: editar o texto de uma sessão antiga não é bloqueado.
+        f"""CREATE TRIGGER trg_sessoes_agenda_update
+            BEFORE UPDATE OF medico_id, data_sessao, hora_inicio_sessao, hora_fim_sessao ON sessoes
+            WHEN {agendada} AND (NEW.medico_id IS NOT OLD.medico_id OR NEW.data_sessao IS NOT OLD.data_sessao
+                 OR NEW.hora_inicio_sessao IS NOT OLD.hora_inicio_sessao OR NEW.hora_fim_sessao IS NOT OLD.hora_fim_sessao)
+            BEGIN {verificacoes} END""",
+    ]
+
+def _conflito_de_erro(conn, erro, sessao_id, medico_id, data, hora_inicio, hora_fim):
+    """Converte o erro de um gatilho de agenda em ConflitoAgendamento, com as sessões conflitantes. Retorna None se não for o caso."""
+    motivo = str(erro)
+    if motivo not in ConflitoAgendamento.MENSAGENS:
+        return None
+    conflitantes = []
+    if motivo == 'conflito_horario':
+        cursor = _executar(conn, 'sessoes.conflitantes',
+                           (medico_id, dia_numero(data), sessao_id, _minutos(hora_fim), _minutos(hora_inicio)))
+        conflitantes = [dict(zip(('id', 'hora_inicio', 'hora_fim', 'paciente_nome'), row)) for row in cursor.fetchall()]
+    return ConflitoAgendamento(motivo, medico_id, data, hora_inicio, hora_fim, conflitantes)
+
+def _minutos(hora):
+    """Converte HH:MM em minutos desde a meia-noite."""
+    horas, minutos = hora.split(':')
+    return int(horas) * 60 + int(minutos)
+
+# --- Registro de Alterações entre Estações ---
+# Gatilhos gravam cada inserção, alteração e exclusão das tabelas abaixo em log_alteracoes, com
+# uma sequência crescente (AUTOINCREMENT nunca volta atrás). Assim uma estação descobre o que as
+# outras gravaram lendo só as linhas do log depois da última sequência vista (ver alteracoes_desde
+# e notificacoes.py), inclusive alterações feitas por outros processos ou pelo arquivamento.
+
+# tabela -> (coluna do paciente afetado, coluna do dia afetado); None quando a tabela não tem
+_TABELAS_MONITORADAS = {
+    'pacientes': ('id', None),
+    'medicos': (None, None),
+    'disponibilidade_medico': (None, 'dia_disponivel'),
+    'sessoes': ('paciente_id', 'dia_sessao'),
+    'prontuarios': ('paciente_id', None),
+}
+
+def _sql_gatilhos_alteracoes():
+    """Gatilhos AFTER INSERT/UPDATE/DELETE que registram as alterações; numa alteração, dia_anterior é o dia antigo."""
+    gatilhos = []
+    for tabela, (coluna_paciente, coluna_dia) in _TABELAS_MONITORADAS.items():
+        for evento, operacao, linha in (('INSERT', 'inserido', 'NEW'), ('UPDATE', 'atualizado', 'NEW'), ('DELETE', 'excluido', 'OLD')):
+            paciente = f"{linha}.{coluna_paciente}" if coluna_paciente else "NULL"
+            dia = f"{linha}.{coluna_dia}" if coluna_dia else "NULL"
+            dia_anterior = f"OLD.{coluna_dia}" if coluna_dia and evento == 'UPDATE' else "NULL"
+            gatilhos.append((
+                f"trg_log_{tabela}_{evento.lower()}",
+                f"""CREATE TRIGGER trg_log_{tabela}_{evento.lower()} AFTER {evento} ON {tabela}
+                    BEGIN
+                        INSERT INTO log_alteracoes (tabela, operacao, registro_id, paciente_id, dia, dia_anterior)
+                        VALUES ('{tabela}', '{operacao}', {linha}.id, {paciente}, {dia}, {dia_anterior});
+                    END"""))
+    return gatilhos
+
+def ultima_alteracao():
+    """Retorna a sequência da alteração mais recente registrada no banco atual (0 se não houver nenhuma)."""
+    with _conectar() as conn:
+        return _executar(conn, 'alteracoes.ultima').fetchone()[0]
+
+def alteracoes_desde(seq, limite=None):
+    """
+    Retorna {'seq', 'alteracoes'} com as alterações posteriores à sequência seq, em ordem, e a nova
+    sequência a guardar. Cada alteração tem tabela, operacao ('inserido', 'atualizado' ou 'excluido'),
+    registro_id, paciente_id, dia e dia_anterior (ver dia_numero). 'alteracoes' é None quando não dá
+    para entregar só as diferenças (mais de limite linhas, ou linhas já descartadas do log): quem
+    chama deve recarregar tudo.
+    """
+    limite = limite or LOG_ALTERACOES_LOTE
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        primeira, ultima = _executar(conn, 'alteracoes.limites').fetchone()
+        if ultima is None or ultima <= seq:
+            return {'seq': max(seq, ultima or 0), 'alteracoes': []}
+        if primeira > seq + 1 or ultima - seq > limite:
+            return {'seq': ultima, 'alteracoes': None}
+        alteracoes = [dict(row) for row in _executar(conn, 'alteracoes.desde', (seq, ultima))]
+    return {'seq': ultima, 'alteracoes': alteracoes}
+
+# --- Registro de Consultas ---
+# Todo o SQL das funções de dados fica aqui, com um nome, e é executado por _executar(conn, nome, ...).
+# Cada thread mantém uma conexão aberta por banco (_conectar), então o cache de instruções do sqlite3
+# compila cada consulta uma única vez por conexão. validar_consultas() prepara todas com EXPLAIN
+# contra o schema atual, e as estatísticas por nome mostram quais consultas pesam no uso real.
+# (As consultas federadas entre clínicas montam o SQL por banco anexado e ficam de fora.)
+
+_SQL_NIVEIS = """
+    SELECT * FROM (SELECT dia_sessao AS dia, minuto_inicio_sessao AS minuto, id, {nivel} AS nivel FROM ({origem}))
+    WHERE dia IS NOT NULL AND nivel IS NOT NULL"""
+
+_SQL_NIVEIS_ORIGEM = {
+    '': "SELECT dia_sessao, minuto_inicio_sessao, id, nivel_evolucao FROM sessoes WHERE paciente_id = ?",
+    '_com_arquivo': """
+        SELECT dia_sessao, minuto_inicio_sessao, id, nivel_evolucao FROM sessoes WHERE paciente_id = ?
+        UNION ALL
+        SELECT dia_sessao, minuto_inicio_sessao, id, nivel_evolucao FROM arquivo.sessoes_arquivadas WHERE paciente_id = ?""",
+}
+
+_SQL_PONTOS_EVOLUCAO = """
+    WITH niveis AS (
+        SELECT dia, minuto, id, nivel, ({periodo} - ?) / ? AS ponto FROM ({niveis})
+    ),
+    transicoes AS (
+        -- Uma única ordenação: a sessão anterior e a seguinte dizem se houve mudança de nível
+        -- e se a sessão é a primeira ou a última do seu ponto
+        SELECT ponto, dia, nivel,
+               LAG(nivel) OVER ordem AS anterior,
+               LAG(ponto) OVER ordem IS NOT ponto AS primeira,
+               LEAD(ponto) OVER ordem IS NOT ponto AS ultima
+        FROM niveis
+        WINDOW ordem AS (ORDER BY dia, minuto, id)
+    )
+    SELECT MIN(dia) AS dia_inicio, MAX(dia) AS dia_fim, COUNT(*) AS sessoes,
+           MAX(CASE WHEN primeira THEN nivel END) AS nivel_inicial,
+           MAX(CASE WHEN ultima THEN nivel END) AS nivel_final,
+           MIN(nivel) AS nivel_min, MAX(nivel) AS nivel_max, AVG(nivel) AS nivel_medio,
+           COALESCE(SUM(nivel > anterior), 0) AS subidas, COALESCE(SUM(nivel < anterior), 0) AS descidas
+    FROM transicoes
+    GROUP BY ponto
+    ORDER BY ponto"""
+
+# Criptografia: linhas com algum texto ainda em claro, em lotes por id (ver cifrar_dados_existentes).
+# Nas tabelas principais o texto em claro é TEXT; no arquivo morto, um BLOB comprimido sem a MARCA.
+def _sql_em_claro(tabela, colunas, condicao):
+    return (f"SELECT id, {', '.join(colunas)} FROM {tabela} "
+            f"WHERE id > ? AND ({' OR '.join(condicao.format(c=c) for c in colunas)}) ORDER BY id LIMIT ?")
+
+def _sql_cifrar(tabela, colunas):
+    return f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in colunas)} WHERE id = ?"
+
+_SQL_EM_CLARO = "typeof({c}) = 'text'"
+_SQL_ARQUIVADO_EM_CLARO = f"substr({{c}}, 1, {len(criptografia.PREFIXO)}) <> X'{criptografia.PREFIXO.hex()}'"
+
+_SQL_SESSOES_PACIENTE = """
+    SELECT s.id, s.data_sessao, s.dia_sessao, s.minuto_inicio_sessao, s.hora_inicio_sessao, s.nivel_evolucao,
+           s.resumo_sessao, s.medico_id, 0 AS arquivada
+    FROM sessoes s
+    WHERE s.paciente_id = ?"""
+
+_SQL_HISTORICO_PACIENTE = f"""
+    SELECT id, data_sessao, dia_sessao, minuto_inicio_sessao, hora_inicio_sessao, hora_fim_sessao, medico_id,
+           nivel_evolucao, {', '.join(_COLUNAS_TEXTO_ARQUIVADAS)}, 0 AS arquivada
+    FROM sessoes WHERE paciente_id = ?"""
+
+# Verificação de integridade. Cada problema é uma condição sobre a linha 't' de uma tabela, e cada
+# tabela é lida uma única vez. As condições testam o texto original (date(), GLOB), mais barato que
+# calcular as colunas geradas linha a linha, e os órfãos usam NOT IN, que monta a lista de ids uma vez.
+# A disponibilidade é lida com a maior hora de fim dos horários válidos anteriores do mesmo médico
+# e dia (uma função de janela), o que revela as sobreposições.
+_SQL_DISPONIBILIDADE_ORDENADA = """
+    (SELECT d.id, d.medico_id, d.data_disponivel, d.dia_disponivel, d.hora_inicio, d.hora_fim, d.minuto_inicio, d.minuto_fim,
+            MAX(d.minuto_fim) FILTER (WHERE d.minuto_inicio < d.minuto_fim)
+                OVER (PARTITION BY d.medico_id, d.dia_disponivel ORDER BY d.minuto_inicio, d.id
+                      ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS fim_anterior
+     FROM disponibilidade_medico d)"""
+
+_ORIGENS_INTEGRIDADE = {
+    'sessoes': 'sessoes',
+    'disponibilidade_medico': _SQL_DISPONIBILIDADE_ORDENADA,
+    'prontuarios': 'prontuarios',
+    'pacientes': 'pacientes',
+    'usuarios': 'usuarios',
+}
+
+_SEM_PACIENTE = "t.paciente_id NOT IN (SELECT id FROM pacientes)"
+_SEM_MEDICO = "t.medico_id NOT IN (SELECT id FROM medicos)" # NULL (sem médico) não conta
+# Os horários são testados também no texto: um banco antigo calcula as colunas geradas com um padrão mais frouxo
+_DISPONIBILIDADE_INVALIDA = (f"date(t.data_disponivel) IS NOT t.data_disponivel OR NOT {_sql_hora_valida('t.hora_inicio')}"
+                             f" OR NOT {_sql_hora_valida('t.hora_fim')} OR t.minuto_inicio IS NULL"
+                             " OR t.minuto_fim IS NULL OR t.minuto_fim <= t.minuto_inicio")
+_DISPONIBILIDADE_SOBREPOSTA = ("t.dia_disponivel IS NOT NULL AND t.minuto_inicio < t.minuto_fim"
+                               " AND t.minuto_inicio < t.fim_anterior")
+
+# problema -> (origem, condição, descrição, reparos); os reparos rodam nesta ordem, numa única transação.
+# Datas e horários malformados de sessões e pacientes não são corrigidos: não há como saber o valor certo.
+_VERIFICACOES_INTEGRIDADE = {
+    'sessoes_sem_paciente': (
+        'sessoes', _SEM_PACIENTE, "Sessões de pacientes que não existem mais (excluídas no reparo)",
+        (f"DELETE FROM sessoes AS t WHERE {_SEM_PACIENTE}",)),
+    'sessoes_medico_inexistente': (
+        'sessoes', _SEM_MEDICO, "Sessões de médicos que não existem mais (o médico é removido da sessão no reparo)",
+        (f"UPDATE sessoes AS t SET medico_id = NULL WHERE {_SEM_MEDICO}",)),
+    'sessoes_data_invalida': (
+        'sessoes', "date(t.data_sessao) IS NOT t.data_sessao", "Sessões com data fora do formato AAAA-MM-DD (só relatadas)", ()),
+    'sessoes_horario_invalido': (
+        'sessoes', f"""NOT {_sql_hora_valida('t.hora_inicio_sessao')} OR NOT {_sql_hora_valida('t.hora_fim_sessao')}
+                       OR t.hora_fim_sessao <= t.hora_inicio_sessao""",
+        "Sessões com horário fora do formato HH:MM ou com fim antes do início (só relatadas)", ()),
+    'disponibilidade_sem_medico': (
+        'disponibilidade_medico', _SEM_MEDICO, "Horários de disponibilidade de médicos que não existem mais (excluídos no reparo)",
+        (f"DELETE FROM disponibilidade_medico AS t WHERE {_SEM_MEDICO}",)),
+    'disponibilidade_invalida': (
+        'disponibilidade_medico', _DISPONIBILIDADE_INVALIDA,
+        "Horários de disponibilidade com data ou horário malformado (excluídos no reparo)",
+        (f"DELETE FROM disponibilidade_medico AS t WHERE {_DISPONIBILIDADE_INVALIDA}",)),
+    'disponibilidade_sobreposta': (
+        'disponibilidade_medico', _DISPONIBILIDADE_SOBREPOSTA,
+        "Horários de disponibilidade sobrepostos a outro do mesmo médico no mesmo dia (unidos no reparo)",
+        # O primeiro horário de cada grupo sobreposto passa a cobrir o grupo inteiro; os demais, agora
+        # contidos nele, continuam sobrepostos e são excluídos pelo segundo passo
+        (f"""UPDATE disponibilidade_medico SET hora_inicio = g.hora_inicio, hora_fim = g.hora_fim
+            FROM (SELECT MIN(id) AS id, printf('%02d:%02d', MIN(minuto_inicio) / 60, MIN(minuto_inicio) % 60) AS hora_inicio,
+                         printf('%02d:%02d', MAX(minuto_fim) / 60, MAX(minuto_fim) % 60) AS hora_fim
+                  FROM (SELECT *, SUM(fim_anterior IS NULL OR minuto_inicio >= fim_anterior)
+                                      OVER (PARTITION BY medico_id, dia_disponivel ORDER BY minuto_inicio, id) AS grupo
+                        FROM {_SQL_DISPONIBILIDADE_ORDENADA}
+                        WHERE dia_disponivel IS NOT NULL AND minuto_inicio < minuto_fim)
+                  GROUP BY medico_id, dia_disponivel, grupo
+                  HAVING COUNT(*) > 1) g
+            WHERE disponibilidade_medico.id = g.id""",
+         f"DELETE FROM disponibilidade_medico WHERE id IN (SELECT t.id FROM {_SQL_DISPONIBILIDADE_ORDENADA} t WHERE {_DISPONIBILIDADE_SOBREPOSTA})")),
+    'prontuarios_sem_paciente': (
+        'prontuarios', _SEM_PACIENTE, "Prontuários de pacientes que não existem mais (excluídos no reparo)",
+        (f"DELETE FROM prontuarios AS t WHERE {_SEM_PACIENTE}",)),
+    'pacientes_data_invalida': (
+        'pacientes', "date(t.data_nascimento) IS NOT t.data_nascimento",
+        "Pacientes com data de nascimento fora do formato AAAA-MM-DD (só relatados)", ()),
+    'pacientes_sem_prontuario': (
+        'pacientes', "t.id NOT IN (SELECT paciente_id FROM prontuarios)",
+        "Pacientes sem prontuário (um prontuário vazio é criado no reparo)",
+        ("INSERT INTO prontuarios (paciente_id) SELECT t.id FROM pacientes t WHERE t.id NOT IN (SELECT paciente_id FROM prontuarios)",)),
+    'usuarios_medico_inexistente': (
+        'usuarios', _SEM_MEDICO, "Usuários vinculados a médicos que não existem mais (vínculo desfeito no reparo)",
+        (f"UPDATE usuarios AS t SET medico_id = NULL WHERE {_SEM_MEDICO}",)),
+}
+
+CONSULTAS = {
+    # Pacientes
+    'pacientes.inserir': "INSERT INTO pacientes (nome_completo, data_nascimento, nome_responsavel) VALUES (?, ?, ?)",
+    'pacientes.listar':
+        "SELECT id, nome_completo, data_nascimento, dia_nascimento, nome_responsavel FROM pacientes ORDER BY nome_completo",
+    'pacientes.buscar_por_id':
+        "SELECT id, nome_completo, data_nascimento, dia_nascimento, nome_responsavel FROM pacientes WHERE id = ?",
+    'pacientes.buscar_por_nome': """
+        SELECT id, nome_completo, data_nascimento, dia_nascimento, nome_responsavel FROM pacientes
+        WHERE lower(nome_completo) LIKE ? ORDER BY nome_completo""",
+    'pacientes.atualizar': "UPDATE pacientes SET nome_completo = ?, data_nascimento = ?, nome_responsavel = ? WHERE id = ?",
+    'pacientes.excluir': "DELETE FROM pacientes WHERE id = ?",
+
+    # Médicos
+    'medicos.inserir': "INSERT INTO medicos (nome_completo, especialidade, contato) VALUES (?, ?, ?)",
+    'medicos.listar': "SELECT id, nome_completo, especialidade, contato FROM medicos ORDER BY nome_completo",
+    'medicos.buscar_por_id': "SELECT id, nome_completo, especialidade, contato FROM medicos WHERE id = ?",
+    'medicos.nomes': "SELECT id, nome_completo FROM medicos",
+    'medicos.atualizar': "UPDATE medicos SET nome_completo = ?, especialidade = ?, contato = ? WHERE id = ?",
+    'medicos.excluir': "DELETE FROM medicos WHERE id = ?",
+    'sequencia.ultima': "SELECT seq FROM sqlite_sequence WHERE name = ?",
+    # sessoes.medico_id foi criada por ALTER TABLE, sem chave estrangeira: a exclusão a desfaz aqui
+    'medicos.desvincular_sessoes': "UPDATE sessoes SET medico_id = NULL WHERE medico_id = ?",
+
+    # Disponibilidade
+    'disponibilidade.inserir':
+        "INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, ?, ?, ?)",
+    'disponibilidade.listar_por_dia': """
+        SELECT id, hora_inicio, hora_fim FROM disponibilidade_medico
+        WHERE medico_id = ? AND dia_disponivel = ? ORDER BY minuto_inicio""",
+    'disponibilidade.dias_no_intervalo':
+        "SELECT DISTINCT dia_disponivel FROM disponibilidade_medico WHERE medico_id = ? AND dia_disponivel BETWEEN ? AND ?",
+    'disponibilidade.listar_intervalo': """
+        SELECT id, dia_disponivel AS dia, hora_inicio, hora_fim FROM disponibilidade_medico
+        WHERE medico_id = ? AND dia_disponivel BETWEEN ? AND ? ORDER BY dia_disponivel, minuto_inicio""",
+    'disponibilidade.buscar_por_id': "SELECT id, medico_id, dia_disponivel AS dia, hora_inicio, hora_fim FROM disponibilidade_medico WHERE id = ?",
+    'disponibilidade.resumo_periodo': """
+        SELECT medico_id, dia,
+               SUM(minutos_disponiveis) AS minutos_disponiveis,
+               SUM(minutos_agendados) AS minutos_agendados,
+               SUM(sessoes) AS sessoes
+        FROM (
+            SELECT medico_id, dia_disponivel AS dia,
+                   COALESCE(minuto_fim - minuto_inicio, 0) AS minutos_disponiveis,
+                   0 AS minutos_agendados, 0 AS sessoes
+            FROM disponibilidade_medico
+            WHERE dia_disponivel BETWEEN ? AND ?
+            UNION ALL
+            SELECT medico_id, dia_sessao,
+                   0, COALESCE(minuto_fim_sessao - minuto_inicio_sessao, 0), 1
+            FROM sessoes
+            WHERE dia_sessao BETWEEN ? AND ? AND medico_id IS NOT NULL
+        )
+        GROUP BY medico_id, dia""",
+    'disponibilidade.excluir': "DELETE FROM disponibilidade_medico WHERE id = ?",
+    'disponibilidade.excluir_intervalo':
+        "DELETE FROM disponibilidade_medico WHERE medico_id = ? AND dia_disponivel BETWEEN ? AND ?",
+    'disponibilidade.copiar': """
+        INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim)
+        SELECT medico_id, ?, hora_inicio, hora_fim FROM disponibilidade_medico WHERE id = ?""",
+    'disponibilidade.mover': "UPDATE disponibilidade_medico SET data_disponivel = ? WHERE id = ?",
+
+    # Prontuários
+    'prontuarios.buscar_por_paciente': "SELECT * FROM prontuarios WHERE paciente_id = ?",
+    'prontuarios.inserir': "INSERT INTO prontuarios (paciente_id) VALUES (?)",
+    'prontuarios.paciente': "SELECT paciente_id FROM prontuarios WHERE id = ?",
+    'prontuarios.atualizar': """
+        UPDATE prontuarios SET queixa_principal = ?, historico_medico_relevante = ?, anamnese = ?, informacoes_adicionais = ?
+        WHERE id = ?""",
+
+    # Usuários
+    'usuarios.inserir': "INSERT INTO usuarios (nome_usuario, senha_hash, nivel_acesso, medico_id, chave_dados) VALUES (?, ?, ?, ?, ?)",
+    'usuarios.existentes': "SELECT nome_usuario FROM usuarios WHERE nome_usuario IN (SELECT value FROM json_each(?))",
+    'usuarios.listar': """
+        SELECT u.id, u.nome_usuario, u.nivel_acesso, u.medico_id, m.nome_completo AS medico_nome
+        FROM usuarios u LEFT JOIN medicos m ON m.id = u.medico_id
+        ORDER BY u.nome_usuario""",
+    'usuarios.vincular_medico': "UPDATE usuarios SET medico_id = ? WHERE id = ?",
+    'usuarios.atualizar_senha':
+        "UPDATE usuarios SET senha_hash = ?, chave_dados = ?, tentativas_falhas = 0, bloqueado_ate = NULL WHERE id = ?",
+    'usuarios.senha': "SELECT senha_hash FROM usuarios WHERE id = ?",
+    'usuarios.guardar_chave': "UPDATE usuarios SET chave_dados = ? WHERE id = ?",
+    'usuarios.excluir': "DELETE FROM usuarios WHERE id = ?",
+    'usuarios.verificar': """
+        SELECT id, nome_usuario, senha_hash, nivel_acesso, medico_id, tentativas_falhas, bloqueado_ate, chave_dados
+        FROM usuarios WHERE nome_usuario = ?""",
+    'usuarios.registrar_tentativa': "UPDATE usuarios SET tentativas_falhas = ?, bloqueado_ate = ? WHERE id = ?",
+    'usuarios.existe_admin': "SELECT 1 FROM usuarios WHERE nivel_acesso = 'admin'",
+    # Usada na inicialização, antes da migração que cria usuarios.medico_id
+    'usuarios.inserir_admin': "INSERT INTO usuarios (nome_usuario, senha_hash, nivel_acesso) VALUES (?, ?, 'admin')",
+
+    # Sessões
+    'sessoes.inserir': """
+        INSERT INTO sessoes (paciente_id, medico_id, data_sessao, hora_inicio_sessao, hora_fim_sessao,
+                             resumo_sessao, nivel_evolucao, observacoes_evolucao, plano_terapeutico)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    'sessoes.listar_por_paciente':
+        _SQL_SESSOES_PACIENTE + " ORDER BY dia_sessao DESC, minuto_inicio_sessao DESC",
+    'sessoes.listar_por_paciente_com_arquivo': _SQL_SESSOES_PACIENTE + """
+        UNION ALL
+        SELECT a.id, a.data_sessao, a.dia_sessao, a.minuto_inicio_sessao, a.hora_inicio_sessao, a.nivel_evolucao,
+               descomprimir(a.resumo_sessao), a.medico_id, 1
+        FROM arquivo.sessoes_arquivadas a
+        WHERE a.paciente_id = ?
+        ORDER BY dia_sessao DESC, minuto_inicio_sessao DESC""",
+    'sessoes.listar_por_ids': """
+        SELECT s.id, s.paciente_id, s.data_sessao, s.dia_sessao, s.minuto_inicio_sessao, s.hora_inicio_sessao,
+               s.nivel_evolucao, s.resumo_sessao, s.medico_id, 0 AS arquivada
+        FROM sessoes s
+        WHERE s.id IN (SELECT value FROM json_each(?))""",
+    'sessoes.historico_paciente': _SQL_HISTORICO_PACIENTE + " ORDER BY dia_sessao, minuto_inicio_sessao",
+    'sessoes.historico_paciente_com_arquivo': _SQL_HISTORICO_PACIENTE + f"""
+        UNION ALL
+        SELECT id, data_sessao, dia_sessao, minuto_inicio_sessao, hora_inicio_sessao, hora_fim_sessao, medico_id,
+               nivel_evolucao, {', '.join(f'descomprimir({c})' for c in _COLUNAS_TEXTO_ARQUIVADAS)}, 1
+        FROM arquivo.sessoes_arquivadas WHERE paciente_id = ?
+        ORDER BY dia_sessao, minuto_inicio_sessao""",
+    'sessoes.buscar_por_id': """
+        SELECT data_sessao, hora_inicio_sessao, medico_id, resumo_sessao, nivel_evolucao,
+               observacoes_evolucao, plano_terapeutico, hora_fim_sessao, 0 AS arquivada, paciente_id
+        FROM sessoes WHERE id = ?""",
+    'sessoes.paciente': "SELECT paciente_id FROM sessoes WHERE id = ?",
+    'sessoes.atualizar': """
+        UPDATE sessoes SET
+            medico_id = ?,
+            data_sessao = ?,
+            hora_inicio_sessao = ?,
+            hora_fim_sessao = ?,
+            resumo_sessao = ?,
+            nivel_evolucao = ?,
+            observacoes_evolucao = ?,
+            plano_terapeutico = ?
+        WHERE id = ?""",
+    'sessoes.excluir': "DELETE FROM sessoes WHERE id = ?",
+    'sessoes.pacientes_por_ids': "SELECT id, paciente_id FROM sessoes WHERE id IN (SELECT value FROM json_each(?))",
+    # A cópia leva só o agendamento (paciente, médico e horário); os registros clínicos ficam em branco
+    'sessoes.copiar': """
+        INSERT INTO sessoes (paciente_id, medico_id, data_sessao, hora_inicio_sessao, hora_fim_sessao, nivel_evolucao)
+        SELECT paciente_id, medico_id, ?, hora_inicio_sessao, hora_fim_sessao, nivel_evolucao FROM sessoes WHERE id = ?""",
+    'sessoes.mover': "UPDATE sessoes SET data_sessao = ? WHERE id = ?",
+    # Deslocamento da agenda de um médico: as linhas do período, na ordem em que podem ser deslocadas
+    # sem esbarrar umas nas outras (ver deslocar_agenda_medico)
+    'sessoes.do_medico_no_periodo': """
+        SELECT id, paciente_id FROM sessoes WHERE medico_id = ? AND dia_sessao BETWEEN ? AND ?
+        ORDER BY dia_sessao * ? """,
+    'sessoes.deslocar': "UPDATE sessoes SET data_sessao = date(data_sessao, ?) WHERE id = ?",
+    'disponibilidade.do_medico_no_periodo': """
+        SELECT id FROM disponibilidade_medico WHERE medico_id = ? AND dia_disponivel BETWEEN ? AND ?
+        ORDER BY dia_disponivel * ? """,
+    'disponibilidade.deslocar': "UPDATE disponibilidade_medico SET data_disponivel = date(data_disponivel, ?) WHERE id = ?",
+    # Carteira do médico: um resumo por paciente atendido, a partir do índice (medico_id, dia_sessao, ...)
+    'sessoes.carteira_medico': """
+        SELECT s.paciente_id, p.nome_completo AS paciente_nome, p.nome_responsavel, COUNT(*) AS sessoes,
+               MIN(s.data_sessao) AS primeira_sessao,
+               MAX(CASE WHEN s.dia_sessao < ? THEN s.data_sessao END) AS ultima_sessao,
+               MIN(CASE WHEN s.dia_sessao >= ? THEN s.data_sessao END) AS proxima_sessao
+        FROM sessoes s
+        JOIN pacientes p ON p.id = s.paciente_id
+        WHERE s.medico_id = ?
+        GROUP BY s.paciente_id
+        ORDER BY p.nome_completo""",
+    'sessoes.dias': "SELECT DISTINCT dia_sessao FROM sessoes WHERE dia_sessao IS NOT NULL",
+    'sessoes.dias_no_intervalo': "SELECT DISTINCT dia_sessao FROM sessoes WHERE dia_sessao BETWEEN ? AND ?",
+    'sessoes.horarios_medico_no_dia':
+        "SELECT hora_inicio_sessao FROM sessoes WHERE medico_id = ? AND dia_sessao = ? ORDER BY minuto_inicio_sessao",
+    'sessoes.conflitantes': """
+        SELECT s.id, s.hora_inicio_sessao, s.hora_fim_sessao, p.nome_completo AS paciente_nome
+        FROM sessoes s LEFT JOIN pacientes p ON p.id = s.paciente_id
+        WHERE s.medico_id = ? AND s.dia_sessao = ? AND s.id IS NOT ?
+          AND s.minuto_inicio_sessao < ? AND s.minuto_fim_sessao > ?
+        ORDER BY s.minuto_inicio_sessao""",
+
+    # Agenda do terapeuta: cada metade usa o índice (medico_id, dia, minuto) da sua tabela
+    'agenda.medico': """
+        SELECT 'sessao' AS tipo, s.dia_sessao AS dia, s.minuto_inicio_sessao AS minuto_inicio,
+               s.minuto_fim_sessao AS minuto_fim, s.id AS sessao_id, s.paciente_id,
+               p.nome_completo AS paciente_nome, s.nivel_evolucao
+        FROM sessoes s
+        LEFT JOIN pacientes p ON p.id = s.paciente_id
+        WHERE s.medico_id = ? AND s.dia_sessao BETWEEN ? AND ?
+        UNION ALL
+        SELECT 'disponivel', d.dia_disponivel, d.minuto_inicio, d.minuto_fim, NULL, NULL, NULL, NULL
+        FROM disponibilidade_medico d
+        WHERE d.medico_id = ? AND d.dia_disponivel BETWEEN ? AND ?
+        ORDER BY dia, minuto_inicio""",
+
+    # Lista de espera. Os candidatos a um horário livre vêm de duas buscas por índice: as entradas do
+    # próprio médico e as da especialidade dele (sem médico), ambas por faixa de minuto_inicio.
+    'lista_espera.inserir': """
+        INSERT INTO lista_espera (paciente_id, medico_id, especialidade, dias_semana, hora_inicio, hora_fim,
+                                  duracao_minutos, prioridade, observacao, criado_em)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    'lista_espera.listar': """
+        SELECT l.id, l.paciente_id, p.nome_completo AS paciente_nome, l.medico_id, m.nome_completo AS medico_nome,
+               l.especialidade, l.dias_semana, l.hora_inicio, l.hora_fim, l.duracao_minutos, l.prioridade,
+               l.observacao, l.criado_em
+        FROM lista_espera l
+        JOIN pacientes p ON p.id = l.paciente_id
+        LEFT JOIN medicos m ON m.id = l.medico_id
+        ORDER BY l.prioridade DESC, l.criado_em, l.id""",
+    'lista_espera.paciente': "SELECT paciente_id FROM lista_espera WHERE id = ?",
+    'lista_espera.excluir': "DELETE FROM lista_espera WHERE id = ?",
+    'lista_espera.candidatos': """
+        SELECT l.id, l.paciente_id, p.nome_completo AS paciente_nome, l.minuto_inicio, l.minuto_fim,
+               l.duracao_minutos, l.prioridade, l.criado_em
+        FROM (
+            SELECT * FROM lista_espera
+            WHERE medico_id = ? AND minuto_inicio < ? AND minuto_fim > ?
+            UNION ALL
+            SELECT * FROM lista_espera
+            WHERE medico_id IS NULL AND especialidade = (SELECT especialidade FROM medicos WHERE id = ?)
+              AND minuto_inicio < ? AND minuto_fim > ?
+        ) l
+        JOIN pacientes p ON p.id = l.paciente_id
+        WHERE l.dias_semana & ?
+          AND MIN(l.minuto_fim, ?) - MAX(l.minuto_inicio, ?) >= l.duracao_minutos
+          AND NOT EXISTS (SELECT 1 FROM sessoes s WHERE s.paciente_id = l.paciente_id AND s.dia_sessao = ?)
+        ORDER BY l.prioridade DESC, l.criado_em, l.id
+        LIMIT ?""",
+
+    # Lembretes de sessão. As próximas sessões vêm de uma faixa do índice (dia_sessao, medico_id); a fila
+    # é lida pelo índice parcial dos lembretes por enviar, e cada lote reservado é marcado com um código próprio.
+    'sessoes.proximas': """
+        SELECT s.id, s.paciente_id, p.nome_completo AS paciente_nome, p.nome_responsavel, s.medico_id,
+               m.nome_completo AS medico_nome, s.data_sessao, s.hora_inicio_sessao, s.hora_fim_sessao,
+               s.dia_sessao, s.minuto_inicio_sessao
+        FROM sessoes s
+        JOIN pacientes p ON p.id = s.paciente_id
+        LEFT JOIN medicos m ON m.id = s.medico_id
+        WHERE s.dia_sessao BETWEEN ? AND ?
+          AND s.dia_sessao * 1440 + s.minuto_inicio_sessao BETWEEN ? AND ?
+        ORDER BY s.dia_sessao, s.minuto_inicio_sessao""",
+    'lembretes.gerar': """
+        INSERT INTO lembretes (sessao_id, data_sessao, hora_inicio, sessao_em, enviar_em, criado_em)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (sessao_id) DO UPDATE SET
+            data_sessao = excluded.data_sessao, hora_inicio = excluded.hora_inicio, sessao_em = excluded.sessao_em,
+            enviar_em = excluded.enviar_em, estado = 'pendente', tentativas = 0, reserva = NULL, erro = NULL
+        WHERE data_sessao IS NOT excluded.data_sessao OR hora_inicio IS NOT excluded.hora_inicio""",
+    'lembretes.na_fila': """
+        SELECT sessao_id, data_sessao, hora_inicio FROM lembretes WHERE sessao_id IN (SELECT value FROM json_each(?))""",
+    # Uma rodada ociosa não deve gravar nada: cada gravação muda o data_version e invalida os caches das janelas
+    'lembretes.ha_vencidos': """
+        SELECT EXISTS (
+            SELECT 1 FROM lembretes
+            WHERE estado IN ('pendente', 'enviando') AND enviar_em <= ?
+              AND (estado = 'pendente' OR reservado_ate < ? OR sessao_em <= ?)
+        )""",
+    'lembretes.expirar': """
+        UPDATE lembretes SET estado = 'expirado', reserva = NULL
+        WHERE estado IN ('pendente', 'enviando') AND enviar_em <= ? AND sessao_em <= ?""",
+    'lembretes.reservar': """
+        UPDATE lembretes SET estado = 'enviando', reserva = ?, reservado_ate = ?, tentativas = tentativas + 1
+        WHERE id IN (
+            SELECT id FROM lembretes
+            WHERE estado IN ('pendente', 'enviando') AND enviar_em <= ?
+              AND (estado = 'pendente' OR reservado_ate < ?)
+            ORDER BY enviar_em
+            LIMIT ?
+        )""",
+    'lembretes.reservados': """
+        SELECT l.id, l.reserva, l.tentativas, l.sessao_id, s.paciente_id, p.nome_completo AS paciente_nome,
+               p.nome_responsavel, s.medico_id, m.nome_completo AS medico_nome, s.data_sessao,
+               s.hora_inicio_sessao, s.hora_fim_sessao
+        FROM lembretes l
+        JOIN sessoes s ON s.id = l.sessao_id
+        JOIN pacientes p ON p.id = s.paciente_id
+        LEFT JOIN medicos m ON m.id = s.medico_id
+        WHERE l.reserva = ?
+        ORDER BY l.enviar_em""",
+    'lembretes.enviado': """
+        UPDATE lembretes SET estado = 'enviado', enviado_em = ?, reserva = NULL, erro = NULL
+        WHERE id = ? AND reserva = ?""",
+    'lembretes.falhou': """
+        UPDATE lembretes SET estado = CASE WHEN tentativas >= ? THEN 'falhou' ELSE 'pendente' END,
+                             enviar_em = ? + ? * tentativas, reserva = NULL, erro = ?
+        WHERE id = ? AND reserva = ?""",
+    'lembretes.resumo': "SELECT estado, COUNT(*) FROM lembretes GROUP BY estado",
+
+    # Anexos do prontuário: só metadados no banco da clínica
+    'anexos.inserir': """
+        INSERT INTO anexos (prontuario_id, nome_arquivo, tipo_mime, tamanho, hash, criado_em, usuario_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+    'anexos.listar_por_prontuario': """
+        SELECT id, nome_arquivo, tipo_mime, tamanho, hash, criado_em, usuario_id
+        FROM anexos WHERE prontuario_id = ? ORDER BY criado_em DESC, id DESC""",
+    'anexos.buscar_por_id': """
+        SELECT a.id, a.prontuario_id, a.nome_arquivo, a.tipo_mime, a.tamanho, a.hash, p.paciente_id
+        FROM anexos a JOIN prontuarios p ON p.id = a.prontuario_id WHERE a.id = ?""",
+    'anexos.excluir': "DELETE FROM anexos WHERE id = ?",
+    'anexos.hashes_paciente': """
+        SELECT DISTINCT a.hash FROM anexos a JOIN prontuarios p ON p.id = a.prontuario_id WHERE p.paciente_id = ?""",
+
+    # Conteúdo dos anexos (exigem o banco de conteúdo anexado como 'conteudo')
+    'conteudo.buscar_por_hash': "SELECT id FROM conteudo.arquivos WHERE hash = ?",
+    'conteudo.inserir': "INSERT INTO conteudo.arquivos (hash, tamanho, dados) VALUES (?, ?, zeroblob(?))",
+    'conteudo.excluir_sem_anexo':
+        "DELETE FROM conteudo.arquivos WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM anexos WHERE hash = ?)",
+
+    # Arquivo morto (exigem o arquivo anexado como 'arquivo')
+    'arquivo.mover_sessoes': f"""
+        INSERT INTO arquivo.sessoes_arquivadas
+            (id, paciente_id, medico_id, data_sessao, dia_sessao, hora_inicio_sessao, hora_fim_sessao,
+             minuto_inicio_sessao, nivel_evolucao, {', '.join(_COLUNAS_TEXTO_ARQUIVADAS)})
+        SELECT id, paciente_id, medico_id, data_sessao, dia_sessao, hora_inicio_sessao, hora_fim_sessao,
+               minuto_inicio_sessao, nivel_evolucao, {', '.join(f'comprimir({c})' for c in _COLUNAS_TEXTO_ARQUIVADAS)}
+        FROM sessoes WHERE dia_sessao < ?""",
+    'arquivo.excluir_sessoes_movidas': "DELETE FROM sessoes WHERE dia_sessao < ?",
+    'arquivo.buscar_sessao_por_id': """
+        SELECT data_sessao, hora_inicio_sessao, medico_id, descomprimir(resumo_sessao) AS resumo_sessao, nivel_evolucao,
+               descomprimir(observacoes_evolucao) AS observacoes_evolucao,
+               descomprimir(plano_terapeutico) AS plano_terapeutico, hora_fim_sessao, 1 AS arquivada, paciente_id
+        FROM arquivo.sessoes_arquivadas WHERE id = ?""",
+    'arquivo.excluir_sessoes_paciente': "DELETE FROM arquivo.sessoes_arquivadas WHERE paciente_id = ?",
+
+    # Criptografia dos textos clínicos (as de sessões arquivadas exigem o arquivo morto anexado)
+    'criptografia.buscar': "SELECT verificador FROM criptografia WHERE id = 1",
+    'criptografia.inserir': "INSERT INTO criptografia (id, verificador, ativada_em) VALUES (1, ?, ?)",
+    'criptografia.prontuarios_em_claro': _sql_em_claro('prontuarios', _COLUNAS_CIFRADAS_PRONTUARIO, _SQL_EM_CLARO),
+    'criptografia.cifrar_prontuario': _sql_cifrar('prontuarios', _COLUNAS_CIFRADAS_PRONTUARIO),
+    'criptografia.sessoes_em_claro': _sql_em_claro('sessoes', _COLUNAS_CIFRADAS_SESSAO, _SQL_EM_CLARO),
+    'criptografia.cifrar_sessao': _sql_cifrar('sessoes', _COLUNAS_CIFRADAS_SESSAO),
+    'criptografia.arquivadas_em_claro':
+        _sql_em_claro('arquivo.sessoes_arquivadas', _COLUNAS_CIFRADAS_SESSAO, _SQL_ARQUIVADO_EM_CLARO),
+    'criptografia.cifrar_arquivada': _sql_cifrar('arquivo.sessoes_arquivadas', _COLUNAS_CIFRADAS_SESSAO),
+
+    # Registro de alterações entre estações (as buscas usam a chave primária seq)
+    'alteracoes.ultima': "SELECT COALESCE(MAX(seq), 0) FROM log_alteracoes",
+    'alteracoes.limites': "SELECT MIN(seq), MAX(seq) FROM log_alteracoes",
+    'alteracoes.desde': """
+        SELECT seq, tabela, operacao, registro_id, paciente_id, dia, dia_anterior
+        FROM log_alteracoes WHERE seq > ? AND seq <= ? ORDER BY seq""",
+    'alteracoes.podar': "DELETE FROM log_alteracoes WHERE seq <= (SELECT MAX(seq) FROM log_alteracoes) - ?",
+}
+
+# Linha do tempo de evolução: uma variante por agrupamento, com e sem o arquivo morto
+for _sufixo, _origem in _SQL_NIVEIS_ORIGEM.items():
+    _niveis = _SQL_NIVEIS.format(nivel=_sql_nivel('nivel_evolucao'), origem=_origem)
+    CONSULTAS[f'evolucao.intervalo{_sufixo}'] = f"SELECT MIN(dia), MAX(dia) FROM ({_niveis})"
+    for _agrupamento, _periodo in _SQL_PERIODO.items():
+        CONSULTAS[f'evolucao.pontos_{_agrupamento}{_sufixo}'] = _SQL_PONTOS_EVOLUCAO.format(periodo=_periodo, niveis=_niveis)
+
+# Verificação de integridade (ver verificar_integridade): uma contagem por tabela, que avalia todas as
+# condições da tabela numa única leitura, e uma consulta de exemplos e uma de reparo por problema
+for _tabela, _origem in _ORIGENS_INTEGRIDADE.items():
+    _condicoes = {nome: condicao for nome, (tabela, condicao, _, _) in _VERIFICACOES_INTEGRIDADE.items() if tabela == _tabela}
+    _somas = ', '.join(f"COALESCE(SUM({condicao}), 0) AS {nome}" for nome, condicao in _condicoes.items())
+    CONSULTAS[f'integridade.contar.{_tabela}'] = f"SELECT {_somas} FROM {_origem} t"
+    for _nome, _condicao in _condicoes.items():
+        CONSULTAS[f'integridade.exemplos.{_nome}'] = f"SELECT t.id FROM {_origem} t WHERE {_condicao} ORDER BY t.id LIMIT ?"
+for _nome, (_, _, _, _reparos) in _VERIFICACOES_INTEGRIDADE.items():
+    for _passo, _sql in enumerate(_reparos, 1):
+        CONSULTAS[f'integridade.reparar.{_nome}.{_passo}'] = _sql
+
+_estatisticas_consultas = {}   # nome -> [execuções, segundos no total, maior duração em segundos]
+_observadores_consultas = []
+
+def _executar(conn, nome, parametros=()):
+    """
+    Executa a consulta registrada com esse nome e retorna o cursor. A duração medida é a do execute
+    (preparação, ou reaproveitamento do cache de instruções, e a primeira linha do resultado).
+    """
+    inicio = time.perf_counter()
+    cursor = conn.execute(CONSULTAS[nome], parametros)
+    _medir_consulta(nome, time.perf_counter() - inicio)
+    return cursor
+
+def _executar_lote(conn, nome, lista_parametros):
+    """
+    Executa a consulta registrada uma vez para cada conjunto de parâmetros (executemany), com uma
+    única preparação e dentro da transação de quem chama. Conta como uma execução nas estatísticas.
+    """
+    inicio = time.perf_counter()
+    cursor = conn.executemany(CONSULTAS[nome], lista_parametros)
+    _medir_consulta(nome, time.perf_counter() - inicio)
+    return cursor
+
+def _medir_consulta(nome, duracao):
+    estatistica = _estatisticas_consultas.setdefault(nome, [0, 0.0, 0.0])
+    estatistica[0] += 1
+    estatistica[1] += duracao
+    estatistica[2] = max(estatistica[2], duracao)
+    for observador in list(_observadores_consultas):
+        observador(nome, duracao)
+
+def registrar_observador_consultas(observador):
+    """Registra uma função observador(nome, segundos), chamada após cada consulta registrada executada."""
+    if observador not in _observadores_consultas:
+        _observadores_consultas.append(observador)
+
+def remover_observador_consultas(observador):
+    if observador in _observadores_consultas:
+        _observadores_consultas.remove(observador)
+
+def estatisticas_consultas():
+    """Retorna, por nome de consulta, o número de execuções e os tempos total, médio e máximo (ms)."""
+    return {
+        nome: {'execucoes': execucoes, 'total_ms': round(total * 1000, 3),
+               'media_ms': round(total * 1000 / execucoes, 4), 'max_ms': round(maximo * 1000, 3)}
+        for nome, (execucoes, total, maximo) in sorted(_estatisticas_consultas.items())
+    }
+
+def zerar_estatisticas_consultas():
+    _estatisticas_consultas.clear()
+
+def _preparar_para_explicar(conn, nome, prefixo):
+    sql = CONSULTAS[nome]
+    # Nenhuma consulta registrada usa '?' dentro de textos literais, então a contagem é exata
+    return conn.execute(f"{prefixo} {sql}", [None] * sql.count('?'))
+
+def validar_consultas():
+    """
+    Prepara cada consulta registrada com EXPLAIN contra o schema do banco atual. Retorna {nome: erro}
+    das que falharam (vazio se todas são válidas). As consultas do arquivo morto e do conteúdo dos anexos
+    são validadas contra o schema desses bancos, criados vazios (em memória) se ainda não existirem.
+    """
+    erros = {}
+    conn = _abrir_conexao(DB_FILE)
+    try:
+        _registrar_funcoes_arquivo(conn)
+        if not _anexar_arquivo_morto(conn):
+            conn.execute("ATTACH DATABASE ':memory:' AS arquivo")
+            _criar_tabelas_arquivo(conn)
+        if not _anexar_conteudo_anexos(conn):
+            conn.execute("ATTACH DATABASE ':memory:' AS conteudo")
+            _criar_tabelas_conteudo(conn)
+        for nome in CONSULTAS:
+            try:
+                _preparar_para_explicar(conn, nome, 'EXPLAIN').fetchall()
+            except sqlite3.Error as e:
+                erros[nome] = str(e)
+    finally:
+        conn.close()
+    return erros
+
+def explicar_consulta(nome):
+    """Retorna o plano de execução (EXPLAIN QUERY PLAN) de uma consulta registrada, uma linha por passo."""
+    with _conectar() as conn:
+        _anexar_arquivo_morto(conn)
+        _anexar_conteudo_anexos(conn)
+        return [passo[-1] for passo in _preparar_para_explicar(conn, nome, 'EXPLAIN QUERY PLAN').fetchall()]
+
 # --- Inicialização e Migração ---
+# As alterações de schema são textos fixos: nomes de colunas e tabelas nunca vêm de variáveis.
+
+# Controle de tentativas de login (ver autenticacao.registrar_falha)
+_MIGRACAO_USUARIOS = {
+    'tentativas_falhas': "ALTER TABLE usuarios ADD COLUMN tentativas_falhas INTEGER NOT NULL DEFAULT 0",
+    'bloqueado_ate': "ALTER TABLE usuarios ADD COLUMN bloqueado_ate REAL", # Momento (time.time()) em que o bloqueio termina
+    'chave_dados': "ALTER TABLE usuarios ADD COLUMN chave_dados BLOB", # Chave da criptografia, cifrada pela senha do usuário
+}
+
+_MIGRACAO_SESSOES = {
+    'nivel_evolucao': "ALTER TABLE sessoes ADD COLUMN nivel_evolucao TEXT",
+    'observacoes_evolucao': "ALTER TABLE sessoes ADD COLUMN observacoes_evolucao TEXT",
+    'plano_terapeutico': "ALTER TABLE sessoes ADD COLUMN plano_terapeutico TEXT",
+    'medico_id': "ALTER TABLE sessoes ADD COLUMN medico_id INTEGER", # Referencia o médico da sessão
+    'hora_inicio_sessao': "ALTER TABLE sessoes ADD COLUMN hora_inicio_sessao TEXT",
+    'hora_fim_sessao': "ALTER TABLE sessoes ADD COLUMN hora_fim_sessao TEXT",
+}
+
+# Colunas ordenáveis: dias como inteiros e horários em minutos desde a meia-noite.
+# São colunas geradas (VIRTUAL), calculadas a partir do texto original, que continua
+# sendo a fonte da verdade; valores malformados resultam em NULL.
+_COLUNAS_GERADAS = {
+    'sessoes': {
+        'dia_sessao': f"ALTER TABLE sessoes ADD COLUMN dia_sessao INTEGER GENERATED ALWAYS AS ({_sql_dia('data_sessao')}) VIRTUAL",
+        'minuto_inicio_sessao': ("ALTER TABLE sessoes ADD COLUMN minuto_inicio_sessao INTEGER "
+                                 f"GENERATED ALWAYS AS ({_sql_minutos('hora_inicio_sessao')}) VIRTUAL"),
+        'minuto_fim_sessao': ("ALTER TABLE sessoes ADD COLUMN minuto_fim_sessao INTEGER "
+                              f"GENERATED ALWAYS AS ({_sql_minutos('hora_fim_sessao')}) VIRTUAL"),
+    },
+    'disponibilidade_medico': {
+        'dia_disponivel': ("ALTER TABLE disponibilidade_medico ADD COLUMN dia_disponivel INTEGER "
+                           f"GENERATED ALWAYS AS ({_sql_dia('data_disponivel')}) VIRTUAL"),
+        'minuto_inicio': ("ALTER TABLE disponibilidade_medico ADD COLUMN minuto_inicio INTEGER "
+                          f"GENERATED ALWAYS AS ({_sql_minutos('hora_inicio')}) VIRTUAL"),
+        'minuto_fim': ("ALTER TABLE disponibilidade_medico ADD COLUMN minuto_fim INTEGER "
+                       f"GENERATED ALWAYS AS ({_sql_minutos('hora_fim')}) VIRTUAL"),
+    },
+    'pacientes': {
+        'dia_nascimento': ("ALTER TABLE pacientes ADD COLUMN dia_nascimento INTEGER "
+                           f"GENERATED ALWAYS AS ({_sql_dia('data_nascimento')}) VIRTUAL"),
+    },
+}
+
+def _colunas_da_tabela(cursor, tabela):
+    """Nomes das colunas de uma tabela, inclusive as geradas (table_xinfo, e não table_info)."""
+    return [row[0] for row in cursor.execute("SELECT name FROM pragma_table_xinfo(?)", (tabela,))]
+
 
 def inicializar_banco_de_dados():
     """
     Cria as tabelas se não existirem e garante que o schema da tabela 'sessoes'
     esteja atualizado, adicionando colunas que faltam. Deve ser chamada no início do app.
+    Ao final, valida as consultas registradas (CONSULTAS) contra o schema resultante.
     """
-    with sqlite3.connect(DB_FILE) as conn:
+    # Conexão própria, fechada ao final: as instruções compiladas antes das alterações de schema não ficam em cache
+    with closing(_abrir_conexao(DB_FILE)) as conn, conn:
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON")
 
         # 1. Criar tabela de pacientes
         cursor.execute("""
@@ -76,22 +1611,11 @@ def inicializar_banco_de_dados():
         )
         """)
         # 5. Migração de Schema para 'sessoes'
-        cursor.execute("PRAGMA table_info(sessoes)")
-        colunas_existentes = [coluna[1] for coluna in cursor.fetchall()]
-
-        colunas_necessarias = {
-            "nivel_evolucao": "TEXT",
-            "observacoes_evolucao": "TEXT",
-            "plano_terapeutico": "TEXT",
-            "medico_id": "INTEGER", # Adiciona a coluna para referenciar o médico
-            "hora_inicio_sessao": "TEXT",
-            "hora_fim_sessao": "TEXT"
-        }
-
-        for coluna, tipo in colunas_necessarias.items():
+        colunas_existentes = _colunas_da_tabela(cursor, 'sessoes')
+        for coluna, alteracao in _MIGRACAO_SESSOES.items():
             if coluna not in colunas_existentes:
                 print(f"Atualizando schema: Adicionando coluna '{coluna}' à tabela 'sessoes'...")
-                cursor.execute(f"ALTER TABLE sessoes ADD COLUMN {coluna} {tipo}")
+                cursor.execute(alteracao)
 
         # 6. Criar tabela de prontuários
         cursor.execute("""
@@ -117,326 +1641,1213 @@ def inicializar_banco_de_dados():
         """)
 
         # 8. Criar usuário admin padrão se não existir nenhum
-        cursor.execute("SELECT 1 FROM usuarios WHERE nivel_acesso = 'admin'")
-        if not cursor.fetchone():
+        if not _executar(conn, 'usuarios.existe_admin').fetchone():
             nome_admin_padrao = 'admin'
             senha_admin_padrao = 'admin123'
             senha_hashed = hash_senha(senha_admin_padrao)
-            cursor.execute(
-                "INSERT INTO usuarios (nome_usuario, senha_hash, nivel_acesso) VALUES (?, ?, ?)",
-                (nome_admin_padrao, senha_hashed, 'admin')
-            )
+            _executar(conn, 'usuarios.inserir_admin', (nome_admin_padrao, senha_hashed))
             print("="*50)
             print("NENHUM USUÁRIO ADMIN ENCONTRADO. UM PADRÃO FOI CRIADO:")
             print(f"  Usuário: {nome_admin_padrao}\n  Senha:   {senha_admin_padrao}")
             print("="*50)
 
-        print("Banco de dados pronto.")
+        # 9. Colunas ordenáveis (ver _COLUNAS_GERADAS)
+        for tabela, colunas in _COLUNAS_GERADAS.items():
+            existentes = _colunas_da_tabela(cursor, tabela)
+            for coluna, alteracao in colunas.items():
+                if coluna not in existentes:
+                    print(f"Atualizando schema: Adicionando coluna ordenável '{coluna}' à tabela '{tabela}'...")
+                    cursor.execute(alteracao)
+
+        # 10. Índices para consultas por intervalo de dias
+        cursor.execute("DROP INDEX IF EXISTS idx_disponibilidade_data") # Substituídos pelos índices sobre as colunas inteiras
+        cursor.execute("DROP INDEX IF EXISTS idx_sessoes_data_medico")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_disponibilidade_dia ON disponibilidade_medico (dia_disponivel, medico_id, minuto_inicio, minuto_fim)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_disponibilidade_medico_dia ON disponibilidade_medico (medico_id, dia_disponivel, minuto_inicio)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_dia ON sessoes (dia_sessao, medico_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_medico_dia ON sessoes (medico_id, dia_sessao, minuto_inicio_sessao)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_paciente_dia ON sessoes (paciente_id, dia_sessao, minuto_inicio_sessao)")
+
+        # 11. Gatilhos contra conflitos de agenda (recriados para acompanhar mudanças na definição)
+        cursor.execute("DROP TRIGGER IF EXISTS trg_sessoes_agenda_insert")
+        cursor.execute("DROP TRIGGER IF EXISTS trg_sessoes_agenda_update")
+        for gatilho in _sql_gatilhos_agendamento():
+            cursor.execute(gatilho)
+
+        # 12. Vínculo entre usuário e médico/terapeuta (para a agenda do próprio terapeuta)
+        if 'medico_id' not in _colunas_da_tabela(cursor, 'usuarios'):
+            print("Atualizando schema: Adicionando coluna 'medico_id' à tabela 'usuarios'...")
+            cursor.execute("ALTER TABLE usuarios ADD COLUMN medico_id INTEGER REFERENCES medicos (id) ON DELETE SET NULL")
+
+        # 13. Registro de alterações entre estações (ver _sql_gatilhos_alteracoes), podado a cada início
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS log_alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabela TEXT NOT NULL,
+            operacao TEXT NOT NULL, -- 'inserido', 'atualizado' ou 'excluido'
+            registro_id INTEGER NOT NULL,
+            paciente_id INTEGER,
+            dia INTEGER, -- Dia afetado (ver dia_numero), nas tabelas com data
+            dia_anterior INTEGER -- Dia antes da alteração, quando a data pode ter mudado
+        )
+        """)
+        for nome, gatilho in _sql_gatilhos_alteracoes():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {nome}")
+            cursor.execute(gatilho)
+        _executar(conn, 'alteracoes.podar', (LOG_ALTERACOES_MANTER,))
+
+        # 14. Usuários: bloqueio de login após tentativas com senha errada e chave da criptografia
+        colunas_existentes = _colunas_da_tabela(cursor, 'usuarios')
+        for coluna, alteracao in _MIGRACAO_USUARIOS.items():
+            if coluna not in colunas_existentes:
+                print(f"Atualizando schema: Adicionando coluna '{coluna}' à tabela 'usuarios'...")
+                cursor.execute(alteracao)
+
+        # 15. Lista de espera: janela de horário preferida (texto HH:MM, com os minutos em colunas geradas)
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS lista_espera (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            medico_id INTEGER, -- NULL: qualquer médico da especialidade
+            especialidade TEXT COLLATE NOCASE,
+            dias_semana INTEGER NOT NULL DEFAULT {TODOS_OS_DIAS}, -- Bit 0 = segunda ... bit 6 = domingo
+            hora_inicio TEXT NOT NULL, -- Formato HH:MM
+            hora_fim TEXT NOT NULL, -- Formato HH:MM
+            duracao_minutos INTEGER NOT NULL DEFAULT {DURACAO_PADRAO_ESPERA},
+            prioridade INTEGER NOT NULL DEFAULT 0, -- Maior = atendido antes
+            observacao TEXT,
+            criado_em REAL NOT NULL, -- Momento (time.time()) da entrada na lista; desempata a prioridade
+            minuto_inicio INTEGER GENERATED ALWAYS AS ({_sql_minutos('hora_inicio')}) VIRTUAL,
+            minuto_fim INTEGER GENERATED ALWAYS AS ({_sql_minutos('hora_fim')}) VIRTUAL,
+            CHECK (medico_id IS NOT NULL OR especialidade IS NOT NULL),
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id) ON DELETE CASCADE,
+            FOREIGN KEY (medico_id) REFERENCES medicos (id) ON DELETE CASCADE
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lista_espera_medico ON lista_espera (medico_id, minuto_inicio, minuto_fim)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lista_espera_especialidade ON lista_espera (especialidade, minuto_inicio, minuto_fim) "
+                       "WHERE medico_id IS NULL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lista_espera_paciente ON lista_espera (paciente_id)")
+        # Uma janela fora do formato HH:MM teria minuto_inicio/minuto_fim NULL e nunca casaria com uma vaga:
+        # o gatilho a recusa (recriado, como os da agenda, para valer também nos bancos já existentes)
+        inicio, fim = _sql_minutos('NEW.hora_inicio'), _sql_minutos('NEW.hora_fim')
+        for evento in ('INSERT', 'UPDATE OF hora_inicio, hora_fim'):
+            nome = f"trg_lista_espera_horario_{evento.split()[0].lower()}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS {nome}")
+            cursor.execute(f"""CREATE TRIGGER {nome} BEFORE {evento} ON lista_espera
+                BEGIN SELECT RAISE(ABORT, 'horario_invalido') WHERE ({inicio}) IS NULL OR ({fim}) IS NULL OR ({fim}) <= ({inicio}); END""")
+
+        # 16. Anexos do prontuário: só os metadados; o conteúdo fica no banco de anexos (ver caminho_anexos)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS anexos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prontuario_id INTEGER NOT NULL,
+            nome_arquivo TEXT NOT NULL,
+            tipo_mime TEXT,
+            tamanho INTEGER NOT NULL, -- Em bytes
+            hash TEXT NOT NULL, -- SHA-256 do conteúdo (chave no banco de anexos)
+            criado_em REAL NOT NULL, -- Momento (time.time()) do envio
+            usuario_id INTEGER, -- Quem anexou
+            FOREIGN KEY (prontuario_id) REFERENCES prontuarios (id) ON DELETE CASCADE
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anexos_prontuario ON anexos (prontuario_id, criado_em)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anexos_hash ON anexos (hash)")
+
+        # 17. Criptografia dos textos clínicos: a linha existe a partir da ativação (ver ativar_criptografia)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS criptografia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            verificador BLOB NOT NULL, -- Texto conhecido cifrado com a chave de dados
+            ativada_em REAL NOT NULL -- Momento (time.time()) da ativação
+        )
+        """)
+
+        # 18. Fila de lembretes das próximas sessões (ver gerar_lembretes e lembretes.py)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lembretes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sessao_id INTEGER NOT NULL UNIQUE,
+            data_sessao TEXT NOT NULL, -- Data e horário da sessão quando o lembrete foi gerado:
+            hora_inicio TEXT NOT NULL, -- se a sessão for remarcada, o lembrete volta para a fila
+            sessao_em REAL NOT NULL, -- Início da sessão (time.time())
+            enviar_em REAL NOT NULL, -- A partir de quando o lembrete pode ser enviado
+            estado TEXT NOT NULL DEFAULT 'pendente', -- 'pendente', 'enviando', 'enviado', 'falhou' ou 'expirado'
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            reserva TEXT, -- Lote que está sendo enviado (ver reservar_lembretes)
+            reservado_ate REAL, -- Depois disto, o lembrete ainda em 'enviando' pode ser reservado de novo
+            enviado_em REAL,
+            erro TEXT, -- Última falha de envio
+            criado_em REAL NOT NULL,
+            FOREIGN KEY (sessao_id) REFERENCES sessoes (id) ON DELETE CASCADE
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lembretes_fila ON lembretes (enviar_em) WHERE estado IN ('pendente', 'enviando')")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lembretes_reserva ON lembretes (reserva) WHERE reserva IS NOT NULL")
+
+    for nome, erro in validar_consultas().items():
+        print(f"Aviso: a consulta registrada '{nome}' não é válida no schema atual: {erro}")
+    print("Banco de dados pronto.")
 
 # --- Funções de Pacientes ---
 
+@_exige('pacientes.editar')
 def adicionar_paciente(nome, data_nasc, responsavel):
-    """Adiciona um novo paciente ao banco de dados."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO pacientes (nome_completo, data_nascimento, nome_responsavel) VALUES (?, ?, ?)",
-            (nome, data_nasc, responsavel)
-        )
+    """Adiciona um novo paciente ao banco de dados. Retorna o ID do novo paciente."""
+    with _conectar() as conn:
+        paciente_id = _executar(conn, 'pacientes.inserir', (nome, data_nasc, responsavel)).lastrowid
+    _registrar_escrita('pacientes', operacao='inserido', registro_id=paciente_id)
+    if _auditores:
+        _auditar('inserido', 'pacientes', paciente_id, paciente_id)
+    return paciente_id
+
+@_exige('pacientes.editar')
+def adicionar_pacientes(pacientes):
+    """Adiciona vários pacientes, dados como (nome, data_nasc, responsavel), numa única transação. Retorna os IDs."""
+    pacientes = list(pacientes)
+    with _conectar() as conn:
+        inseridos = _executar_lote(conn, 'pacientes.inserir', pacientes).rowcount
+        paciente_ids = _ids_inseridos(conn, 'pacientes', inseridos) if inseridos else []
+    _registrar_escrita('pacientes', operacao='inserido')
+    if _auditores:
+        for paciente_id in paciente_ids:
+            _auditar('inserido', 'pacientes', paciente_id, paciente_id)
+    return paciente_ids
 
 def listar_pacientes():
     """Retorna uma lista de todos os pacientes cadastrados, ordenados por nome."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row  # Retorna resultados como dicionários
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nome_completo, data_nascimento, nome_responsavel FROM pacientes ORDER BY nome_completo")
         # Converte os objetos Row para dicionários para desacoplar do sqlite3
-        return [dict(row) for row in cursor.fetchall()]
+        return [dict(row) for row in _executar(conn, 'pacientes.listar').fetchall()]
 
+@_em_cache('pacientes')
 def buscar_paciente_por_id(paciente_id):
     """Busca um paciente específico pelo seu ID."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nome_completo, data_nascimento, nome_responsavel FROM pacientes WHERE id = ?", (paciente_id,))
-        row = cursor.fetchone()
+        row = _executar(conn, 'pacientes.buscar_por_id', (paciente_id,)).fetchone()
         return dict(row) if row else None
 
+@_exige('pacientes.editar')
 def atualizar_paciente(paciente_id, nome, data_nasc, responsavel):
     """Atualiza os dados de um paciente existente."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE pacientes
-            SET nome_completo = ?, 
-                data_nascimento = ?, 
-                nome_responsavel = ?
-            WHERE id = ?
-            """,
-            (nome, data_nasc, responsavel, paciente_id)
-        )
+    with _conectar() as conn:
+        _executar(conn, 'pacientes.atualizar', (nome, data_nasc, responsavel, paciente_id))
+    _registrar_escrita('pacientes', operacao='atualizado', registro_id=paciente_id)
+    if _auditores:
+        _auditar('atualizado', 'pacientes', paciente_id, paciente_id)
 
+@_exige('pacientes.editar')
 def excluir_paciente(paciente_id):
     """Exclui um paciente do banco de dados pelo seu ID."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM pacientes WHERE id = ?", (paciente_id,))
+    with _conectar() as conn:
+        tem_arquivo = _anexar_arquivo_morto(conn)
+        tem_conteudo = _anexar_conteudo_anexos(conn) # Anexados antes da transação (ATTACH não pode ocorrer dentro dela)
+        hashes = [row[0] for row in _executar(conn, 'anexos.hashes_paciente', (paciente_id,))]
+        _executar(conn, 'pacientes.excluir', (paciente_id,))
+        if tem_arquivo: # A exclusão em cascata não alcança o arquivo morto
+            _executar(conn, 'arquivo.excluir_sessoes_paciente', (paciente_id,))
+        if hashes and tem_conteudo: # Nem o banco de anexos
+            _executar_lote(conn, 'conteudo.excluir_sem_anexo', [(h, h) for h in hashes])
+    _registrar_escrita('pacientes', operacao='excluido', registro_id=paciente_id)
+    _registrar_escrita('sessoes', 'prontuarios', 'anexos') # Removidos em cascata
+    if _auditores:
+        _auditar('excluido', 'pacientes', paciente_id, paciente_id)
 
 def buscar_pacientes_por_nome(termo_busca):
     """Busca pacientes cujo nome completo contenha o termo de busca (case-insensitive)."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, nome_completo, data_nascimento, nome_responsavel FROM pacientes WHERE lower(nome_completo) LIKE ? ORDER BY nome_completo",
-            ('%' + termo_busca.lower() + '%',)
-        )
+        cursor = _executar(conn, 'pacientes.buscar_por_nome', ('%' + termo_busca.lower() + '%',))
         return [dict(row) for row in cursor.fetchall()]
 
+def iterar_pacientes(termo_busca=None, tamanho_lote=500):
+    """
+    Percorre os pacientes por nome (só os que contêm termo_busca, se informado), lendo do banco em
+    lotes para não carregar o cadastro inteiro na memória.
+    """
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        if termo_busca:
+            cursor = _executar(conn, 'pacientes.buscar_por_nome', ('%' + termo_busca.lower() + '%',))
+        else:
+            cursor = _executar(conn, 'pacientes.listar')
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            for row in lote:
+                yield dict(row)
+
 # --- Funções de Médicos ---
 
+@_exige('medicos.gerenciar')
 def adicionar_medico(nome, especialidade, contato):
     """Adiciona um novo médico ao banco de dados."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO medicos (nome_completo, especialidade, contato) VALUES (?, ?, ?)",
-            (nome, especialidade, contato)
-        )
+    with _conectar() as conn:
+        _executar(conn, 'medicos.inserir', (nome, especialidade, contato))
+    _registrar_escrita('medicos')
 
+@_em_cache('medicos')
 def listar_medicos():
     """Retorna uma lista de todos os médicos cadastrados."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nome_completo, especialidade, contato FROM medicos ORDER BY nome_completo")
-        return [dict(row) for row in cursor.fetchall()]
+        return [dict(row) for row in _executar(conn, 'medicos.listar').fetchall()]
 
+@_em_cache('medicos')
 def buscar_medico_por_id(medico_id):
     """Busca um médico específico pelo seu ID."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nome_completo, especialidade, contato FROM medicos WHERE id = ?", (medico_id,))
-        row = cursor.fetchone()
+        row = _executar(conn, 'medicos.buscar_por_id', (medico_id,)).fetchone()
         return dict(row) if row else None
 
+@_exige('medicos.gerenciar')
 def atualizar_medico(medico_id, nome, especialidade, contato):
     """Atualiza os dados de um médico existente."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE medicos SET nome_completo = ?, especialidade = ?, contato = ? WHERE id = ?",
-                       (nome, especialidade, contato, medico_id))
+    with _conectar() as conn:
+        _executar(conn, 'medicos.atualizar', (nome, especialidade, contato, medico_id))
+    _registrar_escrita('medicos')
 
+@_exige('medicos.gerenciar')
 def excluir_medico(medico_id):
     """Exclui um médico do banco de dados."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM medicos WHERE id = ?", (medico_id,))
+    with _conectar() as conn:
+        _executar(conn, 'medicos.desvincular_sessoes', (medico_id,))
+        _executar(conn, 'medicos.excluir', (medico_id,))
+    _registrar_escrita('medicos')
+    _registrar_escrita('sessoes', 'disponibilidade_medico', 'usuarios') # Desvinculadas ou removidas em cascata
+
+@_exige('medicos.gerenciar')
+def excluir_medicos(medico_ids):
+    """Exclui vários médicos numa única transação. Retorna quantos foram excluídos."""
+    parametros = [(medico_id,) for medico_id in medico_ids]
+    with _conectar() as conn:
+        _executar_lote(conn, 'medicos.desvincular_sessoes', parametros)
+        excluidos = _executar_lote(conn, 'medicos.excluir', parametros).rowcount
+    _registrar_escrita('medicos')
+    _registrar_escrita('sessoes', 'disponibilidade_medico', 'usuarios') # Desvinculadas ou removidas em cascata
+    return excluidos
+
+@_em_cache('medicos')
+def _nomes_medicos():
+    """Mapa id -> nome de todos os médicos, usado no lugar do JOIN com medicos nas listas de sessões."""
+    with _conectar() as conn:
+        return dict(_executar(conn, 'medicos.nomes').fetchall())
 
 # --- Funções de Disponibilidade de Médicos ---
 
+@_exige('medicos.gerenciar')
 def adicionar_disponibilidade(medico_id, data_disponivel, hora_inicio, hora_fim):
-    """Adiciona um novo horário de disponibilidade para um médico."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, ?, ?, ?)",
-            (medico_id, data_disponivel, hora_inicio, hora_fim)
-        )
+    """Adiciona um novo horário de disponibilidade para um médico. Retorna o ID do novo horário."""
+    with _conectar() as conn:
+        disponibilidade_id = _executar(conn, 'disponibilidade.inserir', (medico_id, data_disponivel, hora_inicio, hora_fim)).lastrowid
+    _registrar_escrita('disponibilidade_medico', operacao='inserido', registro_id=disponibilidade_id)
+    return disponibilidade_id
 
 def listar_disponibilidade_por_data(medico_id, data_disponivel):
-    """Retorna os horários de um médico para uma data específica."""
-    with sqlite3.connect(DB_FILE) as conn:
+    """Retorna os horários de um médico para uma data específica (YYYY-MM-DD)."""
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, hora_inicio, hora_fim FROM disponibilidade_medico WHERE medico_id = ? AND data_disponivel = ? ORDER BY hora_inicio",
-            (medico_id, data_disponivel)
-        )
+        cursor = _executar(conn, 'disponibilidade.listar_por_dia', (medico_id, dia_numero(data_disponivel)))
         return [dict(row) for row in cursor.fetchall()]
 
+def listar_disponibilidade_intervalo(medico_id, dia_inicio, dia_fim):
+    """
+    Retorna os horários de um médico entre dois dias (números, ver dia_numero), ordenados por dia e
+    horário, com o dia de cada um. Vários meses são lidos de uma vez pelo índice (medico_id, dia_disponivel).
+    """
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'disponibilidade.listar_intervalo', (medico_id, dia_inicio, dia_fim))
+        return [dict(row) for row in cursor.fetchall()]
+
+def buscar_disponibilidade_por_id(disponibilidade_id):
+    """Busca um horário de disponibilidade pelo seu ID (com o médico e o dia), ou None."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        row = _executar(conn, 'disponibilidade.buscar_por_id', (disponibilidade_id,)).fetchone()
+        return dict(row) if row else None
+
 def listar_datas_disponiveis_por_mes(medico_id, ano, mes):
-    """Retorna as datas únicas com disponibilidade para um médico em um dado mês/ano."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        # O formato YYYY-MM% garante que pegamos todos os dias do mês
-        cursor.execute("SELECT DISTINCT data_disponivel FROM disponibilidade_medico WHERE medico_id = ? AND data_disponivel LIKE ?",
-                       (medico_id, f"{ano}-{mes:02d}-%"))
-        return [row[0] for row in cursor.fetchall()]
+    """Retorna as datas únicas (datetime.date) com disponibilidade para um médico em um dado mês/ano."""
+    with _conectar() as conn:
+        # Intervalo de dias inteiros, atendido pelo índice (medico_id, dia_disponivel)
+        cursor = _executar(conn, 'disponibilidade.dias_no_intervalo', (medico_id, *intervalo_mes(ano, mes)))
+        return [data_do_dia(row[0]) for row in cursor.fetchall()]
+
+def resumo_disponibilidade_periodo(data_inicio, data_fim):
+    """
+    Retorna, para cada médico e dia entre data_inicio e data_fim (date ou YYYY-MM-DD, inclusive),
+    os minutos disponíveis, os minutos já agendados e a quantidade de sessões. O dia é
+    retornado como número (ver dia_numero). Disponibilidade e sessões são somadas numa única
+    consulta por intervalo.
+    """
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'disponibilidade.resumo_periodo', intervalo_entre(data_inicio, data_fim) * 2)
+        return [dict(row) for row in cursor.fetchall()]
 
+@_exige('medicos.gerenciar')
 def excluir_disponibilidade(disponibilidade_id):
     """Exclui um horário de disponibilidade específico pelo seu ID."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM disponibilidade_medico WHERE id = ?", (disponibilidade_id,))
+    with _conectar() as conn:
+        _executar(conn, 'disponibilidade.excluir', (disponibilidade_id,))
+    _registrar_escrita('disponibilidade_medico', operacao='excluido', registro_id=disponibilidade_id)
+
+# Operações em lote: uma única transação (executemany) por ação, seja qual for a quantidade de horários
+
+def _ids_inseridos(conn, tabela, quantidade):
+    """Ids das últimas linhas inseridas na tabela por esta transação (AUTOINCREMENT numera em sequência)."""
+    if not quantidade:
+        return []
+    row = _executar(conn, 'sequencia.ultima', (tabela,)).fetchone()
+    if row is None or row[0] is None: # Só acontece se a tabela não for AUTOINCREMENT: os ids não seriam sequenciais
+        raise sqlite3.DatabaseError(f"Tabela {tabela} sem entrada em sqlite_sequence: ids inseridos desconhecidos")
+    ultimo = row[0]
+    return list(range(ultimo - quantidade + 1, ultimo + 1))
+
+@_exige('medicos.gerenciar')
+def excluir_disponibilidades(disponibilidade_ids):
+    """Exclui vários horários de disponibilidade numa única transação. Retorna quantos foram excluídos."""
+    with _conectar() as conn:
+        excluidos = _executar_lote(conn, 'disponibilidade.excluir', [(i,) for i in disponibilidade_ids]).rowcount
+    _registrar_escrita('disponibilidade_medico')
+    return excluidos
+
+@_exige('medicos.gerenciar')
+def excluir_disponibilidade_periodo(medico_id, data_inicio, data_fim):
+    """Exclui todos os horários do médico entre as datas (inclusive) com uma única instrução. Retorna quantos foram excluídos."""
+    with _conectar() as conn:
+        excluidos = _executar(conn, 'disponibilidade.excluir_intervalo', (medico_id, *intervalo_entre(data_inicio, data_fim))).rowcount
+    _registrar_escrita('disponibilidade_medico')
+    return excluidos
+
+@_exige('medicos.gerenciar')
+def copiar_disponibilidades(disponibilidade_ids, data_destino):
+    """Copia os horários indicados (mesmo médico e horário) para a data_destino (YYYY-MM-DD). Retorna os ids das cópias."""
+    disponibilidade_ids = list(disponibilidade_ids)
+    with _conectar() as conn:
+        copiados = _executar_lote(conn, 'disponibilidade.copiar', [(data_destino, i) for i in disponibilidade_ids]).rowcount
+        novos_ids = _ids_inseridos(conn, 'disponibilidade_medico', copiados)
+    _registrar_escrita('disponibilidade_medico')
+    return novos_ids
+
+@_exige('medicos.gerenciar')
+def mover_disponibilidades(disponibilidade_ids, data_destino):
+    """Move os horários indicados para a data_destino (YYYY-MM-DD). Retorna quantos foram movidos."""
+    with _conectar() as conn:
+        movidos = _executar_lote(conn, 'disponibilidade.mover', [(data_destino, i) for i in disponibilidade_ids]).rowcount
+    _registrar_escrita('disponibilidade_medico')
+    return movidos
 
 # --- Funções de Prontuário ---
 
+def buscar_prontuario_por_paciente(paciente_id):
+    """Busca o prontuário de um paciente sem criá-lo. Retorna None se o paciente ainda não tiver prontuário."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        prontuario = _executar(conn, 'prontuarios.buscar_por_paciente', (paciente_id,)).fetchone()
+        if prontuario is None:
+            return None
+        if _auditores:
+            _auditar('visualizado', 'prontuarios', prontuario['id'], paciente_id)
+        return _decifrar(dict(prontuario), _COLUNAS_CIFRADAS_PRONTUARIO)
+
 def buscar_ou_criar_prontuario(paciente_id):
     """
-    Busca o prontuário de um paciente. Se não existir, cria um em branco e o retorna.
+    Busca o prontuário de um paciente. Se não existir, cria um em branco e o retorna; criar
+    exige a permissão 'prontuarios.editar' (só buscar, ver buscar_prontuario_por_paciente, não).
     """
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+
         # Tenta buscar o prontuário
-        cursor.execute("SELECT * FROM prontuarios WHERE paciente_id = ?", (paciente_id,))
-        prontuario = cursor.fetchone()
-        
+        prontuario = _executar(conn, 'prontuarios.buscar_por_paciente', (paciente_id,)).fetchone()
+
         if prontuario:
-            return dict(prontuario)
+            if _auditores:
+                _auditar('visualizado', 'prontuarios', prontuario['id'], paciente_id)
+            return _decifrar(dict(prontuario), _COLUNAS_CIFRADAS_PRONTUARIO)
         else:
             # Se não existir, cria um novo
-            cursor.execute("INSERT INTO prontuarios (paciente_id) VALUES (?)", (paciente_id,))
+            exigir_permissao('prontuarios.editar')
+            _executar(conn, 'prontuarios.inserir', (paciente_id,))
             conn.commit()
+            _registrar_escrita('prontuarios')
             # Busca novamente para retornar o registro completo com o ID
-            cursor.execute("SELECT * FROM prontuarios WHERE paciente_id = ?", (paciente_id,))
-            novo_prontuario = cursor.fetchone()
+            novo_prontuario = _executar(conn, 'prontuarios.buscar_por_paciente', (paciente_id,)).fetchone()
+            if _auditores:
+                _auditar('inserido', 'prontuarios', novo_prontuario['id'], paciente_id)
             return dict(novo_prontuario)
 
+@_exige('prontuarios.editar')
 def atualizar_prontuario(prontuario_id, queixa, historico, anamnese, info_adicional):
     """Atualiza os dados de um prontuário existente."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """UPDATE prontuarios SET queixa_principal = ?, historico_medico_relevante = ?, anamnese = ?, informacoes_adicionais = ? WHERE id = ?""",
-            (queixa, historico, anamnese, info_adicional, prontuario_id)
-        )
+    with _conectar() as conn:
+        textos = _cifrar(conn, _COLUNAS_CIFRADAS_PRONTUARIO, queixa, historico, anamnese, info_adicional)
+        _executar(conn, 'prontuarios.atualizar', (*textos, prontuario_id))
+        row = _executar(conn, 'prontuarios.paciente', (prontuario_id,)).fetchone() if _auditores else None
+    _registrar_escrita('prontuarios')
+    if _auditores:
+        _auditar('atualizado', 'prontuarios', prontuario_id, row[0] if row else None)
+
+# --- Funções de Anexos ---
+
+def _resumo_arquivo(caminho):
+    """Retorna (tamanho, SHA-256 em hexadecimal) de um arquivo, lido em blocos."""
+    resumo, tamanho = hashlib.sha256(), 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_ANEXO), b''):
+            resumo.update(bloco)
+            tamanho += len(bloco)
+    return tamanho, resumo.hexdigest()
+
+@_exige('prontuarios.editar')
+def adicionar_anexo(prontuario_id, caminho_arquivo, nome_arquivo=None, tipo_mime=None):
+    """
+    Anexa um arquivo ao prontuário e retorna o ID do anexo. Se o mesmo conteúdo já estiver guardado
+    (mesmo SHA-256), só os metadados são gravados; senão o arquivo é copiado em blocos para o banco
+    de anexos, na mesma transação dos metadados. Lança ValueError se o arquivo passar de
+    TAMANHO_MAXIMO_ANEXO ou mudar durante a cópia.
+    """
+    tamanho, hash_conteudo = _resumo_arquivo(caminho_arquivo)
+    if tamanho > TAMANHO_MAXIMO_ANEXO:
+        raise ValueError(f"O arquivo tem {tamanho // (1024 * 1024)} MB; o limite é {TAMANHO_MAXIMO_ANEXO // (1024 * 1024)} MB.")
+    nome_arquivo = nome_arquivo or os.path.basename(caminho_arquivo)
+    tipo_mime = tipo_mime or mimetypes.guess_type(nome_arquivo)[0]
+    usuario_id = _sessao_atual.usuario_id if _sessao_atual else None
+    with _conectar() as conn:
+        _anexar_conteudo_anexos(conn, criar=True)
+        if _executar(conn, 'conteudo.buscar_por_hash', (hash_conteudo,)).fetchone() is None:
+            conteudo_id = _executar(conn, 'conteudo.inserir', (hash_conteudo, tamanho, tamanho)).lastrowid
+            resumo = hashlib.sha256()
+            with open(caminho_arquivo, 'rb') as f, conn.blobopen('arquivos', 'dados', conteudo_id, name='conteudo') as blob:
+                for bloco in iter(lambda: f.read(TAMANHO_BLOCO_ANEXO), b''):
+                    if blob.tell() + len(bloco) > tamanho:
+                        raise ValueError("O arquivo foi alterado durante o envio. Tente novamente.")
+                    blob.write(bloco)
+                    resumo.update(bloco)
+            if resumo.hexdigest() != hash_conteudo:
+                raise ValueError("O arquivo foi alterado durante o envio. Tente novamente.")
+        anexo_id = _executar(conn, 'anexos.inserir', (prontuario_id, nome_arquivo, tipo_mime, tamanho, hash_conteudo,
+                                                      time.time(), usuario_id)).lastrowid
+        row = _executar(conn, 'prontuarios.paciente', (prontuario_id,)).fetchone() if _auditores else None
+    _registrar_escrita('anexos', operacao='inserido', registro_id=anexo_id)
+    if _auditores:
+        _auditar('inserido', 'anexos', anexo_id, row[0] if row else None)
+    return anexo_id
+
+def listar_anexos(prontuario_id):
+    """Retorna os metadados dos anexos de um prontuário (sem o conteúdo), do mais recente para o mais antigo."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in _executar(conn, 'anexos.listar_por_prontuario', (prontuario_id,)).fetchall()]
+
+def buscar_anexo_por_id(anexo_id):
+    """Retorna os metadados de um anexo (com o paciente do prontuário), ou None."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        row = _executar(conn, 'anexos.buscar_por_id', (anexo_id,)).fetchone()
+        return dict(row) if row else None
+
+def ler_anexo(anexo_id, tamanho_bloco=TAMANHO_BLOCO_ANEXO):
+    """
+    Retorna um iterador com o conteúdo de um anexo em blocos de até tamanho_bloco bytes, lidos
+    diretamente do BLOB (blobopen), sem carregar o arquivo inteiro na memória. Lança ValueError
+    (antes de ler qualquer bloco) se o anexo não existir.
+    """
+    anexo = buscar_anexo_por_id(anexo_id)
+    conn = _conectar()
+    if anexo is None or not _anexar_conteudo_anexos(conn):
+        raise ValueError("Anexo não encontrado.")
+    row = _executar(conn, 'conteudo.buscar_por_hash', (anexo['hash'],)).fetchone()
+    if row is None:
+        raise ValueError("O conteúdo deste anexo não está no banco de anexos.")
+    if _auditores:
+        _auditar('visualizado', 'anexos', anexo_id, anexo['paciente_id'])
+    def blocos():
+        with conn.blobopen('arquivos', 'dados', row[0], readonly=True, name='conteudo') as blob:
+            yield from iter(lambda: blob.read(tamanho_bloco), b'')
+    return blocos()
+
+def salvar_anexo_em(anexo_id, caminho_destino):
+    """Grava o conteúdo de um anexo no arquivo indicado, em blocos. Retorna o número de bytes gravados."""
+    gravados, blocos = 0, ler_anexo(anexo_id)
+    with open(caminho_destino, 'wb') as f:
+        for bloco in blocos:
+            f.write(bloco)
+            gravados += len(bloco)
+    return gravados
+
+@_exige('prontuarios.editar')
+def excluir_anexo(anexo_id):
+    """Exclui um anexo; o conteúdo também é apagado, na mesma transação, se nenhum outro anexo o usar."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        tem_conteudo = _anexar_conteudo_anexos(conn)
+        anexo = _executar(conn, 'anexos.buscar_por_id', (anexo_id,)).fetchone()
+        if anexo is None:
+            return
+        _executar(conn, 'anexos.excluir', (anexo_id,))
+        if tem_conteudo:
+            _executar(conn, 'conteudo.excluir_sem_anexo', (anexo['hash'], anexo['hash']))
+    _registrar_escrita('anexos', operacao='excluido', registro_id=anexo_id)
+    if _auditores:
+        _auditar('excluido', 'anexos', anexo_id, anexo['paciente_id'])
 
 # --- Funções de Usuários ---
 
-def adicionar_usuario(nome_usuario, senha, nivel_acesso):
-    """Adiciona um novo usuário ao banco de dados. Lança ValueError se o usuário já existir."""
+@_exige('usuarios.gerenciar')
+def adicionar_usuario(nome_usuario, senha, nivel_acesso, medico_id=None):
+    """
+    Adiciona um novo usuário ao banco de dados, opcionalmente vinculado a um médico/terapeuta.
+    Lança ValueError se o usuário já existir. Num banco com criptografia, o usuário recebe uma cópia
+    da chave cifrada pela sua senha; lança AcessoNegado se a sessão atual não tiver a chave.
+    """
     senha_hashed = hash_senha(senha)
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
+    with _conectar() as conn:
+        chave_dados = _chave_do_usuario(conn, senha)
         try:
-            cursor.execute(
-                "INSERT INTO usuarios (nome_usuario, senha_hash, nivel_acesso) VALUES (?, ?, ?)",
-                (nome_usuario, senha_hashed, nivel_acesso)
-            )
+            _executar(conn, 'usuarios.inserir', (nome_usuario, senha_hashed, nivel_acesso, medico_id, chave_dados))
         except sqlite3.IntegrityError:
             raise ValueError(f"O nome de usuário '{nome_usuario}' já existe.")
+    _registrar_escrita('usuarios')
+
+@_exige('usuarios.gerenciar')
+def adicionar_usuarios(usuarios):
+    """
+    Adiciona vários usuários, dados como dicionários com nome_usuario, senha, nivel_acesso e, se
+    houver, medico_id, numa única transação. Retorna quantos foram adicionados. Lança ValueError,
+    sem gravar nenhum, se algum nome se repetir ou já existir.
+    """
+    usuarios = list(usuarios)
+    nomes = [u['nome_usuario'] for u in usuarios]
+    repetidos = sorted({nome for nome in nomes if nomes.count(nome) > 1}) if len(set(nomes)) < len(nomes) else []
+    with _conectar() as conn:
+        repetidos += [row[0] for row in _executar(conn, 'usuarios.existentes', (json.dumps(nomes),)).fetchall()]
+        if repetidos:
+            resto = f" e mais {len(repetidos) - 10}" if len(repetidos) > 10 else ""
+            raise ValueError(f"Nomes de usuário repetidos ou já existentes: {', '.join(repetidos[:10])}{resto}.")
+        linhas = [(u['nome_usuario'], hash_senha(u['senha']), u['nivel_acesso'], u.get('medico_id'), _chave_do_usuario(conn, u['senha']))
+                  for u in usuarios]
+        adicionados = _executar_lote(conn, 'usuarios.inserir', linhas).rowcount
+    _registrar_escrita('usuarios')
+    return adicionados
 
 def listar_usuarios():
     """Retorna uma lista de todos os usuários cadastrados."""
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nome_usuario, nivel_acesso FROM usuarios ORDER BY nome_usuario")
-        return [dict(row) for row in cursor.fetchall()]
+        return [dict(row) for row in _executar(conn, 'usuarios.listar').fetchall()]
+
+@_exige('usuarios.gerenciar')
+def vincular_usuario_medico(usuario_id, medico_id):
+    """Vincula um usuário a um médico/terapeuta (ou remove o vínculo, com medico_id=None)."""
+    with _conectar() as conn:
+        _executar(conn, 'usuarios.vincular_medico', (medico_id, usuario_id))
+    _registrar_escrita('usuarios')
 
+@_exige('usuarios.gerenciar')
 def atualizar_senha_usuario(usuario_id, nova_senha):
-    """Atualiza a senha de um usuário específico."""
+    """
+    Atualiza a senha de um usuário específico. Num banco com criptografia, a cópia da chave do usuário
+    passa a ser cifrada pela nova senha; lança AcessoNegado se a sessão atual não tiver a chave.
+    """
     nova_senha_hashed = hash_senha(nova_senha)
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE usuarios SET senha_hash = ? WHERE id = ?", (nova_senha_hashed, usuario_id))
+    with _conectar() as conn:
+        chave_dados = _chave_do_usuario(conn, nova_senha)
+        _executar(conn, 'usuarios.atualizar_senha', (nova_senha_hashed, chave_dados, usuario_id))
+    _registrar_escrita('usuarios')
 
+@_exige('usuarios.gerenciar')
 def excluir_usuario(usuario_id):
-    """Exclui um usuário do banco de dados."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM usuarios WHERE id = ?", (usuario_id,))
+    """Exclui um usuário do banco de dados e encerra as sessões dele abertas neste processo."""
+    with _conectar() as conn:
+        _executar(conn, 'usuarios.excluir', (usuario_id,))
+    autenticacao.encerrar_sessoes(usuario_id=usuario_id)
+    _registrar_escrita('usuarios')
 
-def verificar_usuario(nome_usuario, senha):
-    """Verifica as credenciais do usuário. Retorna dados do usuário se for válido, senão None."""
+def _autenticar(nome_usuario, senha):
+    """
+    Confere as credenciais e atualiza o controle de tentativas. Retorna (usuário, None) se estiverem
+    corretas, ou (None, motivo), com motivo 'invalido' ou 'bloqueado'. A senha é comparada em tempo
+    constante, inclusive quando o usuário não existe; um usuário bloqueado não é informado se a senha confere.
+    """
     senha_hashed = hash_senha(senha)
-    with sqlite3.connect(DB_FILE) as conn:
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, nome_usuario, nivel_acesso FROM usuarios WHERE nome_usuario = ? AND senha_hash = ?",
-            (nome_usuario, senha_hashed)
-        )
-        usuario = cursor.fetchone()
-        return dict(usuario) if usuario else None
+        row = _executar(conn, 'usuarios.verificar', (nome_usuario,)).fetchone()
+        confere = autenticacao.conferir_senha(senha_hashed, row['senha_hash'] if row else None)
+        if row is None:
+            return None, 'invalido'
+        agora = time.time()
+        if row['bloqueado_ate'] is not None and agora < row['bloqueado_ate']:
+            return None, 'bloqueado'
+        if not confere:
+            tentativas, bloqueado_ate = autenticacao.registrar_falha(row['tentativas_falhas'], agora)
+            _executar(conn, 'usuarios.registrar_tentativa', (tentativas, bloqueado_ate, row['id']))
+            return None, 'bloqueado' if bloqueado_ate else 'invalido'
+        if row['tentativas_falhas'] or row['bloqueado_ate'] is not None:
+            _executar(conn, 'usuarios.registrar_tentativa', (0, None, row['id']))
+    usuario = dict(row)
+    for coluna in ('senha_hash', 'tentativas_falhas', 'bloqueado_ate'):
+        del usuario[coluna]
+    return usuario, None
+
+def verificar_usuario(nome_usuario, senha):
+    """Verifica as credenciais do usuário. Retorna dados do usuário se for válido, senão None (ver iniciar_sessao)."""
+    usuario, _ = _autenticar(nome_usuario, senha)
+    if usuario is not None:
+        del usuario['chave_dados']
+    return usuario
+
+def iniciar_sessao(nome_usuario, senha):
+    """
+    Autentica o usuário e torna a sua sessão a sessão atual deste processo. Retorna a SessaoAcesso.
+    Lança AcessoNegado se as credenciais estiverem erradas ou se o usuário estiver bloqueado por
+    excesso de tentativas (autenticacao.MAX_TENTATIVAS_LOGIN). Num banco com criptografia, a chave
+    dos textos clínicos guardada para o usuário é aberta aqui, com a senha, e fica na sessão.
+    """
+    global _sessao_atual
+    usuario, motivo = _autenticar(nome_usuario, senha)
+    if motivo == 'bloqueado':
+        raise AcessoNegado(f"Usuário bloqueado por excesso de tentativas (o bloqueio dura {autenticacao.BLOQUEIO_SEGUNDOS // 60} "
+                           "minutos). Tente novamente mais tarde ou peça a um administrador que redefina a senha.")
+    if usuario is None:
+        raise AcessoNegado("Nome de usuário ou senha incorretos.")
+    chave_dados = usuario.pop('chave_dados')
+    _sessao_atual = autenticacao.emitir_sessao(usuario)
+    _abrir_chave(chave_dados, senha)
+    return _sessao_atual
 
 # --- Funções de Sessões ---
 
+@_exige('sessoes.editar')
 def adicionar_sessao(paciente_id, medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano):
-    """Adiciona uma nova sessão para um paciente."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """INSERT INTO sessoes (paciente_id, medico_id, data_sessao, hora_inicio_sessao, hora_fim_sessao, 
-                                  resumo_sessao, nivel_evolucao, observacoes_evolucao, plano_terapeutico) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (paciente_id, medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano)
-        )
+    """Adiciona uma nova sessão para um paciente. Lança ConflitoAgendamento se o horário não estiver livre."""
+    with _conectar() as conn:
+        resumo, obs_evolucao, plano = _cifrar(conn, _COLUNAS_CIFRADAS_SESSAO, resumo, obs_evolucao, plano)
+        try:
+            cursor = _executar(conn, 'sessoes.inserir',
+                               (paciente_id, medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano))
+        except sqlite3.IntegrityError as e:
+            conflito = _conflito_de_erro(conn, e, None, medico_id, data, hora_inicio, hora_fim)
+            if conflito:
+                raise conflito from e
+            raise
+        sessao_id = cursor.lastrowid
+    _registrar_escrita('sessoes', operacao='inserido', registro_id=sessao_id, paciente_id=paciente_id)
+    if _auditores:
+        _auditar('inserido', 'sessoes', sessao_id, paciente_id)
 
-def listar_sessoes_por_paciente(paciente_id):
-    """Retorna uma lista de todas as sessões de um paciente, ordenadas pela data mais recente."""
-    with sqlite3.connect(DB_FILE) as conn:
+def listar_sessoes_por_paciente(paciente_id, incluir_arquivo=False):
+    """
+    Retorna uma lista de todas as sessões de um paciente, ordenadas pela data mais recente.
+    Com incluir_arquivo=True, inclui também as sessões do arquivo morto (marcadas com 'arquivada').
+    """
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT s.id, s.data_sessao, s.hora_inicio_sessao, s.nivel_evolucao, s.resumo_sessao, m.nome_completo as medico_nome
-            FROM sessoes s
-            LEFT JOIN medicos m ON s.medico_id = m.id
-            WHERE s.paciente_id = ? 
-            ORDER BY s.data_sessao DESC, s.hora_inicio_sessao DESC
-            """,
-            (paciente_id,)
-        )
-        return [dict(row) for row in cursor.fetchall()]
+        if incluir_arquivo and _anexar_arquivo_morto(conn):
+            cursor = _executar(conn, 'sessoes.listar_por_paciente_com_arquivo', (paciente_id, paciente_id))
+        else:
+            cursor = _executar(conn, 'sessoes.listar_por_paciente', (paciente_id,))
+        sessoes = [dict(row) for row in cursor.fetchall()]
+    # O nome do médico vem do cache em vez de um JOIN a cada abertura da lista; dos textos, só o resumo é decifrado
+    nomes, decifrar = _nomes_medicos(), _decifrador()
+    for sessao in sessoes:
+        sessao['medico_nome'] = nomes.get(sessao['medico_id'])
+        if type(sessao['resumo_sessao']) is bytes:
+            sessao['resumo_sessao'] = decifrar(sessao['resumo_sessao'], 'resumo_sessao')
+    return sessoes
+
+def listar_sessoes_por_ids(sessao_ids):
+    """
+    Retorna as sessões com os ids informados, no mesmo formato de listar_sessoes_por_paciente (com
+    'paciente_id'). Ids de sessões excluídas (ou arquivadas) não aparecem no resultado.
+    """
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'sessoes.listar_por_ids', (json.dumps(list(sessao_ids)),))
+        sessoes = [dict(row) for row in cursor.fetchall()]
+    nomes, decifrar = _nomes_medicos(), _decifrador()
+    for sessao in sessoes:
+        sessao['medico_nome'] = nomes.get(sessao['medico_id'])
+        if type(sessao['resumo_sessao']) is bytes:
+            sessao['resumo_sessao'] = decifrar(sessao['resumo_sessao'], 'resumo_sessao')
+    return sessoes
+
+def iterar_sessoes_paciente(paciente_id, incluir_arquivo=True, tamanho_lote=200):
+    """
+    Percorre todas as sessões de um paciente, da mais antiga para a mais recente, com todos os textos
+    (inclusive as do arquivo morto), lendo do banco em lotes para não carregar o histórico inteiro na memória.
+    A leitura do histórico é auditada uma vez por chamada, como um único evento sem registro_id.
+    """
+    auditado = False
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        if incluir_arquivo and _anexar_arquivo_morto(conn):
+            cursor = _executar(conn, 'sessoes.historico_paciente_com_arquivo', (paciente_id, paciente_id))
+        else:
+            cursor = _executar(conn, 'sessoes.historico_paciente', (paciente_id,))
+        nomes = _nomes_medicos()
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            if not auditado and _auditores:
+                _auditar('visualizado', 'sessoes', None, paciente_id)
+            auditado = True
+            for row in lote:
+                sessao = _decifrar(dict(row), _COLUNAS_CIFRADAS_SESSAO)
+                sessao['medico_nome'] = nomes.get(sessao['medico_id'])
+                yield sessao
 
 def buscar_sessao_por_id(sessao_id):
-    """Busca uma sessão específica com todos os seus detalhes pelo ID."""
-    with sqlite3.connect(DB_FILE) as conn:
+    """Busca uma sessão específica com todos os seus detalhes pelo ID (no arquivo morto, se já foi arquivada)."""
+    with _conectar() as conn:
         conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT data_sessao, hora_inicio_sessao, medico_id, resumo_sessao, nivel_evolucao, 
-                      observacoes_evolucao, plano_terapeutico, hora_fim_sessao
-               FROM sessoes WHERE id = ?""",
-            (sessao_id,)
-        )
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        row = _executar(conn, 'sessoes.buscar_por_id', (sessao_id,)).fetchone()
+        if row is None and _anexar_arquivo_morto(conn):
+            row = _executar(conn, 'arquivo.buscar_sessao_por_id', (sessao_id,)).fetchone()
+        if row and _auditores:
+            _auditar('visualizado', 'sessoes', sessao_id, row['paciente_id'])
+        return _decifrar(dict(row), _COLUNAS_CIFRADAS_SESSAO) if row else None
 
+@_exige('sessoes.editar')
 def atualizar_sessao(sessao_id, medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano):
-    """Atualiza os dados de uma sessão existente."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """UPDATE sessoes SET 
-                    medico_id = ?,
-                    data_sessao = ?, 
-                    hora_inicio_sessao = ?,
-                    hora_fim_sessao = ?,
-                    resumo_sessao = ?, 
-                    nivel_evolucao = ?,
-                    observacoes_evolucao = ?, 
-                    plano_terapeutico = ?
-               WHERE id = ?""",
-            (medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano, sessao_id)
-        )
+    """Atualiza os dados de uma sessão existente. Lança ConflitoAgendamento se o novo horário não estiver livre."""
+    with _conectar() as conn:
+        paciente_id = _paciente_da_sessao(conn, sessao_id)
+        resumo, obs_evolucao, plano = _cifrar(conn, _COLUNAS_CIFRADAS_SESSAO, resumo, obs_evolucao, plano)
+        try:
+            _executar(conn, 'sessoes.atualizar',
+                      (medico_id, data, hora_inicio, hora_fim, resumo, evolucao, obs_evolucao, plano, sessao_id))
+        except sqlite3.IntegrityError as e:
+            conflito = _conflito_de_erro(conn, e, sessao_id, medico_id, data, hora_inicio, hora_fim)
+            if conflito:
+                raise conflito from e
+            raise
+    _registrar_escrita('sessoes', operacao='atualizado', registro_id=sessao_id, paciente_id=paciente_id)
+    if _auditores:
+        _auditar('atualizado', 'sessoes', sessao_id, paciente_id)
 
+@_exige('sessoes.editar')
 def excluir_sessao(sessao_id):
     """Exclui uma sessão do banco de dados."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM sessoes WHERE id = ?", (sessao_id,))
+    with _conectar() as conn:
+        paciente_id = _paciente_da_sessao(conn, sessao_id)
+        _executar(conn, 'sessoes.excluir', (sessao_id,))
+    _registrar_escrita('sessoes', operacao='excluido', registro_id=sessao_id, paciente_id=paciente_id)
+    if _auditores:
+        _auditar('excluido', 'sessoes', sessao_id, paciente_id)
 
-def listar_datas_sessoes():
-    """Retorna uma lista de datas únicas (YYYY-MM-DD) que possuem sessões agendadas."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT data_sessao FROM sessoes")
-        # Retorna uma lista de strings de data, ex: ['2023-10-26', '2023-10-27']
-        return [row[0] for row in cursor.fetchall()]
+# Operações em lote: uma única transação (executemany) por ação. Se uma das sessões entrar em
+# conflito de agenda, nenhuma é gravada e a ação lança ConflitoAgendamento.
+
+def _pacientes_das_sessoes(conn, sessao_ids):
+    """Mapa sessão -> paciente, lido antes da escrita (para o cache por paciente e a auditoria)."""
+    return dict(_executar(conn, 'sessoes.pacientes_por_ids', (json.dumps(list(sessao_ids)),)).fetchall())
+
+def _registrar_escrita_sessoes(pacientes, acao):
+    """Invalida o cache de sessões (só do paciente, se for um só) e audita cada sessão afetada."""
+    unico = set(pacientes.values())
+    _registrar_escrita('sessoes', paciente_id=unico.pop() if len(unico) == 1 else None)
+    if _auditores:
+        for sessao_id, paciente_id in pacientes.items():
+            _auditar(acao, 'sessoes', sessao_id, paciente_id)
+
+def _executar_lote_agenda(conn, nome, lista_parametros, data_destino=None, copia=False):
+    """
+    Executa o lote de escritas de sessões (o último parâmetro de cada linha é o id da sessão de origem).
+    Se um gatilho de agenda recusar uma linha, desfaz o lote e o refaz linha a linha até a recusada, para
+    lançar ConflitoAgendamento com o médico, o horário e as sessões conflitantes dela. Sem data_destino,
+    a data de destino é a da sessão deslocada pelo primeiro parâmetro (como em 'sessoes.deslocar').
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("SAVEPOINT lote_agenda")
+    try:
+        cursor = _executar_lote(conn, nome, lista_parametros)
+    except sqlite3.IntegrityError as e:
+        if str(e) not in ConflitoAgendamento.MENSAGENS:
+            raise
+        conn.execute("ROLLBACK TO lote_agenda")
+        for parametros in lista_parametros:
+            try:
+                _executar(conn, nome, parametros)
+            except sqlite3.IntegrityError as erro:
+                sessao_id = parametros[-1]
+                row = _executar(conn, 'sessoes.buscar_por_id', (sessao_id,)).fetchone()
+                data, hora_inicio, medico_id, hora_fim = row[0], row[1], row[2], row[7]
+                if data_destino is None:
+                    data = conn.execute("SELECT date(?, ?)", (data, parametros[0])).fetchone()[0]
+                else:
+                    data = data_destino
+                conflito = _conflito_de_erro(conn, erro, None if copia else sessao_id, medico_id, data, hora_inicio, hora_fim)
+                raise (conflito or erro) from e
+        raise
+    conn.execute("RELEASE lote_agenda")
+    return cursor
+
+@_exige('sessoes.editar')
+def excluir_sessoes(sessao_ids):
+    """Exclui várias sessões numa única transação. Retorna quantas foram excluídas."""
+    sessao_ids = list(sessao_ids)
+    with _conectar() as conn:
+        pacientes = _pacientes_das_sessoes(conn, sessao_ids)
+        excluidas = _executar_lote(conn, 'sessoes.excluir', [(i,) for i in sessao_ids]).rowcount
+    _registrar_escrita_sessoes(pacientes, 'excluido')
+    return excluidas
+
+@_exige('sessoes.editar')
+def copiar_sessoes(sessao_ids, data_destino):
+    """
+    Agenda na data_destino (YYYY-MM-DD) uma cópia de cada sessão indicada, com o mesmo paciente,
+    médico e horário e sem os registros clínicos. Retorna os ids das novas sessões.
+    """
+    sessao_ids = list(sessao_ids)
+    with _conectar() as conn:
+        pacientes = _pacientes_das_sessoes(conn, sessao_ids)
+        copiadas = _executar_lote_agenda(conn, 'sessoes.copiar', [(data_destino, i) for i in sessao_ids],
+                                         data_destino, copia=True).rowcount
+        novos_ids = _ids_inseridos(conn, 'sessoes', copiadas)
+    pacientes_novas = {novo: pacientes.get(origem) for novo, origem in zip(novos_ids, [i for i in sessao_ids if i in pacientes])}
+    _registrar_escrita_sessoes(pacientes_novas, 'inserido')
+    return novos_ids
+
+@_exige('sessoes.editar')
+def mover_sessoes(sessao_ids, data_destino):
+    """Remarca as sessões indicadas para a data_destino (YYYY-MM-DD), mantendo os horários. Retorna quantas foram movidas."""
+    sessao_ids = list(sessao_ids)
+    with _conectar() as conn:
+        pacientes = _pacientes_das_sessoes(conn, sessao_ids)
+        movidas = _executar_lote_agenda(conn, 'sessoes.mover', [(data_destino, i) for i in sessao_ids], data_destino).rowcount
+    _registrar_escrita_sessoes(pacientes, 'atualizado')
+    return movidas
+
+@_exige('sessoes.editar')
+def deslocar_agenda_medico(medico_id, data_inicio, data_fim, dias, com_disponibilidade=True):
+    """
+    Remarca as sessões do médico entre data_inicio e data_fim (inclusive) para dias depois (ou antes,
+    se negativo), mantendo os horários, e, com com_disponibilidade, desloca também os horários de
+    disponibilidade do período, tudo numa única transação. Retorna {'sessoes': n, 'disponibilidades': n}.
+    Lança ConflitoAgendamento, sem gravar nada, se alguma sessão não couber na nova data.
+    """
+    if com_disponibilidade:
+        exigir_permissao('medicos.gerenciar')
+    # As mais distantes no sentido do deslocamento vão primeiro: nenhuma cai sobre outra que ainda vai sair do lugar
+    periodo, ordem, deslocamento = intervalo_entre(data_inicio, data_fim), -1 if dias > 0 else 1, f"{dias:+d} days"
+    with _conectar() as conn:
+        disponibilidades = 0
+        if com_disponibilidade:
+            ids = [row[0] for row in _executar(conn, 'disponibilidade.do_medico_no_periodo', (medico_id, *periodo, ordem))]
+            disponibilidades = _executar_lote(conn, 'disponibilidade.deslocar', [(deslocamento, i) for i in ids]).rowcount
+        pacientes = dict(_executar(conn, 'sessoes.do_medico_no_periodo', (medico_id, *periodo, ordem)).fetchall())
+        sessoes = _executar_lote_agenda(conn, 'sessoes.deslocar', [(deslocamento, i) for i in pacientes]).rowcount
+    if com_disponibilidade:
+        _registrar_escrita('disponibilidade_medico')
+    _registrar_escrita_sessoes(pacientes, 'atualizado')
+    return {'sessoes': sessoes, 'disponibilidades': disponibilidades}
+
+def listar_carteira_medico(medico_id):
+    """
+    Retorna os pacientes atendidos pelo médico, por nome, cada um com o número de sessões, a primeira,
+    a última já realizada e a próxima agendada (datas YYYY-MM-DD, ou None).
+    """
+    hoje = dia_numero(date.today())
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in _executar(conn, 'sessoes.carteira_medico', (hoje, hoje, medico_id)).fetchall()]
+
+def _paciente_da_sessao(conn, sessao_id):
+    """Paciente de uma sessão, lido antes da escrita para invalidar só os dados em cache desse paciente."""
+    row = _executar(conn, 'sessoes.paciente', (sessao_id,)).fetchone()
+    return row[0] if row else None
+
+def listar_datas_sessoes(dia_inicio=None, dia_fim=None):
+    """
+    Retorna as datas únicas (datetime.date) que possuem sessões agendadas. Se um intervalo
+    de dias for informado (ver intervalo_mes/intervalo_semana), busca apenas nesse intervalo.
+    """
+    with _conectar() as conn:
+        if dia_inicio is None:
+            cursor = _executar(conn, 'sessoes.dias')
+        else:
+            cursor = _executar(conn, 'sessoes.dias_no_intervalo', (dia_inicio, dia_fim))
+        return [data_do_dia(row[0]) for row in cursor.fetchall()]
+
+def agenda_medico(medico_id, data_inicio, data_fim):
+    """
+    Retorna, numa única consulta, as sessões (com o nome do paciente) e os horários de disponibilidade
+    de um médico entre duas datas, ordenados por dia e horário. Cada linha tem 'tipo' ('sessao' ou
+    'disponivel'), 'dia' (ver dia_numero), 'minuto_inicio' e 'minuto_fim'.
+    """
+    dia_inicio, dia_fim = intervalo_entre(data_inicio, data_fim)
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'agenda.medico', (medico_id, dia_inicio, dia_fim, medico_id, dia_inicio, dia_fim))
+        return [dict(row) for row in cursor.fetchall()]
+
+# --- Lista de Espera ---
+
+@_exige('sessoes.editar')
+def adicionar_lista_espera(paciente_id, medico_id, especialidade, hora_inicio, hora_fim,
+                           dias_semana=TODOS_OS_DIAS, duracao_minutos=DURACAO_PADRAO_ESPERA, prioridade=0, observacao=None):
+    """
+    Coloca um paciente na lista de espera de um médico ou, sem médico, de qualquer médico da
+    especialidade. dias_semana são os dias aceitos em bits (ver TODOS_OS_DIAS) e hora_inicio/hora_fim
+    (HH:MM) a janela em que o paciente pode ser atendido. Retorna o ID da entrada.
+    Lança ValueError se os horários não estiverem no formato HH:MM ou se o fim não vier depois do início.
+    """
+    with _conectar() as conn:
+        try:
+            espera_id = _executar(conn, 'lista_espera.inserir',
+                                  (paciente_id, medico_id, especialidade, dias_semana, hora_inicio, hora_fim,
+                                   duracao_minutos, prioridade, observacao, time.time())).lastrowid
+        except sqlite3.IntegrityError as e:
+            if str(e) == 'horario_invalido':
+                raise ValueError(f"Janela de horário inválida: {hora_inicio} a {hora_fim} (use HH:MM, com o fim depois do início).") from e
+            raise
+    _registrar_escrita('lista_espera', operacao='inserido', registro_id=espera_id, paciente_id=paciente_id)
+    return espera_id
+
+def listar_lista_espera():
+    """Retorna as entradas da lista de espera com os nomes do paciente e do médico, por prioridade e antiguidade."""
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in _executar(conn, 'lista_espera.listar').fetchall()]
+
+@_exige('sessoes.editar')
+def excluir_da_lista_espera(espera_id):
+    """Tira uma entrada da lista de espera."""
+    with _conectar() as conn:
+        row = _executar(conn, 'lista_espera.paciente', (espera_id,)).fetchone()
+        _executar(conn, 'lista_espera.excluir', (espera_id,))
+    _registrar_escrita('lista_espera', operacao='excluido', registro_id=espera_id, paciente_id=row[0] if row else None)
+
+def candidatos_lista_espera(medico_id, data, minuto_inicio, minuto_fim, limite=10):
+    """
+    Retorna as entradas da lista de espera que cabem no horário livre [minuto_inicio, minuto_fim) do
+    médico na data (date ou YYYY-MM-DD): do próprio médico ou da especialidade dele, que aceitam o
+    dia da semana, cuja janela preferida tem ao menos duracao_minutos dentro do horário livre e cujo
+    paciente ainda não tem sessão no dia. Ordenadas por prioridade e antiguidade na lista.
+    """
+    dia = dia_numero(data)
+    dia_semana = 1 << data_do_dia(dia).weekday()
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'lista_espera.candidatos',
+                           (medico_id, minuto_fim, minuto_inicio, medico_id, minuto_fim, minuto_inicio,
+                            dia_semana, minuto_fim, minuto_inicio, dia, limite))
+        return [dict(row) for row in cursor.fetchall()]
+
+@_exige('sessoes.editar')
+def agendar_da_lista_espera(espera_id, medico_id, data, hora_inicio, hora_fim):
+    """
+    Agenda a sessão do paciente de uma entrada da lista de espera e tira a entrada da lista, na mesma
+    transação. Retorna o ID da sessão. Lança ConflitoAgendamento se o horário não estiver mais livre
+    e ValueError se a entrada já saiu da lista.
+    """
+    with _conectar() as conn:
+        row = _executar(conn, 'lista_espera.paciente', (espera_id,)).fetchone()
+        if row is None:
+            raise ValueError("O paciente não está mais na lista de espera.")
+        paciente_id = row[0]
+        try:
+            sessao_id = _executar(conn, 'sessoes.inserir',
+                                  (paciente_id, medico_id, data, hora_inicio, hora_fim, None, None, None, None)).lastrowid
+        except sqlite3.IntegrityError as e:
+            conflito = _conflito_de_erro(conn, e, None, medico_id, data, hora_inicio, hora_fim)
+            if conflito:
+                raise conflito from e
+            raise
+        _executar(conn, 'lista_espera.excluir', (espera_id,))
+    _registrar_escrita('sessoes', operacao='inserido', registro_id=sessao_id, paciente_id=paciente_id)
+    _registrar_escrita('lista_espera', operacao='excluido', registro_id=espera_id, paciente_id=paciente_id)
+    if _auditores:
+        _auditar('inserido', 'sessoes', sessao_id, paciente_id)
+    return sessao_id
+
+# --- Lembretes de Sessão ---
+
+def _minuto_absoluto(momento):
+    """Minutos desde o início do dia 0 (ver dia_numero) até o datetime indicado."""
+    return dia_numero(momento.date()) * 1440 + momento.hour * 60 + momento.minute
+
+def listar_proximas_sessoes(inicio, fim):
+    """
+    Retorna as sessões com horário marcado que começam entre inicio e fim (datetime, inclusive), com
+    os nomes do paciente, do responsável e do médico, em ordem de início. É uma única consulta, sobre
+    a faixa de dias do índice (dia_sessao, medico_id).
+    """
+    dia_inicio, dia_fim = intervalo_entre(inicio.date(), fim.date())
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, 'sessoes.proximas', (dia_inicio, dia_fim, _minuto_absoluto(inicio), _minuto_absoluto(fim)))
+        return [dict(row) for row in cursor.fetchall()]
+
+@_exige('sessoes.editar')
+def gerar_lembretes(agora=None, janela_horas=JANELA_LEMBRETES_HORAS, antecedencia_horas=ANTECEDENCIA_LEMBRETE_HORAS):
+    """
+    Coloca na fila um lembrete para cada sessão que começa nas próximas janela_horas, a ser enviado
+    antecedencia_horas antes dela (agora é um time.time(); por padrão, o momento atual). Uma sessão
+    que já está na fila só volta a 'pendente' se a data ou o horário mudaram. Retorna quantos
+    lembretes foram criados ou reagendados.
+    """
+    agora = time.time() if agora is None else agora
+    inicio = datetime.fromtimestamp(agora)
+    sessoes = listar_proximas_sessoes(inicio, inicio + timedelta(hours=janela_horas))
+    if not sessoes:
+        return 0
+    with _conectar() as conn:
+        na_fila = {row[0]: row[1:] for row in _executar(conn, 'lembretes.na_fila', (json.dumps([s['id'] for s in sessoes]),))}
+    linhas = []
+    for sessao in sessoes:
+        if na_fila.get(sessao['id']) == (sessao['data_sessao'], sessao['hora_inicio_sessao']):
+            continue # Já está na fila com a mesma data e horário: regravar só invalidaria os caches
+        sessao_em = (datetime.combine(data_do_dia(sessao['dia_sessao']), datetime.min.time())
+                     + timedelta(minutes=sessao['minuto_inicio_sessao'])).timestamp()
+        linhas.append((sessao['id'], sessao['data_sessao'], sessao['hora_inicio_sessao'], sessao_em,
+                       sessao_em - antecedencia_horas * 3600, agora))
+    if not linhas:
+        return 0
+    with _conectar() as conn:
+        gerados = _executar_lote(conn, 'lembretes.gerar', linhas).rowcount
+    if gerados:
+        _registrar_escrita('lembretes')
+    return gerados
+
+@_exige('sessoes.editar')
+def reservar_lembretes(limite, agora=None):
+    """
+    Reserva até limite lembretes já vencidos para envio e os retorna com os dados da sessão (nomes do
+    paciente, do responsável e do médico, data e horários), na ordem em que vencem. A reserva vale
+    por RESERVA_LEMBRETES_S: se quem reservou parar antes de concluir_lembretes, o lembrete pode ser
+    reservado de novo. Lembretes de sessões que já começaram passam a 'expirado'.
+    """
+    agora = time.time() if agora is None else agora
+    reserva = os.urandom(8).hex()
+    with _conectar() as conn:
+        if not _executar(conn, 'lembretes.ha_vencidos', (agora, agora, agora)).fetchone()[0]:
+            return []
+        _executar(conn, 'lembretes.expirar', (agora, agora))
+        _executar(conn, 'lembretes.reservar', (reserva, agora + RESERVA_LEMBRETES_S, agora, agora, limite))
+        conn.row_factory = sqlite3.Row
+        lembretes = [dict(row) for row in _executar(conn, 'lembretes.reservados', (reserva,)).fetchall()]
+    _registrar_escrita('lembretes')
+    return lembretes
+
+@_exige('sessoes.editar')
+def concluir_lembretes(enviados, falhas, agora=None):
+    """
+    Registra, numa única transação, o resultado do envio de lembretes reservados: enviados (lista de
+    lembretes) e falhas (lista de (lembrete, mensagem de erro)). Um lembrete que falhou volta para a
+    fila depois de ESPERA_NOVA_TENTATIVA_S por tentativa, até MAX_TENTATIVAS_LEMBRETE. Resultados de
+    uma reserva vencida, que outro processador pode ter retomado, são ignorados.
+    """
+    if not enviados and not falhas:
+        return
+    agora = time.time() if agora is None else agora
+    with _conectar() as conn:
+        _executar_lote(conn, 'lembretes.enviado', [(agora, l['id'], l['reserva']) for l in enviados])
+        _executar_lote(conn, 'lembretes.falhou', [(MAX_TENTATIVAS_LEMBRETE, agora, ESPERA_NOVA_TENTATIVA_S, erro, l['id'], l['reserva'])
+                                                  for l, erro in falhas])
+    _registrar_escrita('lembretes')
+
+def resumo_lembretes():
+    """Retorna quantos lembretes há em cada estado: {'pendente': n, 'enviado': n, ...}."""
+    with _conectar() as conn:
+        return dict(_executar(conn, 'lembretes.resumo').fetchall())
+
+# --- Linha do Tempo de Evolução ---
+
+def _indice_periodo(agrupamento, dia):
+    """Mesmo índice de _SQL_PERIODO, calculado em Python."""
+    if agrupamento == 'semana':
+        return (dia - 1) // 7
+    data = data_do_dia(dia)
+    return data.year * 12 + data.month - 1
+
+@_em_cache('sessoes', por_paciente=True)
+def evolucao_paciente(paciente_id, agrupamento='mes', max_pontos=None):
+    """
+    Linha do tempo do nível de evolução de um paciente, inclusive das sessões do arquivo morto,
+    agregada por semana ou por mês. Se houver mais períodos que max_pontos (por exemplo, a largura
+    do gráfico em pixels), cada ponto junta vários períodos consecutivos.
+
+    Retorna {'agrupamento', 'periodos_por_ponto', 'pontos'}. Cada ponto tem 'inicio' e 'fim'
+    (datas da primeira e da última sessão), 'sessoes', 'nivel_inicial', 'nivel_final', 'nivel_min',
+    'nivel_max', 'nivel_medio' (posições em NIVEIS_EVOLUCAO) e 'subidas'/'descidas' (mudanças de
+    nível em relação à sessão anterior). Sessões sem nível registrado não entram na linha do tempo.
+    """
+    if agrupamento not in _SQL_PERIODO:
+        raise ValueError(f"Agrupamento inválido: '{agrupamento}'. Use 'semana' ou 'mes'.")
+    with _conectar() as conn:
+        sufixo, parametros = '', [paciente_id]
+        if _anexar_arquivo_morto(conn):
+            sufixo, parametros = '_com_arquivo', [paciente_id, paciente_id]
+        dia_min, dia_max = _executar(conn, f'evolucao.intervalo{sufixo}', parametros).fetchone()
+        if dia_min is None:
+            return {'agrupamento': agrupamento, 'periodos_por_ponto': 1, 'pontos': []}
+
+        # Reduz o número de pontos à largura disponível juntando períodos vizinhos
+        primeiro_periodo = _indice_periodo(agrupamento, dia_min)
+        total_periodos = _indice_periodo(agrupamento, dia_max) - primeiro_periodo + 1
+        periodos_por_ponto = ceil(total_periodos / max_pontos) if max_pontos and total_periodos > max_pontos else 1
+
+        conn.row_factory = sqlite3.Row
+        cursor = _executar(conn, f'evolucao.pontos_{agrupamento}{sufixo}', [primeiro_periodo, periodos_por_ponto] + parametros)
+        pontos = []
+        for row in cursor.fetchall():
+            ponto = dict(row)
+            ponto['inicio'], ponto['fim'] = data_do_dia(ponto.pop('dia_inicio')), data_do_dia(ponto.pop('dia_fim'))
+            pontos.append(ponto)
+    return {'agrupamento': agrupamento, 'periodos_por_ponto': periodos_por_ponto, 'pontos': pontos}
 
 def listar_sessoes_por_medico_e_data(medico_id, data_db):
     """Retorna os horários de início das sessões já agendadas para um médico em uma data."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT hora_inicio_sessao FROM sessoes WHERE medico_id = ? AND data_sessao = ?",
-            (medico_id, data_db)
-        )
-        return [row[0] for row in cursor.fetchall()]
\ No newline at end of file
+    with _conectar() as conn:
+        cursor = _executar(conn, 'sessoes.horarios_medico_no_dia', (medico_id, dia_numero(data_db)))
+        return [row[0] for row in cursor.fetchall()]
+
+# --- Verificação de Integridade ---
+
+def verificar_integridade(exemplos=5):
+    """
+    Procura problemas de integridade no banco atual (ver _VERIFICACOES_INTEGRIDADE): registros órfãos,
+    datas e horários malformados, disponibilidades sobrepostas e pacientes sem prontuário. Cada tabela
+    é lida uma única vez. Retorna {problema: {'quantidade', 'descricao', 'exemplos'}}, com até
+    'exemplos' ids das linhas afetadas.
+    """
+    resultado = {}
+    with _conectar() as conn:
+        conn.row_factory = sqlite3.Row
+        for tabela in _ORIGENS_INTEGRIDADE:
+            contagens = _executar(conn, f'integridade.contar.{tabela}').fetchone()
+            for nome in contagens.keys():
+                quantidade = contagens[nome]
+                ids = []
+                if quantidade and exemplos:
+                    ids = [row[0] for row in _executar(conn, f'integridade.exemplos.{nome}', (exemplos,))]
+                resultado[nome] = {'quantidade': quantidade, 'descricao': _VERIFICACOES_INTEGRIDADE[nome][2], 'exemplos': ids}
+    # Na ordem em que os problemas foram declarados, que é a ordem do reparo
+    return {nome: resultado[nome] for nome in _VERIFICACOES_INTEGRIDADE}
+
+@_exige('banco.manutencao')
+def reparar_integridade():
+    """
+    Corrige, numa única transação e com comandos sobre conjuntos, os problemas que têm reparo seguro
+    (ver a descrição de cada um em verificar_integridade). Retorna {problema: linhas alteradas}.
+    """
+    alteradas = {}
+    with _conectar() as conn:
+        for nome, (_, _, _, reparos) in _VERIFICACOES_INTEGRIDADE.items():
+            if reparos:
+                alteradas[nome] = sum(_executar(conn, f'integridade.reparar.{nome}.{passo}').rowcount
+                                      for passo in range(1, len(reparos) + 1))
+        _executar(conn, 'alteracoes.podar', (LOG_ALTERACOES_MANTER,))
+    _registrar_escrita('sessoes', 'disponibilidade_medico', 'prontuarios', 'pacientes', 'usuarios')
+    return alteradas
@@ -0,0 +1,243 @@
+from datetime import date, datetime
+
+# --- Funções de Formatação ---
+# Este módulo não importa tkinter, para que a preparação dos dados das janelas
+# possa ser usada (e medida) fora da interface gráfica.
+
+def formatar_data_para_db(data_str):
+    """Converte data de DD/MM/YYYY para YYYY-MM-DD para salvar no DB."""
+    if not data_str:
+        return None
+    try:
+        # Converte para o formato do banco de dados, que permite ordenação correta
+        return datetime.strptime(data_str, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return None # Retorna None se o formato da data for inválido
+
+def formatar_data_para_exibicao(data_str):
+    """Converte data de YYYY-MM-DD para DD/MM/YYYY para exibir na UI."""
+    if not data_str:
+        return ""
+    try:
+        # Converte de volta para o formato amigável para o usuário
+        return datetime.strptime(data_str, '%Y-%m-%d').strftime('%d/%m/%Y')
+    except ValueError:
+        return data_str # Se já estiver em outro formato, retorna o original
+
+def calcular_idade(data_nasc_db):
+    """Calcula a idade a partir da data de nascimento no formato YYYY-MM-DD."""
+    if not data_nasc_db:
+        return ""
+    try:
+        nascimento = datetime.strptime(data_nasc_db, '%Y-%m-%d').date()
+        hoje = date.today()
+        # Calcula a idade de forma precisa
+        idade = hoje.year - nascimento.year - ((hoje.month, hoje.day) < (nascimento.month, nascimento.day))
+        return idade
+    except (ValueError, TypeError):
+        return "" # Retorna vazio se a data for inválida
+
+def formatar_dia_para_exibicao(dia, data_str=None):
+    """
+    Converte o número do dia (coluna ordenável do banco) para DD/MM/YYYY sem passar por strptime.
+    Se o dia for NULL (data malformada no banco), exibe o texto original.
+    """
+    if dia is None:
+        return data_str or ""
+    data = date.fromordinal(dia)
+    return f"{data.day:02d}/{data.month:02d}/{data.year}"
+
+def calcular_idade_por_dia(dia_nasc):
+    """Calcula a idade a partir do número do dia de nascimento (coluna ordenável do banco)."""
+    if dia_nasc is None:
+        return ""
+    nascimento = date.fromordinal(dia_nasc)
+    hoje = date.today()
+    return hoje.year - nascimento.year - ((hoje.month, hoje.day) < (nascimento.month, nascimento.day))
+
+# --- Preparação de Dados para as Janelas ---
+
+def preparar_linhas_pacientes(pacientes):
+    """Monta as tuplas exibidas na tabela de pacientes, na ordem das colunas da Treeview."""
+    linhas = []
+    for paciente in pacientes:
+        idade = calcular_idade_por_dia(paciente['dia_nascimento'])
+        data_nasc_exibicao = formatar_dia_para_exibicao(paciente['dia_nascimento'], paciente['data_nascimento'])
+        linhas.append((paciente['id'], paciente['nome_completo'], idade, data_nasc_exibicao, paciente['nome_responsavel']))
+    return linhas
+
+def preparar_linhas_sessoes(sessoes):
+    """Monta as tuplas exibidas na tabela de sessões de um paciente."""
+    linhas = []
+    for sessao in sessoes:
+        data_exibicao = formatar_dia_para_exibicao(sessao['dia_sessao'], sessao['data_sessao'])
+        # Limita o resumo para exibição na tabela e remove quebras de linha
+        resumo_original = sessao['resumo_sessao'] or ""
+        resumo_curto = (resumo_original[:75] + '...') if len(resumo_original) > 75 else resumo_original
+        linhas.append((sessao['id'], data_exibicao, sessao['hora_inicio_sessao'] or '', sessao['medico_nome'] or 'Não definido',
+                       sessao['nivel_evolucao'], resumo_curto.replace('\n', ' ')))
+    return linhas
+
+def preparar_datas_calendario(datas_str):
+    """
+    Converte as datas YYYY-MM-DD em objetos date, ignorando valores inválidos.
+    Datas que já vêm do banco como date (colunas ordenáveis) são usadas diretamente.
+    """
+    datas = []
+    for data_str in datas_str:
+        if isinstance(data_str, date):
+            datas.append(data_str)
+            continue
+        try:
+            datas.append(datetime.strptime(data_str, '%Y-%m-%d').date())
+        except (ValueError, TypeError):
+            continue # Ignora datas em formato inválido
+    return datas
+
+def formatar_minutos(minutos):
+    """Formata uma duração em minutos como horas legíveis, ex.: 90 -> '1h30', 120 -> '2h'."""
+    horas, resto = divmod(int(minutos or 0), 60)
+    return f"{horas}h{resto:02d}" if resto else f"{horas}h"
+
+def preparar_grade_disponibilidade(medicos, resumo, dias):
+    """
+    Monta as linhas da grade médicos x dias da visão geral da agenda.
+    Cada célula mostra 'agendado / disponível'; dias sem agenda ficam vazios.
+    """
+    # Indexa o resumo por (medico_id, dia) numa única passada
+    por_celula = {(r['medico_id'], r['dia']): r for r in resumo}
+    numeros_dias = [dia.toordinal() for dia in dias]
+    linhas = []
+    for medico in medicos:
+        valores = [medico['nome_completo']]
+        total_disp, total_agend = 0, 0
+        for numero_dia in numeros_dias:
+            celula = por_celula.get((medico['id'], numero_dia))
+            if celula is None:
+                valores.append("")
+                continue
+            total_disp += celula['minutos_disponiveis']
+            total_agend += celula['minutos_agendados']
+            valores.append(f"{formatar_minutos(celula['minutos_agendados'])} / {formatar_minutos(celula['minutos_disponiveis'])}")
+        valores.append(f"{formatar_minutos(total_agend)} / {formatar_minutos(total_disp)}")
+        linhas.append((medico['id'], tuple(valores)))
+    return linhas
+
+DIAS_SEMANA_ABREVIADOS = ('Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom')
+
+def formatar_minuto_do_dia(minuto):
+    """Converte minutos desde a meia-noite para HH:MM, ex.: 510 -> '08:30'."""
+    if minuto is None:
+        return ""
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+def preparar_linhas_agenda(agenda, dias):
+    """
+    Monta as linhas da agenda do terapeuta (ver agenda.montar_agenda), na ordem dos dias.
+    Retorna tuplas (iid, valores, tags): sessões usam o iid 'sessao_<id>' e horários livres a tag 'livre'.
+    """
+    linhas = []
+    for dia in dias:
+        numero_dia = dia.toordinal()
+        rotulo_dia = f"{DIAS_SEMANA_ABREVIADOS[dia.weekday()]} {dia.day:02d}/{dia.month:02d}"
+        for posicao, item in enumerate(agenda.get(numero_dia, [])):
+            horario = f"{formatar_minuto_do_dia(item['minuto_inicio'])}–{formatar_minuto_do_dia(item['minuto_fim'])}"
+            if item['tipo'] == 'sessao':
+                linhas.append((f"sessao_{item['sessao_id']}",
+                               (rotulo_dia, horario, item['paciente_nome'] or 'Paciente não encontrado', item['nivel_evolucao'] or ''),
+                               ('sessao',)))
+            else:
+                duracao = formatar_minutos(item['minuto_fim'] - item['minuto_inicio'])
+                linhas.append((f"livre_{numero_dia}_{posicao}", (rotulo_dia, horario, f"Horário livre ({duracao})", ''), ('livre',)))
+    return linhas
+
+def preparar_grafico_evolucao(pontos, largura, altura, margem=40):
+    """
+    Converte os pontos de database.evolucao_paciente em coordenadas do gráfico da linha do tempo.
+    O eixo x é proporcional ao tempo e o eixo y vai do nível 1 (embaixo) ao 4 (em cima).
+    Retorna {'linha': [x0, y0, x1, y1, ...] do nível médio, 'faixas': [(x, y_min, y_max), ...],
+    'marcas': [(x, y, 'subiu' | 'desceu' | 'manteve'), ...] do nível final de cada ponto,
+    'eixo_y': [(y, nivel), ...], 'eixo_x': [(x, 'MM/AAAA'), ...]}.
+    """
+    grafico = {'linha': [], 'faixas': [], 'marcas': [], 'eixo_y': [], 'eixo_x': []}
+    util_x, util_y = max(largura - 2 * margem, 1), max(altura - 2 * margem, 1)
+
+    def y_do_nivel(nivel):
+        return margem + util_y * (4 - nivel) / 3
+
+    grafico['eixo_y'] = [(y_do_nivel(nivel), nivel) for nivel in (1, 2, 3, 4)]
+    if not pontos:
+        return grafico
+    primeiro_dia, ultimo_dia = pontos[0]['inicio'].toordinal(), pontos[-1]['fim'].toordinal()
+    intervalo = max(ultimo_dia - primeiro_dia, 1)
+
+    def x_do_dia(dia):
+        return margem + util_x * (dia - primeiro_dia) / intervalo
+
+    nivel_anterior = None
+    for ponto in pontos:
+        x = x_do_dia((ponto['inicio'].toordinal() + ponto['fim'].toordinal()) / 2)
+        grafico['linha'] += [x, y_do_nivel(ponto['nivel_medio'])]
+        grafico['faixas'].append((x, y_do_nivel(ponto['nivel_min']), y_do_nivel(ponto['nivel_max'])))
+        if nivel_anterior is None or ponto['nivel_final'] == nivel_anterior:
+            tendencia = 'manteve'
+        else:
+            tendencia = 'subiu' if ponto['nivel_final'] > nivel_anterior else 'desceu'
+        grafico['marcas'].append((x, y_do_nivel(ponto['nivel_final']), tendencia))
+        nivel_anterior = ponto['nivel_final']
+
+    # Até 6 rótulos de mês/ano no eixo x, igualmente espaçados
+    quantidade = min(6, len(pontos))
+    for i in range(quantidade):
+        dia = primeiro_dia + round(intervalo * i / max(quantidade - 1, 1))
+        data = date.fromordinal(dia)
+        grafico['eixo_x'].append((x_do_dia(dia), f"{data.month:02d}/{data.year}"))
+    return grafico
+
+def descrever_ponto_evolucao(ponto, niveis):
+    """Texto do ponto da linha do tempo sob o cursor, com o período, as sessões e as mudanças de nível."""
+    periodo = ponto['inicio'].strftime('%d/%m/%Y')
+    if ponto['fim'] != ponto['inicio']:
+        periodo += f" a {ponto['fim'].strftime('%d/%m/%Y')}"
+    return (f"{periodo}: {ponto['sessoes']} sessão(ões), de {niveis[ponto['nivel_inicial'] - 1]} "
+            f"a {niveis[ponto['nivel_final'] - 1]} (média {ponto['nivel_medio']:.1f}); "
+            f"{ponto['subidas']} subida(s), {ponto['descidas']} descida(s)")
+
+ACOES_AUDITORIA = {'visualizado': 'Visualizou', 'inserido': 'Criou', 'atualizado': 'Alterou', 'excluido': 'Excluiu'}
+TABELAS_AUDITORIA = {'pacientes': 'Paciente', 'prontuarios': 'Prontuário', 'sessoes': 'Sessão', 'anexos': 'Anexo'}
+
+def preparar_linhas_auditoria(eventos):
+    """Monta as tuplas exibidas na tabela de eventos de auditoria (ver auditoria.consultar_eventos)."""
+    linhas = []
+    for evento in eventos:
+        momento = datetime.fromtimestamp(evento['momento']).strftime('%d/%m/%Y %H:%M:%S')
+        registro = TABELAS_AUDITORIA.get(evento['tabela'], evento['tabela'])
+        # Sem registro_id, o evento cobre o histórico inteiro do paciente (ver database.iterar_sessoes_paciente)
+        registro += f" #{evento['registro_id']}" if evento['registro_id'] is not None else " (histórico)"
+        linhas.append((momento, evento['nome_usuario'] or '(sem sessão)', ACOES_AUDITORIA.get(evento['acao'], evento['acao']),
+                       registro, evento['paciente_nome'] or (f"#{evento['paciente_id']}" if evento['paciente_id'] else '')))
+    return linhas
+
+def preparar_linhas_lista_espera(entradas):
+    """Monta as tuplas exibidas na lista de espera (ver database.listar_lista_espera); a primeira coluna é o ID."""
+    linhas = []
+    for entrada in entradas:
+        dias = [nome for i, nome in enumerate(DIAS_SEMANA_ABREVIADOS) if entrada['dias_semana'] & (1 << i)]
+        linhas.append((entrada['id'], entrada['paciente_nome'], entrada['medico_nome'] or f"Qualquer ({entrada['especialidade']})",
+                       'Todos' if len(dias) == 7 else ', '.join(dias), f"{entrada['hora_inicio']} - {entrada['hora_fim']}",
+                       f"{entrada['duracao_minutos']} min", entrada['prioridade'],
+                       datetime.fromtimestamp(entrada['criado_em']).strftime('%d/%m/%Y')))
+    return linhas
+
+def formatar_tamanho(tamanho):
+    """Formata um tamanho em bytes como '512 B', '34,5 KB' ou '2,1 MB'."""
+    if tamanho < 1024:
+        return f"{tamanho} B"
+    if tamanho < 1024 * 1024:
+        return f"{tamanho / 1024:.1f} KB".replace('.', ',')
+    return f"{tamanho / (1024 * 1024):.1f} MB".replace('.', ',')
+
+def preparar_linhas_anexos(anexos):
+    """Monta as tuplas exibidas na lista de anexos do prontuário (ver database.listar_anexos); a primeira coluna é o ID."""
+    return [(anexo['id'], anexo['nome_arquivo'], anexo['tipo_mime'] or '', formatar_tamanho(anexo['tamanho']),
+             datetime.fromtimestamp(anexo['criado_em']).strftime('%d/%m/%Y %H:%M')) for anexo in anexos]
@@ -0,0 +1,314 @@
+"""
+Gerador de dados sintéticos para a clínica.
+
+Preenche pacientes, médicos, disponibilidade, sessões, prontuários e usuários com
+textos realistas em português, em escalas que vão de um consultório pequeno até
+uma rede de 10 clínicas. Uso:
+
+    python gerar_dados.py --escala clinica --arquivo clinica_teste.db
+    python gerar_dados.py --escala rede --sessoes 2000000 --arquivo rede.db
+    python gerar_dados.py --escala rede --fragmentar pasta_rede
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import database
+
+# --- Escalas Pré-definidas ---
+ESCALAS = {
+    'consultorio': {'clinicas': 1, 'pacientes': 300, 'medicos': 6, 'sessoes': 20_000, 'usuarios': 4},
+    'clinica': {'clinicas': 1, 'pacientes': 3_000, 'medicos': 30, 'sessoes': 200_000, 'usuarios': 15},
+    'rede': {'clinicas': 10, 'pacientes': 30_000, 'medicos': 300, 'sessoes': 2_000_000, 'usuarios': 120},
+}
+
+# --- Vocabulário para Textos Realistas ---
+PRENOMES = [
+    "Ana", "Beatriz", "Bruna", "Camila", "Carolina", "Clara", "Eduarda", "Fernanda", "Gabriela", "Helena",
+    "Isabela", "Júlia", "Larissa", "Laura", "Letícia", "Luana", "Manuela", "Mariana", "Marina", "Natália",
+    "Rafaela", "Sofia", "Valentina", "Vitória", "Alice", "Cecília", "Lívia", "Lorena", "Yasmin", "Heloísa",
+    "Arthur", "Bernardo", "Bruno", "Caio", "Daniel", "Davi", "Eduardo", "Enzo", "Felipe", "Gabriel",
+    "Guilherme", "Gustavo", "Heitor", "Henrique", "João", "Joaquim", "Lucas", "Matheus", "Miguel", "Murilo",
+    "Nicolas", "Otávio", "Pedro", "Rafael", "Samuel", "Thiago", "Vinícius", "Vicente", "Lorenzo", "Théo",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+    "Rocha", "Dias", "Nascimento", "Andrade", "Moreira", "Nunes", "Marques", "Machado", "Mendes", "Freitas",
+    "Cardoso", "Ramos", "Gonçalves", "Santana", "Teixeira", "Araújo", "Conceição", "Brito", "Monteiro", "Assunção",
+]
+ESPECIALIDADES = [
+    "Fonoaudiologia", "Psicologia", "Terapia Ocupacional", "Fisioterapia", "Psicopedagogia",
+    "Neuropsicologia", "Musicoterapia", "Psicomotricidade",
+]
+NIVEIS_EVOLUCAO = ["Iniciante", "Intermediário", "Avançado", "Manutenção"]
+ATIVIDADES = [
+    "atividades de consciência fonológica", "jogos de atenção compartilhada", "exercícios de motricidade fina",
+    "treino de habilidades sociais", "leitura compartilhada de livro ilustrado", "circuito psicomotor",
+    "atividades de integração sensorial", "exercícios de respiração e sopro", "jogo simbólico com fantoches",
+    "sequência lógica com cartões", "atividades de escrita espontânea", "treino de rotina com agenda visual",
+    "exercícios de equilíbrio na prancha", "brincadeiras de turno e espera", "atividades de regulação emocional",
+]
+REACOES = [
+    "O paciente participou com interesse durante toda a sessão.",
+    "Houve agitação no início, com melhora após a atividade de acolhimento.",
+    "Demonstrou boa tolerância à frustração nas tarefas propostas.",
+    "Precisou de mediação constante para concluir as atividades.",
+    "Apresentou iniciativa de comunicação espontânea em vários momentos.",
+    "Relatou cansaço; a sessão foi adaptada com pausas mais frequentes.",
+    "Manteve contato visual por períodos mais longos que na sessão anterior.",
+    "A família relatou avanços percebidos em casa durante a semana.",
+]
+METAS = [
+    "ampliar o vocabulário expressivo", "reduzir o tempo de latência nas respostas", "melhorar a preensão do lápis",
+    "aumentar a autonomia nas atividades de vida diária", "favorecer a interação com pares",
+    "consolidar a leitura de sílabas complexas", "desenvolver estratégias de autorregulação",
+    "fortalecer a musculatura orofacial", "melhorar o planejamento motor",
+]
+QUEIXAS = [
+    "Atraso na fala relatado pela escola.", "Dificuldade de concentração nas atividades escolares.",
+    "Trocas de letras na escrita.", "Crises de choro e irritabilidade frequentes.",
+    "Dificuldade de coordenação motora e quedas frequentes.", "Seletividade alimentar acentuada.",
+    "Encaminhamento do neuropediatra para avaliação multidisciplinar.",
+]
+HISTORICOS = [
+    "Nascido a termo, sem intercorrências.", "Prematuridade de 34 semanas, permaneceu 10 dias em UTI neonatal.",
+    "Diagnóstico de TEA nível 1.", "Diagnóstico de TDAH em acompanhamento com neuropediatra.",
+    "Otites de repetição na primeira infância.", "Alergia a lactose.", "Sem diagnósticos prévios.",
+]
+
+# --- Funções de Geração ---
+
+def _nome_pessoa(rng):
+    return f"{rng.choice(PRENOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+
+def _hora(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+def _resumo_sessao(rng):
+    atividades = rng.sample(ATIVIDADES, 2)
+    return f"Trabalhamos {atividades[0]} e {atividades[1]}. {rng.choice(REACOES)}"
+
+def _plano_terapeutico(rng):
+    return f"Próximas sessões: {rng.choice(METAS)} e {rng.choice(METAS)}, com {rng.choice(ATIVIDADES)}."
+
+def _em_lotes(linhas, tamanho=10_000):
+    """Agrupa um iterável de linhas em listas de tamanho fixo para o executemany."""
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _gerar_pacientes(rng, total):
+    hoje = date.today()
+    for _ in range(total):
+        nascimento = hoje - timedelta(days=rng.randint(2 * 365, 17 * 365))
+        sobrenome = rng.choice(SOBRENOMES)
+        yield (f"{rng.choice(PRENOMES)} {rng.choice(SOBRENOMES)} {sobrenome}", nascimento.isoformat(),
+               f"{rng.choice(PRENOMES)} {rng.choice(SOBRENOMES)} {sobrenome}")
+
+def _gerar_medicos(rng, total, clinicas):
+    for i in range(total):
+        especialidade = rng.choice(ESPECIALIDADES)
+        unidade = f" - Unidade {i % clinicas + 1}" if clinicas > 1 else ""
+        telefone = f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
+        yield (_nome_pessoa(rng), especialidade + unidade, telefone)
+
+def _gerar_agenda(rng, medico_ids, paciente_ids, total_sessoes, duracao=50):
+    """
+    Gera disponibilidade e sessões dia a dia, do futuro próximo para o passado, até atingir
+    o total de sessões. As sessões sempre caem dentro da disponibilidade do médico e nunca
+    se sobrepõem, como numa agenda real.
+    """
+    if total_sessoes > 0 and not (medico_ids and paciente_ids): # Sem eles, o laço nunca chegaria ao total
+        raise ValueError("Gerar sessões exige ao menos um médico e um paciente.")
+    disponibilidades, sessoes = [], []
+    dia = date.today() + timedelta(days=30)
+    geradas = 0
+    while geradas < total_sessoes:
+        if dia.weekday() < 5 or (dia.weekday() == 5 and rng.random() < 0.3):
+            data_str = dia.isoformat()
+            futuro = dia > date.today()
+            for medico_id in medico_ids:
+                if rng.random() < 0.15: # Folgas, férias e ausências
+                    continue
+                # Manhã e/ou tarde
+                janelas = []
+                if rng.random() < 0.8:
+                    janelas.append((8 * 60, 12 * 60))
+                if rng.random() < 0.8:
+                    janelas.append((13 * 60 + 30, 18 * 60))
+                for inicio, fim in janelas:
+                    disponibilidades.append((medico_id, data_str, _hora(inicio), _hora(fim)))
+                    slot = inicio
+                    while slot + duracao <= fim and geradas < total_sessoes:
+                        ocupado = rng.random() < (0.45 if futuro else 0.8)
+                        if ocupado:
+                            nivel = rng.choice(NIVEIS_EVOLUCAO)
+                            sessoes.append((rng.choice(paciente_ids), medico_id, data_str, _hora(slot), _hora(slot + duracao),
+                                            None if futuro else _resumo_sessao(rng),
+                                            None if futuro else nivel,
+                                            None if futuro else rng.choice(REACOES),
+                                            None if futuro else _plano_terapeutico(rng)))
+                            geradas += 1
+                        slot += duracao + 10
+            if len(sessoes) >= 10_000:
+                yield disponibilidades, sessoes
+                disponibilidades, sessoes = [], []
+        dia -= timedelta(days=1)
+    if disponibilidades or sessoes:
+        yield disponibilidades, sessoes
+
+# Arquivos que acompanham um banco (ver database.caminho_arquivo_morto, database.caminho_anexos e
+# auditoria.caminho_auditoria): os de um banco antigo seriam anexados ao novo como se fossem dele
+_ARQUIVOS_DO_BANCO = ('_arquivo.db', '_anexos.db', '_auditoria.db')
+_SUFIXOS_SQLITE = ('', '-wal', '-shm', '-journal')
+
+def _remover_banco(arquivo):
+    """Apaga o banco e os arquivos que o acompanham (arquivo morto, anexos, auditoria e os do SQLite)."""
+    base = os.path.splitext(arquivo)[0]
+    for caminho in (arquivo, *(base + sufixo for sufixo in _ARQUIVOS_DO_BANCO)):
+        for sufixo in _SUFIXOS_SQLITE:
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
+
+def _validar_quantidades(clinicas, pacientes, medicos, sessoes, usuarios):
+    """Lança ValueError para quantidades com que a geração não terminaria ou falharia no meio."""
+    if clinicas < 1:
+        raise ValueError("É preciso ao menos uma clínica.")
+    negativas = [nome for nome, valor in (('pacientes', pacientes), ('medicos', medicos), ('sessoes', sessoes),
+                                          ('usuarios', usuarios)) if valor < 0]
+    if negativas:
+        raise ValueError(f"Quantidades negativas: {', '.join(negativas)}.")
+    if sessoes > 0 and (medicos < 1 or pacientes < 1):
+        raise ValueError("Gerar sessões exige ao menos um médico e um paciente.")
+
+def gerar_banco(arquivo, clinicas=1, pacientes=300, medicos=6, sessoes=20_000, usuarios=4, semente=42, verbose=True):
+    """
+    Cria (ou sobrescreve) um banco de dados sintético no arquivo indicado.
+    Retorna um dicionário com a quantidade de linhas de cada tabela.
+    Lança ValueError, antes de apagar o arquivo, se as quantidades não permitirem gerar o banco.
+    """
+    _validar_quantidades(clinicas, pacientes, medicos, sessoes, usuarios)
+    rng = random.Random(semente)
+    database.fechar_conexoes() # Uma conexão aberta com o arquivo antigo continuaria lendo os dados apagados
+    _remover_banco(arquivo)
+
+    db_original = database.DB_FILE
+    database.DB_FILE = arquivo
+    try:
+        database.inicializar_banco_de_dados()
+    finally:
+        database.DB_FILE = db_original
+
+    inicio = time.perf_counter()
+    with sqlite3.connect(arquivo) as conn:
+        # Carga em massa: sem fsync a cada página, o arquivo é descartável até o commit final.
+        conn.execute("PRAGMA synchronous = OFF")
+        cursor = conn.cursor()
+
+        for lote in _em_lotes(_gerar_pacientes(rng, pacientes)):
+            cursor.executemany("INSERT INTO pacientes (nome_completo, data_nascimento, nome_responsavel) VALUES (?, ?, ?)", lote)
+        paciente_ids = [row[0] for row in cursor.execute("SELECT id FROM pacientes")]
+
+        cursor.executemany("INSERT INTO medicos (nome_completo, especialidade, contato) VALUES (?, ?, ?)",
+                           list(_gerar_medicos(rng, medicos, clinicas)))
+        medico_ids = [row[0] for row in cursor.execute("SELECT id FROM medicos")]
+
+        # Cerca de 70% dos pacientes já têm prontuário preenchido
+        prontuarios = [(pid, rng.choice(QUEIXAS), rng.choice(HISTORICOS),
+                        f"{rng.choice(HISTORICOS)} {rng.choice(QUEIXAS)} {rng.choice(REACOES)}", None)
+                       for pid in paciente_ids if rng.random() < 0.7]
+        cursor.executemany(
+            """INSERT INTO prontuarios (paciente_id, queixa_principal, historico_medico_relevante, anamnese, informacoes_adicionais)
+               VALUES (?, ?, ?, ?, ?)""", prontuarios)
+
+        for disponibilidades, lote_sessoes in _gerar_agenda(rng, medico_ids, paciente_ids, sessoes):
+            cursor.executemany(
+                "INSERT INTO disponibilidade_medico (medico_id, data_disponivel, hora_inicio, hora_fim) VALUES (?, ?, ?, ?)",
+                disponibilidades)
+            cursor.executemany(
+                """INSERT INTO sessoes (paciente_id, medico_id, data_sessao, hora_inicio_sessao, hora_fim_sessao,
+                                        resumo_sessao, nivel_evolucao, observacoes_evolucao, plano_terapeutico)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", lote_sessoes)
+            if verbose:
+                print(f"  ... {cursor.execute('SELECT COUNT(*) FROM sessoes').fetchone()[0]} sessões", end='\r')
+        if verbose:
+            print()
+
+        # Usuários: o admin padrão já existe; os demais são terapeutas e recepcionistas
+        senha_hashed = database.hash_senha('senha123')
+        cursor.executemany(
+            "INSERT INTO usuarios (nome_usuario, senha_hash, nivel_acesso) VALUES (?, ?, ?)",
+            [(f"usuario{i:04d}", senha_hashed, 'admin' if i % 10 == 0 else 'terapeuta') for i in range(1, usuarios + 1)])
+
+        # A carga sintética não é uma alteração a notificar às estações (ver database.alteracoes_desde)
+        cursor.execute("DELETE FROM log_alteracoes")
+
+        contagens = {}
+        for tabela in ('pacientes', 'medicos', 'disponibilidade_medico', 'sessoes', 'prontuarios', 'usuarios'):
+            contagens[tabela] = cursor.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+
+    if verbose:
+        print(f"Banco '{arquivo}' gerado em {time.perf_counter() - inicio:.1f}s: {contagens}")
+    return contagens
+
+def gerar_rede_fragmentada(pasta, clinicas=10, pacientes=30_000, medicos=300, sessoes=2_000_000, usuarios=120,
+                           semente=42, verbose=True):
+    """
+    Gera uma rede com um arquivo SQLite por clínica, dividindo os totais igualmente entre elas,
+    e grava o clinicas.json correspondente na pasta. Retorna o dicionário {clinica: arquivo}.
+    """
+    _validar_quantidades(clinicas, pacientes, medicos, sessoes, usuarios)
+    os.makedirs(pasta, exist_ok=True)
+    arquivos = {}
+    for i in range(clinicas):
+        nome = f"unidade{i + 1:02d}"
+        arquivos[nome] = os.path.join(pasta, f"clinica_{nome}.db")
+        if verbose:
+            print(f"Clínica {nome}:")
+        gerar_banco(arquivos[nome], clinicas=1, pacientes=max(1, pacientes // clinicas), medicos=max(1, medicos // clinicas),
+                    sessoes=sessoes // clinicas, usuarios=max(1, usuarios // clinicas), semente=semente + i, verbose=verbose)
+    with open(os.path.join(pasta, database.ARQUIVO_CONFIG_CLINICAS), 'w', encoding='utf-8') as f:
+        json.dump({'clinica_atual': next(iter(arquivos)),
+                   'clinicas': {nome: os.path.basename(arquivo) for nome, arquivo in arquivos.items()}},
+                  f, indent=2, ensure_ascii=False)
+    return arquivos
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um banco de dados sintético para testes de desempenho.")
+    parser.add_argument('--arquivo', default='clinica_sintetica.db', help="Arquivo SQLite de destino (será sobrescrito).")
+    parser.add_argument('--escala', choices=ESCALAS.keys(), default='consultorio')
+    parser.add_argument('--clinicas', type=int)
+    parser.add_argument('--pacientes', type=int)
+    parser.add_argument('--medicos', type=int)
+    parser.add_argument('--sessoes', type=int)
+    parser.add_argument('--usuarios', type=int)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--fragmentar', metavar='PASTA',
+                        help="Gera um arquivo por clínica (e o clinicas.json) nesta pasta, em vez de um banco único.")
+    args = parser.parse_args()
+
+    parametros = dict(ESCALAS[args.escala])
+    for chave in parametros:
+        valor = getattr(args, chave)
+        if valor is not None:
+            parametros[chave] = valor
+    try:
+        if args.fragmentar:
+            gerar_rede_fragmentada(args.fragmentar, semente=args.semente, **parametros)
+        else:
+            gerar_banco(args.arquivo, semente=args.semente, **parametros)
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Harness de regressão das janelas Tk com orçamento de tempo de renderização.
+
+Abre cada construtor de janela (abrir_janela_lista, abrir_janela_sessoes,
+abrir_janela_disponibilidade, abrir_janela_principal, ...) sobre um banco gerado por
+gerar_dados.py, com a raiz Tk oculta, e mede o tempo desde a chamada até os widgets
+estarem preenchidos. Termina com código 1 se algum orçamento for excedido, para ser
+usado em CI sob Xvfb:
+
+    xvfb-run python harness_janelas.py --escala clinica
+    python harness_janelas.py --xvfb --db clinica_sintetica.db --orcamento abrir_janela_lista=150
+    python harness_janelas.py --orcamentos orcamentos.json --saida janelas.json
+    python harness_janelas.py --escala clinica --sem-cache    # mede as janelas sem o cache de leituras
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Orçamentos padrão, em milissegundos, da chamada até os widgets preenchidos
+ORCAMENTOS_PADRAO = {
+    'abrir_janela_principal': 500,
+    'abrir_janela_lista': 300,
+    'abrir_janela_lista_medicos': 150,
+    'abrir_janela_sessoes': 200,
+    'abrir_janela_disponibilidade': 200,
+    'abrir_janela_visao_geral_agenda': 200,
+    'abrir_janela_agenda_terapeuta': 100,
+    'abrir_janela_evolucao_paciente': 150,
+    'abrir_janela_auditoria': 300,
+    'abrir_janela_lista_espera': 300,
+}
+
+class FalhaHarness(Exception):
+    """Erro de execução do harness (diálogo de erro aberto, janela vazia, etc.)."""
+
+def iniciar_xvfb(display=':99'):
+    """Inicia um servidor Xvfb em segundo plano, caso não haja DISPLAY disponível."""
+    processo = subprocess.Popen(['Xvfb', display, '-screen', '0', '1280x1024x24'],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = display
+    time.sleep(0.5)
+    return processo
+
+def _widgets(widget):
+    """Percorre recursivamente todos os widgets descendentes."""
+    for filho in widget.winfo_children():
+        yield filho
+        yield from _widgets(filho)
+
+def _contar_conteudo(janela):
+    """Conta as linhas das Treeviews e os eventos dos calendários de uma janela."""
+    linhas, eventos = 0, 0
+    for w in _widgets(janela):
+        if w.winfo_class() == 'Treeview':
+            linhas += len(w.get_children())
+        if hasattr(w, 'get_calevents'):
+            eventos += len(w.get_calevents())
+    return linhas, eventos
+
+class _ContadorConsultas:
+    """Envolve as funções públicas de database.py para contar quantas vezes cada janela consulta o banco."""
+
+    def __init__(self, database):
+        self.database = database
+        self.chamadas = {}
+        self.originais = {}
+
+    def __enter__(self):
+        for nome in dir(self.database):
+            funcao = getattr(self.database, nome)
+            if nome.startswith('_') or not callable(funcao) or getattr(funcao, '__module__', None) != self.database.__name__:
+                continue
+            self.originais[nome] = funcao
+            setattr(self.database, nome, self._envolver(nome, funcao))
+        return self
+
+    def _envolver(self, nome, funcao):
+        def envolvida(*args, **kwargs):
+            self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+            return funcao(*args, **kwargs)
+        return envolvida
+
+    def __exit__(self, *exc):
+        for nome, funcao in self.originais.items():
+            setattr(self.database, nome, funcao)
+
+def _medir(root, nome, abrir, repeticoes):
+    """Abre a janela várias vezes e devolve as estatísticas de tempo e de conteúdo."""
+    import database
+    tempos, linhas, eventos, consultas = [], 0, 0, {}
+    for _ in range(repeticoes):
+        antes = set(root.winfo_children())
+        with _ContadorConsultas(database) as contador:
+            inicio = time.perf_counter()
+            janela = abrir()
+            if janela is None:
+                novas = [w for w in root.winfo_children() if w not in antes]
+                janela = novas[-1] if novas else None
+            if janela is None:
+                raise FalhaHarness(f"{nome}: nenhuma janela foi criada.")
+            janela.update() # Processa o layout e os eventos pendentes até a janela estar desenhada
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas = contador.chamadas
+        linhas, eventos = _contar_conteudo(janela)
+        janela.destroy()
+        root.update()
+    if linhas == 0 and eventos == 0:
+        raise FalhaHarness(f"{nome}: a janela abriu sem nenhuma linha ou evento preenchido.")
+    return {
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'max_ms': round(max(tempos), 3),
+        'linhas': linhas,
+        'eventos_calendario': eventos,
+        'consultas': consultas,
+    }
+
+def _cenarios(root, app, database):
+    """Define as chamadas de cada construtor de janela, com ids representativos do banco."""
+    with sqlite3.connect(database.DB_FILE) as conn:
+        paciente_id, paciente_nome = conn.execute(
+            """SELECT p.id, p.nome_completo FROM pacientes p JOIN sessoes s ON s.paciente_id = p.id
+               GROUP BY p.id ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+        medico_id, medico_nome = conn.execute(
+            """SELECT m.id, m.nome_completo FROM medicos m JOIN disponibilidade_medico d ON d.medico_id = m.id
+               WHERE d.data_disponivel >= date('now', 'start of month') LIMIT 1""").fetchone()
+    atualizar = lambda: None
+    return {
+        'abrir_janela_principal': lambda: app.construir_janela_principal(root), # Toplevel, sem a vigia de alterações
+        'abrir_janela_lista': lambda: app.abrir_janela_lista(root, atualizar),
+        'abrir_janela_lista_medicos': lambda: app.abrir_janela_lista_medicos(root),
+        'abrir_janela_sessoes': lambda: app.abrir_janela_sessoes(root, paciente_id, paciente_nome, atualizar),
+        'abrir_janela_disponibilidade': lambda: app.abrir_janela_disponibilidade(root, medico_id, medico_nome),
+        'abrir_janela_visao_geral_agenda': lambda: app.abrir_janela_visao_geral_agenda(root),
+        'abrir_janela_agenda_terapeuta': lambda: app.abrir_janela_agenda_terapeuta(root, medico_id, medico_nome),
+        'abrir_janela_evolucao_paciente': lambda: app.abrir_janela_evolucao_paciente(root, paciente_id, paciente_nome),
+        'abrir_janela_auditoria': lambda: app.abrir_janela_auditoria(root),
+        'abrir_janela_lista_espera': lambda: app.abrir_janela_lista_espera(root),
+    }
+
+def executar(arquivo_db, orcamentos, repeticoes=3, filtro=None, usar_cache=True):
+    """Executa o harness sobre uma cópia do banco. Retorna (resultados, lista de violações de orçamento)."""
+    import tkinter as tk
+    import app
+    import database
+
+    def _dialogo_inesperado(*args, **kwargs):
+        raise FalhaHarness(f"Diálogo inesperado durante a abertura da janela: {args}")
+    # Um messagebox modal travaria o harness; qualquer diálogo aberto é tratado como falha.
+    for nome in ('showerror', 'showwarning', 'showinfo', 'askyesno'):
+        setattr(app.messagebox, nome, _dialogo_inesperado)
+    # Nem os lembretes em segundo plano: a medição não pode enviar nada nem disputar o banco com eles
+    app.lembretes.iniciar = lambda *args, **kwargs: None
+
+    pasta = tempfile.mkdtemp(prefix='harness_clinica_')
+    copia = os.path.join(pasta, 'clinica.db')
+    shutil.copy(arquivo_db, copia)
+    db_original = database.DB_FILE
+    database.DB_FILE = copia
+    database.CACHE_ATIVO = usar_cache
+    database.limpar_cache()
+    database.inicializar_banco_de_dados()
+    database.iniciar_sessao('admin', 'admin123') # Admin padrão criado pela inicialização do banco
+
+    root = tk.Tk()
+    root.withdraw()
+    resultados, violacoes = {}, []
+    try:
+        for nome, abrir in _cenarios(root, app, database).items():
+            if filtro and filtro not in nome:
+                continue
+            resultado = _medir(root, nome, abrir, repeticoes)
+            orcamento = orcamentos.get(nome)
+            resultado['orcamento_ms'] = orcamento
+            resultados[nome] = resultado
+            status = 'OK'
+            if orcamento is not None and resultado['mediana_ms'] > orcamento:
+                status = 'EXCEDEU'
+                violacoes.append(f"{nome}: {resultado['mediana_ms']:.1f} ms > orçamento de {orcamento} ms")
+            print(f"{nome:<32} {resultado['mediana_ms']:>9.1f} ms (orçamento {orcamento} ms) "
+                  f"linhas={resultado['linhas']} eventos={resultado['eventos_calendario']} "
+                  f"consultas={sum(resultado['consultas'].values())}  {status}")
+        if usar_cache:
+            estatisticas = database.estatisticas_cache()
+            print(f"Cache: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas "
+                  f"(taxa de acerto {estatisticas['taxa_acerto']:.0%})")
+    finally:
+        root.destroy()
+        database.encerrar_sessao()
+        database.fechar_conexoes()
+        database.DB_FILE = db_original
+        database.CACHE_ATIVO = True
+        shutil.rmtree(pasta, ignore_errors=True)
+    return resultados, violacoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de abertura das janelas Tk e falha se exceder o orçamento.")
+    parser.add_argument('--db', help="Banco já gerado. Se omitido, um banco é gerado na escala indicada.")
+    parser.add_argument('--escala', default='consultorio')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--orcamentos', help="Arquivo JSON {nome_da_janela: ms} que substitui os orçamentos padrão.")
+    parser.add_argument('--orcamento', action='append', default=[], metavar='JANELA=MS', help="Sobrescreve um orçamento.")
+    parser.add_argument('--filtro', help="Executa apenas as janelas cujo nome contém este texto.")
+    parser.add_argument('--saida', help="Arquivo JSON onde os resultados serão gravados.")
+    parser.add_argument('--xvfb', action='store_true', help="Inicia um Xvfb próprio se não houver DISPLAY.")
+    parser.add_argument('--sem-cache', action='store_true', help="Desativa o cache de leituras de database.py.")
+    args = parser.parse_args()
+
+    orcamentos = dict(ORCAMENTOS_PADRAO)
+    if args.orcamentos:
+        with open(args.orcamentos, encoding='utf-8') as f:
+            orcamentos.update(json.load(f))
+    for item in args.orcamento:
+        nome, _, valor = item.partition('=')
+        orcamentos[nome] = float(valor)
+
+    xvfb = None
+    if args.xvfb and not os.environ.get('DISPLAY'):
+        xvfb = iniciar_xvfb()
+
+    pasta_temporaria = None
+    arquivo_db = args.db
+    try:
+        if not arquivo_db:
+            import gerar_dados
+            pasta_temporaria = tempfile.mkdtemp(prefix='dados_clinica_')
+            arquivo_db = os.path.join(pasta_temporaria, f"{args.escala}.db")
+            gerar_dados.gerar_banco(arquivo_db, **gerar_dados.ESCALAS[args.escala])
+        resultados, violacoes = executar(arquivo_db, orcamentos, args.repeticoes, args.filtro, not args.sem_cache)
+    finally:
+        if pasta_temporaria:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+        if xvfb:
+            xvfb.terminate()
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'resultados': resultados, 'violacoes': violacoes}, f, indent=2, ensure_ascii=False)
+    if violacoes:
+        print("\nOrçamentos excedidos:")
+        for v in violacoes:
+            print(f"  - {v}")
+        sys.exit(1)
+    print("\nTodas as janelas dentro do orçamento.")
+
+if __name__ == "__main__":
+    main()
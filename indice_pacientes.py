@@ -0,0 +1,148 @@
+"""
+Índice em memória para a busca de pacientes enquanto se digita.
+
+Os nomes dos pacientes e dos responsáveis são normalizados (sem acentos e sem diferença
+entre maiúsculas e minúsculas) e guardados em listas ordenadas, onde uma busca por prefixo
+é uma busca binária. O índice é mantido atualizado pelas escritas de database.py (ouvinte
+de escrita) e recarregado por inteiro se outro processo alterar o banco.
+
+Os resultados vêm em três faixas, nesta ordem:
+    0. o nome completo do paciente começa com o texto digitado;
+    1. alguma palavra do nome do paciente começa com o texto digitado;
+    2. alguma palavra do nome do responsável começa com o texto digitado.
+"""
+import unicodedata
+from bisect import bisect_left, insort
+
+import database
+
+NOME_COMPLETO, PALAVRA_NOME, PALAVRA_RESPONSAVEL = 0, 1, 2
+LIMITE_PADRAO = 50
+
+def normalizar(texto):
+    """Remove acentos, converte para minúsculas e junta os espaços repetidos."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+class IndicePacientes:
+    """Listas ordenadas de (chave normalizada, id do paciente), uma por faixa de relevância."""
+
+    def __init__(self):
+        self.faixas = ([], [], [])
+        self.pacientes = {}   # id -> dicionário do paciente, como em listar_pacientes()
+        self.chaves = {}      # id -> lista de (faixa, chave) inseridas para o paciente
+        self.palavras = {}    # id -> conjunto de palavras normalizadas do paciente e do responsável
+
+    def __len__(self):
+        return len(self.pacientes)
+
+    @staticmethod
+    def _chaves_do_paciente(paciente):
+        nome = normalizar(paciente['nome_completo'])
+        responsavel = normalizar(paciente['nome_responsavel'])
+        chaves = [(NOME_COMPLETO, nome)]
+        chaves += [(PALAVRA_NOME, palavra) for palavra in set(nome.split()[1:])]
+        chaves += [(PALAVRA_RESPONSAVEL, palavra) for palavra in set(responsavel.split())]
+        return chaves, set(nome.split()) | set(responsavel.split())
+
+    def carregar(self, pacientes):
+        """Reconstrói o índice inteiro a partir de uma lista de pacientes (ordenação feita uma única vez)."""
+        self.__init__()
+        for paciente in pacientes:
+            chaves, palavras = self._chaves_do_paciente(paciente)
+            self.pacientes[paciente['id']] = paciente
+            self.chaves[paciente['id']] = chaves
+            self.palavras[paciente['id']] = palavras
+            for faixa, chave in chaves:
+                self.faixas[faixa].append((chave, paciente['id']))
+        for lista in self.faixas:
+            lista.sort()
+
+    def adicionar(self, paciente):
+        """Insere (ou substitui) um paciente, mantendo as listas ordenadas."""
+        self.remover(paciente['id'])
+        chaves, palavras = self._chaves_do_paciente(paciente)
+        self.pacientes[paciente['id']] = paciente
+        self.chaves[paciente['id']] = chaves
+        self.palavras[paciente['id']] = palavras
+        for faixa, chave in chaves:
+            insort(self.faixas[faixa], (chave, paciente['id']))
+
+    def remover(self, paciente_id):
+        for faixa, chave in self.chaves.pop(paciente_id, []):
+            lista = self.faixas[faixa]
+            posicao = bisect_left(lista, (chave, paciente_id))
+            if posicao < len(lista) and lista[posicao] == (chave, paciente_id):
+                del lista[posicao]
+        self.pacientes.pop(paciente_id, None)
+        self.palavras.pop(paciente_id, None)
+
+    def _com_prefixo(self, faixa, prefixo):
+        """Percorre, em ordem, os ids cuja chave na faixa começa com o prefixo."""
+        lista = self.faixas[faixa]
+        posicao = bisect_left(lista, (prefixo,))
+        while posicao < len(lista) and lista[posicao][0].startswith(prefixo):
+            yield lista[posicao][1]
+            posicao += 1
+
+    def buscar(self, termo, limite=LIMITE_PADRAO):
+        """Retorna até 'limite' pacientes que combinam com o termo, dos mais aos menos relevantes."""
+        consulta = normalizar(termo)
+        if not consulta:
+            return []
+        termos = consulta.split()
+        # As faixas de palavras são percorridas pelo termo mais longo (o mais seletivo);
+        # os demais termos precisam ser prefixo de alguma palavra do paciente ou do responsável.
+        guia = max(termos, key=len)
+        outros = [t for t in termos if t != guia]
+        encontrados, resultados = set(), []
+        candidatos = [(NOME_COMPLETO, consulta, [])] + [(faixa, guia, outros) for faixa in (PALAVRA_NOME, PALAVRA_RESPONSAVEL)]
+        for faixa, prefixo, exigidos in candidatos:
+            for paciente_id in self._com_prefixo(faixa, prefixo):
+                if paciente_id in encontrados:
+                    continue
+                palavras = self.palavras[paciente_id]
+                if exigidos and not all(any(p.startswith(t) for p in palavras) for t in exigidos):
+                    continue
+                encontrados.add(paciente_id)
+                resultados.append(self.pacientes[paciente_id])
+                if len(resultados) >= limite:
+                    return resultados
+        return resultados
+
+# --- Índice Compartilhado pela Interface ---
+# Um índice por arquivo de banco (clínica), carregado na primeira busca.
+
+_indices = {}    # arquivo -> (IndicePacientes, geracao_externa no momento da carga)
+
+def _ao_escrever(tabela, operacao, registro_id):
+    """Ouvinte de escrita: aplica ao índice do banco atual as alterações de pacientes."""
+    if tabela != 'pacientes' or database.DB_FILE not in _indices:
+        return
+    indice, geracao = _indices[database.DB_FILE]
+    if operacao == 'excluido':
+        indice.remover(registro_id)
+    elif operacao in ('inserido', 'atualizado'):
+        paciente = database.buscar_paciente_por_id(registro_id)
+        if paciente:
+            indice.adicionar(paciente)
+    else:
+        del _indices[database.DB_FILE] # Escrita sem registro conhecido: recarrega na próxima busca
+
+database.registrar_ouvinte(_ao_escrever)
+
+def obter_indice():
+    """Retorna o índice do banco atual, recarregando-o se outro processo alterou o banco."""
+    geracao = database.geracao_externa()
+    atual = _indices.get(database.DB_FILE)
+    if atual is None or atual[1] != geracao:
+        indice = IndicePacientes()
+        indice.carregar(database.listar_pacientes())
+        _indices[database.DB_FILE] = (indice, geracao)
+        return indice
+    return atual[0]
+
+def buscar_pacientes_incremental(termo, limite=LIMITE_PADRAO):
+    """Busca de pacientes para cada tecla digitada: mesmas chaves de listar_pacientes()."""
+    return obter_indice().buscar(termo, limite)
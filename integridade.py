@@ -0,0 +1,68 @@
+"""
+Verificação (e reparo) da integridade do banco da clínica.
+
+Procura sessões, prontuários e horários de disponibilidade órfãos, datas e horários malformados,
+disponibilidades sobrepostas e pacientes sem prontuário (ver database.verificar_integridade).
+Com --reparar, corrige numa única transação os problemas que têm reparo seguro e verifica de novo.
+Uso:
+
+    python integridade.py                           # só relata, no clinica.db
+    python integridade.py --db clinica_sintetica.db --exemplos 10
+    python integridade.py --reparar --saida integridade.json
+"""
+import argparse
+import json
+import time
+
+import database
+
+def executar(reparar=False, exemplos=5):
+    """Verifica o banco atual (e, se pedido, repara e verifica de novo). Devolve o relatório com os tempos."""
+    inicio = time.perf_counter()
+    relatorio = {'antes': database.verificar_integridade(exemplos)}
+    relatorio['verificacao_s'] = round(time.perf_counter() - inicio, 3)
+    if reparar:
+        inicio = time.perf_counter()
+        relatorio['reparadas'] = database.reparar_integridade()
+        relatorio['reparo_s'] = round(time.perf_counter() - inicio, 3)
+        relatorio['depois'] = database.verificar_integridade(exemplos)
+    return relatorio
+
+def imprimir(relatorio):
+    antes, depois = relatorio['antes'], relatorio.get('depois')
+    cabecalho = f"{'problema':<30} {'antes':>10}" + (f" {'reparadas':>10} {'depois':>10}" if depois else '')
+    print(cabecalho)
+    for nome, problema in antes.items():
+        linha = f"{nome:<30} {problema['quantidade']:>10}"
+        if depois:
+            linha += f" {relatorio['reparadas'].get(nome, '-'):>10} {depois[nome]['quantidade']:>10}"
+        print(linha)
+    print(f"Verificação em {relatorio['verificacao_s']:.2f}s" +
+          (f", reparo em {relatorio['reparo_s']:.2f}s" if depois else ''))
+    for nome, problema in (depois or antes).items():
+        if problema['quantidade']:
+            print(f"- {problema['descricao']}: ids {', '.join(map(str, problema['exemplos']))}"
+                  + (" ..." if problema['quantidade'] > len(problema['exemplos']) else ''))
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica (e opcionalmente repara) a integridade do banco da clínica.")
+    parser.add_argument('--db', default=database.DB_FILE, help="Banco da clínica (padrão: %(default)s).")
+    parser.add_argument('--reparar', action='store_true', help="Corrige os problemas que têm reparo seguro.")
+    parser.add_argument('--exemplos', type=int, default=5, help="Ids de exemplo listados por problema (padrão: %(default)s).")
+    parser.add_argument('--saida', help="Arquivo JSON onde o relatório será gravado.")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db
+    try:
+        database.inicializar_banco_de_dados()
+        relatorio = executar(args.reparar, args.exemplos)
+    finally:
+        database.fechar_conexoes()
+
+    imprimir(relatorio)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
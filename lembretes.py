@@ -0,0 +1,197 @@
+"""
+Lembretes das próximas sessões, para os responsáveis pelos pacientes.
+
+A cada INTERVALO_PROCESSAMENTO_S, uma thread própria põe na fila do banco (tabela lembretes) um
+lembrete para cada sessão das próximas horas (database.gerar_lembretes, uma única consulta por
+índice) e envia os que já venceram: reserva um lote (database.reservar_lembretes), entrega o lote
+ao remetente e grava o resultado numa única transação (database.concluir_lembretes), até a fila
+esvaziar. A janela principal nunca espera por um envio. Um lote reservado por um processo que parou
+volta para a fila quando a reserva vence; um envio que falhou é tentado de novo mais tarde.
+
+O remetente é qualquer objeto com enviar_lote(lembretes) -> (enviados, falhas). RemetenteArquivo
+grava as mensagens num arquivo, um JSON por linha (para testes, ou para a recepção ligar a partir
+da lista); RemetenteSMTP as envia por e-mail.
+"""
+import abc
+import atexit
+import json
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import database
+import formatacao
+
+LOTE_MAXIMO = 200
+INTERVALO_PROCESSAMENTO_S = 60
+
+def caminho_saida(arquivo=None):
+    """Arquivo padrão de RemetenteArquivo para o banco da clínica indicado (por padrão, o atual)."""
+    return os.path.splitext(arquivo or database.DB_FILE)[0] + '_lembretes.jsonl'
+
+def mensagem(lembrete):
+    """Texto do lembrete de uma sessão (lembrete como retornado por database.reservar_lembretes)."""
+    saudacao = f"Olá, {lembrete['nome_responsavel']}." if lembrete.get('nome_responsavel') else "Olá."
+    medico = f" com {lembrete['medico_nome']}" if lembrete.get('medico_nome') else ""
+    data = formatacao.formatar_data_para_exibicao(lembrete['data_sessao'])
+    return f"{saudacao} Lembramos que {lembrete['paciente_nome']} tem sessão{medico} em {data}, às {lembrete['hora_inicio_sessao']}."
+
+class Remetente(abc.ABC):
+    """Base dos remetentes: enviar_lote envia um lembrete por vez com enviar e separa as falhas."""
+
+    @abc.abstractmethod
+    def enviar(self, lembrete):
+        """Envia um lembrete; uma exceção conta como falha só desse lembrete."""
+
+    def enviar_lote(self, lembretes):
+        """Envia os lembretes. Retorna (enviados, falhas), com as falhas como [(lembrete, mensagem de erro)]."""
+        enviados, falhas = [], []
+        for lembrete in lembretes:
+            try:
+                self.enviar(lembrete)
+                enviados.append(lembrete)
+            except Exception as e:
+                falhas.append((lembrete, str(e) or type(e).__name__))
+        return enviados, falhas
+
+class RemetenteArquivo(Remetente):
+    """Acrescenta cada lembrete ao arquivo como uma linha JSON, com o destinatário e a mensagem; um lote por escrita."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_saida()
+
+    @staticmethod
+    def _linha(l):
+        return json.dumps({'sessao_id': l['sessao_id'], 'paciente_id': l['paciente_id'], 'destinatario': l['nome_responsavel'],
+                           'data_sessao': l['data_sessao'], 'hora_inicio': l['hora_inicio_sessao'], 'mensagem': mensagem(l),
+                           'momento': time.time()}, ensure_ascii=False) + '\n'
+
+    def enviar(self, lembrete):
+        self.enviar_lote([lembrete])
+
+    def enviar_lote(self, lembretes):
+        linhas = [self._linha(l) for l in lembretes]
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            f.writelines(linhas)
+        return list(lembretes), []
+
+class RemetenteSMTP(Remetente):
+    """
+    Envia os lembretes por e-mail, numa conexão por lote. O cadastro de pacientes não guarda e-mail:
+    endereco(lembrete) retorna o do responsável, ou None, que conta como falha do lembrete.
+    """
+
+    def __init__(self, servidor, endereco, remetente, porta=25, usuario=None, senha=None, tls=False,
+                 assunto="Lembrete de sessão"):
+        self.servidor, self.porta = servidor, porta
+        self.endereco = endereco
+        self.remetente = remetente
+        self.usuario, self.senha, self.tls = usuario, senha, tls
+        self.assunto = assunto
+        self._smtp = None
+
+    def enviar_lote(self, lembretes):
+        with smtplib.SMTP(self.servidor, self.porta, timeout=30) as smtp:
+            if self.tls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.senha)
+            self._smtp = smtp
+            try:
+                return super().enviar_lote(lembretes)
+            finally:
+                self._smtp = None
+
+    def enviar(self, lembrete):
+        destino = self.endereco(lembrete)
+        if not destino:
+            raise ValueError("Responsável sem e-mail cadastrado.")
+        email = EmailMessage()
+        email['From'], email['To'], email['Subject'] = self.remetente, destino, self.assunto
+        email.set_content(mensagem(lembrete))
+        self._smtp.send_message(email)
+
+def processar(remetente, lote=LOTE_MAXIMO, agora=None, parar=None):
+    """
+    Gera os lembretes da janela e envia, lote a lote, todos os que já venceram, na thread atual (para
+    rotinas agendadas; parar é um threading.Event que interrompe entre lotes). Retorna os totais:
+    {'gerados': n, 'enviados': n, 'falhas': n, 'lotes': n}.
+    """
+    rodada = {'gerados': database.gerar_lembretes(agora), 'enviados': 0, 'falhas': 0, 'lotes': 0}
+    # As falhas voltam para a fila com enviar_em no futuro, então a rodada termina mesmo se o remetente falhar sempre
+    while parar is None or not parar.is_set():
+        lembretes = database.reservar_lembretes(lote, agora)
+        if not lembretes:
+            break
+        try:
+            enviados, falhas = remetente.enviar_lote(lembretes)
+        except Exception as e:
+            enviados, falhas = [], [(lembrete, str(e) or type(e).__name__) for lembrete in lembretes]
+        database.concluir_lembretes(enviados, falhas, agora)
+        rodada['enviados'] += len(enviados)
+        rodada['falhas'] += len(falhas)
+        rodada['lotes'] += 1
+    return rodada
+
+class ProcessadorLembretes:
+    """
+    Gera e envia os lembretes do banco atual a partir de uma thread própria, com a sessão de acesso
+    atual (as escritas na fila exigem 'sessoes.editar'). Ao trocar de clínica, encerre e crie outro.
+    """
+
+    def __init__(self, remetente, lote=LOTE_MAXIMO, intervalo=INTERVALO_PROCESSAMENTO_S):
+        self.remetente = remetente
+        self.lote = lote
+        self.intervalo = intervalo
+        self.estatisticas = {'gerados': 0, 'enviados': 0, 'falhas': 0, 'lotes': 0, 'rodadas': 0}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='lembretes', daemon=True)
+        self._thread.start()
+
+    def processar(self, agora=None):
+        """
+        Uma rodada: gera os lembretes da janela e envia, lote a lote, todos os que já venceram. Também
+        pode ser chamada diretamente (agora é um time.time()). Retorna os totais da rodada.
+        """
+        rodada = processar(self.remetente, self.lote, agora, self._parar)
+        for chave, n in rodada.items():
+            self.estatisticas[chave] += n
+        self.estatisticas['rodadas'] += 1
+        return rodada
+
+    def _executar(self):
+        try:
+            while not self._parar.is_set():
+                try:
+                    self.processar()
+                except Exception as e:
+                    # Banco ocupado, sessão encerrada...: a próxima rodada tenta de novo
+                    print(f"Aviso: falha ao processar os lembretes (nova tentativa na próxima rodada): {e}")
+                self._parar.wait(self.intervalo)
+        finally:
+            database.fechar_conexoes() # As conexões desta thread
+
+    def encerrar(self, espera=30):
+        """Para a thread depois do lote em andamento (esperando até espera segundos)."""
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join(espera)
+
+_processador = None
+
+def iniciar(remetente=None):
+    """Passa a enviar os lembretes do banco atual (por padrão, para o arquivo de caminho_saida). Retorna o processador."""
+    global _processador
+    if _processador is None:
+        _processador = ProcessadorLembretes(remetente or RemetenteArquivo())
+        atexit.register(encerrar)
+    return _processador
+
+def encerrar():
+    """Para o envio de lembretes."""
+    global _processador
+    if _processador is not None:
+        _processador.encerrar()
+        _processador = None
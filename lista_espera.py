@@ -0,0 +1,74 @@
+"""
+Lista de espera: propostas de pacientes para os horários que ficam livres na agenda.
+
+Quando uma sessão é desmarcada ou o médico ganha um novo horário de disponibilidade, propor_vagas
+calcula os horários livres do médico no dia (agenda.montar_agenda sobre database.agenda_medico) e,
+para cada um, pede ao banco os pacientes que cabem nele (database.candidatos_lista_espera). Essa
+busca percorre só uma faixa dos índices (medico_id, minuto_inicio) e (especialidade, minuto_inicio)
+da lista, e não a lista inteira. Cada proposta começa no primeiro minuto em que a janela preferida
+do paciente e o horário livre se encontram.
+"""
+from datetime import date
+
+import agenda
+import database
+
+LIMITE_PROPOSTAS = 5
+
+def mascara_dias(dias):
+    """Converte dias da semana (0 = segunda ... 6 = domingo) na máscara de bits guardada na lista."""
+    return sum(1 << d for d in set(dias))
+
+def _hora(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+def propor_vagas(medico_id, data, limite=LIMITE_PROPOSTAS):
+    """
+    Retorna até limite propostas para os horários livres do médico na data (date ou YYYY-MM-DD), da
+    melhor para a pior (prioridade, depois antiguidade na lista). Cada proposta tem espera_id,
+    paciente_id, paciente_nome, medico_id, data (YYYY-MM-DD), hora_inicio, hora_fim e prioridade.
+    Um paciente aparece uma única vez; datas passadas não têm propostas.
+    """
+    data = date.fromisoformat(data) if isinstance(data, str) else data
+    if data < date.today():
+        return []
+    dia = database.dia_numero(data)
+    livres = [item for item in agenda.montar_agenda(database.agenda_medico(medico_id, data, data)).get(dia, [])
+              if item['tipo'] == 'livre']
+    candidatos = []
+    for livre in livres:
+        for candidato in database.candidatos_lista_espera(medico_id, data, livre['minuto_inicio'], livre['minuto_fim'], limite):
+            inicio = max(candidato['minuto_inicio'], livre['minuto_inicio'])
+            candidatos.append((candidato, inicio))
+    candidatos.sort(key=lambda c: (-c[0]['prioridade'], c[0]['criado_em'], c[0]['id']))
+    propostas, pacientes = [], set()
+    for candidato, inicio in candidatos:
+        if candidato['paciente_id'] in pacientes:
+            continue
+        pacientes.add(candidato['paciente_id'])
+        propostas.append({
+            'espera_id': candidato['id'], 'paciente_id': candidato['paciente_id'], 'paciente_nome': candidato['paciente_nome'],
+            'medico_id': medico_id, 'data': data.isoformat(), 'hora_inicio': _hora(inicio),
+            'hora_fim': _hora(inicio + candidato['duracao_minutos']), 'prioridade': candidato['prioridade'],
+        })
+        if len(propostas) == limite:
+            break
+    return propostas
+
+def propor_para_sessoes(sessoes, limite=LIMITE_PROPOSTAS):
+    """
+    Propostas para as vagas abertas pela exclusão das sessões indicadas (lidas antes da exclusão, com
+    medico_id e data_sessao): {(medico_id, data): [proposta, ...]}, só com os dias que têm propostas.
+    """
+    vagas = sorted({(s['medico_id'], s['data_sessao']) for s in sessoes if s.get('medico_id') and s.get('data_sessao')})
+    resultado = {}
+    for medico_id, data in vagas:
+        propostas = propor_vagas(medico_id, data, limite)
+        if propostas:
+            resultado[(medico_id, data)] = propostas
+    return resultado
+
+def agendar(proposta):
+    """Agenda a proposta e tira o paciente da lista de espera. Retorna o ID da sessão (ver database.agendar_da_lista_espera)."""
+    return database.agendar_da_lista_espera(proposta['espera_id'], proposta['medico_id'], proposta['data'],
+                                            proposta['hora_inicio'], proposta['hora_fim'])
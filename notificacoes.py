@@ -0,0 +1,77 @@
+"""
+Notificação de alterações feitas por outras estações (ou processos) no banco da clínica.
+
+Os gatilhos de log_alteracoes (ver database.alteracoes_desde) numeram cada alteração. A vigia
+guarda a última sequência vista e, a cada verificação, lê apenas o PRAGMA data_version de uma
+conexão própria, que não toca nas tabelas: ele só muda quando outra conexão grava no arquivo.
+Só então busca as linhas do log posteriores à sequência guardada e as entrega às janelas
+inscritas, que atualizam apenas o que mudou. A janela principal agenda verificar() com after().
+
+As gravações deste mesmo processo (feitas pelas conexões de database._conectar, e não pela da
+vigia) também mudam o data_version e também são entregues. O log não registra a conexão de
+origem, e separar as linhas pela sequência falharia com gravações simultâneas de outra estação;
+a janela que gravou apenas relê as linhas que já mostra, o que é barato e nunca perde alterações.
+"""
+import sqlite3
+
+import database
+
+INTERVALO_VERIFICACAO_MS = 1000
+
+class VigiaAlteracoes:
+    """
+    Acompanha o banco atual e avisa as funções inscritas sobre as alterações gravadas por outras conexões
+    (inclusive as deste processo; ver o início do módulo).
+    Ao trocar de clínica (database.selecionar_clinica), feche a vigia e crie outra.
+    """
+
+    def __init__(self):
+        self.arquivo = database.DB_FILE
+        self._conn = sqlite3.connect(self.arquivo, check_same_thread=False)
+        self._inscritos = []  # (conjunto de tabelas, função)
+        # A versão é lida antes da sequência: uma gravação entre as duas leituras aparece na próxima verificação
+        self._versao = self._ler_versao()
+        self.seq = database.ultima_alteracao()
+
+    def _ler_versao(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def inscrever(self, tabelas, funcao):
+        """
+        Inscreve funcao(alteracoes) para as alterações das tabelas indicadas. alteracoes é a lista de
+        alterações dessas tabelas (ver database.alteracoes_desde) ou None quando é preciso recarregar tudo.
+        """
+        self._inscritos.append((frozenset(tabelas), funcao))
+
+    def cancelar(self, funcao):
+        self._inscritos = [(tabelas, f) for tabelas, f in self._inscritos if f != funcao]
+
+    def verificar(self):
+        """Entrega as alterações novas aos inscritos. Retorna quantas alterações novas havia (0 se o banco não mudou)."""
+        versao = self._ler_versao()
+        if versao == self._versao:
+            return 0
+        self._versao = versao
+        seq_anterior = self.seq
+        resultado = database.alteracoes_desde(seq_anterior)
+        self.seq = resultado['seq']
+        alteracoes = resultado['alteracoes']
+        if alteracoes == []:
+            return 0
+        for tabelas, funcao in list(self._inscritos):
+            if alteracoes is None:
+                relevantes = None
+            else:
+                relevantes = [a for a in alteracoes if a['tabela'] in tabelas]
+                if not relevantes:
+                    continue
+            try:
+                funcao(relevantes)
+            except Exception as e:
+                # Uma janela com defeito não deve impedir que as demais sejam avisadas
+                print(f"Aviso: inscrito {getattr(funcao, '__name__', funcao)} falhou: {e}")
+        return self.seq - seq_anterior
+
+    def fechar(self):
+        self._conn.close()
+        self._inscritos = []
@@ -0,0 +1,339 @@
+"""
+Relatórios para entregar às famílias: prontuário e histórico completo de sessões de um paciente.
+
+Gera HTML (a partir de um modelo com string.Template) e PDF (escritor próprio em Python puro,
+sem dependências). As sessões são lidas do banco em lotes e escritas no arquivo à medida que
+chegam, sem carregar o histórico inteiro na memória. Relatórios de muitos pacientes podem ser
+gerados em paralelo num pool de processos:
+
+    python relatorios.py 12 --saida relatorio.pdf
+    python relatorios.py --todos --pasta relatorios --formatos html pdf --processos 4
+    python relatorios.py 12 --saida relatorio.pdf --usuario admin   # banco com criptografia
+
+Num banco com os textos clínicos criptografados, --usuario abre a chave no login (a senha vem de
+CLINICA_SENHA ou é pedida no terminal); sem ela, os textos saem como conteúdo indisponível.
+"""
+import argparse
+import getpass
+import html
+import os
+import re
+import textwrap
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from string import Template
+
+import database
+from formatacao import calcular_idade_por_dia, formatar_dia_para_exibicao
+
+# --- Modelo HTML ---
+# O modelo tem três partes: 'inicio' (cabeçalho e prontuário), 'sessao' (repetida para cada sessão)
+# e 'fim'. Os valores já chegam escapados para HTML.
+
+MODELO_HTML = {
+    'inicio': Template("""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>Relatório - $nome</title>
+<style>
+  body { font-family: Helvetica, Arial, sans-serif; margin: 2cm; color: #222; }
+  h1 { font-size: 20px; border-bottom: 2px solid #444; padding-bottom: 4px; }
+  h2 { font-size: 16px; margin-top: 28px; }
+  h3 { font-size: 13px; margin-bottom: 2px; }
+  h4 { font-size: 11px; margin: 8px 0 2px; color: #555; }
+  p { font-size: 11px; margin: 0 0 6px; }
+  .sessao { border-top: 1px solid #ccc; padding-top: 6px; page-break-inside: avoid; }
+  .rodape { margin-top: 30px; font-size: 9px; color: #777; }
+</style>
+</head>
+<body>
+<h1>Relatório de Acompanhamento Terapêutico</h1>
+<p><strong>Paciente:</strong> $nome<br>
+<strong>Data de nascimento:</strong> $nascimento ($idade anos)<br>
+<strong>Responsável:</strong> $responsavel</p>
+<h2>Prontuário</h2>
+<h4>Queixa principal</h4><p>$queixa</p>
+<h4>Histórico médico relevante</h4><p>$historico</p>
+<h4>Anamnese</h4><p>$anamnese</p>
+<h4>Informações adicionais</h4><p>$informacoes</p>
+<h2>Histórico de Sessões</h2>
+"""),
+    'sessao': Template("""<section class="sessao">
+<h3>$data $horario &mdash; $medico</h3>
+<h4>Nível de evolução</h4><p>$nivel</p>
+<h4>Resumo da sessão</h4><p>$resumo</p>
+<h4>Observações sobre a evolução</h4><p>$observacoes</p>
+<h4>Plano terapêutico</h4><p>$plano</p>
+</section>
+"""),
+    'fim': Template("""<p class="rodape">$total_sessoes sessão(ões). Relatório gerado em $gerado_em.</p>
+</body>
+</html>
+"""),
+}
+
+# --- Dados do Relatório ---
+
+SEM_PRONTUARIO = 'Sem prontuário'
+
+def _texto(valor):
+    return (valor or '').strip() or '—'
+
+def _cabecalho(paciente_id):
+    """Reúne os dados do paciente e do prontuário, já formatados para exibição."""
+    paciente = database.buscar_paciente_por_id(paciente_id)
+    if paciente is None:
+        raise ValueError(f"Paciente {paciente_id} não encontrado.")
+    prontuario = database.buscar_prontuario_por_paciente(paciente_id) # Só leitura: o relatório não cria prontuários
+    if prontuario is None:
+        prontuario = dict.fromkeys(('queixa_principal', 'historico_medico_relevante', 'anamnese', 'informacoes_adicionais'),
+                                   SEM_PRONTUARIO)
+    return {
+        'nome': paciente['nome_completo'],
+        'nascimento': formatar_dia_para_exibicao(paciente['dia_nascimento'], paciente['data_nascimento']),
+        'idade': calcular_idade_por_dia(paciente['dia_nascimento']),
+        'responsavel': _texto(paciente['nome_responsavel']),
+        'queixa': _texto(prontuario.get('queixa_principal')),
+        'historico': _texto(prontuario.get('historico_medico_relevante')),
+        'anamnese': _texto(prontuario.get('anamnese')),
+        'informacoes': _texto(prontuario.get('informacoes_adicionais')),
+    }
+
+def _sessoes(paciente_id):
+    """Sessões do paciente, da mais antiga para a mais recente, já formatadas, uma de cada vez."""
+    for sessao in database.iterar_sessoes_paciente(paciente_id):
+        inicio, fim = sessao['hora_inicio_sessao'], sessao['hora_fim_sessao']
+        yield {
+            'data': formatar_dia_para_exibicao(sessao['dia_sessao'], sessao['data_sessao']),
+            'horario': f"{inicio}–{fim}" if inicio and fim else (inicio or ''),
+            'medico': sessao['medico_nome'] or 'Não definido',
+            'nivel': _texto(sessao['nivel_evolucao']),
+            'resumo': _texto(sessao['resumo_sessao']),
+            'observacoes': _texto(sessao['observacoes_evolucao']),
+            'plano': _texto(sessao['plano_terapeutico']),
+        }
+
+# --- HTML ---
+
+def _escapar(valores):
+    return {chave: html.escape(str(valor)).replace('\n', '<br>') for chave, valor in valores.items()}
+
+def gerar_relatorio_html(paciente_id, caminho, modelo=MODELO_HTML):
+    """Escreve o relatório HTML do paciente em 'caminho'. Retorna o número de sessões incluídas."""
+    cabecalho = _cabecalho(paciente_id)
+    total = 0
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write(modelo['inicio'].substitute(_escapar(cabecalho)))
+        for sessao in _sessoes(paciente_id):
+            f.write(modelo['sessao'].substitute(_escapar(sessao)))
+            total += 1
+        f.write(modelo['fim'].substitute(total_sessoes=total, gerado_em=datetime.now().strftime('%d/%m/%Y %H:%M')))
+    return total
+
+# --- PDF ---
+
+class EscritorPDF:
+    """
+    Escritor de PDF mínimo, só com texto em Helvetica (fontes padrão do PDF, codificação WinAnsi).
+    Cada página é gravada no arquivo assim que fica cheia; ao fechar, grava a árvore de páginas,
+    o catálogo e a tabela de referências cruzadas.
+    """
+    LARGURA, ALTURA, MARGEM = 595, 842, 50  # A4, em pontos
+
+    def __init__(self, arquivo, titulo=''):
+        self.arquivo = arquivo
+        self.offsets = {}
+        self.paginas = []
+        self.proximo_objeto = 5  # 1: catálogo, 2: árvore de páginas, 3 e 4: fontes
+        self.comandos = []
+        self.y = None
+        arquivo.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for numero, fonte in ((3, 'Helvetica'), (4, 'Helvetica-Bold')):
+            self._objeto(numero, f"<< /Type /Font /Subtype /Type1 /BaseFont /{fonte} /Encoding /WinAnsiEncoding >>".encode())
+        self.titulo = titulo
+
+    def _objeto(self, numero, corpo):
+        self.offsets[numero] = self.arquivo.tell()
+        self.arquivo.write(f"{numero} 0 obj\n".encode() + corpo + b"\nendobj\n")
+
+    def _novo_numero(self):
+        numero = self.proximo_objeto
+        self.proximo_objeto += 1
+        return numero
+
+    @staticmethod
+    def _literal(texto):
+        dados = texto.encode('cp1252', errors='replace')
+        return b'(' + dados.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+    def _fechar_pagina(self):
+        if self.y is None:
+            return
+        conteudo = b'\n'.join(self.comandos)
+        numero_conteudo, numero_pagina = self._novo_numero(), self._novo_numero()
+        self._objeto(numero_conteudo, b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+        self._objeto(numero_pagina, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.LARGURA} {self.ALTURA}] "
+                                     f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {numero_conteudo} 0 R >>").encode())
+        self.paginas.append(numero_pagina)
+        self.comandos, self.y = [], None
+
+    def _linha(self, texto, tamanho, negrito=False):
+        altura = tamanho * 1.35
+        if self.y is None or self.y - altura < self.MARGEM:
+            self._fechar_pagina()
+            self.y = self.ALTURA - self.MARGEM
+        self.y -= altura
+        fonte = '/F2' if negrito else '/F1'
+        self.comandos.append(b"BT %s %g Tf %d %.1f Td " % (fonte.encode(), tamanho, self.MARGEM, self.y)
+                             + self._literal(texto) + b" Tj ET")
+
+    def texto(self, conteudo, tamanho=10, negrito=False):
+        """Escreve um parágrafo, quebrando as linhas pela largura útil (largura média de caractere da Helvetica)."""
+        largura_caracteres = int((self.LARGURA - 2 * self.MARGEM) / (tamanho * 0.52))
+        for paragrafo in (conteudo or '').split('\n'):
+            for linha in textwrap.wrap(paragrafo, largura_caracteres) or ['']:
+                self._linha(linha, tamanho, negrito)
+
+    def espaco(self, pontos=6):
+        if self.y is not None:
+            self.y -= pontos
+
+    def fechar(self):
+        self._fechar_pagina()
+        if not self.paginas: # PDF sem páginas é inválido
+            self._linha('', 10)
+            self._fechar_pagina()
+        kids = ' '.join(f"{n} 0 R" for n in self.paginas)
+        self._objeto(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.paginas)} >>".encode())
+        self._objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        numero_info = self._novo_numero()
+        self._objeto(numero_info, b"<< /Title " + self._literal(self.titulo) + b" /Producer (Sistema de Clinica) >>")
+        inicio_xref = self.arquivo.tell()
+        total = self.proximo_objeto
+        linhas = [b"xref", b"0 %d" % total, b"0000000000 65535 f "]
+        linhas += [b"%010d 00000 n " % self.offsets[n] for n in range(1, total)]
+        self.arquivo.write(b"\n".join(linhas) + b"\n")
+        self.arquivo.write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (total, numero_info, inicio_xref))
+
+def gerar_relatorio_pdf(paciente_id, caminho):
+    """Escreve o relatório PDF do paciente em 'caminho'. Retorna o número de sessões incluídas."""
+    cabecalho = _cabecalho(paciente_id)
+    total = 0
+    with open(caminho, 'wb') as f:
+        pdf = EscritorPDF(f, titulo=f"Relatório - {cabecalho['nome']}")
+        pdf.texto("Relatório de Acompanhamento Terapêutico", 16, negrito=True)
+        pdf.espaco(8)
+        pdf.texto(f"Paciente: {cabecalho['nome']}", 11, negrito=True)
+        pdf.texto(f"Data de nascimento: {cabecalho['nascimento']} ({cabecalho['idade']} anos)")
+        pdf.texto(f"Responsável: {cabecalho['responsavel']}")
+        pdf.espaco(10)
+        pdf.texto("Prontuário", 13, negrito=True)
+        for titulo, chave in (("Queixa principal", 'queixa'), ("Histórico médico relevante", 'historico'),
+                              ("Anamnese", 'anamnese'), ("Informações adicionais", 'informacoes')):
+            pdf.espaco(4)
+            pdf.texto(titulo, 10, negrito=True)
+            pdf.texto(cabecalho[chave])
+        pdf.espaco(10)
+        pdf.texto("Histórico de Sessões", 13, negrito=True)
+        for sessao in _sessoes(paciente_id):
+            pdf.espaco(8)
+            pdf.texto(f"{sessao['data']} {sessao['horario']} - {sessao['medico']}", 11, negrito=True)
+            pdf.texto(f"Nível de evolução: {sessao['nivel']}")
+            for titulo, chave in (("Resumo da sessão", 'resumo'), ("Observações sobre a evolução", 'observacoes'),
+                                  ("Plano terapêutico", 'plano')):
+                pdf.texto(titulo, 9, negrito=True)
+                pdf.texto(sessao[chave])
+            total += 1
+        pdf.espaco(12)
+        pdf.texto(f"{total} sessão(ões). Relatório gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')}.", 8)
+        pdf.fechar()
+    return total
+
+def gerar_relatorio(paciente_id, caminho):
+    """Gera o relatório no formato indicado pela extensão do arquivo (.html ou .pdf)."""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao in ('.html', '.htm'):
+        return gerar_relatorio_html(paciente_id, caminho)
+    if extensao == '.pdf':
+        return gerar_relatorio_pdf(paciente_id, caminho)
+    raise ValueError(f"Formato de relatório não suportado: '{extensao}'. Use .html ou .pdf.")
+
+# --- Geração em Lote ---
+
+def nome_arquivo_relatorio(paciente_id, nome, formato):
+    """Nome de arquivo seguro a partir do nome do paciente, ex.: relatorio_000012_ana_souza.pdf."""
+    sem_acentos = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode()
+    slug = re.sub(r'[^a-z0-9]+', '_', sem_acentos.lower()).strip('_')
+    return f"relatorio_{paciente_id:06d}_{slug}.{formato}"
+
+def _inicializar_processo(arquivo_db, credenciais):
+    # Com 'spawn' (Windows, macOS) o processo filho importa database.py do zero
+    database.DB_FILE = arquivo_db
+    if credenciais: # A sessão (e a chave dos textos) não passa para o filho: cada processo faz o seu login
+        database.iniciar_sessao(*credenciais)
+
+def _gerar_para_paciente(paciente_id, pasta, formatos):
+    paciente = database.buscar_paciente_por_id(paciente_id)
+    arquivos, sessoes = [], 0
+    for formato in formatos:
+        caminho = os.path.join(pasta, nome_arquivo_relatorio(paciente_id, paciente['nome_completo'], formato))
+        sessoes = gerar_relatorio(paciente_id, caminho)
+        arquivos.append(caminho)
+    return {'paciente_id': paciente_id, 'arquivos': arquivos, 'sessoes': sessoes}
+
+def gerar_relatorios_em_lote(paciente_ids, pasta, formatos=('html', 'pdf'), processos=None, ao_concluir=None, credenciais=None):
+    """
+    Gera os relatórios de vários pacientes em paralelo, num pool de processos (processos=1 gera
+    no próprio processo, com a sessão atual). ao_concluir(resultado) é chamada a cada paciente
+    concluído. credenciais=(nome_usuario, senha) abre uma sessão em cada processo do pool, para
+    decifrar os textos de um banco com criptografia. Retorna a lista de resultados, na ordem dos ids.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    resultados = []
+    if processos == 1:
+        for paciente_id in paciente_ids:
+            resultados.append(_gerar_para_paciente(paciente_id, pasta, formatos))
+            if ao_concluir:
+                ao_concluir(resultados[-1])
+        return resultados
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo,
+                             initargs=(database.DB_FILE, credenciais)) as executor:
+        total = len(paciente_ids)
+        for resultado in executor.map(_gerar_para_paciente, paciente_ids, [pasta] * total, [formatos] * total, chunksize=8):
+            resultados.append(resultado)
+            if ao_concluir:
+                ao_concluir(resultado)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera relatórios de prontuário e histórico de sessões.")
+    parser.add_argument('pacientes', nargs='*', type=int, help="IDs dos pacientes.")
+    parser.add_argument('--todos', action='store_true', help="Gera para todos os pacientes cadastrados.")
+    parser.add_argument('--db', default=database.DB_FILE)
+    parser.add_argument('--saida', help="Arquivo de saída (.html ou .pdf) quando há um único paciente.")
+    parser.add_argument('--pasta', default='relatorios', help="Pasta de saída para a geração em lote.")
+    parser.add_argument('--formatos', nargs='+', choices=('html', 'pdf'), default=['pdf'])
+    parser.add_argument('--processos', type=int, help="Tamanho do pool de processos (padrão: número de CPUs).")
+    parser.add_argument('--usuario', help="Usuário que abre a chave dos textos criptografados (senha em CLINICA_SENHA ou pedida no terminal).")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db
+    credenciais = None
+    if args.usuario:
+        credenciais = (args.usuario, os.environ.get('CLINICA_SENHA') or getpass.getpass(f"Senha de {args.usuario}: "))
+        database.iniciar_sessao(*credenciais)
+    if args.saida and len(args.pacientes) == 1:
+        sessoes = gerar_relatorio(args.pacientes[0], args.saida)
+        print(f"Relatório gravado em {args.saida} ({sessoes} sessões).")
+        return
+    paciente_ids = [p['id'] for p in database.listar_pacientes()] if args.todos else args.pacientes
+    inicio = time.perf_counter()
+    resultados = gerar_relatorios_em_lote(paciente_ids, args.pasta, tuple(args.formatos), args.processos, credenciais=credenciais)
+    duracao = time.perf_counter() - inicio
+    print(f"{len(resultados)} relatório(s) em {duracao:.1f}s ({len(resultados) / duracao * 60:.0f} por minuto) na pasta '{args.pasta}'.")
+
+if __name__ == "__main__":
+    main()
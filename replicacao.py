@@ -0,0 +1,467 @@
+"""
+Replicação offline entre cópias do banco da clínica (por exemplo, o notebook das visitas domiciliares).
+
+Cada banco com a replicação ativada (ativar) tem uma origem, que identifica a cópia, e um relógio de
+Lamport. Gatilhos em medicos, pacientes, disponibilidade_medico, prontuarios e sessoes registram a
+versão de cada linha em replicacao_versoes: um uuid, que identifica a linha em todas as cópias (os
+ids locais divergem), o relógio e a origem da última alteração e o seq local em que ela chegou aqui.
+Uma exclusão deixa a versão como lápide (excluido = 1).
+
+exportar grava num arquivo delta (JSON comprimido com gzip) o estado atual de cada linha alterada
+desde o último seq que o destino confirmou ter recebido, com as chaves estrangeiras trocadas por
+uuids. aplicar, na outra cópia, grava cada linha cuja versão (relógio, origem) seja maior que a
+local: a última escrita vence e a origem desempata, então as duas cópias chegam ao mesmo resultado
+em qualquer ordem. Prontuários são mesclados campo a campo: um campo vazio de um lado recebe o texto
+do outro, e só os campos preenchidos dos dois lados seguem a versão vencedora. Uma sessão recebida
+que não cabe na agenda local (conflito de horário ou fora da disponibilidade) não é gravada: fica em
+replicacao_conflitos para revisão.
+
+Para começar, ative a replicação no banco da clínica e crie a cópia do notebook com criar_copia, que
+dá a ela uma origem própria. O arquivo morto e os anexos não são replicados: uma sessão arquivada
+chega às outras cópias como excluída. Textos cifrados seguem cifrados, e a cópia criada por
+criar_copia tem a mesma chave de dados. Uso pela linha de comando:
+
+    python replicacao.py copiar notebook.db              # no banco da clínica
+    python replicacao.py exportar para_clinica.json.gz --db notebook.db
+    python replicacao.py aplicar para_clinica.json.gz    # no banco da clínica
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import secrets
+import sqlite3
+import time
+
+import database
+
+# Na ordem de aplicação: cada tabela vem depois das que ela referencia
+TABELAS = ('medicos', 'pacientes', 'disponibilidade_medico', 'prontuarios', 'sessoes')
+CHAVES_ESTRANGEIRAS = {
+    'disponibilidade_medico': {'medico_id': 'medicos'},
+    'prontuarios': {'paciente_id': 'pacientes'},
+    'sessoes': {'paciente_id': 'pacientes', 'medico_id': 'medicos'},
+}
+CAMPOS_MESCLADOS = {'prontuarios': ('queixa_principal', 'historico_medico_relevante', 'anamnese', 'informacoes_adicionais')}
+FORMATO_DELTA = 1
+LOTE_CONSULTA = 500 # Ids por consulta (json_each)
+
+_ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS replicacao_estado (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        origem TEXT NOT NULL, -- Identifica esta cópia do banco
+        relogio INTEGER NOT NULL -- Relógio de Lamport; também numera a chegada das versões (seq)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS replicacao_versoes (
+        uuid TEXT PRIMARY KEY, -- Identifica a linha em todas as cópias
+        tabela TEXT NOT NULL,
+        registro_id INTEGER, -- id local; NULL na lápide de uma linha que nunca existiu nesta cópia
+        relogio INTEGER NOT NULL,
+        origem TEXT NOT NULL, -- Cópia que fez a última alteração
+        seq INTEGER NOT NULL, -- Relógio local quando a versão chegou a esta cópia
+        excluido INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_replicacao_registro ON replicacao_versoes (tabela, registro_id) WHERE excluido = 0",
+    "CREATE INDEX IF NOT EXISTS idx_replicacao_seq ON replicacao_versoes (seq)",
+    """
+    CREATE TABLE IF NOT EXISTS replicacao_pares (
+        origem TEXT PRIMARY KEY,
+        confirmado INTEGER NOT NULL DEFAULT 0, -- Seq local até o qual o par confirmou ter recebido
+        recebido INTEGER NOT NULL DEFAULT 0 -- Seq do par até o qual esta cópia já aplicou
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS replicacao_conflitos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabela TEXT NOT NULL,
+        uuid TEXT NOT NULL,
+        relogio INTEGER NOT NULL,
+        origem TEXT NOT NULL,
+        dados TEXT NOT NULL, -- Linha recebida, em JSON (chaves estrangeiras como uuids)
+        motivo TEXT NOT NULL,
+        recebido_em REAL NOT NULL -- Momento (time.time()) da aplicação
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_replicacao_conflitos_uuid ON replicacao_conflitos (uuid)",
+)
+
+# O prontuário é único por paciente: o uuid deriva do uuid do paciente, então os prontuários
+# criados em branco nas duas cópias são reconhecidos como a mesma linha
+_SQL_UUID = {
+    'prontuarios': "'prontuario:' || COALESCE((SELECT uuid FROM replicacao_versoes WHERE tabela = 'pacientes' "
+                   "AND registro_id = {linha}.paciente_id AND excluido = 0), lower(hex(randomblob(16))))",
+}
+_SQL_UUID_PADRAO = "lower(hex(randomblob(16)))"
+
+def _sql_gatilhos(tabela):
+    """Gatilhos que registram a versão local de cada inserção, alteração e exclusão da tabela."""
+    uuid = _SQL_UUID.get(tabela, _SQL_UUID_PADRAO).format(linha='NEW')
+    versao_local = "(relogio, origem, seq) = (SELECT relogio, origem, relogio FROM replicacao_estado)"
+    return [
+        (f"trg_replicacao_{tabela}_inserido", f"""
+        CREATE TRIGGER trg_replicacao_{tabela}_inserido AFTER INSERT ON {tabela} BEGIN
+            UPDATE replicacao_estado SET relogio = relogio + 1;
+            INSERT OR REPLACE INTO replicacao_versoes (uuid, tabela, registro_id, relogio, origem, seq)
+                SELECT {uuid}, '{tabela}', NEW.id, relogio, origem, relogio FROM replicacao_estado;
+        END"""),
+        (f"trg_replicacao_{tabela}_atualizado", f"""
+        CREATE TRIGGER trg_replicacao_{tabela}_atualizado AFTER UPDATE ON {tabela} BEGIN
+            UPDATE replicacao_estado SET relogio = relogio + 1;
+            UPDATE replicacao_versoes SET {versao_local}
+                WHERE tabela = '{tabela}' AND registro_id = NEW.id AND excluido = 0;
+        END"""),
+        (f"trg_replicacao_{tabela}_excluido", f"""
+        CREATE TRIGGER trg_replicacao_{tabela}_excluido AFTER DELETE ON {tabela} BEGIN
+            UPDATE replicacao_estado SET relogio = relogio + 1;
+            UPDATE replicacao_versoes SET {versao_local}, excluido = 1
+                WHERE tabela = '{tabela}' AND registro_id = OLD.id AND excluido = 0;
+        END"""),
+    ]
+
+def _abrir(arquivo=None):
+    conn = sqlite3.connect(arquivo or database.DB_FILE, isolation_level=None) # Transações explícitas
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def _estado(conn):
+    row = conn.execute("SELECT origem, relogio FROM replicacao_estado WHERE id = 1").fetchone() \
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'replicacao_estado'").fetchone() else None
+    if row is None:
+        raise ValueError("A replicação não está ativada neste banco (ver replicacao.ativar).")
+    return row
+
+def _colunas(conn, tabela):
+    """Colunas gravadas da tabela (sem o id e sem as colunas geradas)."""
+    return [nome for nome, oculta in conn.execute("SELECT name, hidden FROM pragma_table_xinfo(?)", (tabela,))
+            if oculta == 0 and nome != 'id']
+
+def _em_lotes(itens, tamanho=LOTE_CONSULTA):
+    for inicio in range(0, len(itens), tamanho):
+        yield itens[inicio:inicio + tamanho]
+
+def _ativar(conn):
+    """Cria as tabelas e os gatilhos e registra a versão inicial das linhas existentes. Retorna a origem."""
+    for instrucao in _ESQUEMA:
+        conn.execute(instrucao)
+    if conn.execute("SELECT 1 FROM replicacao_estado").fetchone() is None:
+        conn.execute("INSERT INTO replicacao_estado (id, origem, relogio) VALUES (1, ?, 0)", (secrets.token_hex(8),))
+    for tabela in TABELAS:
+        for nome, gatilho in _sql_gatilhos(tabela):
+            conn.execute(f"DROP TRIGGER IF EXISTS {nome}")
+            conn.execute(gatilho)
+        # Linhas anteriores à ativação: versão 0, igual em todas as cópias feitas depois (criar_copia)
+        conn.execute(f"""
+            INSERT INTO replicacao_versoes (uuid, tabela, registro_id, relogio, origem, seq)
+            SELECT {_SQL_UUID.get(tabela, _SQL_UUID_PADRAO).format(linha='t')}, '{tabela}', t.id, 0, e.origem, 0
+            FROM {tabela} t, replicacao_estado e
+            WHERE NOT EXISTS (SELECT 1 FROM replicacao_versoes v WHERE v.tabela = '{tabela}' AND v.registro_id = t.id AND v.excluido = 0)""")
+    return _estado(conn)[0]
+
+def ativar(arquivo=None):
+    """Ativa a replicação no banco (por padrão, o atual). Pode ser chamada de novo sem efeito. Retorna a origem."""
+    database.exigir_permissao('banco.manutencao')
+    conn = _abrir(arquivo)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        origem = _ativar(conn)
+        conn.execute("COMMIT")
+        return origem
+    finally:
+        conn.close()
+
+def criar_copia(destino, arquivo=None):
+    """
+    Cria em destino uma cópia do banco (por padrão, o atual) para trabalhar desconectada, com origem
+    própria. As duas cópias passam a se conhecer como pares, sem nada a trocar ainda. Ativa a
+    replicação no banco de origem, se preciso. Lança ValueError se destino já existir. Retorna a origem da cópia.
+    """
+    database.exigir_permissao('banco.manutencao')
+    if os.path.exists(destino):
+        raise ValueError(f"O arquivo '{destino}' já existe.")
+    fonte = _abrir(arquivo)
+    copia = None
+    try:
+        fonte.execute("BEGIN IMMEDIATE")
+        origem_fonte = _ativar(fonte)
+        fonte.execute("COMMIT")
+        copia = _abrir(destino)
+        fonte.backup(copia)
+        # O relógio gravado na cópia marca o ponto exato do backup: o que a fonte gravar depois tem seq maior
+        relogio = _estado(copia)[1]
+        origem_copia = secrets.token_hex(8)
+        copia.execute("UPDATE replicacao_estado SET origem = ?", (origem_copia,))
+        for conn, par in ((fonte, origem_copia), (copia, origem_fonte)):
+            conn.execute("INSERT INTO replicacao_pares (origem, confirmado, recebido) VALUES (?, ?, ?)", (par, relogio, relogio))
+        return origem_copia
+    finally:
+        if copia is not None:
+            copia.close()
+        fonte.close()
+
+def listar_pares(arquivo=None):
+    """Cópias conhecidas do banco: [{'origem', 'confirmado', 'recebido'}]."""
+    conn = _abrir(arquivo)
+    try:
+        _estado(conn)
+        return [{'origem': o, 'confirmado': c, 'recebido': r}
+                for o, c, r in conn.execute("SELECT origem, confirmado, recebido FROM replicacao_pares ORDER BY origem")]
+    finally:
+        conn.close()
+
+def _codificar(valor):
+    return {'b64': base64.b64encode(valor).decode('ascii')} if isinstance(valor, bytes) else valor
+
+def _decodificar(valor):
+    return base64.b64decode(valor['b64']) if isinstance(valor, dict) else valor
+
+def exportar(caminho, destino=None, arquivo=None):
+    """
+    Grava em caminho as alterações do banco (por padrão, o atual) que o destino (origem de um par)
+    ainda não confirmou. Sem destino, usa o único par conhecido; sem pares, exporta tudo.
+    Retorna {'linhas': n, 'desde': seq, 'ate': seq, 'bytes': tamanho do arquivo}.
+    """
+    database.exigir_permissao('banco.manutencao')
+    conn = _abrir(arquivo)
+    try:
+        conn.execute("BEGIN") # Leitura consistente: o delta não mistura estados antes e depois de outra escrita
+        origem, relogio = _estado(conn)
+        pares = conn.execute("SELECT origem, confirmado, recebido FROM replicacao_pares").fetchall()
+        if destino is None and len(pares) == 1:
+            destino = pares[0][0]
+        par = next((p for p in pares if p[0] == destino), None)
+        desde, confirmado = (par[1], par[2]) if par else (0, 0)
+        versoes = conn.execute("""
+            SELECT tabela, uuid, registro_id, relogio, origem, excluido FROM replicacao_versoes
+            WHERE seq > ? AND origem IS NOT ? ORDER BY seq""", (desde, destino)).fetchall()
+        uuids = {tabela: dict(conn.execute(
+                     "SELECT registro_id, uuid FROM replicacao_versoes WHERE tabela = ? AND excluido = 0", (tabela,)))
+                 for tabela in {ref for refs in CHAVES_ESTRANGEIRAS.values() for ref in refs.values()}}
+        linhas_por_tabela = {}
+        for tabela in TABELAS:
+            ids = [v[2] for v in versoes if v[0] == tabela and not v[5]]
+            colunas = _colunas(conn, tabela)
+            linhas = linhas_por_tabela[tabela] = {}
+            for lote in _em_lotes(ids):
+                for row in conn.execute(f"SELECT id, {', '.join(colunas)} FROM {tabela} WHERE id IN (SELECT value FROM json_each(?))",
+                                        (json.dumps(lote),)):
+                    dados = {coluna: _codificar(valor) for coluna, valor in zip(colunas, row[1:])}
+                    for coluna, referencia in CHAVES_ESTRANGEIRAS.get(tabela, {}).items():
+                        if dados.get(coluna) is not None:
+                            dados[coluna] = uuids[referencia].get(dados[coluna])
+                    linhas[row[0]] = dados
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    delta = {
+        'formato': FORMATO_DELTA, 'origem': origem, 'destino': destino, 'desde': desde, 'ate': relogio,
+        'confirmado': confirmado, 'relogio': relogio,
+        'linhas': [[tabela, uuid, versao, origem_versao, excluido, None if excluido else linhas_por_tabela[tabela].get(registro_id)]
+                   for tabela, uuid, registro_id, versao, origem_versao, excluido in versoes],
+    }
+    with gzip.open(caminho, 'wt', encoding='utf-8') as f:
+        json.dump(delta, f, ensure_ascii=False, separators=(',', ':'))
+    return {'linhas': len(versoes), 'desde': desde, 'ate': relogio, 'bytes': os.path.getsize(caminho)}
+
+def _mesclar(tabela, local, recebido, recebido_vence):
+    """Campos da linha mesclada: os do vencedor, completados pelos do outro lado onde o vencedor está vazio."""
+    vencedor, perdedor = (recebido, local) if recebido_vence else (local, recebido)
+    mesclado = dict(vencedor)
+    for campo in CAMPOS_MESCLADOS[tabela]:
+        if vencedor.get(campo) in (None, '', b'') and perdedor.get(campo) not in (None, '', b''):
+            mesclado[campo] = perdedor[campo]
+    return mesclado
+
+class _Aplicacao:
+    """Estado da aplicação de um delta numa conexão (dentro de uma transação)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.colunas = {tabela: _colunas(conn, tabela) for tabela in TABELAS}
+        self.ids = {tabela: {uuid: registro_id for uuid, registro_id in conn.execute(
+                        "SELECT uuid, registro_id FROM replicacao_versoes WHERE tabela = ? AND excluido = 0", (tabela,))}
+                    for tabela in {ref for refs in CHAVES_ESTRANGEIRAS.values() for ref in refs.values()}}
+        self.resumo = {'aplicadas': 0, 'mescladas': 0, 'ignoradas': 0, 'conflitos': 0}
+
+    def versao_local(self, uuid):
+        """(registro_id, relogio, origem, excluido) da linha nesta cópia, ou None. Lida a cada linha: a
+        exclusão em cascata de um paciente recebido no mesmo delta muda as versões das suas sessões."""
+        return self.conn.execute("SELECT registro_id, relogio, origem, excluido FROM replicacao_versoes WHERE uuid = ?",
+                                 (uuid,)).fetchone()
+
+    def conflito(self, tabela, uuid, relogio, origem, dados, motivo):
+        # O delta seguinte do mesmo par traz a linha de novo; a mesma versão é registrada uma única vez
+        self.conn.execute("""
+            INSERT INTO replicacao_conflitos (tabela, uuid, relogio, origem, dados, motivo, recebido_em)
+            SELECT ?, ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM replicacao_conflitos WHERE uuid = ? AND relogio = ? AND origem = ?)""",
+            (tabela, uuid, relogio, origem, json.dumps(dados, ensure_ascii=False), motivo, time.time(), uuid, relogio, origem))
+        self.resumo['conflitos'] += 1
+
+    def valores(self, tabela, dados):
+        """Valores locais da linha recebida (chaves estrangeiras como ids locais); lança KeyError se faltar a referência."""
+        valores = {coluna: _decodificar(valor) for coluna, valor in dados.items() if coluna in self.colunas[tabela]}
+        for coluna, referencia in CHAVES_ESTRANGEIRAS.get(tabela, {}).items():
+            if valores.get(coluna) is not None:
+                valores[coluna] = self.ids[referencia][valores[coluna]]
+        return valores
+
+    def ler_local(self, tabela, registro_id):
+        colunas = self.colunas[tabela]
+        row = self.conn.execute(f"SELECT {', '.join(colunas)} FROM {tabela} WHERE id = ?", (registro_id,)).fetchone()
+        return dict(zip(colunas, row))
+
+    def fixar_versao(self, tabela, registro_id, uuid, relogio, origem):
+        """Troca a versão local, recém-gravada pelo gatilho, pela versão recebida."""
+        self.conn.execute("UPDATE replicacao_versoes SET uuid = ?, relogio = ?, origem = ? WHERE tabela = ? AND registro_id = ? AND excluido = 0",
+                          (uuid, relogio, origem, tabela, registro_id))
+
+    def aplicar(self, tabela, uuid, relogio, origem, excluido, dados, local):
+        conn = self.conn
+        vence = local is None or (relogio, origem) > (local[1], local[2])
+        vivo = local is not None and local[0] is not None and not local[3]
+        if excluido:
+            if not vence:
+                self.resumo['ignoradas'] += 1
+                return
+            if vivo:
+                conn.execute(f"DELETE FROM {tabela} WHERE id = ?", (local[0],))
+                conn.execute("UPDATE replicacao_versoes SET relogio = ?, origem = ? WHERE uuid = ?", (relogio, origem, uuid))
+                self.ids.get(tabela, {}).pop(uuid, None)
+            else: # Lápide de uma linha que não existe aqui: guardada para vencer uma alteração mais antiga que ainda chegue
+                conn.execute("UPDATE replicacao_estado SET relogio = relogio + 1")
+                conn.execute("""
+                    INSERT OR REPLACE INTO replicacao_versoes (uuid, tabela, registro_id, relogio, origem, seq, excluido)
+                    SELECT ?, ?, NULL, ?, ?, relogio, 1 FROM replicacao_estado""", (uuid, tabela, relogio, origem))
+            self.resumo['aplicadas'] += 1
+            return
+        mesclar = tabela in CAMPOS_MESCLADOS and vivo
+        if not vence and not mesclar:
+            self.resumo['ignoradas'] += 1
+            return
+        try:
+            valores = self.valores(tabela, dados)
+        except KeyError:
+            self.conflito(tabela, uuid, relogio, origem, dados, "referência ausente nesta cópia")
+            return
+        nova_versao = False
+        if mesclar:
+            atual = self.ler_local(tabela, local[0])
+            mesclado = _mesclar(tabela, atual, valores, vence)
+            if mesclado == (valores if vence else atual):
+                if not vence:
+                    self.resumo['ignoradas'] += 1
+                    return
+                mesclar = False # Nada a completar: a linha recebida é gravada como está
+            # A mescla difere da versão vencedora: fica com a versão nova do gatilho, que as demais cópias recebem
+            nova_versao, valores = mesclar, mesclado
+        colunas = list(valores)
+        try:
+            if vivo:
+                conn.execute(f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in colunas)} WHERE id = ?",
+                             (*valores.values(), local[0]))
+                registro_id = local[0]
+            else:
+                if local is not None: # Lápide local mais antiga que a linha recebida
+                    conn.execute("DELETE FROM replicacao_versoes WHERE uuid = ?", (uuid,))
+                registro_id = conn.execute(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                                           tuple(valores.values())).lastrowid
+        except sqlite3.IntegrityError as e:
+            self.conflito(tabela, uuid, relogio, origem, dados, str(e))
+            return
+        if not nova_versao:
+            self.fixar_versao(tabela, registro_id, uuid, relogio, origem)
+        if tabela in self.ids:
+            self.ids[tabela][uuid] = registro_id
+        self.resumo['mescladas' if mesclar else 'aplicadas'] += 1
+
+def aplicar(caminho, arquivo=None):
+    """
+    Aplica no banco (por padrão, o atual) um delta gravado por exportar em outra cópia, numa única
+    transação. Retorna {'aplicadas', 'mescladas', 'ignoradas', 'conflitos'} (ver replicacao_conflitos).
+    Lança ValueError se o delta for desta mesma cópia, de formato desconhecido, ou se começar depois
+    do último delta aplicado desse par (faltaria um delta no meio).
+    """
+    database.exigir_permissao('banco.manutencao')
+    with gzip.open(caminho, 'rt', encoding='utf-8') as f:
+        delta = json.load(f)
+    if delta.get('formato') != FORMATO_DELTA:
+        raise ValueError("Formato de delta desconhecido.")
+    conn = _abrir(arquivo)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        origem_local, _ = _estado(conn)
+        if delta['origem'] == origem_local:
+            raise ValueError("Este delta foi exportado por esta mesma cópia.")
+        row = conn.execute("SELECT recebido FROM replicacao_pares WHERE origem = ?", (delta['origem'],)).fetchone()
+        if delta['desde'] > (row[0] if row else 0):
+            raise ValueError("Falta um delta anterior deste par; exporte de novo a partir do último aplicado.")
+        if delta['destino'] not in (None, origem_local):
+            raise ValueError("Este delta foi exportado para outra cópia.")
+        # Relógio de Lamport: as escritas desta aplicação (lápides, mesclas) ficam depois de todas as versões recebidas
+        conn.execute("UPDATE replicacao_estado SET relogio = MAX(relogio, ?)", (delta['relogio'],))
+        aplicacao = _Aplicacao(conn)
+        ordem = {tabela: i for i, tabela in enumerate(TABELAS)}
+        for linha in sorted(delta['linhas'], key=lambda l: ordem[l[0]]): # sorted é estável: mantém a ordem de seq
+            aplicacao.aplicar(*linha, aplicacao.versao_local(linha[1]))
+        conn.execute("""
+            INSERT INTO replicacao_pares (origem, confirmado, recebido) VALUES (?, ?, ?)
+            ON CONFLICT (origem) DO UPDATE SET confirmado = MAX(confirmado, excluded.confirmado),
+                                               recebido = MAX(recebido, excluded.recebido)""",
+                     (delta['origem'], delta['confirmado'], delta['ate']))
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if os.path.abspath(arquivo or database.DB_FILE) == os.path.abspath(database.DB_FILE):
+        database.limpar_cache()
+    return aplicacao.resumo
+
+def listar_conflitos(arquivo=None):
+    """Linhas recebidas que não puderam ser gravadas, da mais recente para a mais antiga."""
+    conn = _abrir(arquivo)
+    try:
+        conn.row_factory = sqlite3.Row
+        _estado(conn)
+        return [dict(row) for row in conn.execute("SELECT * FROM replicacao_conflitos ORDER BY id DESC")]
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replicação offline entre cópias do banco da clínica.")
+    parser.add_argument('--db', default=database.DB_FILE, help="Banco da clínica (padrão: %(default)s).")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('ativar', help="Ativa a replicação no banco.")
+    comandos.add_parser('copiar', help="Cria uma cópia para trabalhar desconectada.").add_argument('destino')
+    exportacao = comandos.add_parser('exportar', help="Grava as alterações que o par ainda não recebeu.")
+    exportacao.add_argument('delta')
+    exportacao.add_argument('--destino', help="Origem do par (obrigatória se houver mais de um).")
+    comandos.add_parser('aplicar', help="Aplica um delta exportado por outra cópia.").add_argument('delta')
+    comandos.add_parser('conflitos', help="Lista as linhas recebidas que não puderam ser gravadas.")
+    args = parser.parse_args()
+
+    database.DB_FILE = args.db
+    database.inicializar_banco_de_dados()
+    if args.comando == 'ativar':
+        print(f"Replicação ativada; origem {ativar()}.")
+    elif args.comando == 'copiar':
+        print(f"Cópia criada em {args.destino}; origem {criar_copia(args.destino)}.")
+    elif args.comando == 'exportar':
+        resumo = exportar(args.delta, args.destino)
+        print(f"{resumo['linhas']} linha(s) exportada(s) ({resumo['bytes'] / 1024:.1f} KB).")
+    elif args.comando == 'aplicar':
+        resumo = aplicar(args.delta)
+        print(", ".join(f"{n} {estado}" for estado, n in resumo.items()))
+    else:
+        for conflito in listar_conflitos():
+            print(f"{conflito['tabela']:<12} {conflito['uuid']:<34} {conflito['motivo']}")
+
+if __name__ == "__main__":
+    main()
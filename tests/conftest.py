@@ -0,0 +1,25 @@
+"""Fixtures compartilhadas pelos testes: cada teste roda num banco novo, num diretório temporário."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "slow: testes de volume, que levam alguns segundos (deselecione com -m 'not slow')")
+
+@pytest.fixture
+def banco(tmp_path):
+    """Banco da clínica vazio e já inicializado; retorna o caminho do arquivo."""
+    db_original, autorizacao_original = database.DB_FILE, database.AUTORIZACAO_ATIVA
+    database.DB_FILE = str(tmp_path / 'clinica.db')
+    database.AUTORIZACAO_ATIVA = False
+    database.inicializar_banco_de_dados()
+    yield database.DB_FILE
+    database.encerrar_sessao()
+    database.fechar_conexoes()
+    database.limpar_cache()
+    database.DB_FILE, database.AUTORIZACAO_ATIVA = db_original, autorizacao_original
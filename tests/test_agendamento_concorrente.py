@@ -0,0 +1,67 @@
+"""
+Vários processos reservando o mesmo horário do mesmo médico ao mesmo tempo: os gatilhos de
+agendamento rodam dentro da transação de escrita, então exatamente um consegue e os demais recebem
+ConflitoAgendamento.
+"""
+import multiprocessing
+import sqlite3
+
+import pytest
+
+import database
+
+PROCESSOS = 8
+
+def _tentar_reservar(arquivo_db, barreira, fila, argumentos):
+    database.DB_FILE = arquivo_db
+    barreira.wait()
+    try:
+        database.adicionar_sessao(*argumentos)
+        fila.put('reservado')
+    except database.ConflitoAgendamento as e:
+        fila.put(e.motivo)
+    except sqlite3.Error as e:
+        fila.put(f"erro: {e}")
+
+def _disputar(arquivo_db, lista_argumentos):
+    """Dispara um processo por conjunto de argumentos, todos liberados juntos. Retorna os resultados."""
+    barreira = multiprocessing.Barrier(len(lista_argumentos))
+    fila = multiprocessing.Queue()
+    filhos = [multiprocessing.Process(target=_tentar_reservar, args=(arquivo_db, barreira, fila, argumentos))
+              for argumentos in lista_argumentos]
+    for filho in filhos:
+        filho.start()
+    resultados = [fila.get(timeout=60) for _ in filhos]
+    for filho in filhos:
+        filho.join(timeout=60)
+    return resultados
+
+@pytest.fixture
+def agenda(banco):
+    database.adicionar_medico("Dra. Concorrência", "Fonoaudiologia", "")
+    medico_id = database.listar_medicos()[0]['id']
+    paciente_id = database.adicionar_paciente("Paciente Concorrência", "2015-03-10", "Responsável")
+    database.adicionar_disponibilidade(medico_id, '2098-01-05', '08:00', '12:00')
+    return banco, medico_id, paciente_id
+
+@pytest.mark.parametrize('rodada', range(3))
+def test_um_unico_agendamento_por_horario(agenda, rodada):
+    arquivo_db, medico_id, paciente_id = agenda
+    argumentos = (paciente_id, medico_id, '2098-01-05', '10:00', '10:50', "Corrida", "Iniciante", "", "")
+    resultados = _disputar(arquivo_db, [argumentos] * PROCESSOS)
+
+    assert resultados.count('reservado') == 1
+    assert resultados.count('conflito_horario') == PROCESSOS - 1
+    assert len(database.listar_sessoes_por_medico_e_data(medico_id, '2098-01-05')) == 1
+
+def test_horarios_sobrepostos_tambem_conflitam(agenda):
+    arquivo_db, medico_id, paciente_id = agenda
+    # Cada horário começa 10 minutos depois do anterior: todos se sobrepõem ao vizinho
+    lista = [(paciente_id, medico_id, '2098-01-05', f"10:{10 * i:02d}", f"11:{10 * i:02d}", "Corrida", "Iniciante", "", "")
+             for i in range(5)]
+    resultados = _disputar(arquivo_db, lista)
+
+    sessoes = [linha for linha in database.agenda_medico(medico_id, '2098-01-05', '2098-01-05') if linha['tipo'] == 'sessao']
+    assert resultados.count('reservado') == len(sessoes) >= 1
+    assert all(r in ('reservado', 'conflito_horario') for r in resultados)
+    assert all(anterior['minuto_fim'] <= seguinte['minuto_inicio'] for anterior, seguinte in zip(sessoes, sessoes[1:]))
@@ -0,0 +1,173 @@
+"""
+Replicação entre duas cópias do banco (a clínica e o notebook): edições e exclusões feitas nas duas
+cópias ao mesmo tempo, trocadas por deltas nos dois sentidos, terminam com o mesmo conteúdo, e o
+empate de relógio de Lamport é decidido pela origem, igual nas duas cópias. Em volume, 50 mil
+alterações feitas no notebook sincronizam em segundos.
+"""
+import sqlite3
+from contextlib import closing, contextmanager
+
+import pytest
+
+import benchmark
+import database
+import gerar_dados
+import replicacao
+
+DIAS = ('2098-03-02', '2098-03-03', '2098-03-04')
+
+@contextmanager
+def _no_banco(arquivo):
+    """Direciona as funções de database.py para o arquivo indicado durante o bloco."""
+    anterior = database.DB_FILE
+    database.DB_FILE = arquivo
+    try:
+        yield
+    finally:
+        database.fechar_conexoes()
+        database.DB_FILE = anterior
+
+def _conteudo(arquivo):
+    """Linhas replicadas do banco, por uuid, com as chaves estrangeiras trocadas por uuids (os ids locais divergem)."""
+    with closing(sqlite3.connect(arquivo)) as conn:
+        uuids = {tabela: dict(conn.execute(
+                     "SELECT registro_id, uuid FROM replicacao_versoes WHERE tabela = ? AND excluido = 0", (tabela,)))
+                 for tabela in ('medicos', 'pacientes')}
+        linhas = {}
+        for tabela in replicacao.TABELAS:
+            colunas = replicacao._colunas(conn, tabela)
+            for row in conn.execute(f"""
+                    SELECT v.uuid, {', '.join('t.' + c for c in colunas)} FROM {tabela} t
+                    JOIN replicacao_versoes v ON v.tabela = '{tabela}' AND v.registro_id = t.id AND v.excluido = 0"""):
+                dados = dict(zip(colunas, row[1:]))
+                for coluna, referencia in replicacao.CHAVES_ESTRANGEIRAS.get(tabela, {}).items():
+                    dados[coluna] = uuids[referencia].get(dados[coluna], dados[coluna])
+                linhas[row[0]] = (tabela, dados)
+    return linhas
+
+def _sincronizar(clinica, notebook, pasta):
+    """Troca os deltas nos dois sentidos, como no retorno do notebook à clínica. Retorna os resumos de aplicar."""
+    para_notebook, para_clinica = str(pasta / 'para_notebook.json.gz'), str(pasta / 'para_clinica.json.gz')
+    replicacao.exportar(para_notebook, arquivo=clinica)
+    no_notebook = replicacao.aplicar(para_notebook, arquivo=notebook)
+    replicacao.exportar(para_clinica, arquivo=notebook)
+    na_clinica = replicacao.aplicar(para_clinica, arquivo=clinica)
+    return no_notebook, na_clinica
+
+def _origem(arquivo):
+    with closing(sqlite3.connect(arquivo)) as conn:
+        return conn.execute("SELECT origem FROM replicacao_estado").fetchone()[0]
+
+def _sessao(paciente_id, medico_id, dia, hora_inicio, resumo=""):
+    fim = f"{int(hora_inicio[:2]):02d}:50"
+    return (paciente_id, medico_id, dia, hora_inicio, fim, resumo, "Iniciante", "", "")
+
+@pytest.fixture
+def copias(banco, tmp_path):
+    """Clínica com um médico, dois pacientes e algumas sessões, e a cópia do notebook criada a partir dela."""
+    database.adicionar_medico("Dra. Réplica", "Psicologia", "")
+    medico_id = database.listar_medicos()[0]['id']
+    for dia in DIAS:
+        database.adicionar_disponibilidade(medico_id, dia, '08:00', '12:00')
+    ana = database.adicionar_paciente("Ana Souza", "2015-03-10", "Marta Souza")
+    bruno = database.adicionar_paciente("Bruno Lima", "2016-07-01", "Paulo Lima")
+    for paciente_id, dia, hora in ((ana, DIAS[0], '08:00'), (ana, DIAS[1], '08:00'), (bruno, DIAS[0], '09:00'), (bruno, DIAS[2], '10:00')):
+        database.adicionar_sessao(*_sessao(paciente_id, medico_id, dia, hora, "Original"))
+    notebook = str(tmp_path / 'notebook.db')
+    replicacao.criar_copia(notebook)
+    database.limpar_cache()
+    return {'clinica': banco, 'notebook': notebook, 'medico_id': medico_id, 'ana': ana, 'bruno': bruno}
+
+def _sessao_id(arquivo, paciente_id, dia):
+    with closing(sqlite3.connect(arquivo)) as conn:
+        return conn.execute("SELECT id FROM sessoes WHERE paciente_id = ? AND data_sessao = ?", (paciente_id, dia)).fetchone()[0]
+
+def test_copias_recem_criadas_sao_iguais(copias):
+    assert _conteudo(copias['clinica']) == _conteudo(copias['notebook'])
+    assert _origem(copias['clinica']) != _origem(copias['notebook'])
+
+def test_edicoes_concorrentes_convergem_com_desempate_pela_origem(copias, tmp_path):
+    clinica, notebook, ana, bruno = copias['clinica'], copias['notebook'], copias['ana'], copias['bruno']
+    # Ana: uma edição de cada lado, com o mesmo relógio; quem vence é a maior origem
+    with _no_banco(clinica):
+        database.atualizar_paciente(ana, "Ana Souza (clínica)", "2015-03-10", "Marta Souza")
+    with _no_banco(notebook):
+        database.atualizar_paciente(ana, "Ana Souza (notebook)", "2015-03-10", "Marta Souza")
+    # Bruno: duas edições no notebook contra uma na clínica; o relógio maior vence, qualquer que seja a origem
+    with _no_banco(clinica):
+        database.atualizar_paciente(bruno, "Bruno Lima (clínica)", "2016-07-01", "Paulo Lima")
+    with _no_banco(notebook):
+        database.atualizar_paciente(bruno, "Bruno Lima (rascunho)", "2016-07-01", "Paulo Lima")
+        database.atualizar_paciente(bruno, "Bruno Lima (notebook)", "2016-07-01", "Paulo Lima")
+        novo = database.adicionar_paciente("Carla Dias", "2017-01-20", "Rita Dias")
+        database.adicionar_sessao(*_sessao(novo, copias['medico_id'], DIAS[2], '11:00', "Visita domiciliar"))
+
+    _sincronizar(clinica, notebook, tmp_path)
+
+    conteudo = _conteudo(clinica)
+    assert conteudo == _conteudo(notebook)
+    nomes = {dados['nome_completo'] for tabela, dados in conteudo.values() if tabela == 'pacientes'}
+    vencedor_ana = "Ana Souza (clínica)" if _origem(clinica) > _origem(notebook) else "Ana Souza (notebook)"
+    assert nomes == {vencedor_ana, "Bruno Lima (notebook)", "Carla Dias"}
+    assert sum(1 for tabela, dados in conteudo.values() if dados.get('resumo_sessao') == "Visita domiciliar") == 1
+
+def test_exclusoes_concorrentes_convergem(copias, tmp_path):
+    clinica, notebook, ana, bruno = copias['clinica'], copias['notebook'], copias['ana'], copias['bruno']
+    medico_id = copias['medico_id']
+    with _no_banco(clinica):
+        database.excluir_sessao(_sessao_id(clinica, ana, DIAS[0]))  # Excluída dos dois lados
+        database.excluir_sessao(_sessao_id(clinica, ana, DIAS[1]))  # Excluída aqui, editada duas vezes no notebook
+        database.atualizar_sessao(_sessao_id(clinica, bruno, DIAS[2]), *_sessao(bruno, medico_id, DIAS[2], '10:00', "Editada na clínica")[1:])
+    with _no_banco(notebook):
+        database.excluir_sessao(_sessao_id(notebook, ana, DIAS[0]))
+        sessao_id = _sessao_id(notebook, ana, DIAS[1])
+        database.atualizar_sessao(sessao_id, *_sessao(ana, medico_id, DIAS[1], '08:00', "Rascunho")[1:])
+        database.atualizar_sessao(sessao_id, *_sessao(ana, medico_id, DIAS[1], '08:00', "Editada no notebook")[1:])
+        database.excluir_paciente(bruno)  # Com as sessões, em cascata, inclusive a editada na clínica
+
+    _sincronizar(clinica, notebook, tmp_path)
+
+    conteudo = _conteudo(clinica)
+    assert conteudo == _conteudo(notebook)
+    resumos = sorted(dados['resumo_sessao'] for tabela, dados in conteudo.values() if tabela == 'sessoes')
+    # A edição posterior (relógio maior) vence a exclusão; a edição da clínica perde para a exclusão em cascata, mais nova
+    assert resumos == ["Editada no notebook"]
+    assert {dados['nome_completo'] for tabela, dados in conteudo.values() if tabela == 'pacientes'} == {"Ana Souza"}
+
+def test_nova_sincronizacao_so_traz_o_que_mudou(copias, tmp_path):
+    clinica, notebook, ana = copias['clinica'], copias['notebook'], copias['ana']
+    with _no_banco(notebook):
+        database.atualizar_paciente(ana, "Ana Souza Prado", "2015-03-10", "Marta Souza")
+    _sincronizar(clinica, notebook, tmp_path)
+    reaplicar = str(tmp_path / 'reaplicar.json.gz')
+    replicacao.exportar(reaplicar, arquivo=notebook)
+    _sincronizar(clinica, notebook, tmp_path) # O recebimento é confirmado no delta seguinte de cada lado
+    antes = _conteudo(clinica)
+
+    # Sem alterações, nenhum lado tem o que enviar, e reaplicar um delta já recebido não muda nada
+    delta = str(tmp_path / 'vazio.json.gz')
+    assert replicacao.exportar(delta, arquivo=notebook)['linhas'] == 0
+    assert replicacao.exportar(delta, arquivo=clinica)['linhas'] == 0
+    reaplicado = replicacao.aplicar(reaplicar, arquivo=clinica)
+    assert reaplicado['aplicadas'] == reaplicado['mescladas'] == reaplicado['conflitos'] == 0
+    assert _conteudo(clinica) == antes
+
+    with _no_banco(clinica):
+        database.atualizar_paciente(ana, "Ana Souza Prado", "2015-03-10", "Marta Prado")
+    assert replicacao.exportar(delta, arquivo=clinica)['linhas'] == 1
+    _sincronizar(clinica, notebook, tmp_path)
+    assert _conteudo(clinica) == _conteudo(notebook)
+    assert replicacao.listar_conflitos(clinica) == replicacao.listar_conflitos(notebook) == []
+
+@pytest.mark.slow
+def test_cinquenta_mil_alteracoes_sincronizam_em_segundos(tmp_path):
+    arquivo = str(tmp_path / 'consultorio.db')
+    gerar_dados.gerar_banco(arquivo, verbose=False, **gerar_dados.ESCALAS['consultorio'])
+
+    relatorio = benchmark.medir_replicacao(arquivo, alteracoes=50_000)
+
+    assert relatorio['convergiu']
+    ida, volta = relatorio['notebook_para_clinica'], relatorio['clinica_para_notebook']
+    assert ida['linhas'] == 50_000 and ida['aplicadas'] + ida['mescladas'] + ida['conflitos'] == 50_000
+    segundos = sum(r['exportar_segundos'] + r['aplicar_segundos'] for r in (ida, volta))
+    assert segundos < 30, f"sincronização levou {segundos:.1f}s"
@@ -0,0 +1,17 @@
+"""
+Só app.py (e o harness_janelas.py, que o abre) usa tkinter: os demais módulos rodam no cron e em
+servidores sem interface gráfica (clinica.py) e preparam os dados das janelas fora delas (formatacao.py).
+"""
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COM_INTERFACE = {'app', 'harness_janelas'}
+
+def test_modulos_sem_interface_nao_importam_tkinter():
+    modulos = sorted(nome[:-3] for nome in os.listdir(RAIZ) if nome.endswith('.py') and nome[:-3] not in COM_INTERFACE)
+    # Num processo novo, para que um tkinter importado por outro teste não mascare o resultado
+    codigo = f"import sys\nfor m in {modulos!r}: __import__(m)\nprint(sorted(m for m in sys.modules if m.split('.')[0] in ('tkinter', 'tkcalendar')))"
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, capture_output=True, text=True, check=True).stdout
+    assert saida.strip() == '[]'